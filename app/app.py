@@ -9,6 +9,7 @@ configuration for the application's title, version, and file paths.
 """
 
 import time
+import asyncio
 from fastapi import FastAPI, Request, status
 from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
@@ -31,12 +32,16 @@ from app.routers import (
     datafile_upload_router, datafile_replace_router,
     datafile_download_router, datafile_select_router,
     datafile_update_router, datafile_delete_router,
-    datafile_list_router,
+    datafile_list_router, datafile_export_router,
+
+    upload_insert_router, upload_part_router, upload_select_router,
+    upload_finalize_router, upload_delete_router,
 
     comment_insert_router, comment_select_router, comment_update_router,
     comment_delete_router, comment_list_router,
 
     revision_select_router, revision_download_router, revision_list_router,
+    thumbnail_retrieve_router,
 
     favorite_insert_router, favorite_select_router, favorite_delete_router,
     favorite_list_router, download_select_router, download_list_router,
@@ -48,6 +53,9 @@ from app.routers import (
     lock_retrieve_router, lock_delete_router, cache_erase_router,
     custom_execute_router, sphinx_router)
 from app.database import Base, sessionmanager
+from app.cache import cache_pool
+from app.managers.cache_manager import CacheManager
+from app.helpers.content_cache_helper import content_cache
 from app.constants import ERR_SERVER_ERROR
 from contextlib import asynccontextmanager
 from uuid import uuid4
@@ -57,6 +65,18 @@ from app.version import __version__
 from app.helpers.openapi_helper import load_description
 from app.helpers.uptime_helper import Uptime
 from app.helpers.hook_helper import load_hooks
+from app.helpers.upload_helper import uploads_gc
+from app.helpers.orphan_helper import orphans_gc
+from app.helpers.scrub_helper import scrub_worker
+from app.helpers.shard_helper import shards_migrate_all
+from app.helpers.storage_helper import (
+    thumbnails_storage, userpics_storage, storage_static_files,
+    storages_close)
+from app.managers.storage_manager import STORAGE_LOCAL
+from app.helpers.thumbnail_helper import thumbnails_worker
+from app.helpers.media_helper import media_pool
+from app.helpers.io_helper import io_pool
+from app.helpers.crypto_helper import crypto_pool
 
 cfg = get_config()
 ctx = get_context()
@@ -66,17 +86,47 @@ log = get_log()
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
-    Manages the application startup lifecycle by removing the lock if
-    it exists, initializing the database schema, and registering hooks.
-    Yields control back to the application after setup is complete.
+    Manages the application startup lifecycle by initializing the
+    database schema, opening the Redis connection pool, subscribing to
+    the cache evictions of the other workers, removing the lock if it
+    exists, registering hooks, starting the removal of expired upload
+    sessions and unreferenced files, the integrity scrubber and the
+    thumbnail queue workers, and migrating the stored files to the
+    sharded layout in the background for the local storage. Yields
+    control back to the application after setup is complete, and on
+    exit cancels the background tasks and waits for them to finish,
+    then shuts down the media, file I/O and crypto pools and closes the
+    storages and the Redis connection pool.
     """
     async with sessionmanager.async_engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
+    cache_pool.open()
+    tasks = [asyncio.create_task(
+        CacheManager(cache_pool.get_client()).listen(content_cache.evict))]
     await remove_lock()
     await load_hooks()
+
+    tasks.append(asyncio.create_task(uploads_gc()))
+    tasks.append(asyncio.create_task(orphans_gc()))
+    tasks.append(asyncio.create_task(scrub_worker()))
+    if cfg.STORAGE_BACKEND == STORAGE_LOCAL:
+        tasks.append(asyncio.create_task(shards_migrate_all()))
+    tasks += [asyncio.create_task(thumbnails_worker())
+              for _ in range(cfg.THUMBNAILS_QUEUE_WORKERS)]
     yield
 
+    # The tasks finish their cancellation before the pools they use
+    # are shut down.
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    media_pool.shutdown()
+    await storages_close()
+    io_pool.shutdown()
+    crypto_pool.shutdown()
+    await cache_pool.close()
+
 
 app = FastAPI(lifespan=lifespan, title=cfg.APP_TITLE, version=__version__,
               description=load_description(), openapi_tags=openapi_tags)
@@ -113,11 +163,20 @@ app.include_router(datafile_download_router.router, prefix=cfg.APP_PREFIX)
 app.include_router(datafile_update_router.router, prefix=cfg.APP_PREFIX)
 app.include_router(datafile_delete_router.router, prefix=cfg.APP_PREFIX)
 app.include_router(datafile_list_router.router, prefix=cfg.APP_PREFIX)
+app.include_router(datafile_export_router.router, prefix=cfg.APP_PREFIX)
+
+# upload routers
+app.include_router(upload_insert_router.router, prefix=cfg.APP_PREFIX)
+app.include_router(upload_part_router.router, prefix=cfg.APP_PREFIX)
+app.include_router(upload_select_router.router, prefix=cfg.APP_PREFIX)
+app.include_router(upload_finalize_router.router, prefix=cfg.APP_PREFIX)
+app.include_router(upload_delete_router.router, prefix=cfg.APP_PREFIX)
 
 # revision routers
 app.include_router(revision_select_router.router, prefix=cfg.APP_PREFIX)
 app.include_router(revision_download_router.router, prefix=cfg.APP_PREFIX)
 app.include_router(revision_list_router.router, prefix=cfg.APP_PREFIX)
+app.include_router(thumbnail_retrieve_router.router, prefix=cfg.APP_PREFIX)
 
 # download routers
 app.include_router(download_select_router.router, prefix=cfg.APP_PREFIX)
@@ -161,10 +220,10 @@ app.mount("/sphinx",
           name="sphinx")
 
 app.mount(cfg.USERPIC_PREFIX,
-          StaticFiles(directory=cfg.USERPIC_BASE_PATH, html=False),
+          storage_static_files(userpics_storage, cfg.USERPIC_BASE_PATH),
           name=cfg.USERPIC_BASE_PATH)
 app.mount(cfg.THUMBNAILS_PREFIX,
-          StaticFiles(directory=cfg.THUMBNAILS_BASE_PATH, html=False),
+          storage_static_files(thumbnails_storage, cfg.THUMBNAILS_BASE_PATH),
           name=cfg.THUMBNAILS_BASE_PATH)
 app.mount("/", StaticFiles(directory=cfg.HTML_PATH, html=True), name="/")
 
@@ -1,7 +1,10 @@
 """
-Provides asynchronous access to the Redis cache. This module defines
-a function to establish a connection to Redis using configuration
-settings and ensures the connection is properly closed after use.
+Provides asynchronous access to the Redis cache. The worker process
+shares a single Redis client backed by a bounded connection pool, so
+requests reuse open connections instead of connecting to Redis every
+time; once all connections of the pool are in use, requests wait for
+a free one. The pool is opened when the application starts, closed
+when it stops, and its usage is reported by the telemetry.
 """
 
 import redis.asyncio as redis
@@ -10,15 +13,87 @@ from app.config import get_config
 cfg = get_config()
 
 
+class CacheConnectionPool(redis.BlockingConnectionPool):
+    """
+    Blocking connection pool that counts its connections itself, so the
+    usage reported by the telemetry does not depend on the internals of
+    redis-py.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.connections = set()
+        self.in_use = set()
+
+    async def get_connection(self, *args, **kwargs):
+        """Takes a connection, waiting while all of them are in use."""
+        connection = await super().get_connection(*args, **kwargs)
+        self.connections.add(connection)
+        self.in_use.add(connection)
+        return connection
+
+    async def release(self, connection):
+        """Returns the connection to the pool."""
+        self.in_use.discard(connection)
+        await super().release(connection)
+
+
+class CachePool:
+    """
+    Holds the connection pool and the Redis client of the worker
+    process. The pool is created on first use if the application has
+    not opened it, e.g. in scripts.
+    """
+
+    def __init__(self):
+        self.pool = None
+        self.client = None
+
+    def open(self):
+        """Creates the connection pool and the client."""
+        self.pool = CacheConnectionPool(
+            host=cfg.REDIS_HOST, port=cfg.REDIS_PORT,
+            decode_responses=cfg.REDIS_DECODE,
+            max_connections=cfg.REDIS_POOL_SIZE,
+            timeout=cfg.REDIS_POOL_TIMEOUT,
+            socket_timeout=cfg.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=cfg.REDIS_SOCKET_TIMEOUT,
+            health_check_interval=cfg.REDIS_HEALTH_CHECK_INTERVAL)
+        self.client = redis.Redis(connection_pool=self.pool)
+
+    def get_client(self) -> redis.Redis:
+        """Returns the shared client, opening the pool if needed."""
+        if self.client is None:
+            self.open()
+        return self.client
+
+    def get_stats(self) -> dict:
+        """Returns the numbers of idle and used connections."""
+        if self.pool is None:
+            return {"redis_pool_idle": 0, "redis_pool_in_use": 0}
+
+        return {
+            "redis_pool_idle": (
+                len(self.pool.connections) - len(self.pool.in_use)),
+            "redis_pool_in_use": len(self.pool.in_use),
+        }
+
+    async def close(self):
+        """Closes the client and disconnects the connections."""
+        client, self.client = self.client, None
+        pool, self.pool = self.pool, None
+        if client is not None:
+            await client.aclose()
+            await pool.disconnect()
+
+
+cache_pool = CachePool()
+
+
 async def get_cache():
     """
-    Establishes and yields an asynchronous Redis connection using the
-    configured host, port, and decoding settings. Ensures the connection
-    is closed after use.
+    Yields the shared Redis client of the worker process. Connections
+    are taken from the pool for every command and returned after it, so
+    nothing has to be closed after use.
     """
-    try:
-        conn = redis.Redis(host=cfg.REDIS_HOST, port=cfg.REDIS_PORT,
-                           decode_responses=cfg.REDIS_DECODE)
-        yield conn
-    finally:
-        await conn.close()
+    yield cache_pool.get_client()
@@ -35,6 +35,12 @@ class Config:
     REDIS_PORT: int
     REDIS_DECODE: bool
     REDIS_EXPIRE: int
+    REDIS_POOL_SIZE: int
+    REDIS_POOL_TIMEOUT: int
+    REDIS_SOCKET_TIMEOUT: int
+    REDIS_HEALTH_CHECK_INTERVAL: int
+    CACHE_MEMORY_SIZE: int
+    CACHE_MEMORY_TTL: int
 
     LOG_LEVEL: str
     LOG_NAME: str
@@ -87,6 +93,13 @@ class Config:
 
     REVISIONS_BASE_PATH: str
     REVISIONS_EXTENSION: str
+    REVISIONS_COMPRESSION: str
+
+    CHUNKS_ENABLED: bool
+    CHUNKS_BASE_PATH: str
+    CHUNKS_MIN_SIZE: int
+    CHUNKS_AVG_SIZE: int
+    CHUNKS_MAX_SIZE: int
 
     THUMBNAILS_BASE_URL: str
     THUMBNAILS_BASE_PATH: str
@@ -95,6 +108,64 @@ class Config:
     THUMBNAIL_WIDTH: int
     THUMBNAIL_HEIGHT: int
     THUMBNAIL_QUALITY: int
+    THUMBNAILS_QUEUE_WORKERS: int
+    THUMBNAILS_QUEUE_INTERVAL: int
+    THUMBNAILS_QUEUE_ATTEMPTS: int
+    THUMBNAILS_QUEUE_RETRY_DELAY: int
+    THUMBNAILS_QUEUE_TIMEOUT: int
+
+    RENDITIONS_BASE_PATH: str
+    RENDITIONS_SIZE: int
+    RENDITIONS_QUALITY: int
+
+    MEDIA_POOL_WORKERS: int
+    MEDIA_POOL_TIMEOUT: int
+
+    IO_POOL_WORKERS: int
+    IO_CHUNK_MIN_SIZE: int
+    IO_CHUNK_MAX_SIZE: int
+
+    CRYPTO_POOL_WORKERS: int
+
+    IMAGE_MAX_PIXELS: int
+    IMAGE_MAX_MEMORY: int
+
+    VIDEO_WORKERS: int
+    VIDEO_TIMEOUT: int
+    VIDEO_SEEK_RATIO: float
+    VIDEO_LOCKS_PATH: str
+
+    CONTENT_CACHE_PATH: str
+    CONTENT_CACHE_SIZE: int
+    CONTENT_CACHE_FILE_SIZE: int
+    CONTENT_CACHE_MEMORY_SIZE: int
+    CONTENT_CACHE_MEMORY_FILE_SIZE: int
+
+    UPLOADS_BASE_PATH: str
+    UPLOADS_EXPIRES: int
+    UPLOADS_PARTS_LIMIT: int
+    UPLOADS_PART_SIZE: int
+    UPLOADS_GC_INTERVAL: int
+
+    ORPHANS_GC_INTERVAL: int
+    ORPHANS_GC_DELAY: int
+    ORPHANS_GC_BATCH_SIZE: int
+    ORPHANS_RECONCILE_INTERVAL: int
+
+    SCRUB_BANDWIDTH: int
+    SCRUB_INTERVAL: int
+    SCRUB_BATCH_SIZE: int
+    SCRUB_IDLE_INTERVAL: int
+
+    STORAGE_BACKEND: str
+    S3_ENDPOINT: str
+    S3_REGION: str
+    S3_BUCKET: str
+    S3_ACCESS_KEY: str
+    S3_SECRET_KEY: str
+    S3_PART_SIZE: int
+    S3_POOL_SIZE: int
+    S3_TIMEOUT: int
 
     HTML_PATH: str
 
@@ -105,7 +176,7 @@ def get_config() -> Config:
     Loads configuration settings from an .env file and returns them as a
     Config dataclass instance. The function uses type hints to convert
     the environment variable values to their appropriate types, such as
-    int, list, or bool. Caches the result to optimize performance
+    int, float, list, or bool. Caches the result to optimize performance
     for subsequent calls.
     """
     keys_and_types = {x.name: x.type for x in fields(Config)}
@@ -117,6 +188,9 @@ def get_config() -> Config:
         if value_type == int:
             value = int(value)
 
+        elif value_type == float:
+            value = float(value)
+
         elif value_type == list:
             value = value.split(",")
 
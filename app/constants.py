@@ -58,6 +58,12 @@ ERR_VALUE_DUPLICATED = "value_duplicated"
 # The file MIME type is not supported for the operation (422).
 ERR_MIMETYPE_UNSUPPORTED = "mimetype_unsupported"
 
+# The requested byte range cannot be satisfied (416).
+ERR_RANGE_UNSATISFIABLE = "range_unsatisfiable"
+
+# The value provided exceeds the allowed size (413).
+ERR_VALUE_TOO_LARGE = "value_too_large"
+
 # Internal server error (500).
 ERR_SERVER_ERROR = "Internal server error"
 
@@ -123,6 +129,13 @@ HOOK_BEFORE_DATAFILE_DELETE = "before_datafile_delete"
 HOOK_AFTER_DATAFILE_DELETE = "after_datafile_delete"
 HOOK_AFTER_DATAFILE_LIST = "after_datafile_list"
 
+# upload hooks
+HOOK_BEFORE_UPLOAD_INSERT = "before_upload_insert"
+HOOK_AFTER_UPLOAD_INSERT = "after_upload_insert"
+HOOK_AFTER_UPLOAD_SELECT = "after_upload_select"
+HOOK_BEFORE_UPLOAD_DELETE = "before_upload_delete"
+HOOK_AFTER_UPLOAD_DELETE = "after_upload_delete"
+
 # comment hooks
 HOOK_BEFORE_COMMENT_INSERT = "before_comment_insert"
 HOOK_AFTER_COMMENT_INSERT = "after_comment_insert"
@@ -138,6 +151,7 @@ HOOK_AFTER_REVISION_SELECT = "after_revision_select"
 HOOK_BEFORE_REVISION_DOWNLOAD = "before_revision_download"
 HOOK_AFTER_REVISION_DOWNLOAD = "after_revision_download"
 HOOK_AFTER_REVISION_LIST = "after_revision_list"
+HOOK_AFTER_THUMBNAIL_RETRIEVE = "after_thumbnail_retrieve"
 
 # download hooks
 HOOK_AFTER_DOWNLOAD_SELECT = "after_download_select"
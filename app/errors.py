@@ -20,11 +20,13 @@ class E(HTTPException):
     responses, useful for debugging and user experience.
     """
     def __init__(self, loc: list, error_input: str, error_type: str,
-                 status_code: int):
+                 status_code: int, headers: dict = None):
         """
         Initializes the exception with detailed error information,
         including the location of the error, the input that caused it,
-        the type of the error, and the HTTP status code.
+        the type of the error, the HTTP status code, and optional
+        response headers.
         """
         detail = [{"loc": loc, "input": error_input, "type": error_type}]
-        super().__init__(status_code=status_code, detail=detail)
+        super().__init__(status_code=status_code, detail=detail,
+                         headers=headers)
@@ -15,6 +15,7 @@ from app.models.datafile_model import Datafile
 from app.models.revision_model import Revision
 from app.models.comment_model import Comment
 from app.models.download_model import Download
+from app.models.upload_model import Upload
 from app.models.favorite_model import Favorite
 from app.models.option_model import Option
 from app.managers.entity_manager import EntityManager
@@ -552,6 +553,61 @@ async def after_datafile_list(
     ...
 
 
+async def before_upload_insert(
+    entity_manager: EntityManager, cache_manager: CacheManager,
+    current_user: User, upload: Upload
+):
+    """
+    Executes before an upload session is created. Receives the upload
+    entity and performs any necessary pre-processing actions.
+    """
+    ...
+
+
+async def after_upload_insert(
+    entity_manager: EntityManager, cache_manager: CacheManager,
+    current_user: User, upload: Upload
+):
+    """
+    Executes after an upload session is created. Receives the upload
+    entity and performs any necessary post-processing actions.
+    """
+    ...
+
+
+async def after_upload_select(
+    entity_manager: EntityManager, cache_manager: CacheManager,
+    current_user: User, upload: Upload
+):
+    """
+    Executes after an upload session is selected. Receives the upload
+    entity and performs any necessary post-processing actions.
+    """
+    ...
+
+
+async def before_upload_delete(
+    entity_manager: EntityManager, cache_manager: CacheManager,
+    current_user: User, upload: Upload
+):
+    """
+    Executes before an upload session is deleted. Receives the upload
+    entity and performs any necessary pre-processing actions.
+    """
+    ...
+
+
+async def after_upload_delete(
+    entity_manager: EntityManager, cache_manager: CacheManager,
+    current_user: User, upload: Upload
+):
+    """
+    Executes after an upload session is deleted. Receives the upload
+    entity and performs any necessary post-processing actions.
+    """
+    ...
+
+
 async def before_comment_insert(
     entity_manager: EntityManager, cache_manager: CacheManager,
     current_user: User, comment: Comment
@@ -686,6 +742,17 @@ async def after_revision_list(
     ...
 
 
+async def after_thumbnail_retrieve(
+    entity_manager: EntityManager, cache_manager: CacheManager,
+    current_user: User, revision: Revision
+):
+    """
+    Executes after a thumbnail of a revision is retrieved. Receives the
+    revision entity and performs any necessary post-processing actions.
+    """
+    ...
+
+
 async def after_download_select(
     entity_manager: EntityManager, cache_manager: CacheManager,
     current_user: User, download: Download
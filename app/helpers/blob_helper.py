@@ -0,0 +1,137 @@
+"""
+Provides content-addressed naming for revision, chunk and thumbnail
+files. Files are named after a keyed digest of the plaintext content
+hash, so identical uploads resolve to one shared file while the names
+do not reveal the hash of the content itself. Compressed and
+uncompressed copies of the same content are stored under different
+names. Revisions that share a file are reference-counted by their
+filename in the revisions table. Storing a file and its deletion by
+the orphans sweeper are serialized by a lock on the filename.
+"""
+
+import hmac
+import base64
+import hashlib
+from typing import Tuple
+from redis.asyncio.lock import Lock
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from app.managers.file_manager import FileManager
+from app.managers.storage_manager import Storage
+from app.helpers.storage_helper import revisions_storage
+from app.cache import cache_pool
+from app.config import get_config
+
+cfg = get_config()
+
+BLOB_KEY_INFO = b"hidden content addresses"
+MANIFEST_EXTENSION = ".manifest"
+BLOB_LOCK_PREFIX = "lock:blob:"
+
+
+def _derive_key() -> bytes:
+    """
+    Derives the key for content addresses from the configured Fernet
+    key using HKDF.
+    """
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=None,
+                info=BLOB_KEY_INFO)
+    return hkdf.derive(base64.urlsafe_b64decode(cfg.FERNET_KEY))
+
+
+blob_key = _derive_key()
+
+
+def get_blob_name(content_hash: str) -> str:
+    """
+    Returns the content address for the given plaintext content hash.
+    """
+    return hmac.new(blob_key, content_hash.encode(),
+                    hashlib.sha256).hexdigest()
+
+
+def get_revision_filename(content_hash: str,
+                          compression: str = None) -> str:
+    """
+    Returns the revision filename for the given content hash and the
+    compression the file is stored with.
+    """
+    if compression:
+        content_hash += ":" + compression
+    return get_blob_name(content_hash) + cfg.REVISIONS_EXTENSION
+
+
+def get_manifest_filename(content_hash: str,
+                          compression: str = None) -> str:
+    """
+    Returns the filename of the chunk manifest of a revision for the
+    given content hash and the compression its chunks are stored with.
+    """
+    if compression:
+        content_hash += ":" + compression
+    return (get_blob_name(content_hash + ":manifest") + MANIFEST_EXTENSION +
+            cfg.REVISIONS_EXTENSION)
+
+
+def is_manifest(revision_filename: str) -> bool:
+    """Checks whether the revision file is a chunk manifest."""
+    return revision_filename.endswith(
+        MANIFEST_EXTENSION + cfg.REVISIONS_EXTENSION)
+
+
+def get_chunk_filename(chunk_hash: str, compression: str = None) -> str:
+    """
+    Returns the chunk filename for the given hash of the chunk content
+    and the compression the chunk is stored with.
+    """
+    return get_revision_filename(chunk_hash, compression)
+
+
+def get_thumbnail_filename(content_hash: str) -> str:
+    """Returns the thumbnail filename for the given content hash."""
+    return get_blob_name(content_hash) + cfg.THUMBNAILS_EXTENSION
+
+
+def blob_lock(filename: str) -> Lock:
+    """
+    Returns the lock on the stored file, which is held while the file
+    is stored and while the sweeper checks and deletes it. The lock
+    expires after the deletion delay if its holder dies.
+    """
+    return cache_pool.get_client().lock(
+        BLOB_LOCK_PREFIX + filename, timeout=cfg.ORPHANS_GC_DELAY)
+
+
+async def blob_refresh(storage: Storage, filename: str) -> bool:
+    """
+    Refreshes the modification time of a stored file, so the sweeper
+    postpones its deletion. Returns False if the file does not exist.
+    """
+    try:
+        await storage.touch(filename)
+        return True
+
+    except FileNotFoundError:
+        return False
+
+
+async def revision_store(upload_path: str, content_hash: str,
+                         compression: str = None) -> Tuple[str, bool]:
+    """
+    Puts an uploaded revision file into the content-addressed store.
+    If a file with the same content is already stored, it is kept as it
+    is, since downloads in progress read its segments by offsets, and
+    the upload is discarded; the modification time of the file is
+    refreshed, so the sweeper postpones its deletion. Returns the
+    revision filename and whether the file did not exist before, so the
+    caller knows if it may remove the file when the upload fails
+    afterwards.
+    """
+    revision_filename = get_revision_filename(content_hash, compression)
+    async with blob_lock(revision_filename):
+        if await blob_refresh(revisions_storage, revision_filename):
+            await FileManager.delete(upload_path)
+            return revision_filename, False
+
+        await revisions_storage.put(revision_filename, upload_path)
+        return revision_filename, True
@@ -0,0 +1,529 @@
+"""
+Provides the content-defined chunk store for revisions. When chunking
+is enabled, an uploaded stream is split into chunks at boundaries that
+depend on the content only, every chunk is stored encrypted in the
+chunk storage under the keyed digest of its content, and the revision
+file becomes a manifest listing the chunks, so a revision that differs
+from a stored one by a small edit only adds the chunks around the edit.
+Downloads reassemble the content from the chunks of the manifest and
+fetch the next chunks ahead while a chunk is sent. Chunks are shared by
+the manifests of all revisions with common content, so the manifests
+record their chunks in the chunks table, and the orphans sweeper only
+deletes chunks that no manifest of a revision references.
+"""
+
+import hmac
+import time
+import uuid
+import zlib
+import base64
+import asyncio
+import hashlib
+from bisect import bisect_right, bisect_left
+from collections import OrderedDict, deque
+from typing import AsyncIterator, List, Tuple
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from sqlalchemy import select, update, delete, insert, exists, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app.managers.file_manager import FileManager, COMPRESSION_ZLIB
+from app.helpers.cipher_helper import SegmentEncryptor, SegmentDecryptor
+from app.helpers.io_helper import io_open, IOWriter
+from app.helpers.crypto_helper import crypto_run
+from app.helpers.blob_helper import (
+    get_manifest_filename, get_chunk_filename, is_manifest, blob_refresh,
+    blob_lock)
+from app.helpers.storage_helper import revisions_storage, chunks_storage
+from app.models.chunk_model import Chunk
+from app.models.orphan_model import Orphan, OrphanKind
+from app.models.revision_model import Revision
+from app.database import sessionmanager
+from app.config import get_config
+from app.log import get_log
+
+cfg = get_config()
+log = get_log()
+
+CHUNKS_KEY_INFO = b"hidden chunk boundaries"
+CHUNKS_BATCH_SIZE = 64
+CHUNKS_PREFETCH = 4
+CHUNKS_MANIFESTS_CACHED = 32
+
+
+def _derive_key() -> bytes:
+    """
+    Derives the key for chunk boundaries from the configured Fernet key
+    using HKDF, so the boundaries do not reveal the content to anyone
+    who can list the chunk storage.
+    """
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=None,
+                info=CHUNKS_KEY_INFO)
+    return hkdf.derive(base64.urlsafe_b64decode(cfg.FERNET_KEY))
+
+
+def _boundary_params(key: bytes) -> Tuple[bytes, bytes]:
+    """
+    Returns the translation table that projects every byte value to one
+    bit, with one half of the values mapped to one, and the bit pattern
+    that ends a chunk.
+    """
+    ranked = sorted(range(256), key=lambda x: hmac.new(
+        key, b"byte:%d" % x, hashlib.sha256).digest())
+    ones = set(ranked[:128])
+    table = bytes(1 if x in ones else 0 for x in range(256))
+
+    digest = hmac.new(key, b"pattern", hashlib.sha256).digest()
+    pattern = bytes((digest[i // 8] >> (i % 8)) & 1 for i in range(64))
+    return table, pattern
+
+
+CHUNKS_TABLE, CHUNKS_PATTERN = _boundary_params(_derive_key())
+
+
+class Chunker:
+    """
+    Splits a byte stream into content-defined chunks. Every byte is
+    projected to one keyed bit and a chunk ends where the bits of the
+    last bytes match the keyed pattern, so a boundary only depends on
+    the bytes right before it and an edit shifts the boundaries of the
+    chunks around it alone. The search runs on the projected bits with
+    bytes.find, which keeps the chunker fast without native code. The
+    pattern is one bit longer than the average size requires before the
+    average size and one bit shorter after it, which narrows the spread
+    of the chunk sizes; chunks are never shorter than the minimum size,
+    except for the last one, and never longer than the maximum size.
+    """
+
+    def __init__(self, min_size: int, avg_size: int, max_size: int):
+        bits = max(2, avg_size.bit_length() - 1)
+        self.pattern_small = CHUNKS_PATTERN[:bits + 1]
+        self.pattern_large = CHUNKS_PATTERN[2:bits + 1]
+        self.min_size = max(min_size, len(self.pattern_small))
+        self.avg_size = max(avg_size, self.min_size)
+        self.max_size = max(max_size, self.avg_size)
+        self._buffer = bytearray()
+        self._bits = bytearray()
+
+    def _cut(self) -> int:
+        """Returns the length of the next chunk of the buffer."""
+        size = len(self._buffer)
+        if size <= self.min_size:
+            return size
+
+        pattern = self.pattern_small
+        i = self._bits.find(pattern, self.min_size - len(pattern),
+                            min(self.avg_size, size))
+        if i >= 0:
+            return i + len(pattern)
+
+        pattern = self.pattern_large
+        i = self._bits.find(pattern, self.avg_size - len(pattern) + 1,
+                            min(self.max_size, size))
+        if i >= 0:
+            return i + len(pattern)
+
+        return min(self.max_size, size)
+
+    def _pop(self) -> bytes:
+        length = self._cut()
+        chunk = bytes(self._buffer[:length])
+        del self._buffer[:length]
+        del self._bits[:length]
+        return chunk
+
+    def update(self, data: bytes) -> List[bytes]:
+        """
+        Buffers the data and returns the chunks that are complete. The
+        chunks are cut once the buffer exceeds the maximum size, so the
+        boundary search always sees the whole range of a chunk.
+        """
+        self._buffer.extend(data)
+        self._bits.extend(data.translate(CHUNKS_TABLE))
+        chunks = []
+        while len(self._buffer) > self.max_size:
+            chunks.append(self._pop())
+        return chunks
+
+    def finalize(self) -> List[bytes]:
+        """Returns the chunks of the remaining buffer."""
+        chunks = []
+        while self._buffer:
+            chunks.append(self._pop())
+        return chunks
+
+
+def chunk_encrypt(data: bytes, compression: str = None) -> bytes:
+    """
+    Compresses the chunk with the given compression and encrypts it as
+    a segmented file with a single segment.
+    """
+    if compression == COMPRESSION_ZLIB:
+        data = zlib.compress(data)
+    elif compression:
+        raise ValueError("Compression %s is not supported" % compression)
+
+    encryptor = SegmentEncryptor(segment_size=max(len(data), 1))
+    return encryptor.update(data) + encryptor.finalize()
+
+
+def chunk_decrypt(data: bytes, compression: str = None) -> bytes:
+    """
+    Authenticates and decrypts the stored chunk and decompresses it.
+    Raises SegmentError if the chunk was tampered with or truncated.
+    """
+    decryptor = SegmentDecryptor(data, len(data))
+    data = b"".join([decryptor.decrypt(i, data[
+        decryptor.segment_offset(i):
+        decryptor.segment_offset(i) + decryptor.segment_length(i)])
+        for i in range(decryptor.segments_count)])
+
+    if compression == COMPRESSION_ZLIB:
+        return zlib.decompress(data)
+    elif compression:
+        raise ValueError("Compression %s is not supported" % compression)
+    return data
+
+
+async def chunk_read(chunk_filename: str, compression: str = None) -> bytes:
+    """
+    Reads the chunk from the chunk storage and decrypts it in the crypto
+    pool.
+    """
+    data = b"".join([x async for x in chunks_storage.read_iter(
+        chunk_filename)])
+    return await crypto_run(chunk_decrypt, data, compression)
+
+
+class Manifest:
+    """
+    The list of the chunks of a revision with their plaintext sizes and
+    the plaintext offsets at which they start. Stored as lines of the
+    chunk filename and size, encrypted like a revision file.
+    """
+
+    def __init__(self, chunks: List[Tuple[str, int]]):
+        self.filenames = [filename for filename, _ in chunks]
+        self.offsets = [0]
+        for _, chunk_size in chunks:
+            self.offsets.append(self.offsets[-1] + chunk_size)
+
+    @property
+    def size(self) -> int:
+        return self.offsets[-1]
+
+    def dumps(self) -> bytes:
+        return "".join("%s %s\n" % (
+            filename, self.offsets[i + 1] - self.offsets[i])
+            for i, filename in enumerate(self.filenames)).encode()
+
+    @classmethod
+    def loads(cls, data: bytes) -> "Manifest":
+        chunks = []
+        for line in data.decode().splitlines():
+            filename, chunk_size = line.split(" ")
+            chunks.append((filename, int(chunk_size)))
+        return cls(chunks)
+
+
+manifests_cache = OrderedDict()
+
+
+async def manifest_read(manifest_filename: str,
+                        cached: bool = True) -> Manifest:
+    """
+    Reads and decrypts the manifest from the revision storage. Manifests
+    are content-addressed and never change, so the recently read ones
+    are kept in memory of the worker process.
+    """
+    manifest = manifests_cache.get(manifest_filename) if cached else None
+    if manifest is not None:
+        manifests_cache.move_to_end(manifest_filename)
+        return manifest
+
+    manifest = Manifest.loads(b"".join([
+        chunk async for chunk in FileManager.decrypt_iter(
+            manifest_filename, storage=revisions_storage)]))
+
+    manifests_cache[manifest_filename] = manifest
+    while len(manifests_cache) > CHUNKS_MANIFESTS_CACHED:
+        manifests_cache.popitem(last=False)
+    return manifest
+
+
+async def manifest_iter(manifest_filename: str, start: int = 0,
+                        end: int = None,
+                        compression: str = None) -> AsyncIterator[bytes]:
+    """
+    Yields the plaintext of the chunked revision between the start
+    (inclusive) and the end (exclusive) offsets, chunk by chunk. The
+    next chunks are read ahead concurrently, so the latency of the
+    storage is not paid for every chunk.
+    """
+    manifest = await manifest_read(manifest_filename)
+    end = manifest.size if end is None else min(end, manifest.size)
+    if start >= end:
+        return
+
+    indexes = iter(range(bisect_right(manifest.offsets, start) - 1,
+                         bisect_left(manifest.offsets, end)))
+    tasks = deque()
+    try:
+        for i in indexes:
+            tasks.append((i, asyncio.ensure_future(chunk_read(
+                manifest.filenames[i], compression))))
+            if len(tasks) < CHUNKS_PREFETCH:
+                continue
+
+            i, task = tasks.popleft()
+            yield _slice(await task, manifest.offsets[i], start, end)
+
+        while tasks:
+            i, task = tasks.popleft()
+            yield _slice(await task, manifest.offsets[i], start, end)
+
+    finally:
+        for _, task in tasks:
+            task.cancel()
+
+
+def _slice(data: bytes, offset: int, start: int, end: int) -> bytes:
+    """Returns the part of the chunk at the offset within the range."""
+    return data[max(start - offset, 0):end - offset]
+
+
+async def revision_decrypt_iter(revision, start: int = 0,
+                                end: int = None) -> AsyncIterator[bytes]:
+    """
+    Yields the plaintext of the revision between the start (inclusive)
+    and the end (exclusive) offsets, from its chunks if the revision is
+    chunked, or from its revision file otherwise.
+    """
+    if is_manifest(revision.revision_filename):
+        chunks = manifest_iter(revision.revision_filename, start, end,
+                               revision.revision_compression)
+    else:
+        chunks = FileManager.decrypt_iter(
+            revision.revision_filename, start, end,
+            revision.revision_compression, revisions_storage)
+
+    async for chunk in chunks:
+        yield chunk
+
+
+async def revision_decrypt_file(revision, path: str):
+    """Decrypts the whole revision into the file at the path."""
+    async with io_open(path, "wb") as fn:
+        writer = IOWriter(fn)
+        async for chunk in revision_decrypt_iter(revision):
+            await writer.write(chunk)
+        await writer.flush()
+
+
+async def chunks_reference(revision_filename: str, chunk_filenames: list):
+    """
+    Records the chunks as referenced by the manifest, or refreshes the
+    existing references, and drops the pending deletions of the chunks.
+    A sweep that has already claimed the deletions holds their entries
+    locked, so dropping them waits for the sweep to finish, and chunks
+    deleted by it are found missing afterwards and stored again.
+    """
+    now = int(time.time())
+    async with sessionmanager.async_sessionmaker() as session:
+        chunk_filenames = list(dict.fromkeys(chunk_filenames))
+        await session.execute(
+            pg_insert(Chunk).values([
+                {"created_date": now, "revision_filename": revision_filename,
+                 "chunk_filename": chunk_filename}
+                for chunk_filename in chunk_filenames])
+            .on_conflict_do_update(
+                index_elements=["revision_filename", "chunk_filename"],
+                set_={"created_date": now}))
+        await session.commit()
+
+        await session.execute(
+            delete(Orphan).where(Orphan.orphan_kind == OrphanKind.chunk,
+                                 Orphan.orphan_filename.in_(chunk_filenames)))
+        await session.commit()
+
+
+async def _chunks_store(chunks: List[Tuple[str, bytes]],
+                        compression: str) -> int:
+    """
+    Stores the chunks that are missing in the chunk storage. Returns
+    the encrypted size of the chunks stored.
+    """
+    chunks = dict(chunks)
+    exists = await asyncio.gather(*[
+        chunks_storage.exists(chunk_filename) for chunk_filename in chunks])
+
+    async def store(chunk_filename: str, data: bytes) -> int:
+        data = await crypto_run(chunk_encrypt, data, compression)
+        await chunks_storage.write(chunk_filename, _iter(data))
+        return len(data)
+
+    sizes = await asyncio.gather(*[
+        store(chunk_filename, data)
+        for (chunk_filename, data), chunk_exists in zip(
+            chunks.items(), exists) if not chunk_exists])
+    return sum(sizes)
+
+
+async def _iter(data: bytes) -> AsyncIterator[bytes]:
+    yield data
+
+
+def _chunks_split(chunker: Chunker, content_hash, data: bytes,
+                  compression: str = None) -> List[Tuple[str, bytes]]:
+    """
+    Adds the data to the content hash and to the chunker, or finalizes
+    the chunker if no data is given, and returns the complete chunks
+    with their filenames. Runs in the crypto pool, as the boundary
+    search and the hashing take a while on large buffers.
+    """
+    if data is None:
+        chunks = chunker.finalize()
+    else:
+        content_hash.update(data)
+        chunks = chunker.update(data)
+
+    return [(get_chunk_filename(hashlib.sha256(chunk).hexdigest(),
+                                compression), chunk) for chunk in chunks]
+
+
+async def _owner_release(owner: str):
+    """Deletes the temporary references of the upload."""
+    async with sessionmanager.async_sessionmaker() as session:
+        await session.execute(
+            delete(Chunk).where(Chunk.revision_filename == owner))
+        await session.commit()
+
+
+async def chunks_receive(chunks: AsyncIterator[bytes],
+                         compression: str = None) -> dict:
+    """
+    Receives the plaintext stream into the chunk store and stores the
+    manifest of the chunks in the revision storage. While the stream
+    is received, its chunks are referenced by a temporary owner, which
+    is refreshed if the upload takes longer than the deletion delay, and
+    the references are handed over to the manifest at the end. Returns
+    a dict with the plaintext size, the content hash, the manifest
+    filename, whether the manifest was created by this call, and the
+    stored size, which is the size of the manifest and of the chunks
+    this upload added to the store.
+    """
+    owner = str(uuid.uuid4())
+    chunker = Chunker(cfg.CHUNKS_MIN_SIZE, cfg.CHUNKS_AVG_SIZE,
+                      cfg.CHUNKS_MAX_SIZE)
+    content_hash = hashlib.sha256()
+    original_size, stored_size = 0, 0
+    manifest_chunks, batch = [], []
+    refreshed_date = time.time()
+
+    async def flush(batch: list) -> int:
+        if not batch:
+            return 0
+        manifest_chunks.extend(
+            (chunk_filename, len(data)) for chunk_filename, data in batch)
+        await chunks_reference(owner, [x for x, _ in batch])
+        return await _chunks_store(batch, compression)
+
+    try:
+        async for data in chunks:
+            original_size += len(data)
+            batch.extend(await crypto_run(
+                _chunks_split, chunker, content_hash, data, compression))
+
+            if len(batch) >= CHUNKS_BATCH_SIZE:
+                stored_size += await flush(batch)
+                batch = []
+
+            if time.time() - refreshed_date > cfg.ORPHANS_GC_DELAY / 2:
+                refreshed_date = time.time()
+                async with sessionmanager.async_sessionmaker() as session:
+                    await session.execute(
+                        update(Chunk).where(Chunk.revision_filename == owner)
+                        .values(created_date=int(refreshed_date)))
+                    await session.commit()
+
+        batch.extend(await crypto_run(
+            _chunks_split, chunker, content_hash, None, compression))
+        stored_size += await flush(batch)
+
+        manifest = Manifest(manifest_chunks)
+        manifest_filename = get_manifest_filename(content_hash.hexdigest(),
+                                                  compression)
+        for i in range(0, len(manifest.filenames), cfg.ORPHANS_GC_BATCH_SIZE):
+            await chunks_reference(manifest_filename, manifest.filenames[
+                i:i + cfg.ORPHANS_GC_BATCH_SIZE])
+
+        encryptor = SegmentEncryptor()
+        data = encryptor.update(manifest.dumps()) + encryptor.finalize()
+        async with blob_lock(manifest_filename):
+            created = not await blob_refresh(revisions_storage,
+                                             manifest_filename)
+            if created:
+                await revisions_storage.write(manifest_filename, _iter(data))
+        stored_size += len(data)
+
+    finally:
+        try:
+            await _owner_release(owner)
+        except Exception as e:
+            log.error("Chunks release failed; module=chunk_helper; "
+                      "function=chunks_receive; e=%s;" % str(e))
+
+    return {
+        "original_size": original_size,
+        "content_hash": content_hash.hexdigest(),
+        "revision_filename": manifest_filename,
+        "revision_created": created,
+        "revision_size": stored_size,
+    }
+
+
+async def chunks_referenced(session, chunk_filenames: List[str]) -> set:
+    """
+    Returns the chunks still referenced by a manifest of any revision,
+    or referenced recently by an upload or a manifest whose revision
+    may not be committed yet.
+    """
+    fresh_date = int(time.time()) - cfg.ORPHANS_GC_DELAY
+    async_result = await session.execute(
+        select(Chunk.chunk_filename)
+        .where(Chunk.chunk_filename.in_(chunk_filenames),
+               or_(Chunk.created_date > fresh_date,
+                   exists().where(Revision.revision_filename ==
+                                  Chunk.revision_filename)))
+        .distinct())
+    return set(async_result.scalars().all())
+
+
+async def chunks_release(session, revision_filename: str):
+    """
+    Deletes the references of the deleted manifest, except the recent
+    ones of an upload of the same content in progress, and journals
+    the chunks for deletion in the same transaction.
+    """
+    fresh_date = int(time.time()) - cfg.ORPHANS_GC_DELAY
+    async_result = await session.execute(
+        delete(Chunk)
+        .where(Chunk.revision_filename == revision_filename,
+               Chunk.created_date <= fresh_date)
+        .returning(Chunk.chunk_filename))
+    chunk_filenames = async_result.scalars().all()
+
+    if chunk_filenames:
+        await session.execute(insert(Orphan), [
+            {"orphan_kind": OrphanKind.chunk, "orphan_filename": x}
+            for x in chunk_filenames])
+
+
+async def chunk_references_delete(session, chunk_filename: str):
+    """
+    Deletes the stale references of the deleted chunk, which are left
+    behind by uploads that did not complete.
+    """
+    fresh_date = int(time.time()) - cfg.ORPHANS_GC_DELAY
+    await session.execute(
+        delete(Chunk).where(Chunk.chunk_filename == chunk_filename,
+                            Chunk.created_date <= fresh_date))
@@ -0,0 +1,265 @@
+"""
+Implements the segmented at-rest format used for revision files. The
+plaintext is split into fixed-size segments and each segment is sealed
+separately with AES-GCM, so a revision can be encrypted and decrypted
+as a stream with constant memory and any segment can be read without
+touching the others. The file starts with a small header holding the
+format magic, the segment size and a random nonce prefix; the header is
+authenticated together with every segment, and the last segment carries
+a final flag, so reordered, truncated or extended files are rejected.
+The AES key is derived from the configured Fernet key.
+"""
+
+import os
+import base64
+import struct
+import binascii
+from cryptography.hazmat.primitives import hashes, hmac
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.exceptions import InvalidTag, InvalidSignature
+from app.config import get_config
+
+cfg = get_config()
+
+SEGMENT_MAGIC = b"HDS1"
+SEGMENT_SIZE = 1024 * 64  # 64 KB
+SEGMENT_TAG_SIZE = 16
+SEGMENT_HEADER_FORMAT = ">4sI8s"
+SEGMENT_HEADER_SIZE = struct.calcsize(SEGMENT_HEADER_FORMAT)
+SEGMENT_KEY_INFO = b"hidden revision segments"
+FERNET_HEADER_SIZE = 25  # version, timestamp and IV
+FERNET_HMAC_SIZE = 32
+
+
+def _derive_key() -> bytes:
+    """
+    Derives the AES-256 key for revision segments from the configured
+    Fernet key using HKDF, so no additional secret has to be managed.
+    """
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=None,
+                info=SEGMENT_KEY_INFO)
+    return hkdf.derive(base64.urlsafe_b64decode(cfg.FERNET_KEY))
+
+
+aesgcm = AESGCM(_derive_key())
+
+
+class SegmentError(Exception):
+    """
+    Raised when a segmented file is malformed or any of its segments
+    fails authentication.
+    """
+
+
+def is_segmented(data: bytes) -> bool:
+    """
+    Checks whether the given leading bytes of a file belong to the
+    segmented format. Legacy revisions are single Fernet tokens and
+    never start with the segment magic.
+    """
+    return data[:len(SEGMENT_MAGIC)] == SEGMENT_MAGIC
+
+
+def encrypted_size(plaintext_size: int,
+                   segment_size: int = SEGMENT_SIZE) -> int:
+    """
+    Returns the size of the segmented file produced for a plaintext of
+    the given size. An empty plaintext still produces one final segment.
+    """
+    segments_count = max(1, -(-plaintext_size // segment_size))
+    return (SEGMENT_HEADER_SIZE + plaintext_size +
+            segments_count * SEGMENT_TAG_SIZE)
+
+
+def decrypted_size(file_size: int, segment_size: int = SEGMENT_SIZE) -> int:
+    """
+    Returns the plaintext size of a segmented file of the given size,
+    which is the inverse of encrypted_size.
+    """
+    body_size = max(0, file_size - SEGMENT_HEADER_SIZE)
+    segments_count = max(1, -(-body_size // (segment_size +
+                                             SEGMENT_TAG_SIZE)))
+    return max(0, body_size - segments_count * SEGMENT_TAG_SIZE)
+
+
+class SegmentEncryptor:
+    """
+    Incrementally encrypts a byte stream into the segmented format.
+    Data is fed with update and the remaining buffer is sealed as the
+    final segment by finalize; both return the bytes to be written, the
+    first chunk returned is prefixed with the file header.
+    """
+
+    def __init__(self, segment_size: int = SEGMENT_SIZE):
+        self.segment_size = segment_size
+        self.nonce_prefix = os.urandom(8)
+        self.header = struct.pack(SEGMENT_HEADER_FORMAT, SEGMENT_MAGIC,
+                                  segment_size, self.nonce_prefix)
+        self.segment_index = 0
+        self._buffer = bytearray()
+        self._header_sent = False
+
+    def seal(self, segment_index: int, data: bytes, final: bool) -> bytes:
+        """
+        Seals the segment with the given index. Does not change the
+        state of the encryptor, so segments whose indexes were taken
+        with take can be sealed in any order and in any thread.
+        """
+        nonce = self.nonce_prefix + struct.pack(">I", segment_index)
+        aad = self.header + (b"\x01" if final else b"\x00")
+        return aesgcm.encrypt(nonce, bytes(data), aad)
+
+    def take(self, segments_count: int) -> int:
+        """
+        Reserves the indexes for the given number of segments sealed
+        outside of the encryptor and returns the first of them.
+        """
+        segment_index = self.segment_index
+        self.segment_index += segments_count
+        return segment_index
+
+    def _seal(self, data: bytes, final: bool) -> bytes:
+        return self.seal(self.take(1), data, final)
+
+    def _output(self, sealed: list) -> bytes:
+        if not self._header_sent:
+            sealed.insert(0, self.header)
+            self._header_sent = True
+        return b"".join(sealed)
+
+    def update(self, data: bytes) -> bytes:
+        """
+        Buffers the data and seals every complete segment. A full
+        segment is held back until more data arrives, because only
+        finalize knows which segment is the last one.
+        """
+        self._buffer.extend(data)
+        sealed = []
+        while len(self._buffer) > self.segment_size:
+            sealed.append(self._seal(
+                self._buffer[:self.segment_size], final=False))
+            del self._buffer[:self.segment_size]
+        return self._output(sealed)
+
+    def finalize(self) -> bytes:
+        """
+        Seals the remaining buffer as the final segment and returns it.
+        """
+        sealed = [self._seal(self._buffer, final=True)]
+        self._buffer = bytearray()
+        return self._output(sealed)
+
+
+class SegmentDecryptor:
+    """
+    Decrypts individual segments of a segmented file. The decryptor is
+    built from the file header and the total file size, which together
+    define the position and length of every segment, so segments can be
+    read and decrypted in any order.
+    """
+
+    def __init__(self, header: bytes, file_size: int):
+        if len(header) < SEGMENT_HEADER_SIZE or not is_segmented(header):
+            raise SegmentError("Segment header is invalid")
+
+        self.header = bytes(header[:SEGMENT_HEADER_SIZE])
+        _, self.segment_size, self.nonce_prefix = struct.unpack(
+            SEGMENT_HEADER_FORMAT, self.header)
+
+        body_size = file_size - SEGMENT_HEADER_SIZE
+        if self.segment_size <= 0 or body_size < SEGMENT_TAG_SIZE:
+            raise SegmentError("Segmented file is truncated")
+
+        stride = self.segment_size + SEGMENT_TAG_SIZE
+        self.segments_count = -(-body_size // stride)
+        last_size = body_size - (self.segments_count - 1) * stride
+        if last_size < SEGMENT_TAG_SIZE:
+            raise SegmentError("Segmented file is truncated")
+
+        self.file_size = file_size
+        self.plaintext_size = (
+            body_size - self.segments_count * SEGMENT_TAG_SIZE)
+
+    @property
+    def stride(self) -> int:
+        return self.segment_size + SEGMENT_TAG_SIZE
+
+    def segment_offset(self, segment_index: int) -> int:
+        """Returns the file offset at which the segment starts."""
+        return SEGMENT_HEADER_SIZE + segment_index * self.stride
+
+    def segment_length(self, segment_index: int) -> int:
+        """Returns the length of the sealed segment in the file."""
+        return min(self.stride,
+                   self.file_size - self.segment_offset(segment_index))
+
+    def segment_index(self, plaintext_offset: int) -> int:
+        """Returns the index of the segment holding the given offset."""
+        return plaintext_offset // self.segment_size
+
+    def decrypt(self, segment_index: int, data: bytes) -> bytes:
+        """
+        Authenticates and decrypts the sealed segment with the given
+        index. Raises SegmentError if the segment was tampered with,
+        moved, or the file was truncated after it.
+        """
+        final = segment_index == self.segments_count - 1
+        nonce = self.nonce_prefix + struct.pack(">I", segment_index)
+        aad = self.header + (b"\x01" if final else b"\x00")
+        try:
+            return aesgcm.decrypt(nonce, bytes(data), aad)
+        except InvalidTag:
+            raise SegmentError("Segment %s failed authentication" % (
+                segment_index))
+
+
+class FernetVerifier:
+    """
+    Incrementally verifies a legacy Fernet token read in chunks, so the
+    authenticity of a legacy revision file can be checked without
+    loading it into memory. The token is base64-decoded as it is fed
+    and everything but the trailing HMAC is signed; verify compares the
+    signature once the whole token has been fed.
+    """
+
+    def __init__(self):
+        signing_key = base64.urlsafe_b64decode(cfg.FERNET_KEY)[:16]
+        self.hmac = hmac.HMAC(signing_key, hashes.SHA256())
+        self._encoded = bytearray()
+        self._decoded = bytearray()
+        self._size = 0
+
+    def _feed(self, data: bytes):
+        self._decoded.extend(data)
+        self._size += len(data)
+        signed = len(self._decoded) - FERNET_HMAC_SIZE
+        if signed > 0:
+            self.hmac.update(bytes(self._decoded[:signed]))
+            del self._decoded[:signed]
+
+    def update(self, data: bytes):
+        """Feeds the next chunk of the token."""
+        self._encoded.extend(data.strip())
+        aligned = len(self._encoded) - len(self._encoded) % 4
+        try:
+            self._feed(base64.urlsafe_b64decode(
+                bytes(self._encoded[:aligned])))
+        except binascii.Error:
+            raise SegmentError("Fernet token is malformed")
+        del self._encoded[:aligned]
+
+    def verify(self):
+        """
+        Raises SegmentError if the token is malformed or its signature
+        does not match.
+        """
+        ciphertext_size = self._size - FERNET_HEADER_SIZE - FERNET_HMAC_SIZE
+        if (self._encoded or ciphertext_size <= 0 or
+                ciphertext_size % 16 != 0):
+            raise SegmentError("Fernet token is truncated")
+
+        try:
+            self.hmac.verify(bytes(self._decoded))
+        except InvalidSignature:
+            raise SegmentError("Fernet token failed authentication")
@@ -0,0 +1,222 @@
+"""
+Provides a bounded cache of decrypted revision content, so frequently
+downloaded revisions are not decrypted and decompressed on every
+request. The cache has two tiers: small revisions are kept in memory
+of the worker process, larger ones as plaintext files in a local cache
+directory, which should be on tmpfs or a local SSD and is shared by
+all workers. Both tiers are evicted in least recently used order by
+their total size. Revisions never change, so entries are keyed by the
+revision ID and only removed when the revision is deleted; the
+deletion is broadcast over the eviction channel of the entity cache,
+so every worker drops the revision from its memory tier. Entries are
+filled by full downloads of uncached revisions while they are streamed.
+"""
+
+import os
+import uuid
+from collections import OrderedDict
+from typing import AsyncIterator
+from app.managers.file_manager import FileManager, FILE_TMP_EXTENSION
+from app.helpers.chunk_helper import revision_decrypt_iter
+from app.helpers.io_helper import io_open, IOWriter
+from app.managers.cache_manager import CACHE_CHANNEL
+from app.cache import cache_pool
+from app.config import get_config
+from app.log import get_log
+
+cfg = get_config()
+log = get_log()
+
+CONTENT_CACHE_CHUNK_SIZE = 1024 * 256  # 256 KB
+CONTENT_CACHE_PREFIX = "content:"
+
+
+class ContentCache:
+    """
+    Caches the decrypted content of revisions in memory and in the cache
+    directory. The cache serves the content through the revision_iter
+    method, which falls back to decrypting the revision file and fills
+    the cache on full reads. Counts hits and misses of the process.
+    """
+
+    def __init__(self):
+        self.memory = OrderedDict()
+        self.memory_size = 0
+        self.disk_size = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @property
+    def is_enabled(self) -> bool:
+        return cfg.CONTENT_CACHE_SIZE > 0
+
+    def get_path(self, revision_id: int) -> str:
+        return os.path.join(cfg.CONTENT_CACHE_PATH, str(revision_id))
+
+    def get_stats(self) -> dict:
+        """Returns the hit and miss counters and the tier sizes."""
+        return {
+            "content_cache_memory_hits": self.memory_hits,
+            "content_cache_disk_hits": self.disk_hits,
+            "content_cache_misses": self.misses,
+            "content_cache_memory_size": self.memory_size,
+            "content_cache_disk_size": self.disk_size,
+        }
+
+    def _memory_set(self, revision_id: int, data: bytes):
+        """
+        Puts the data into the memory tier and evicts the least recently
+        used entries above the memory limit.
+        """
+        self.memory[revision_id] = data
+        self.memory_size += len(data)
+
+        while self.memory_size > cfg.CONTENT_CACHE_MEMORY_SIZE:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_size -= len(evicted)
+
+    async def _disk_commit(self, tmp_path: str, revision_id: int):
+        """
+        Moves the completely written file into the cache directory and
+        evicts the least recently used files if the directory exceeds
+        its size limit. Other workers write to the same directory, so
+        the size is counted from the directory itself.
+        """
+        await FileManager.move(tmp_path, self.get_path(revision_id))
+        self.disk_size = await FileManager.evict(
+            cfg.CONTENT_CACHE_PATH, cfg.CONTENT_CACHE_SIZE)
+
+    async def _disk_iter(self, path: str, start: int,
+                         end: int) -> AsyncIterator[bytes]:
+        async with io_open(path, "rb") as fn:
+            await fn.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                chunk = await fn.read(min(CONTENT_CACHE_CHUNK_SIZE,
+                                          remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    async def _fill_iter(self, revision) -> AsyncIterator[bytes]:
+        """
+        Yields the decrypted content of the whole revision and stores it
+        in the memory tier or the cache directory. The entry is only
+        stored when the content has been read completely.
+        """
+        if revision.original_size <= cfg.CONTENT_CACHE_MEMORY_FILE_SIZE:
+            data = bytearray()
+            async for chunk in revision_decrypt_iter(revision):
+                data.extend(chunk)
+                yield chunk
+
+            self._memory_set(revision.id, bytes(data))
+            return
+
+        await FileManager.makedirs(cfg.CONTENT_CACHE_PATH)
+        tmp_path = os.path.join(cfg.CONTENT_CACHE_PATH, "%s.%s%s" % (
+            revision.id, uuid.uuid4(), FILE_TMP_EXTENSION))
+
+        try:
+            async with io_open(tmp_path, "wb") as fn:
+                writer = IOWriter(fn)
+                async for chunk in revision_decrypt_iter(revision):
+                    await writer.write(chunk)
+                    yield chunk
+                await writer.flush()
+
+            await self._disk_commit(tmp_path, revision.id)
+
+        finally:
+            await FileManager.delete(tmp_path)
+
+    async def revision_iter(self, revision, start: int,
+                            end: int) -> AsyncIterator[bytes]:
+        """
+        Yields the decrypted content of the revision between the start
+        (inclusive) and the end (exclusive) offsets, from the cache if
+        possible. Uncached revisions are decrypted, and full reads of
+        revisions within the file size limit fill the cache.
+        """
+        if not self.is_enabled:
+            async for chunk in revision_decrypt_iter(revision, start, end):
+                yield chunk
+            return
+
+        data = self.memory.get(revision.id)
+        if data is not None:
+            self.memory.move_to_end(revision.id)
+            self.memory_hits += 1
+            if data[start:end]:
+                yield data[start:end]
+            return
+
+        path = self.get_path(revision.id)
+        try:
+            chunks = self._disk_iter(path, start, end)
+            chunk = await chunks.__anext__()
+            await FileManager.touch(path)
+
+        except (FileNotFoundError, StopAsyncIteration):
+            chunks = None
+
+        if chunks:
+            self.disk_hits += 1
+            yield chunk
+            async for chunk in chunks:
+                yield chunk
+            return
+
+        self.misses += 1
+        is_full = start == 0 and end >= revision.original_size
+        if is_full and revision.original_size <= cfg.CONTENT_CACHE_FILE_SIZE:
+            async for chunk in self._fill_iter(revision):
+                yield chunk
+
+        else:
+            async for chunk in revision_decrypt_iter(revision, start, end):
+                yield chunk
+
+    def _memory_delete(self, revision_id: int):
+        data = self.memory.pop(revision_id, None)
+        if data is not None:
+            self.memory_size -= len(data)
+
+    def evict(self, key: str):
+        """
+        Removes the revision of the key broadcast by a worker from the
+        memory tier, or all the revisions if the key is an asterisk.
+        Other keys belong to the entity cache and are ignored.
+        """
+        if key == "*":
+            self.memory.clear()
+            self.memory_size = 0
+
+        elif key.startswith(CONTENT_CACHE_PREFIX):
+            revision_id = key[len(CONTENT_CACHE_PREFIX):]
+            if revision_id.isdigit():
+                self._memory_delete(int(revision_id))
+
+    async def delete(self, revision_id: int):
+        """
+        Removes the revision from both tiers of the cache and broadcasts
+        the deletion, so the other workers drop it from their memory
+        tiers. A failed broadcast is logged; the revision then stays in
+        the memory of the other workers until it is evicted.
+        """
+        self._memory_delete(revision_id)
+        await FileManager.delete(self.get_path(revision_id))
+
+        try:
+            await cache_pool.get_client().publish(
+                CACHE_CHANNEL, CONTENT_CACHE_PREFIX + str(revision_id))
+
+        except Exception as e:
+            log.error("Content cache eviction failed; "
+                      "module=content_cache_helper; function=delete; "
+                      "revision_id=%s; e=%s;" % (revision_id, str(e)))
+
+
+content_cache = ContentCache()
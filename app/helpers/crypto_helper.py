@@ -0,0 +1,187 @@
+"""
+Provides the thread pool that encrypts and decrypts revisions outside
+of the event loop. AES-GCM of the cryptography library, zlib and
+SHA-256 release the GIL on large buffers, so the segments of a revision
+are sealed and opened in batches on several cores at once, while the
+output is still produced in order. The number of batches in flight is
+bounded: once it is reached, the stream waits for the oldest batch,
+which holds back reading from the network or the storage.
+"""
+
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+from app.helpers.cipher_helper import (
+    SegmentEncryptor, SegmentDecryptor, SEGMENT_SIZE)
+from app.config import get_config
+
+cfg = get_config()
+
+CRYPTO_BATCH_SIZE = SEGMENT_SIZE * 16  # 1 MB
+
+crypto_pool = ThreadPoolExecutor(max_workers=cfg.CRYPTO_POOL_WORKERS,
+                                 thread_name_prefix="crypto_pool")
+
+
+async def crypto_run(func: Callable, *args):
+    """Runs the function with the given arguments in the pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(crypto_pool, func, *args)
+
+
+class _Batches:
+    """
+    Keeps the batches submitted to the pool in order and returns their
+    results once they are done, waiting for the oldest one while more
+    than twice as many batches as the pool has threads are in flight.
+    When a batch fails, the batches after it are cancelled.
+    """
+
+    def __init__(self):
+        self.pending = deque()
+
+    def submit(self, func: Callable, *args):
+        self.pending.append(asyncio.get_running_loop().run_in_executor(
+            crypto_pool, func, *args))
+
+    async def drain(self, wait: bool = False) -> list:
+        results = []
+        try:
+            while self.pending and (
+                    wait or self.pending[0].done() or
+                    len(self.pending) > cfg.CRYPTO_POOL_WORKERS * 2):
+                results.append(await self.pending.popleft())
+
+        except BaseException:
+            self.cancel()
+            raise
+
+        return results
+
+    def cancel(self):
+        while self.pending:
+            self.pending.popleft().cancel()
+
+
+class ParallelEncryptor:
+    """
+    Encrypts a byte stream into the segmented format like the segment
+    encryptor, sealing the segments in the pool. Both update and
+    finalize return the encrypted bytes that are ready so far, the
+    output of finalize completes the file.
+    """
+
+    def __init__(self, segment_size: int = SEGMENT_SIZE):
+        self.encryptor = SegmentEncryptor(segment_size)
+        self.batches = _Batches()
+        self.buffer = bytearray()
+        self.header = self.encryptor.header
+
+    def _seal(self, segment_index: int, data: bytes, final: bool) -> bytes:
+        segment_size = self.encryptor.segment_size
+        segments = [data[i:i + segment_size]
+                    for i in range(0, len(data), segment_size)] or [b""]
+        return b"".join(self.encryptor.seal(
+            segment_index + i, segment,
+            final and i == len(segments) - 1)
+            for i, segment in enumerate(segments))
+
+    def _submit(self, data: bytes, final: bool):
+        segments_count = max(1, -(-len(data) // self.encryptor.segment_size))
+        self.batches.submit(self._seal, self.encryptor.take(segments_count),
+                            data, final)
+
+    def _output(self, results: list) -> bytes:
+        if self.header:
+            results.insert(0, self.header)
+            self.header = b""
+        return b"".join(results)
+
+    async def update(self, data: bytes) -> bytes:
+        """
+        Buffers the data and submits the complete segments once a batch
+        is collected. The last segment is held back, as finalize alone
+        knows which segment is the final one.
+        """
+        self.buffer += data
+        if len(self.buffer) > CRYPTO_BATCH_SIZE:
+            size = (len(self.buffer) - 1) // self.encryptor.segment_size * (
+                self.encryptor.segment_size)
+            batch, self.buffer = self.buffer[:size], self.buffer[size:]
+            self._submit(batch, final=False)
+        return self._output(await self.batches.drain())
+
+    async def finalize(self) -> bytes:
+        """Seals the remaining buffer and returns the rest of the file."""
+        self._submit(self.buffer, final=True)
+        self.buffer = bytearray()
+        return self._output(await self.batches.drain(wait=True))
+
+    def cancel(self):
+        """Cancels the batches in flight when the stream is abandoned."""
+        self.batches.cancel()
+
+
+class ParallelDecryptor:
+    """
+    Decrypts consecutive segments of a segmented file, starting at the
+    given segment, opening them in the pool. Both update and finalize
+    return the plaintext of the batches that are ready so far; raises
+    SegmentError if a segment fails authentication.
+    """
+
+    def __init__(self, decryptor: SegmentDecryptor, segment_index: int = 0):
+        self.decryptor = decryptor
+        self.segment_index = segment_index
+        self.batches = _Batches()
+        self.buffer = bytearray()
+
+    def _open(self, segment_index: int, data: bytes) -> bytes:
+        plaintext, offset = [], 0
+        while offset < len(data):
+            length = self.decryptor.segment_length(segment_index)
+            plaintext.append(self.decryptor.decrypt(
+                segment_index, data[offset:offset + length]))
+            segment_index += 1
+            offset += length
+        return b"".join(plaintext)
+
+    def _submit(self):
+        size, segments_count = 0, 0
+        while self.segment_index + segments_count < (
+                self.decryptor.segments_count):
+            length = self.decryptor.segment_length(
+                self.segment_index + segments_count)
+            if size + length > len(self.buffer):
+                break
+            size += length
+            segments_count += 1
+
+        if segments_count:
+            batch, self.buffer = self.buffer[:size], self.buffer[size:]
+            self.batches.submit(self._open, self.segment_index, batch)
+            self.segment_index += segments_count
+
+    async def update(self, data: bytes) -> List[bytes]:
+        """
+        Buffers the sealed data and submits the complete segments once
+        a batch is collected.
+        """
+        self.buffer += data
+        if len(self.buffer) >= CRYPTO_BATCH_SIZE:
+            self._submit()
+        return await self.batches.drain()
+
+    async def finalize(self) -> List[bytes]:
+        """
+        Submits the remaining complete segments and returns the rest of
+        the plaintext. An incomplete segment left in the buffer is not
+        decrypted.
+        """
+        self._submit()
+        return await self.batches.drain(wait=True)
+
+    def cancel(self):
+        """Cancels the batches in flight when the stream is abandoned."""
+        self.batches.cancel()
@@ -1,96 +1,292 @@
 """
 Provides asynchronous functionality for image resizing and video frame
 extraction. Image resizing and video frame freezing operations are
-performed synchronously in separate threads to avoid blocking the event
-loop. This module includes functions for resizing images, extracting
-thumbnails from videos, and creating image thumbnails with specified
-dimensions and quality. It integrates with the Pillow library for image
-processing and FFmpeg for video frame extraction.
+performed synchronously in the media process pool to avoid blocking the
+event loop and the file I/O threads. This module includes functions for
+resizing images, probing and extracting thumbnails from videos, and
+creating image thumbnails with specified dimensions and quality. It
+integrates with the Pillow library for image processing and FFmpeg for
+video frame extraction. Images are decoded within a pixel and memory
+budget, at a reduced scale where the format allows it, and FFmpeg
+processes are limited host-wide by slot lock files shared by all
+workers and are killed when they time out.
 """
 
 import os
+import json
+import time
 import uuid
-import asyncio
+import fcntl
+import warnings
+import subprocess
 import ffmpeg
+from contextlib import contextmanager
 from typing import Union
 from PIL import Image
-from app.managers.file_manager import FileManager
+from app.managers.file_manager import FileManager, FILE_TMP_EXTENSION
+from app.helpers.storage_helper import thumbnails_storage
+from app.helpers.media_helper import media_pool
 from app.config import get_config
 
 cfg = get_config()
 
+VIDEO_SLOT_WAIT = 0.1
+VIDEO_THREADS = 1
+IMAGE_REDUCING_GAP = 2
 
-def _image_resize_sync(path: str, width: int, height: int, quality: int):
+# Pillow's own check, which rejects images of twice the limit while
+# they are opened, backs up the budget of the image decoder.
+Image.MAX_IMAGE_PIXELS = cfg.IMAGE_MAX_PIXELS
+
+
+def _image_memory(im: Image.Image) -> int:
+    """Returns the approximate size of the decoded image in bytes."""
+    if im.mode in ["I", "F"] or im.mode.startswith("I;32"):
+        depth = 4
+    elif im.mode.startswith("I;16"):
+        depth = 2
+    else:
+        depth = 1
+    return im.width * im.height * len(im.getbands()) * depth
+
+
+def _image_open_sync(path: str, width: int, height: int) -> Image.Image:
+    """
+    Opens an image for resizing to the specified width and height
+    without decoding it yet. Formats that support it, such as JPEG, are
+    set up to decode at the smallest scale that is still at least twice
+    the target size. Raises DecompressionBombError if the image exceeds
+    the pixel budget or its decoded data exceeds the memory budget,
+    before anything is decoded.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+        im = Image.open(path)
+
+    if im.width * im.height > cfg.IMAGE_MAX_PIXELS:
+        raise Image.DecompressionBombError(
+            "Image size (%s pixels) exceeds limit of %s pixels" % (
+                im.width * im.height, cfg.IMAGE_MAX_PIXELS))
+
+    im.draft(None, (width * IMAGE_REDUCING_GAP, height * IMAGE_REDUCING_GAP))
+
+    if _image_memory(im) > cfg.IMAGE_MAX_MEMORY:
+        raise Image.DecompressionBombError(
+            "Image data (%s bytes) exceeds limit of %s bytes" % (
+                _image_memory(im), cfg.IMAGE_MAX_MEMORY))
+    return im
+
+
+def _image_convert_sync(src_path: str, dst_path: str, width: int,
+                        height: int, image_format: str, quality: int):
     """
-    Resizes an image to the specified width and height and saves it with
-    the given quality. This function opens the image from the provided
-    path, resizes it while maintaining the aspect ratio, and saves it
-    with the specified quality.
+    Resizes an image to fit the specified width and height and saves it
+    to the destination path, which may be the source path, in the given
+    format and quality. The image is converted to the output mode after
+    resizing, so the full-size image is never copied; palette images
+    are converted first, since they cannot be resampled smoothly.
+    Transparency is kept for formats that support it.
     """
-    im = Image.open(path)
-    if im.mode in ["P", "RGBA"]:
+    im = _image_open_sync(src_path, width, height)
+    if im.mode == "P":
+        im = im.convert("RGBA")
+
+    im.thumbnail((width, height), reducing_gap=IMAGE_REDUCING_GAP)
+
+    if image_format == "JPEG" and im.mode not in ["RGB", "L"]:
         im = im.convert("RGB")
+    elif im.mode not in ["RGB", "RGBA", "L"]:
+        im = im.convert("RGBA")
 
-    im.thumbnail((width, height))
-    im.save(path, quality=quality, format="JPEG")
+    im.save(dst_path, quality=quality, format=image_format)
 
 
 async def image_resize(path: str, width: int, height: int, quality: int):
     """
     Asynchronously resizes an image to the specified width and height,
-    and saves it with the given quality. The actual resizing is
-    performed synchronously in a separate thread.
+    and saves it in place as JPEG with the given quality. The actual
+    resizing is performed synchronously in the media process pool.
+    """
+    await media_pool.run(_image_convert_sync, path, path, width, height,
+                         "JPEG", quality)
+
+
+async def image_convert(src_path: str, dst_path: str, width: int,
+                        height: int, image_format: str, quality: int):
+    """
+    Asynchronously resizes an image to fit the specified width and
+    height and saves it to another file in the given format. The actual
+    conversion is performed synchronously in the media process pool.
+    """
+    await media_pool.run(_image_convert_sync, src_path, dst_path, width,
+                         height, image_format, quality)
+
+
+def _image_probe_sync(path: str) -> dict:
+    """
+    Reads the dimensions of an image from its header without decoding
+    the image data.
+    """
+    with Image.open(path) as im:
+        width, height = im.size
+    return {"duration": None, "width": width, "height": height}
+
+
+@contextmanager
+def _video_slot_sync():
     """
-    loop = asyncio.get_event_loop()
-    await loop.run_in_executor(None, _image_resize_sync, path,
-                               width, height, quality)
+    Holds one of the FFmpeg slots shared by all processes of the host
+    while the context is active. A slot is an exclusive lock on one of
+    the slot lock files, which the system releases even if the process
+    is killed. Raises TimeoutError if no slot becomes free within the
+    video timeout.
+    """
+    os.makedirs(cfg.VIDEO_LOCKS_PATH, exist_ok=True)
+    deadline = time.monotonic() + cfg.VIDEO_TIMEOUT
+
+    while True:
+        for slot in range(cfg.VIDEO_WORKERS):
+            fd = os.open(os.path.join(cfg.VIDEO_LOCKS_PATH, "%s.lock" % slot),
+                         os.O_RDWR | os.O_CREAT)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+
+            try:
+                yield
+            finally:
+                os.close(fd)
+            return
+
+        if time.monotonic() > deadline:
+            raise TimeoutError("FFmpeg slot is not available")
+        time.sleep(VIDEO_SLOT_WAIT)
+
+
+def _video_run_sync(args: list) -> bytes:
+    """
+    Runs the FFmpeg or FFprobe command in an FFmpeg slot and returns its
+    output. The process is killed if it exceeds the video timeout.
+    """
+    with _video_slot_sync():
+        try:
+            result = subprocess.run(args, capture_output=True,
+                                    timeout=cfg.VIDEO_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            raise TimeoutError("%s timed out" % args[0])
+
+    if result.returncode != 0:
+        raise ffmpeg.Error(args[0], result.stdout, result.stderr)
+    return result.stdout
+
+
+def _video_probe_sync(path: str) -> dict:
+    """
+    Reads the duration of a video and the dimensions of its first video
+    stream using FFprobe.
+    """
+    output = _video_run_sync([
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "format=duration:stream=width,height",
+        "-of", "json", path])
+
+    data = json.loads(output)
+    stream = (data.get("streams") or [{}])[0]
+    duration = data.get("format", {}).get("duration")
+    return {
+        "duration": float(duration) if duration else None,
+        "width": stream.get("width"),
+        "height": stream.get("height"),
+    }
+
+
+async def media_probe(path: str, mimetype: str) -> dict:
+    """
+    Asynchronously probes an image or a video in the media process pool
+    and returns its duration in seconds, which is None for images, and
+    its width and height.
+    """
+    if FileManager.is_video(mimetype):
+        return await media_pool.run(_video_probe_sync, path)
+    return await media_pool.run(_image_probe_sync, path)
 
 
-def _video_freeze_sync(src_path: str, dst_path: str):
+def get_video_offset(duration: float = None) -> float:
     """
-    Freezes the first frame of a video and saves it as an image
-    file using FFmpeg.
+    Returns the offset of the representative frame of a video with the
+    given duration, which is a configured share of the duration, since
+    the first frames are often black.
     """
-    output = ffmpeg.input(src_path, ss=0).output(dst_path, vframes=1)
-    output.overwrite_output().run(capture_stdout=True, capture_stderr=True)
+    return duration * cfg.VIDEO_SEEK_RATIO if duration else 0
 
 
-async def video_freeze(src_path: str, dst_path: str):
+def _video_freeze_sync(src_path: str, dst_path: str, offset: float = 0):
     """
-    Asynchronously freezes the first frame of a video and saves it as an
-    image file by calling the synchronous _video_freeze_sync function
-    within an executor.
+    Freezes the frame of a video at the given offset and saves it as an
+    image file using FFmpeg. The offset is sought in the input, so only
+    the nearest keyframe is decoded; if nothing is extracted because the
+    offset is past the end, the first frame is taken instead.
     """
-    loop = asyncio.get_event_loop()
-    await loop.run_in_executor(None, _video_freeze_sync, src_path, dst_path)
+    output = ffmpeg.input(src_path, ss=offset, threads=VIDEO_THREADS) \
+        .output(dst_path, vframes=1).overwrite_output()
+    _video_run_sync(output.compile())
 
+    if offset and not os.path.isfile(dst_path):
+        _video_freeze_sync(src_path, dst_path)
 
-async def thumbnail_create(path: str, mimetype: str) -> Union[str, None]:
+
+async def video_freeze(src_path: str, dst_path: str, offset: float = 0):
+    """
+    Asynchronously freezes the frame of a video at the given offset and
+    saves it as an image file by calling the synchronous
+    _video_freeze_sync function in the media process pool.
+    """
+    await media_pool.run(_video_freeze_sync, src_path, dst_path, offset)
+
+
+async def thumbnail_create(path: str, mimetype: str,
+                           thumbnail_filename: str = None,
+                           offset: float = 0) -> Union[str, None]:
     """
     Generates a thumbnail for the given file based on its MIME type,
-    creating an image thumbnail from images or extracting a frame from
-    videos, and resizing it to specified dimensions. Returns the
-    filename of the created thumbnail if successful, otherwise returns
-    None. Handles both image and video files, with appropriate error
-    handling and logging for issues during thumbnail creation.
+    creating an image thumbnail from images or extracting the frame at
+    the given offset from videos, and resizing it to specified
+    dimensions. The thumbnail is prepared in a temporary file and stored
+    under the given filename, or a random one if no filename is given.
+    Returns the filename of the created thumbnail if successful,
+    otherwise returns None. Handles both image and video files, with
+    appropriate error handling and logging for issues during thumbnail
+    creation.
     """
     is_image = FileManager.is_image(mimetype)
     is_video = FileManager.is_video(mimetype) if not is_image else False
 
-    thumbnail_filename = None
-    if is_image or is_video:
+    if not is_image and not is_video:
+        return None
 
+    if not thumbnail_filename:
         thumbnail_filename = str(uuid.uuid4()) + cfg.THUMBNAILS_EXTENSION
-        thumbnail_path = os.path.join(
-            cfg.THUMBNAILS_BASE_PATH, thumbnail_filename)
 
-        if is_image:
-            await FileManager.copy(path, thumbnail_path)
+    await FileManager.makedirs(cfg.THUMBNAILS_BASE_PATH)
+    tmp_path = os.path.join(cfg.THUMBNAILS_BASE_PATH, str(uuid.uuid4()) +
+                            FILE_TMP_EXTENSION + cfg.THUMBNAILS_EXTENSION)
+
+    try:
+        # Images are resized from the source file without a copy.
+        source_path = path
+        if is_video:
+            await video_freeze(path, tmp_path, offset)
+            source_path = tmp_path
 
-        elif is_video:
-            await video_freeze(path, thumbnail_path)
+        await image_convert(source_path, tmp_path, cfg.THUMBNAIL_WIDTH,
+                            cfg.THUMBNAIL_HEIGHT, "JPEG",
+                            cfg.THUMBNAIL_QUALITY)
+        await thumbnails_storage.put(thumbnail_filename, tmp_path)
 
-        await image_resize(thumbnail_path, cfg.THUMBNAIL_WIDTH,
-                           cfg.THUMBNAIL_HEIGHT, cfg.THUMBNAIL_QUALITY)
+    except Exception:
+        await FileManager.delete(tmp_path)
+        raise
 
     return thumbnail_filename
@@ -0,0 +1,134 @@
+"""
+Provides the thread pool that runs the blocking file I/O of the file
+manager and the local storage. Every read and write of aiofiles is a
+hop to a thread, so file data is passed to the pool in chunks that
+grow from the minimal to the maximal chunk size as a stream goes on:
+small files do not allocate large buffers, while large files cost one
+hop per several megabytes instead of one per a few kilobytes. The pool
+is not shared with the default executor of the event loop, and its
+queue depth and latencies are reported by the telemetry.
+"""
+
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterator
+import aiofiles
+from app.config import get_config
+
+cfg = get_config()
+
+
+class IOPool(ThreadPoolExecutor):
+    """
+    Runs the file I/O jobs in a bounded pool of threads and counts the
+    jobs waiting for a thread, the running and the completed jobs, and
+    the time the jobs spent waiting and running.
+    """
+
+    def __init__(self):
+        super().__init__(max_workers=cfg.IO_POOL_WORKERS,
+                         thread_name_prefix="io_pool")
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_time = 0.0
+        self.run_time = 0.0
+
+    def submit(self, func: Callable, /, *args, **kwargs) -> Future:
+        submitted = time.monotonic()
+
+        def job():
+            started = time.monotonic()
+            with self.lock:
+                self.queued -= 1
+                self.running += 1
+                self.wait_time += started - submitted
+
+            failed = True
+            try:
+                result = func(*args, **kwargs)
+                failed = False
+                return result
+
+            finally:
+                with self.lock:
+                    self.running -= 1
+                    self.completed += 1
+                    self.failed += failed
+                    self.run_time += time.monotonic() - started
+
+        with self.lock:
+            self.queued += 1
+        try:
+            return super().submit(job)
+
+        except Exception:
+            with self.lock:
+                self.queued -= 1
+            raise
+
+    def get_stats(self) -> dict:
+        """
+        Returns the queue depth, the job counters and the average time
+        in milliseconds the jobs waited for a thread and ran.
+        """
+        with self.lock:
+            completed = max(self.completed, 1)
+            return {
+                "io_pool_queued": self.queued,
+                "io_pool_running": self.running,
+                "io_pool_completed": self.completed,
+                "io_pool_failed": self.failed,
+                "io_pool_wait_avg": round(
+                    self.wait_time * 1000 / completed, 3),
+                "io_pool_run_avg": round(
+                    self.run_time * 1000 / completed, 3),
+            }
+
+
+io_pool = IOPool()
+
+
+def io_open(path: str, mode: str):
+    """Opens the file with aiofiles, running its I/O in the pool."""
+    return aiofiles.open(path, mode=mode, executor=io_pool)
+
+
+def io_chunk_sizes() -> Iterator[int]:
+    """
+    Yields the sizes of the consecutive chunks of a stream, doubling
+    from the minimal chunk size up to the maximal one.
+    """
+    chunk_size = cfg.IO_CHUNK_MIN_SIZE
+    while True:
+        yield chunk_size
+        chunk_size = min(chunk_size * 2, cfg.IO_CHUNK_MAX_SIZE)
+
+
+class IOWriter:
+    """
+    Collects the data written to the file opened with io_open and
+    writes it to the file in chunks of growing size, so a stream of
+    small pieces does not cost a thread hop per piece. The remaining
+    data is written by flush.
+    """
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.buffer = bytearray()
+        self.chunk_sizes = io_chunk_sizes()
+        self.chunk_size = next(self.chunk_sizes)
+
+    async def write(self, data: bytes):
+        self.buffer += data
+        if len(self.buffer) >= self.chunk_size:
+            await self.flush()
+            self.chunk_size = next(self.chunk_sizes)
+
+    async def flush(self):
+        if self.buffer:
+            buffer, self.buffer = self.buffer, bytearray()
+            await self.fn.write(buffer)
@@ -0,0 +1,121 @@
+"""
+Provides the process pool that runs media processing, such as image
+resizing and video frame extraction, outside of the worker process.
+Pillow and FFmpeg jobs are CPU-bound and partly hold the GIL, so they
+do not run in the default thread pool, which is shared with file I/O.
+The pool has its own concurrency limit, jobs beyond it wait in a queue
+of the worker process, and every job has a timeout. Queue depth and
+job counters of the process are reported by the telemetry.
+"""
+
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable
+from app.config import get_config
+from app.log import get_log
+
+cfg = get_config()
+log = get_log()
+
+
+class MediaPool:
+    """
+    Runs media jobs in a bounded pool of spawned processes. At most as
+    many jobs as the pool has processes are submitted at once, so a
+    job never waits inside the pool, where its timeout could not be
+    told apart from the wait. A job that times out cannot be cancelled
+    in its process, so the pool is killed and started again, failing
+    the other running jobs as well; the same applies when a process of
+    the pool dies.
+    """
+
+    def __init__(self):
+        self.executor = None
+        self.semaphore = asyncio.Semaphore(cfg.MEDIA_POOL_WORKERS)
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        """
+        Returns the process pool, which is started on first use. The
+        processes are spawned rather than forked, since the worker
+        process already runs an event loop and threads.
+        """
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=cfg.MEDIA_POOL_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"))
+        return self.executor
+
+    def get_stats(self) -> dict:
+        """Returns the queue depth and the job counters."""
+        return {
+            "media_pool_queued": self.queued,
+            "media_pool_running": self.running,
+            "media_pool_completed": self.completed,
+            "media_pool_failed": self.failed,
+            "media_pool_timeouts": self.timeouts,
+        }
+
+    def shutdown(self, kill: bool = False):
+        """
+        Shuts the pool down; with kill, its processes are terminated
+        instead of finishing their jobs. The next job starts a new pool.
+        """
+        executor, self.executor = self.executor, None
+        if executor is None:
+            return
+
+        if kill:
+            for process in list(executor._processes.values()):
+                process.kill()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    async def run(self, func: Callable, *args):
+        """
+        Runs the picklable function with the given arguments in the pool
+        and returns its result. Waits for a free slot first; raises
+        asyncio.TimeoutError if the job exceeds the job timeout.
+        """
+        self.queued += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.queued -= 1
+
+        self.running += 1
+        try:
+            loop = asyncio.get_event_loop()
+            result = await asyncio.wait_for(
+                loop.run_in_executor(self.get_executor(), func, *args),
+                cfg.MEDIA_POOL_TIMEOUT)
+            self.completed += 1
+            return result
+
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            log.error("Media job timed out; module=media_helper; "
+                      "function=run; func=%s;" % func.__name__)
+            self.shutdown(kill=True)
+            raise
+
+        except BrokenProcessPool:
+            self.failed += 1
+            self.shutdown(kill=True)
+            raise
+
+        except Exception:
+            self.failed += 1
+            raise
+
+        finally:
+            self.running -= 1
+            self.semaphore.release()
+
+
+media_pool = MediaPool()
@@ -0,0 +1,168 @@
+"""
+Provides streaming parsing of multipart/form-data uploads. Unlike the
+UploadFile dependency, which spools the whole request body to a
+temporary file before the router runs, the MultipartStream class reads
+the request stream directly and hands out the data of the file part
+chunk by chunk while it arrives, so an upload can be processed in a
+single pass.
+"""
+
+from collections import deque
+from typing import AsyncIterator
+from fastapi import Request, status
+from multipart.multipart import MultipartParser, parse_options_header
+from app.errors import E
+from app.constants import LOC_BODY, ERR_VALUE_INVALID, ERR_VALUE_EMPTY
+
+DEFAULT_MIMETYPE = "application/octet-stream"
+
+# OpenAPI description of the multipart body, since routers that read
+# the request stream directly do not declare the file as a parameter.
+MULTIPART_FILE_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {
+                        "file": {"type": "string", "format": "binary"},
+                    },
+                },
+            },
+        },
+    },
+}
+
+PART_BEGIN, PART_DATA, PART_END = "part_begin", "part_data", "part_end"
+HEADER_FIELD, HEADER_VALUE, HEADER_END = (
+    "header_field", "header_value", "header_end")
+HEADERS_FINISHED, END = "headers_finished", "end"
+
+
+class MultipartStream:
+    """
+    Reads a multipart/form-data request stream and exposes the first
+    part with the given field name as an async iterator of data chunks.
+    Call open to read up to the headers of the file part, which sets
+    the filename and content_type attributes, then iterate read_chunks
+    to receive the file data; fields other than the file are skipped.
+    """
+
+    def __init__(self, request: Request, field_name: str = "file"):
+        """
+        Initializes the parser from the request content type. Raises a
+        422 error if the request is not a multipart request.
+        """
+        self.field_name = field_name
+        self.filename = None
+        self.content_type = None
+
+        content_type, params = parse_options_header(
+            request.headers.get("Content-Type", ""))
+        boundary = params.get(b"boundary")
+        if content_type != b"multipart/form-data" or not boundary:
+            raise E([LOC_BODY, field_name], None, ERR_VALUE_INVALID,
+                    status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+        self._stream = request.stream()
+        self._events = deque()
+        self._ended = False
+        self._parser = MultipartParser(boundary, callbacks={
+            "on_part_begin": self._on(PART_BEGIN),
+            "on_part_data": self._on_data(PART_DATA),
+            "on_part_end": self._on(PART_END),
+            "on_header_field": self._on_data(HEADER_FIELD),
+            "on_header_value": self._on_data(HEADER_VALUE),
+            "on_header_end": self._on(HEADER_END),
+            "on_headers_finished": self._on(HEADERS_FINISHED),
+            "on_end": self._on(END),
+        })
+
+    def _on(self, event: str):
+        return lambda: self._events.append((event, b""))
+
+    def _on_data(self, event: str):
+        return lambda data, start, end: self._events.append(
+            (event, bytes(data[start:end])))
+
+    async def _next_event(self):
+        """
+        Returns the next parser event, feeding the parser with the
+        request stream as long as no events are pending.
+        """
+        while not self._events:
+            if self._ended:
+                return END, b""
+
+            try:
+                chunk = await self._stream.__anext__()
+            except StopAsyncIteration:
+                chunk = b""
+
+            if chunk:
+                self._parser.write(chunk)
+            else:
+                self._parser.finalize()
+                self._ended = True
+
+        return self._events.popleft()
+
+    async def open(self):
+        """
+        Reads the request stream up to the end of the headers of the
+        file part. Raises a 422 error if the body has no such part.
+        """
+        headers, field, value = {}, b"", b""
+
+        while True:
+            event, data = await self._next_event()
+
+            if event == PART_BEGIN:
+                headers, field, value = {}, b"", b""
+
+            elif event == HEADER_FIELD:
+                field += data
+
+            elif event == HEADER_VALUE:
+                value += data
+
+            elif event == HEADER_END:
+                headers[field.lower()] = value
+                field, value = b"", b""
+
+            elif event == HEADERS_FINISHED:
+                _, options = parse_options_header(
+                    headers.get(b"content-disposition", b""))
+                name = options.get(b"name", b"").decode()
+                filename = options.get(b"filename")
+
+                if name == self.field_name and filename:
+                    self.filename = filename.decode()
+                    self.content_type = headers.get(
+                        b"content-type", b"").decode() or DEFAULT_MIMETYPE
+                    return
+
+            elif event == END:
+                raise E([LOC_BODY, self.field_name], None, ERR_VALUE_EMPTY,
+                        status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    async def read_chunks(self) -> AsyncIterator[bytes]:
+        """
+        Yields the data of the file part as it arrives and stops at the
+        end of the part. Raises a 422 error if the body is truncated.
+        """
+        while True:
+            event, data = await self._next_event()
+
+            if event == PART_DATA and data:
+                yield data
+
+            elif event == PART_END:
+                return
+
+            elif event == END:
+                raise E([LOC_BODY, self.field_name], None,
+                        ERR_VALUE_INVALID,
+                        status.HTTP_422_UNPROCESSABLE_ENTITY)
@@ -0,0 +1,331 @@
+"""
+Provides the garbage collector for revision, thumbnail and chunk files
+that are no longer referenced by any revision. Files to delete are
+recorded in the orphans journal in the same transaction as the
+database change that releases them, and the sweeper started with the
+application deletes them in batches once the change is committed; the
+chunks of a chunk manifest are journaled when the manifest is deleted.
+Files are shared by revisions with identical content, so the sweeper
+deletes a file only if no revision references it at the time of the
+sweep and it has not been stored again recently by an upload that is
+not committed yet; the check and the deletion hold the lock that
+uploads take to store the file. Files that were never journaled, such
+as those left behind by crashed workers, are found by the
+reconciliation scan, which compares the file storages with the
+revisions table from time to time and journals the unreferenced files.
+"""
+
+import os
+import time
+import fcntl
+import asyncio
+from typing import List, Optional
+from sqlalchemy import select, insert, update, delete
+from app.managers.file_manager import (
+    FileManager, FILE_TMP_EXTENSION, FILE_TMP_EXPIRES)
+from app.managers.storage_manager import StorageStat
+from app.helpers.storage_helper import (
+    revisions_storage, thumbnails_storage, chunks_storage)
+from app.helpers.chunk_helper import (
+    chunks_referenced, chunks_release, chunk_references_delete)
+from app.helpers.blob_helper import is_manifest, blob_lock
+from app.helpers.rendition_helper import renditions_delete
+from app.helpers.content_cache_helper import content_cache
+from app.models.orphan_model import Orphan, OrphanKind
+from app.models.revision_model import Revision
+from app.database import sessionmanager
+from app.config import get_config
+from app.log import get_log
+
+cfg = get_config()
+log = get_log()
+
+ORPHANS_RECONCILE_FILENAME = ".reconciled"
+
+ORPHAN_COLUMNS = {
+    OrphanKind.revision: Revision.revision_filename,
+    OrphanKind.thumbnail: Revision.thumbnail_filename,
+}
+
+ORPHAN_STORAGES = {
+    OrphanKind.revision: revisions_storage,
+    OrphanKind.thumbnail: thumbnails_storage,
+    OrphanKind.chunk: chunks_storage,
+}
+
+ORPHAN_BASE_PATHS = {
+    OrphanKind.revision: cfg.REVISIONS_BASE_PATH,
+    OrphanKind.thumbnail: cfg.THUMBNAILS_BASE_PATH,
+    OrphanKind.chunk: cfg.CHUNKS_BASE_PATH,
+}
+
+ORPHAN_EXTENSIONS = {
+    OrphanKind.revision: cfg.REVISIONS_EXTENSION,
+    OrphanKind.thumbnail: cfg.THUMBNAILS_EXTENSION,
+    OrphanKind.chunk: cfg.REVISIONS_EXTENSION,
+}
+
+
+async def orphans_insert(orphan_kind: OrphanKind, filenames: List[str]):
+    """
+    Journals the files for deletion in a separate database session. Used
+    for files whose revisions were never committed, so there is no
+    transaction to journal them in, and by the reconciliation scan.
+    """
+    if not filenames:
+        return
+
+    async with sessionmanager.async_sessionmaker() as session:
+        await session.execute(insert(Orphan), [
+            {"orphan_kind": orphan_kind, "orphan_filename": filename}
+            for filename in filenames])
+        await session.commit()
+
+
+async def _referenced(session, orphan_kind: OrphanKind,
+                      filenames: List[str]) -> set:
+    """Returns the filenames still referenced by any revision."""
+    if orphan_kind == OrphanKind.chunk:
+        return await chunks_referenced(session, filenames)
+
+    column = ORPHAN_COLUMNS[orphan_kind]
+    async_result = await session.execute(
+        select(column).where(column.in_(filenames)).distinct())
+    return set(async_result.scalars().all())
+
+
+async def orphans_sweep() -> int:
+    """
+    Claims a batch of journal entries older than the deletion delay and
+    deletes their files, unless the files are referenced again. Files
+    modified within the delay may belong to an upload in progress, so
+    their entries are postponed. Entries are locked while the batch is
+    processed and locked entries are skipped, so concurrent sweepers
+    never process the same entries. Returns the number of claimed
+    entries.
+    """
+    now = int(time.time())
+    async with sessionmanager.async_sessionmaker() as session:
+        async_result = await session.execute(
+            select(Orphan)
+            .where(Orphan.created_date <= now - cfg.ORPHANS_GC_DELAY)
+            .order_by(Orphan.id)
+            .limit(cfg.ORPHANS_GC_BATCH_SIZE)
+            .with_for_update(skip_locked=True))
+        orphans = async_result.scalars().all()
+
+        done_ids, postponed_ids = [], []
+        deleted_count, deleted_size = 0, 0
+
+        for orphan_kind, storage in ORPHAN_STORAGES.items():
+            kind_orphans = [orphan for orphan in orphans
+                            if orphan.orphan_kind == orphan_kind]
+            if not kind_orphans:
+                continue
+
+            referenced = await _referenced(
+                session, orphan_kind,
+                [orphan.orphan_filename for orphan in kind_orphans])
+
+            for orphan in kind_orphans:
+                if orphan.revision_id is not None:
+                    await content_cache.delete(orphan.revision_id)
+
+                if orphan.orphan_filename in referenced:
+                    done_ids.append(orphan.id)
+                    continue
+
+                # An upload storing the file holds the lock, and the
+                # modification time is checked under it, so a file
+                # stored again meanwhile is never deleted.
+                lock = blob_lock(orphan.orphan_filename)
+                if not await lock.acquire(blocking=False):
+                    postponed_ids.append(orphan.id)
+                    continue
+
+                try:
+                    stat = await storage.stat(orphan.orphan_filename)
+                    if stat and stat.mtime > now - cfg.ORPHANS_GC_DELAY:
+                        postponed_ids.append(orphan.id)
+                        continue
+
+                    await storage.delete(orphan.orphan_filename)
+                    if orphan_kind == OrphanKind.thumbnail:
+                        await renditions_delete(orphan.orphan_filename)
+
+                    elif orphan_kind == OrphanKind.chunk:
+                        await chunk_references_delete(
+                            session, orphan.orphan_filename)
+
+                    elif is_manifest(orphan.orphan_filename):
+                        await chunks_release(session, orphan.orphan_filename)
+
+                except Exception as e:
+                    log.error("File deletion failed; module=orphan_helper; "
+                              "function=orphans_sweep; filename=%s; "
+                              "e=%s;" % (orphan.orphan_filename, str(e)))
+                    continue
+
+                finally:
+                    await lock.release()
+
+                done_ids.append(orphan.id)
+                if stat:
+                    deleted_count += 1
+                    deleted_size += stat.size
+
+        if done_ids:
+            await session.execute(
+                delete(Orphan).where(Orphan.id.in_(done_ids)))
+
+        if postponed_ids:
+            await session.execute(
+                update(Orphan).where(Orphan.id.in_(postponed_ids))
+                .values(created_date=now))
+
+        await session.commit()
+
+    if deleted_count:
+        log.info("Orphans deleted; module=orphan_helper; "
+                 "function=orphans_sweep; files=%s; size=%s;" % (
+                     deleted_count, deleted_size))
+    return len(orphans)
+
+
+def _tmp_files_sync(path: str) -> List[str]:
+    """
+    Returns the paths of the temporary files in the directory that are
+    older than the expiration time of temporary files.
+    """
+    expires = time.time() - FILE_TMP_EXPIRES
+    with os.scandir(path) as entries:
+        return [entry.path for entry in entries
+                if FILE_TMP_EXTENSION in entry.name and
+                entry.is_file(follow_symlinks=False) and
+                entry.stat().st_mtime < expires]
+
+
+async def _reconcile_files(orphan_kind: OrphanKind,
+                           files: List[StorageStat]) -> int:
+    """
+    Journals the files that are not referenced by any revision and are
+    not journaled yet. Files modified within the deletion delay are
+    skipped. Returns the number of files journaled.
+    """
+    now = time.time()
+    filenames = [file.key for file in files
+                 if file.key.endswith(ORPHAN_EXTENSIONS[orphan_kind]) and
+                 file.mtime < now - cfg.ORPHANS_GC_DELAY]
+
+    orphan_filenames = []
+    for i in range(0, len(filenames), cfg.ORPHANS_GC_BATCH_SIZE):
+        batch = filenames[i:i + cfg.ORPHANS_GC_BATCH_SIZE]
+
+        async with sessionmanager.async_sessionmaker() as session:
+            referenced = await _referenced(session, orphan_kind, batch)
+            async_result = await session.execute(
+                select(Orphan.orphan_filename)
+                .where(Orphan.orphan_filename.in_(batch)))
+            referenced.update(async_result.scalars().all())
+
+        orphan_filenames += [x for x in batch if x not in referenced]
+
+    await orphans_insert(orphan_kind, orphan_filenames)
+    return len(orphan_filenames)
+
+
+async def orphans_reconcile(orphan_kind: OrphanKind) -> int:
+    """
+    Lists the storage of the files of the kind and journals the files
+    that no revision references, and deletes the stale temporary files
+    left in the local directory of the kind. The storage is listed in
+    batches, so memory usage does not depend on the number of files.
+    Returns the number of files journaled.
+    """
+    base_path = ORPHAN_BASE_PATHS[orphan_kind]
+    loop = asyncio.get_event_loop()
+
+    if os.path.isdir(base_path):
+        for path in await loop.run_in_executor(
+                None, _tmp_files_sync, base_path):
+            await FileManager.delete(path)
+
+    journaled = 0
+    async for files in ORPHAN_STORAGES[orphan_kind].list_iter():
+        journaled += await _reconcile_files(orphan_kind, files)
+
+    if journaled:
+        log.info("Orphans found; module=orphan_helper; "
+                 "function=orphans_reconcile; orphan_kind=%s; files=%s;" % (
+                     orphan_kind.value, journaled))
+    return journaled
+
+
+def _reconcile_lock_sync(marker_path: str) -> Optional[int]:
+    """
+    Opens and locks the marker file and returns its descriptor if the
+    reconciliation scan is due, or returns None if another worker holds
+    the lock or the last scan is recent.
+    """
+    try:
+        fd = os.open(marker_path, os.O_RDWR | os.O_CREAT | os.O_EXCL)
+        # The first scan runs right away.
+        os.utime(fd, (0, 0))
+    except FileExistsError:
+        fd = os.open(marker_path, os.O_RDWR)
+
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        if os.fstat(fd).st_mtime <= time.time() - (
+                cfg.ORPHANS_RECONCILE_INTERVAL):
+            return fd
+
+    except BlockingIOError:
+        pass
+
+    os.close(fd)
+    return None
+
+
+async def orphans_reconcile_all():
+    """
+    Runs the reconciliation scan of the revision, thumbnail and chunk
+    files if the last scan on this host is older than the reconciliation
+    interval. The workers of the host share the files, so the scan is
+    guarded by an exclusive lock on the marker file in the revisions
+    directory, and the time of the last scan is the modification time
+    of the marker. The marker is opened and locked in the thread pool.
+    """
+    marker_path = os.path.join(cfg.REVISIONS_BASE_PATH,
+                               ORPHANS_RECONCILE_FILENAME)
+    loop = asyncio.get_event_loop()
+    fd = await loop.run_in_executor(None, _reconcile_lock_sync, marker_path)
+    if fd is None:
+        return
+
+    try:
+        for orphan_kind in ORPHAN_STORAGES:
+            await orphans_reconcile(orphan_kind)
+        await FileManager.touch(marker_path)
+
+    finally:
+        await loop.run_in_executor(None, os.close, fd)
+
+
+async def orphans_gc():
+    """
+    Sweeps the orphans journal and runs the reconciliation scan when it
+    is due. Started with the application; every worker runs it, and the
+    sweeper continues without waiting while full batches are claimed.
+    """
+    while True:
+        try:
+            if await orphans_sweep() >= cfg.ORPHANS_GC_BATCH_SIZE:
+                continue
+            await orphans_reconcile_all()
+
+        except Exception as e:
+            log.error("Orphans GC failed; module=orphan_helper; "
+                      "function=orphans_gc; e=%s;" % str(e))
+
+        await asyncio.sleep(cfg.ORPHANS_GC_INTERVAL)
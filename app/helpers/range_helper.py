@@ -0,0 +1,143 @@
+"""
+Provides HTTP Range support for revision downloads. Includes functions
+for evaluating the Range and If-Range request headers against a
+revision, and for building a streaming response that decrypts only the
+requested part of the revision file, so video players can seek and
+download managers can resume without fetching the whole file again.
+"""
+
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Tuple, Union
+from fastapi import status
+from fastapi.responses import StreamingResponse
+from app.helpers.content_cache_helper import content_cache
+from app.errors import E
+from app.config import get_config
+from app.log import get_log
+from app.constants import LOC_HEADER, ERR_RANGE_UNSATISFIABLE
+
+cfg = get_config()
+log = get_log()
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def get_etag(revision) -> str:
+    """
+    Returns the strong entity tag of the revision. Revision content
+    never changes, so the tag only depends on the revision identity.
+    """
+    return '"%s-%s"' % (revision.id, revision.created_date)
+
+
+def get_last_modified(revision) -> str:
+    """Returns the HTTP date on which the revision was created."""
+    return formatdate(revision.created_date, usegmt=True)
+
+
+def _if_range_matches(if_range: str, revision) -> bool:
+    """
+    Checks the If-Range validator, which is either an entity tag or an
+    HTTP date, against the current state of the revision.
+    """
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range == get_etag(revision)
+
+    try:
+        return (int(parsedate_to_datetime(if_range).timestamp()) ==
+                revision.created_date)
+    except (TypeError, ValueError):
+        return False
+
+
+def get_byte_range(revision, range_header: str = None,
+                   if_range_header: str = None
+                   ) -> Union[Tuple[int, int], None]:
+    """
+    Evaluates the Range and If-Range headers for the revision and
+    returns the requested (start, end) byte positions, both inclusive,
+    or None when the whole revision should be returned. Malformed and
+    multi-part ranges are ignored as permitted by RFC 9110; a range
+    that cannot be satisfied raises a 416 error.
+    """
+    size = revision.original_size
+    if not range_header:
+        return None
+
+    elif if_range_header and not _if_range_matches(if_range_header,
+                                                   revision):
+        return None
+
+    match = RANGE_PATTERN.match(range_header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+
+    first, last = match.groups()
+    if not first:
+        start, end = max(0, size - int(last)), size - 1
+        if int(last) == 0:
+            start = size
+
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+
+    if start >= size:
+        raise E([LOC_HEADER, "Range"], range_header,
+                ERR_RANGE_UNSATISFIABLE,
+                status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers={"Content-Range": "bytes */%s" % size})
+
+    return start, end
+
+
+async def _stream(revision, start: int, end: int):
+    """
+    Yields the decrypted chunks of the revision, from the content cache
+    if possible, and logs the error if decryption fails after the
+    response has already started.
+    """
+    try:
+        async for chunk in content_cache.revision_iter(revision, start, end):
+            yield chunk
+
+    except Exception as e:
+        log.error("Stream failed; module=range_helper; function=_stream; "
+                  "filename=%s; e=%s;" % (revision.revision_filename, str(e)))
+        raise e
+
+
+def revision_response(revision, byte_range: Tuple[int, int] = None
+                      ) -> StreamingResponse:
+    """
+    Builds a streaming response for the revision that decrypts the file
+    incrementally. With a byte range the response is a 206 Partial
+    Content response for that range, otherwise the whole revision is
+    returned with a 200 response.
+    """
+    size = revision.original_size
+    headers = {
+        "Content-Disposition": f"attachment; filename={revision.original_filename}",  # noqa E501
+        "Accept-Ranges": "bytes",
+        "ETag": get_etag(revision),
+        "Last-Modified": get_last_modified(revision),
+    }
+
+    if byte_range:
+        start, end = byte_range
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+        headers["Content-Range"] = "bytes %s-%s/%s" % (start, end, size)
+
+    else:
+        start, end = 0, size - 1
+        status_code = status.HTTP_200_OK
+
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        _stream(revision, start, end + 1),
+        status_code=status_code, headers=headers,
+        media_type=revision.original_mimetype)
@@ -0,0 +1,204 @@
+"""
+Provides thumbnail renditions of revisions in several size presets and
+image formats. Renditions are created lazily on the first request in
+the best format the client accepts. The original revision file, or its
+representative frame for videos, is decoded only once per revision into
+a lossless master image of the largest preset, and every preset and
+format is derived from the master. Masters and renditions are kept in
+the renditions cache
+directory, which is evicted in least recently used order once it
+exceeds its size limit. Renditions are named after the thumbnail of the
+revision, so revisions with identical content share them, and they
+never change, which lets clients cache them indefinitely.
+"""
+
+import os
+import uuid
+import asyncio
+import weakref
+from PIL import features
+from app.managers.file_manager import FileManager, FILE_TMP_EXTENSION
+from app.helpers.image_helper import (
+    image_convert, video_freeze, get_video_offset)
+from app.helpers.chunk_helper import revision_decrypt_file
+from app.config import get_config
+
+cfg = get_config()
+
+RENDITION_PRESETS = {
+    "small": (160, 160),
+    "medium": (320, 320),
+    "large": (640, 640),
+}
+
+# Formats in the order of preference, the smallest files first.
+RENDITION_FORMATS = [
+    ("image/avif", "AVIF", ".avif"),
+    ("image/webp", "WEBP", ".webp"),
+    ("image/jpeg", "JPEG", ".jpg"),
+]
+RENDITION_DEFAULT_MIMETYPE = "image/jpeg"
+RENDITION_MASTER_FORMAT = ("PNG", ".png")
+RENDITION_MASTER_SIZE = max(RENDITION_PRESETS.values())
+RENDITION_MASTER_PRESET = "master"
+
+_master_locks = weakref.WeakValueDictionary()
+
+
+def _format_supported(image_format: str) -> bool:
+    """Checks whether Pillow was built with support for the format."""
+    return image_format == "JPEG" or features.check(image_format.lower())
+
+
+RENDITION_MIMETYPES = {
+    mimetype: (image_format, extension)
+    for mimetype, image_format, extension in RENDITION_FORMATS
+    if _format_supported(image_format)}
+
+
+def get_rendition_mimetype(accept_header: str = None) -> str:
+    """
+    Negotiates the rendition format from the Accept header. Formats must
+    be listed explicitly to be chosen, because wildcards are also sent
+    by clients that cannot decode newer formats; the format with the
+    highest quality value wins, the smaller one on ties, and JPEG is
+    returned if nothing else is acceptable.
+    """
+    accepted = {}
+    for item in (accept_header or "").split(","):
+        mimetype, _, params = item.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[mimetype.strip().lower()] = quality
+
+    best_mimetype, best_quality = RENDITION_DEFAULT_MIMETYPE, 0.0
+    for mimetype in RENDITION_MIMETYPES:
+        if accepted.get(mimetype, 0.0) > best_quality:
+            best_mimetype, best_quality = mimetype, accepted[mimetype]
+    return best_mimetype
+
+
+def get_rendition_filename(thumbnail_filename: str, preset: str,
+                           mimetype: str) -> str:
+    """
+    Returns the filename of the rendition of the thumbnail in the given
+    preset and format.
+    """
+    _, extension = RENDITION_MIMETYPES[mimetype]
+    return "%s_%s%s" % (os.path.splitext(thumbnail_filename)[0], preset,
+                        extension)
+
+
+def get_master_filename(thumbnail_filename: str) -> str:
+    """Returns the filename of the master image of the thumbnail."""
+    return "%s_%s%s" % (os.path.splitext(thumbnail_filename)[0],
+                        RENDITION_MASTER_PRESET, RENDITION_MASTER_FORMAT[1])
+
+
+async def _cached(path: str) -> bool:
+    """
+    Checks whether the file is in the renditions cache and touches it,
+    so the eviction removes the least recently used files.
+    """
+    if await FileManager.exists(path):
+        await FileManager.touch(path)
+        return True
+    return False
+
+
+async def master_retrieve(revision) -> str:
+    """
+    Returns the path of the master image of the revision, decoding the
+    revision file if the master is not cached yet. Concurrent requests
+    for the same revision wait for the first one, so the revision is
+    decrypted once.
+    """
+    master_path = os.path.join(cfg.RENDITIONS_BASE_PATH, get_master_filename(
+        revision.thumbnail_filename))
+
+    lock = _master_locks.setdefault(master_path, asyncio.Lock())
+    async with lock:
+        if await _cached(master_path):
+            return master_path
+
+        await FileManager.makedirs(cfg.RENDITIONS_BASE_PATH)
+        tmp_name = str(uuid.uuid4()) + FILE_TMP_EXTENSION
+        source_path = os.path.join(cfg.RENDITIONS_BASE_PATH, tmp_name)
+        frame_path = source_path + cfg.THUMBNAILS_EXTENSION
+        tmp_path = source_path + RENDITION_MASTER_FORMAT[1]
+
+        try:
+            await revision_decrypt_file(revision, source_path)
+
+            image_path = source_path
+            if FileManager.is_video(revision.original_mimetype):
+                await video_freeze(source_path, frame_path,
+                                   get_video_offset(revision.media_duration))
+                image_path = frame_path
+
+            width, height = RENDITION_MASTER_SIZE
+            await image_convert(image_path, tmp_path, width, height,
+                                RENDITION_MASTER_FORMAT[0],
+                                cfg.RENDITIONS_QUALITY)
+            await FileManager.move(tmp_path, master_path)
+
+        finally:
+            for path in [source_path, frame_path, tmp_path]:
+                await FileManager.delete(path)
+
+    return master_path
+
+
+async def rendition_retrieve(revision, preset: str, mimetype: str) -> str:
+    """
+    Returns the path of the rendition of the revision in the given
+    preset and format, creating it from the master image if it is not
+    cached yet. Raises ValueError for an unknown preset or format.
+    """
+    if preset not in RENDITION_PRESETS or mimetype not in (
+            RENDITION_MIMETYPES):
+        raise ValueError("Unknown rendition: %s, %s" % (preset, mimetype))
+
+    rendition_path = os.path.join(
+        cfg.RENDITIONS_BASE_PATH, get_rendition_filename(
+            revision.thumbnail_filename, preset, mimetype))
+
+    if await _cached(rendition_path):
+        return rendition_path
+
+    master_path = await master_retrieve(revision)
+    image_format, extension = RENDITION_MIMETYPES[mimetype]
+    tmp_path = os.path.join(cfg.RENDITIONS_BASE_PATH, str(
+        uuid.uuid4()) + FILE_TMP_EXTENSION + extension)
+
+    try:
+        width, height = RENDITION_PRESETS[preset]
+        await image_convert(master_path, tmp_path, width, height,
+                            image_format, cfg.RENDITIONS_QUALITY)
+        await FileManager.move(tmp_path, rendition_path)
+
+    finally:
+        await FileManager.delete(tmp_path)
+
+    await FileManager.evict(cfg.RENDITIONS_BASE_PATH, cfg.RENDITIONS_SIZE)
+    return rendition_path
+
+
+async def renditions_delete(thumbnail_filename: str):
+    """
+    Deletes the master image and all cached renditions of the thumbnail
+    in every preset and format.
+    """
+    await FileManager.delete(os.path.join(
+        cfg.RENDITIONS_BASE_PATH, get_master_filename(thumbnail_filename)))
+    for preset in RENDITION_PRESETS:
+        for mimetype in RENDITION_MIMETYPES:
+            await FileManager.delete(os.path.join(
+                cfg.RENDITIONS_BASE_PATH, get_rendition_filename(
+                    thumbnail_filename, preset, mimetype)))
@@ -0,0 +1,244 @@
+"""
+Provides the background integrity scrubber for revision files. The
+scrubber walks the revisions table in ID order and verifies that the
+file of every revision exists, has the stored size and authenticates,
+segment by segment for segmented files, chunk by chunk for chunked
+revisions and with a streamed signature check for legacy Fernet files,
+so whole files are never held in memory.
+The result and the time of the verification are stored on the revision
+and every revision is verified again after the scrub interval. Reads
+are paced to the configured bandwidth so the scrubber does not compete
+with downloads, and only one worker per host scrubs at a time. The
+number of revisions by their result is reported by the telemetry.
+"""
+
+import os
+import time
+import fcntl
+import asyncio
+from sqlalchemy import select, or_
+from app.managers.file_manager import FileManager
+from app.helpers.cipher_helper import (
+    SegmentError, FernetVerifier, is_segmented, SEGMENT_HEADER_SIZE)
+from app.helpers.storage_helper import revisions_storage
+from app.helpers.chunk_helper import manifest_read, chunk_read
+from app.helpers.blob_helper import is_manifest
+from app.managers.entity_manager import EntityManager
+from app.models.revision_model import Revision, ScrubStatus
+from app.database import sessionmanager
+from app.repository import Repository
+from app.cache import cache_pool
+from app.config import get_config
+from app.log import get_log
+
+cfg = get_config()
+log = get_log()
+
+SCRUB_LOCK_FILENAME = ".scrub.lock"
+
+
+class Throttle:
+    """
+    Paces reads to the given bandwidth in bytes per second. The reader
+    reports every read, and the throttle sleeps for as long as the
+    reads are ahead of the bandwidth.
+    """
+
+    def __init__(self, bandwidth: int):
+        self.bandwidth = bandwidth
+        self.started = time.monotonic()
+        self.read_size = 0
+
+    async def consume(self, size: int):
+        self.read_size += size
+        delay = (self.started + self.read_size / self.bandwidth -
+                 time.monotonic())
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def _verify_segmented(filename: str, throttle: Throttle) -> int:
+    """
+    Authenticates every segment of the segmented file and returns the
+    plaintext size.
+    """
+    plaintext_size = 0
+    async for chunk in FileManager.decrypt_iter(
+            filename, storage=revisions_storage):
+        await throttle.consume(len(chunk))
+        plaintext_size += len(chunk)
+    return plaintext_size
+
+
+async def _verify_fernet(filename: str, throttle: Throttle):
+    """Verifies the signature of the legacy Fernet file."""
+    verifier = FernetVerifier()
+    async for chunk in revisions_storage.read_iter(filename):
+        await throttle.consume(len(chunk))
+        verifier.update(chunk)
+    verifier.verify()
+
+
+async def _verify_manifest(revision: Revision,
+                           throttle: Throttle) -> ScrubStatus:
+    """
+    Verifies every chunk of the chunked revision: missing if a chunk
+    does not exist, truncated if the sizes of the chunks differ from the
+    manifest or the revision, corrupted if a chunk fails authentication,
+    and ok otherwise.
+    """
+    manifest = await manifest_read(revision.revision_filename, cached=False)
+    if manifest.size != revision.original_size:
+        return ScrubStatus.truncated
+
+    for i, chunk_filename in enumerate(manifest.filenames):
+        try:
+            data = await chunk_read(chunk_filename,
+                                    revision.revision_compression)
+        except FileNotFoundError:
+            return ScrubStatus.missing
+
+        await throttle.consume(len(data))
+        if len(data) != manifest.offsets[i + 1] - manifest.offsets[i]:
+            return ScrubStatus.truncated
+
+    return ScrubStatus.ok
+
+
+async def revision_verify(revision: Revision,
+                          throttle: Throttle) -> ScrubStatus:
+    """
+    Verifies the file of the revision, or the manifest and the chunks
+    of a chunked revision, and returns the result: missing if the file
+    does not exist, truncated if its size differs from the stored size,
+    corrupted if it fails authentication, and ok otherwise.
+    """
+    filename = revision.revision_filename
+    stat = await revisions_storage.stat(filename)
+    if stat is None:
+        return ScrubStatus.missing
+
+    # The size of a chunked revision also counts the chunks it added.
+    elif is_manifest(filename):
+        try:
+            return await _verify_manifest(revision, throttle)
+        except (SegmentError, ValueError):
+            return ScrubStatus.corrupted
+
+    elif stat.size != revision.revision_size:
+        return ScrubStatus.truncated
+
+    try:
+        header = b"".join([chunk async for chunk in (
+            revisions_storage.read_iter(filename, 0, SEGMENT_HEADER_SIZE))])
+
+        if not is_segmented(header):
+            await _verify_fernet(filename, throttle)
+
+        elif (await _verify_segmented(filename, throttle)
+                != revision.original_size and
+                not revision.revision_compression):
+            return ScrubStatus.truncated
+
+    except SegmentError:
+        return ScrubStatus.corrupted
+
+    return ScrubStatus.ok
+
+
+async def revisions_scrub(last_id: int) -> int:
+    """
+    Verifies the next batch of revisions after the given ID that are
+    due for verification and stores the results. Revisions sharing a
+    file are verified once per batch. Returns the ID of the last
+    revision of the batch, or None when the end of the table is reached.
+    """
+    throttle = Throttle(cfg.SCRUB_BANDWIDTH)
+    due_date = int(time.time()) - cfg.SCRUB_INTERVAL
+
+    cache = cache_pool.get_client()
+    async with sessionmanager.async_sessionmaker() as session:
+
+        async_result = await session.execute(
+            select(Revision)
+            .where(Revision.id > last_id,
+                   or_(Revision.scrub_date.is_(None),
+                       Revision.scrub_date < due_date))
+            .order_by(Revision.id)
+            .limit(cfg.SCRUB_BATCH_SIZE))
+        revisions = async_result.unique().scalars().all()
+        if not revisions:
+            return None
+
+        results = {}
+        revision_repository = Repository(session, cache, Revision)
+        for revision in revisions:
+            if revision.revision_filename not in results:
+                results[revision.revision_filename] = await revision_verify(
+                    revision, throttle)
+
+            revision.scrub_status = results[revision.revision_filename]
+            revision.scrub_date = int(time.time())
+            await revision_repository.update(revision, commit=False)
+
+            if revision.scrub_status != ScrubStatus.ok:
+                log.error("Revision scrub failed; module=scrub_helper; "
+                          "function=revisions_scrub; revision_id=%s; "
+                          "status=%s;" % (revision.id,
+                                          revision.scrub_status.value))
+
+        await revision_repository.commit()
+        return revisions[-1].id
+
+
+async def scrub_stats(session) -> dict:
+    """
+    Returns the number of revisions for every scrub result, including
+    the revisions that have not been verified yet.
+    """
+    entity_manager = EntityManager(session)
+    counts = await entity_manager.count_grouped(Revision, "scrub_status")
+    return {"scrub_pending": counts.get(None, 0)} | {
+        "scrub_%s" % status.value: counts.get(status, 0)
+        for status in ScrubStatus}
+
+
+async def scrub_worker():
+    """
+    Scrubs the revisions until the application stops. Started with the
+    application in every worker, but only the worker that holds the
+    lock on the lock file in the revisions directory scrubs, so the
+    bandwidth limit applies to the host; the others retry to take over
+    after the idle interval. When a pass over the table is complete,
+    the scrubber waits for the idle interval before the next pass.
+    """
+    if not cfg.SCRUB_BANDWIDTH:
+        return
+
+    lock_path = os.path.join(cfg.REVISIONS_BASE_PATH, SCRUB_LOCK_FILENAME)
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT)
+    try:
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                await asyncio.sleep(cfg.SCRUB_IDLE_INTERVAL)
+
+        last_id = 0
+        while True:
+            try:
+                last_id = await revisions_scrub(last_id)
+
+            except Exception as e:
+                log.error("Scrub failed; module=scrub_helper; "
+                          "function=scrub_worker; e=%s;" % str(e))
+                await asyncio.sleep(cfg.SCRUB_IDLE_INTERVAL)
+                continue
+
+            if last_id is None:
+                last_id = 0
+                await asyncio.sleep(cfg.SCRUB_IDLE_INTERVAL)
+
+    finally:
+        os.close(fd)
@@ -0,0 +1,153 @@
+"""
+Provides the sharded directory layout for revision, thumbnail and
+userpic files. Instead of keeping all files in one flat directory, each
+file is stored two levels deep under directories named after the first
+characters of its filename, e.g. ab/cd/abcd1234.jpg; filenames are
+random or keyed digests, so files spread evenly over the directories.
+Files stored in the former flat layout are moved into place lazily when
+they are accessed and by a background migration started with the
+application, and the static file mounts still resolve flat URLs.
+"""
+
+import os
+import asyncio
+import itertools
+from typing import List
+from fastapi.staticfiles import StaticFiles
+from app.managers.file_manager import FileManager, FILE_TMP_EXTENSION
+from app.config import get_config
+from app.log import get_log
+
+cfg = get_config()
+log = get_log()
+
+SHARD_LEVELS = 2
+SHARD_WIDTH = 2
+SHARD_MIGRATE_BATCH_SIZE = 1000
+
+
+def get_shard_path(base_path: str, filename: str) -> str:
+    """
+    Returns the path of the file in the sharded layout under the given
+    base path.
+    """
+    shards = [filename[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH]
+              for i in range(SHARD_LEVELS)]
+    return os.path.join(base_path, *shards, filename)
+
+
+async def shard_makedirs(base_path: str, filename: str) -> str:
+    """
+    Creates the shard directories for the file and returns the path of
+    the file in the sharded layout.
+    """
+    path = get_shard_path(base_path, filename)
+    await FileManager.makedirs(os.path.dirname(path))
+    return path
+
+
+async def shard_resolve(base_path: str, filename: str) -> str:
+    """
+    Returns the path of the file in the sharded layout, first moving the
+    file there if it is still stored in the flat layout. Concurrent
+    moves of the same file are harmless, since the loser finds the file
+    already in place.
+    """
+    path = get_shard_path(base_path, filename)
+    if await FileManager.exists(path):
+        return path
+
+    flat_path = os.path.join(base_path, filename)
+    if await FileManager.exists(flat_path):
+        await shard_makedirs(base_path, filename)
+        try:
+            await FileManager.move(flat_path, path)
+        except FileNotFoundError:
+            pass
+
+    return path
+
+
+async def shard_delete(base_path: str, filename: str):
+    """
+    Deletes the file from the sharded layout and from the flat layout,
+    in case it has not been migrated yet.
+    """
+    await FileManager.delete(get_shard_path(base_path, filename))
+    await FileManager.delete(os.path.join(base_path, filename))
+
+
+def _flat_files_sync(base_path: str, limit: int) -> List[str]:
+    """
+    Returns up to the limit of filenames stored in the flat layout of
+    the base path. Temporary files of uploads in progress are skipped.
+    """
+    with os.scandir(base_path) as entries:
+        filenames = (entry.name for entry in entries
+                     if entry.is_file() and
+                     FILE_TMP_EXTENSION not in entry.name and
+                     not entry.name.startswith("."))
+        return list(itertools.islice(filenames, limit))
+
+
+async def shards_migrate(base_path: str):
+    """
+    Moves all files stored in the flat layout of the base path into the
+    sharded layout. The directory is scanned in batches, so memory usage
+    does not depend on the number of files; moved files leave the flat
+    directory, so every batch picks up the next files.
+    """
+    loop = asyncio.get_event_loop()
+    migrated = 0
+
+    while True:
+        filenames = await loop.run_in_executor(
+            None, _flat_files_sync, base_path, SHARD_MIGRATE_BATCH_SIZE)
+
+        for filename in filenames:
+            await shard_resolve(base_path, filename)
+
+        migrated += len(filenames)
+        if len(filenames) < SHARD_MIGRATE_BATCH_SIZE:
+            break
+
+    if migrated:
+        log.info("Shards migrated; module=shard_helper; "
+                 "function=shards_migrate; base_path=%s; files=%s;" % (
+                     base_path, migrated))
+
+
+async def shards_migrate_all():
+    """
+    Migrates the revision, thumbnail and userpic directories to the
+    sharded layout. Started with the application; errors are logged
+    and the remaining files are migrated lazily when accessed or on the
+    next start.
+    """
+    for base_path in [cfg.REVISIONS_BASE_PATH, cfg.THUMBNAILS_BASE_PATH,
+                      cfg.USERPIC_BASE_PATH]:
+        try:
+            await shards_migrate(base_path)
+
+        except Exception as e:
+            log.error("Shards migration failed; module=shard_helper; "
+                      "function=shards_migrate_all; base_path=%s; e=%s;" % (
+                          base_path, str(e)))
+
+
+class ShardedStaticFiles(StaticFiles):
+    """
+    Serves static files stored in the sharded layout under their flat
+    URLs. A flat path is looked up in its shard directories first and
+    then in the flat directory, for files that are not migrated yet.
+    """
+
+    def lookup_path(self, path: str):
+        if os.path.dirname(path):
+            return super().lookup_path(path)
+
+        full_path, stat_result = super().lookup_path(
+            get_shard_path("", path))
+        if stat_result is None:
+            return super().lookup_path(path)
+        return full_path, stat_result
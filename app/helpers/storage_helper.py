@@ -0,0 +1,86 @@
+"""
+Provides the storages of revision, chunk, thumbnail and userpic files
+of the configured backend, shared by the whole worker process, so the
+S3 storages reuse their connection pools across requests. With the S3
+backend, the thumbnail and userpic mounts stream the files from the
+bucket instead of serving them from the local filesystem.
+"""
+
+import os
+import mimetypes
+from email.utils import formatdate
+from fastapi import HTTPException
+from fastapi.responses import Response, StreamingResponse
+from fastapi.staticfiles import StaticFiles
+from app.managers.storage_manager import (
+    Storage, create_storage, STORAGE_LOCAL)
+from app.helpers.shard_helper import ShardedStaticFiles
+from app.config import get_config
+from app.log import get_log
+
+cfg = get_config()
+log = get_log()
+
+revisions_storage = create_storage(cfg.REVISIONS_BASE_PATH, "revisions/")
+thumbnails_storage = create_storage(cfg.THUMBNAILS_BASE_PATH, "thumbnails/")
+userpics_storage = create_storage(cfg.USERPIC_BASE_PATH, "userpics/")
+chunks_storage = create_storage(cfg.CHUNKS_BASE_PATH, "chunks/")
+
+
+class StorageStaticFiles(StaticFiles):
+    """
+    Serves the files of the storage under their filenames, streaming
+    them from the storage. Paths with directories are not served.
+    """
+
+    def __init__(self, storage: Storage):
+        super().__init__(check_dir=False)
+        self.storage = storage
+
+    async def get_response(self, path: str, scope) -> Response:
+        if scope["method"] not in ("GET", "HEAD"):
+            raise HTTPException(status_code=405)
+
+        filename = os.path.basename(path)
+        stat = None
+        if filename == path and not filename.startswith("."):
+            stat = await self.storage.stat(filename)
+
+        if stat is None:
+            raise HTTPException(status_code=404)
+
+        headers = {
+            "content-length": str(stat.size),
+            "last-modified": formatdate(stat.mtime, usegmt=True),
+        }
+        media_type = (mimetypes.guess_type(filename)[0] or
+                      "application/octet-stream")
+
+        if scope["method"] == "HEAD":
+            return Response(headers=headers, media_type=media_type)
+
+        return StreamingResponse(self.storage.read_iter(filename),
+                                 headers=headers, media_type=media_type)
+
+
+def storage_static_files(storage: Storage, base_path: str) -> StaticFiles:
+    """
+    Returns the static files app for the mount of the storage: the
+    sharded local directory for the local backend, or the storage
+    itself otherwise.
+    """
+    if cfg.STORAGE_BACKEND == STORAGE_LOCAL:
+        return ShardedStaticFiles(directory=base_path, html=False)
+    return StorageStaticFiles(storage)
+
+
+async def storages_close():
+    """Closes the storages when the application stops."""
+    for storage in [revisions_storage, thumbnails_storage, userpics_storage,
+                    chunks_storage]:
+        try:
+            await storage.close()
+
+        except Exception as e:
+            log.error("Storage close failed; module=storage_helper; "
+                      "function=storages_close; e=%s;" % str(e))
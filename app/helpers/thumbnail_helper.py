@@ -0,0 +1,191 @@
+"""
+Provides the background queue that creates the thumbnails of revisions.
+Uploads only mark their image and video revisions as pending, and the
+queue workers started with the application create the thumbnails from
+the stored revision files afterwards, so uploads do not wait for media
+processing; the dimensions and the duration of the media are probed
+on the way and stored on the revision. The queue is kept in the
+revisions table, so pending thumbnails survive restarts: a worker
+claims the next due revision by moving its retry date forward, creates
+the thumbnail, and marks the revision as ready, or schedules a retry
+with an increasing delay until the attempts are exhausted and the
+revision is marked as failed. Revisions claimed by a worker that died
+are retried once the claim times out.
+"""
+
+import os
+import time
+import uuid
+import asyncio
+from PIL import Image
+from sqlalchemy import select, update
+from app.managers.file_manager import FileManager, FILE_TMP_EXTENSION
+from app.managers.entity_manager import EntityManager
+from app.helpers.image_helper import (
+    thumbnail_create, media_probe, get_video_offset)
+from app.helpers.storage_helper import thumbnails_storage
+from app.helpers.chunk_helper import revision_decrypt_file
+from app.models.revision_model import Revision, ThumbnailStatus
+from app.database import sessionmanager
+from app.repository import Repository
+from app.cache import cache_pool
+from app.config import get_config
+from app.log import get_log
+
+cfg = get_config()
+log = get_log()
+
+thumbnails_event = asyncio.Event()
+
+
+def thumbnails_notify():
+    """
+    Wakes up the queue workers of the current process, so a thumbnail
+    is created right after its revision is committed instead of on the
+    next poll. Workers of other processes pick it up when they poll.
+    """
+    thumbnails_event.set()
+
+
+async def thumbnail_claim(session) -> int:
+    """
+    Claims the next pending revision whose retry date is due and returns
+    its ID, or None if there is nothing to do. The row is locked while
+    its retry date is moved forward by the queue timeout and its attempt
+    is counted; locked rows are skipped, so concurrent workers never
+    claim the same revision.
+    """
+    now = int(time.time())
+    async_result = await session.execute(
+        select(Revision.id)
+        .where(Revision.thumbnail_status == ThumbnailStatus.pending,
+               Revision.thumbnail_retry_date <= now)
+        .order_by(Revision.thumbnail_retry_date)
+        .limit(1)
+        .with_for_update(skip_locked=True))
+    revision_id = async_result.scalar_one_or_none()
+
+    if revision_id is not None:
+        await session.execute(
+            update(Revision)
+            .where(Revision.id == revision_id)
+            .values(thumbnail_retry_date=now + cfg.THUMBNAILS_QUEUE_TIMEOUT,
+                    thumbnail_attempts=Revision.thumbnail_attempts + 1))
+
+    await session.commit()
+    return revision_id
+
+
+async def thumbnail_render(revision: Revision, is_probed: bool = False):
+    """
+    Probes the media of the revision, unless it is already probed, and
+    creates its thumbnail, unless it already exists for a revision with
+    the same content. The file is decrypted into a temporary plaintext
+    copy for the probe and the thumbnailer, which is removed afterwards.
+    The copy is kept in the uploads directory, which, unlike the
+    thumbnails directory, is not served as static files.
+    """
+    thumbnail_exists = await thumbnails_storage.exists(
+        revision.thumbnail_filename)
+    if is_probed and thumbnail_exists:
+        return
+
+    source_path = os.path.join(
+        cfg.UPLOADS_BASE_PATH, str(uuid.uuid4()) + FILE_TMP_EXTENSION)
+
+    try:
+        await revision_decrypt_file(revision, source_path)
+
+        if not is_probed:
+            probe = await media_probe(source_path, revision.original_mimetype)
+            revision.media_duration = probe["duration"]
+            revision.media_width = probe["width"]
+            revision.media_height = probe["height"]
+
+        if not thumbnail_exists:
+            await thumbnail_create(
+                source_path, revision.original_mimetype,
+                revision.thumbnail_filename,
+                offset=get_video_offset(revision.media_duration))
+
+    finally:
+        await FileManager.delete(source_path)
+
+
+async def thumbnails_process() -> bool:
+    """
+    Claims and processes the next pending revision of the queue in its
+    own database session. Returns whether a revision was processed, so
+    the worker continues without waiting while the queue is not empty.
+    """
+    cache = cache_pool.get_client()
+    async with sessionmanager.async_sessionmaker() as session:
+
+        revision_id = await thumbnail_claim(session)
+        if revision_id is None:
+            return False
+
+        entity_manager = EntityManager(session)
+        revision = await entity_manager.select(Revision, revision_id)
+        if not revision:
+            return True
+
+        # Revisions with the same content share the probe.
+        probed_revision = await entity_manager.select_by(
+            Revision, thumbnail_filename__eq=revision.thumbnail_filename,
+            media_width__ge=0)
+        if probed_revision:
+            revision.media_duration = probed_revision.media_duration
+            revision.media_width = probed_revision.media_width
+            revision.media_height = probed_revision.media_height
+
+        try:
+            await thumbnail_render(revision, probed_revision is not None)
+            revision.thumbnail_status = ThumbnailStatus.ready
+            revision.thumbnail_retry_date = None
+
+        except Exception as e:
+            log.error("Thumbnail failed; module=thumbnail_helper; "
+                      "function=thumbnails_process; revision_id=%s; "
+                      "attempt=%s; e=%s;" % (
+                          revision.id, revision.thumbnail_attempts, str(e)))
+
+            # Images over the decoder budget would fail on every retry.
+            if (isinstance(e, Image.DecompressionBombError) or
+                    revision.thumbnail_attempts >=
+                    cfg.THUMBNAILS_QUEUE_ATTEMPTS):
+                revision.thumbnail_status = ThumbnailStatus.failed
+                revision.thumbnail_retry_date = None
+            else:
+                revision.thumbnail_retry_date = int(time.time()) + (
+                    cfg.THUMBNAILS_QUEUE_RETRY_DELAY *
+                    2 ** (revision.thumbnail_attempts - 1))
+
+        revision_repository = Repository(session, cache, Revision)
+        await revision_repository.update(revision, commit=True)
+        return True
+
+
+async def thumbnails_worker():
+    """
+    Processes the thumbnail queue until the application stops. Started
+    with the application in several instances per process; when the
+    queue is empty, the worker waits for a notification or polls again
+    after the queue interval.
+    """
+    while True:
+        try:
+            if await thumbnails_process():
+                continue
+
+        except Exception as e:
+            log.error("Thumbnails queue failed; module=thumbnail_helper; "
+                      "function=thumbnails_worker; e=%s;" % str(e))
+
+        try:
+            await asyncio.wait_for(thumbnails_event.wait(),
+                                   cfg.THUMBNAILS_QUEUE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+        thumbnails_event.clear()
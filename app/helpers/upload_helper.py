@@ -0,0 +1,179 @@
+"""
+Provides the shared steps for turning an incoming plaintext stream into
+a stored revision file: the stream is received, hashed and encrypted in
+a single pass and moved into the content-addressed store, and images
+and videos are queued for their thumbnails. Used by the datafile upload and
+replace routers and by the finalization of upload sessions. Also
+includes the functions for upload sessions, whose numbered parts are
+stored encrypted in the session directory until the session is
+finalized, and the background task that removes expired sessions.
+"""
+
+import os
+import time
+import uuid
+import asyncio
+from typing import AsyncIterator, Dict
+from app.managers.file_manager import FileManager, FILE_TMP_EXTENSION
+from app.helpers.blob_helper import revision_store, get_thumbnail_filename
+from app.helpers.cipher_helper import decrypted_size
+from app.helpers.chunk_helper import chunks_receive
+from app.helpers.storage_helper import thumbnails_storage
+from app.helpers.orphan_helper import orphans_insert
+from app.models.upload_model import Upload
+from app.models.revision_model import ThumbnailStatus
+from app.models.orphan_model import OrphanKind
+from app.database import sessionmanager
+from app.repository import Repository
+from app.config import get_config
+from app.log import get_log
+
+cfg = get_config()
+log = get_log()
+
+UPLOAD_PART_EXTENSION = ".part"
+
+
+async def revision_receive(chunks: AsyncIterator[bytes],
+                           mimetype: str) -> dict:
+    """
+    Receives the plaintext stream into the revision store, or into the
+    chunk store if chunking is enabled. Content that is not already
+    compressed is compressed before encryption if compression is
+    enabled. Images and videos get the thumbnail status pending for the
+    thumbnail queue, or ready if the content already has a thumbnail.
+    Returns a dict with the plaintext and stored sizes, the compression,
+    the revision filename and whether the file was created by this call
+    rather than shared with existing revisions, which is what
+    revision_discard relies on, and the thumbnail filename and status.
+    """
+    compression = None
+    if cfg.REVISIONS_COMPRESSION and FileManager.is_compressible(mimetype):
+        compression = cfg.REVISIONS_COMPRESSION
+
+    if cfg.CHUNKS_ENABLED:
+        received = await chunks_receive(chunks, compression)
+        original_size = received["original_size"]
+        revision_size = received["revision_size"]
+        content_hash = received["content_hash"]
+        revision_filename = received["revision_filename"]
+        revision_created = received["revision_created"]
+
+    else:
+        upload_path = os.path.join(
+            cfg.REVISIONS_BASE_PATH, str(uuid.uuid4()) + FILE_TMP_EXTENSION)
+        original_size, revision_size, content_hash = (
+            await FileManager.upload_stream(
+                chunks, upload_path, compression=compression))
+
+        # Store the file by its content, so identical uploads share it.
+        revision_filename, revision_created = await revision_store(
+            upload_path, content_hash, compression)
+
+    # queue the thumbnail, unless the content already has one
+    thumbnail_filename, thumbnail_status = None, None
+    if FileManager.is_image(mimetype) or FileManager.is_video(mimetype):
+        thumbnail_filename = get_thumbnail_filename(content_hash)
+        thumbnail_status = (
+            ThumbnailStatus.ready
+            if await thumbnails_storage.exists(thumbnail_filename)
+            else ThumbnailStatus.pending)
+
+    return {
+        "original_size": original_size,
+        "revision_size": revision_size,
+        "revision_compression": compression,
+        "revision_filename": revision_filename,
+        "revision_created": revision_created,
+        "thumbnail_filename": thumbnail_filename,
+        "thumbnail_status": thumbnail_status,
+    }
+
+
+async def revision_discard(received: dict):
+    """
+    Journals the file received by revision_receive for deletion when
+    the revision could not be saved. Files shared with other revisions
+    stay in place for the revisions that use them; the sweeper checks
+    the references again before deleting, since a concurrent upload of
+    the same content may have reused the file meanwhile. If the journal
+    cannot be written either, the file is left for the reconciliation
+    scan and the original error is not masked.
+    """
+    if received["revision_created"]:
+        try:
+            await orphans_insert(OrphanKind.revision,
+                                 [received["revision_filename"]])
+
+        except Exception as e:
+            log.error("Revision discard failed; module=upload_helper; "
+                      "function=revision_discard; e=%s;" % str(e))
+
+
+def get_part_path(upload_path: str, part_number: int) -> str:
+    """Returns the path of the numbered part in the session directory."""
+    return os.path.join(upload_path, str(part_number) + UPLOAD_PART_EXTENSION)
+
+
+async def get_parts(upload_path: str) -> Dict[int, int]:
+    """
+    Returns the plaintext sizes of the parts received in the session
+    directory by their part numbers. Parts are renamed into place only
+    when they are complete, so parts still being received are omitted.
+    """
+    parts = {}
+    for filename in await FileManager.listdir(upload_path):
+        part_number, extension = os.path.splitext(filename)
+        if extension == UPLOAD_PART_EXTENSION and part_number.isdigit():
+            file_size = await FileManager.size(
+                os.path.join(upload_path, filename))
+            parts[int(part_number)] = decrypted_size(file_size)
+    return parts
+
+
+async def parts_read(upload_path: str,
+                     parts_count: int) -> AsyncIterator[bytes]:
+    """
+    Yields the decrypted data of the parts in the session directory in
+    the order of their part numbers.
+    """
+    for part_number in range(1, parts_count + 1):
+        async for chunk in FileManager.decrypt_iter(
+                get_part_path(upload_path, part_number)):
+            yield chunk
+
+
+async def uploads_expire():
+    """
+    Deletes the expired upload sessions together with their parts.
+    Sessions are removed in their own database session, since the task
+    runs outside of any request.
+    """
+    async with sessionmanager.async_sessionmaker() as session:
+        upload_repository = Repository(session, None, Upload)
+        uploads = await upload_repository.select_all(
+            expires_date__lt=int(time.time()), order_by="id", order="asc")
+
+        for upload in uploads:
+            await FileManager.delete_dir(upload.upload_path)
+            await FileManager.delete_dir(upload.finalizing_path)
+            await upload_repository.delete(upload, commit=False)
+
+        await upload_repository.commit()
+
+
+async def uploads_gc():
+    """
+    Periodically removes the expired upload sessions. Started with the
+    application; every worker runs it, so errors from sessions that are
+    removed concurrently are only logged.
+    """
+    while True:
+        try:
+            await uploads_expire()
+
+        except Exception as e:
+            log.error("Uploads GC failed; module=upload_helper; "
+                      "function=uploads_gc; e=%s;" % str(e))
+
+        await asyncio.sleep(cfg.UPLOADS_GC_INTERVAL)
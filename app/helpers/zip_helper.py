@@ -0,0 +1,143 @@
+"""
+Provides streaming ZIP archives of revisions for bulk downloads. The
+archive is assembled on the fly while the response is sent: every
+revision is decrypted incrementally and written into the archive, and
+the bytes the archive produces are passed on to the client as soon as
+they are written, so neither the plaintext nor the archive is kept on
+disk or in memory. Content that is already compressed, such as images,
+videos and archives, is stored as is, other content is deflated. The
+members are written and compressed in the crypto pool, so deflating
+large files does not block the event loop.
+"""
+
+import io
+import os
+import time
+import zipfile
+from typing import AsyncIterator, List, Tuple
+from app.managers.file_manager import FileManager
+from app.helpers.chunk_helper import revision_decrypt_iter
+from app.helpers.crypto_helper import crypto_run
+from app.config import get_config
+from app.log import get_log
+
+cfg = get_config()
+log = get_log()
+
+ZIP_MIMETYPE = "application/zip"
+ZIP_MIN_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+class ZipBuffer(io.RawIOBase):
+    """
+    Write-only and unseekable file object that collects the bytes of
+    the archive until they are drained. The archive writer cannot seek
+    back into it, so it writes the sizes and checksums of the members
+    after their data.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        """Returns the bytes written since the last drain."""
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def get_zip_names(filenames: List[str]) -> List[str]:
+    """
+    Returns the names of the archive members for the filenames. Path
+    separators are replaced, so members are never extracted outside of
+    the target directory, and duplicated names get a numeric suffix
+    before the extension.
+    """
+    names, used = [], set()
+    for filename in filenames:
+        name = filename.replace("/", "_").replace("\\", "_").lstrip(".")
+        name = name or "untitled"
+
+        base, extension = os.path.splitext(name)
+        suffix = 1
+        while name.lower() in used:
+            suffix += 1
+            name = "%s (%s)%s" % (base, suffix, extension)
+
+        used.add(name.lower())
+        names.append(name)
+    return names
+
+
+def _zip_info(name: str, revision) -> zipfile.ZipInfo:
+    """
+    Returns the member header for the revision. The uncompressed size is
+    known in advance, so the ZIP64 extension is used only when needed.
+    """
+    date_time = max(time.localtime(revision.created_date)[:6],
+                    ZIP_MIN_DATE_TIME)
+    zinfo = zipfile.ZipInfo(name, date_time=date_time)
+    zinfo.file_size = revision.original_size
+    zinfo.external_attr = 0o644 << 16
+
+    if FileManager.is_compressible(revision.original_mimetype):
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+    else:
+        zinfo.compress_type = zipfile.ZIP_STORED
+    return zinfo
+
+
+def _zip_write(fn, buffer: ZipBuffer, data: bytes) -> bytes:
+    """
+    Writes the data into the archive member and returns the bytes of
+    the archive produced so far.
+    """
+    fn.write(data)
+    return buffer.drain()
+
+
+def _zip_close(fn, buffer: ZipBuffer) -> bytes:
+    """
+    Closes the archive member or the archive, which flushes the
+    compressor and writes the data descriptor or the central directory,
+    and returns the bytes of the archive produced so far.
+    """
+    fn.close()
+    return buffer.drain()
+
+
+async def zip_stream(revisions: List[Tuple[str, object]]
+                     ) -> AsyncIterator[bytes]:
+    """
+    Yields the ZIP archive of the revisions, given as pairs of member
+    names and revisions, in chunks while the revisions are decrypted
+    one after another. Logs the error if a revision cannot be decrypted
+    after the response has already started.
+    """
+    buffer = ZipBuffer()
+    try:
+        with zipfile.ZipFile(buffer, mode="w") as archive:
+            for name, revision in revisions:
+                with archive.open(_zip_info(name, revision), mode="w") as fn:
+                    async for chunk in revision_decrypt_iter(revision):
+                        data = await crypto_run(_zip_write, fn, buffer, chunk)
+                        if data:
+                            yield data
+
+                    data = await crypto_run(_zip_close, fn, buffer)
+                    if data:
+                        yield data
+
+            yield await crypto_run(_zip_close, archive, buffer)
+
+    except Exception as e:
+        log.error("Stream failed; module=zip_helper; function=zip_stream; "
+                  "e=%s;" % str(e))
+        raise e
@@ -4,12 +4,33 @@ operations with Redis for SQLAlchemy entities. The CacheManager class
 offers methods to set, get, delete, and delete all cached SQLAlchemy
 model instances. It leverages Redis for efficient storage and retrieval
 and supports asynchronous operations to enhance performance.
+Entities are stored as JSON arrays of their mapped column values and
+of their loaded relationships, tagged with a fingerprint of the schema
+of their model, instead of pickles of the whole ORM instance. Entries
+written for another schema are skipped as cache misses. Recently used
+entries are also kept in the memory of the worker process for a short
+time; the workers broadcast the evicted keys over Redis pub/sub, so
+every worker drops its stale copies. The keys of the entries embed the
+generation of their table, so all the entries of a table are evicted at
+once by incrementing its generation; the entries of the previous
+generations are unlinked in the background.
 """
 
-from typing import Type, Optional, Union
-from sqlalchemy.ext.serializer import dumps, loads
-from sqlalchemy.orm import DeclarativeBase
+import enum
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from functools import lru_cache
+from typing import (
+    Callable, Dict, List, NamedTuple, Optional, Tuple, Type, Union)
+import orjson
+from sqlalchemy import inspect
+from sqlalchemy.orm import (
+    DeclarativeBase, Mapper, make_transient_to_detached)
+from sqlalchemy.orm.attributes import set_committed_value
 from redis import Redis
+from redis.exceptions import NoScriptError
 from app.decorators.timed_decorator import timed
 from app.config import get_config
 from app.log import get_log
@@ -17,6 +38,281 @@ from app.log import get_log
 cfg = get_config()
 log = get_log()
 
+CACHE_CODEC_VERSION = 1
+CACHE_CHANNEL = "cache:evict"
+CACHE_ENTITY_PREFIX = "entity"
+CACHE_GENERATION_PREFIX = "generation"
+CACHE_SCAN_COUNT = 1000
+
+
+class CacheScript(NamedTuple):
+    source: str
+    sha: str
+
+
+def _script(source: str) -> CacheScript:
+    return CacheScript(source, hashlib.sha1(source.encode()).hexdigest())
+
+
+# The scripts take the generation key of the table as KEYS[1], the keys
+# of the entries under the expected generation as the other keys and
+# the expected generation as ARGV[1]. The entries are accessed only if
+# the generation is still current, which is checked in the same round
+# trip; the current generation is returned first either way.
+CACHE_GET_SCRIPT = _script("""
+local generation = redis.call("GET", KEYS[1]) or "0"
+local result = {generation}
+if generation == ARGV[1] then
+    for i = 2, #KEYS do
+        result[i] = redis.call("GET", KEYS[i])
+    end
+end
+return result
+""")
+CACHE_SET_SCRIPT = _script("""
+local generation = redis.call("GET", KEYS[1]) or "0"
+if generation == ARGV[1] then
+    for i = 2, #KEYS do
+        redis.call("SET", KEYS[i], ARGV[i + 1], "EX", ARGV[2])
+    end
+end
+return {generation}
+""")
+CACHE_DELETE_SCRIPT = _script("""
+local generation = redis.call("GET", KEYS[1]) or "0"
+if generation == ARGV[1] then
+    redis.call("DEL", unpack(KEYS, 2))
+end
+return {generation}
+""")
+
+# The generations of the tables last returned by the scripts, which are
+# expected on the next access. They are checked by the scripts, so they
+# do not need to be evicted.
+_generations = {}
+_reclaim_tasks = set()
+
+
+def _str(value: Union[bytes, str]) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class _StaleEntry(Exception):
+    """Raised when a cache entry was written for another schema."""
+
+
+class _Schema(NamedTuple):
+    fingerprint: str
+    keys: List[str]
+    enums: List[Tuple[int, Type[enum.Enum]]]
+
+
+@lru_cache(maxsize=None)
+def _schema(mapper: Mapper) -> _Schema:
+    """
+    Returns the schema of the model: the keys of its columns in their
+    encoding order, the positions and classes of its enum columns, and
+    the fingerprint of the codec version, the table, the names and types
+    of the columns and the names of the relationships.
+    """
+    columns = [(attr.key, attr.columns[0].type)
+               for attr in mapper.column_attrs]
+    signature = "%s;%s;%s;%s" % (
+        CACHE_CODEC_VERSION, mapper.local_table.name, ",".join(
+            "%s:%s%s" % (key, column_type, getattr(column_type, "enums", ""))
+            for key, column_type in columns),
+        ",".join(sorted(mapper.relationships.keys())))
+
+    return _Schema(
+        hashlib.sha1(signature.encode()).hexdigest()[:8],
+        [key for key, _ in columns],
+        [(i, column_type.enum_class)
+         for i, (_, column_type) in enumerate(columns)
+         if getattr(column_type, "enum_class", None)])
+
+
+def _encode(entity: DeclarativeBase, path: set) -> Optional[list]:
+    """
+    Returns the fingerprint, the column values and the loaded
+    relationships of the entity, or None if any of its columns is not
+    loaded. Relationships leading back to an entity on the path are
+    skipped.
+    """
+    state = inspect(entity)
+    schema = _schema(state.mapper)
+    if any(key not in state.dict for key in schema.keys):
+        return None
+
+    path = path | {id(entity)}
+    relationships = {}
+    for relationship in state.mapper.relationships:
+        if relationship.key not in state.dict:
+            continue
+
+        value = state.dict[relationship.key]
+        if value is None:
+            relationships[relationship.key] = None
+
+        elif relationship.uselist:
+            if any(id(x) in path for x in value):
+                continue
+            items = [_encode(x, path) for x in value]
+            if None not in items:
+                relationships[relationship.key] = items
+
+        elif id(value) not in path:
+            item = _encode(value, path)
+            if item is not None:
+                relationships[relationship.key] = item
+
+    return [schema.fingerprint, [state.dict[key] for key in schema.keys],
+            relationships]
+
+
+def _decode(mapper: Mapper, data: list) -> DeclarativeBase:
+    """
+    Builds a detached instance of the model from the encoded entity.
+    Column values are loaded into the instance the way the ORM loads
+    rows. Raises _StaleEntry if the entity was encoded for another
+    schema.
+    """
+    fingerprint, values, relationships = data
+    schema = _schema(mapper)
+    if fingerprint != schema.fingerprint or (
+            len(values) != len(schema.keys)):
+        raise _StaleEntry()
+
+    for i, enum_class in schema.enums:
+        if values[i] is not None:
+            values[i] = enum_class(values[i])
+
+    entity = mapper.class_manager.new_instance()
+    entity.__dict__.update(zip(schema.keys, values))
+
+    for key, value in relationships.items():
+        relationship = mapper.relationships[key]
+        if value is not None and relationship.uselist:
+            value = [_decode(relationship.mapper, x) for x in value]
+        elif value is not None:
+            value = _decode(relationship.mapper, value)
+        set_committed_value(entity, key, value)
+
+    make_transient_to_detached(entity)
+    return entity
+
+
+def dumps(entity: DeclarativeBase) -> Optional[bytes]:
+    """
+    Encodes the entity for the cache, or returns None if the entity
+    cannot be cached because some of its columns are not loaded.
+    """
+    data = _encode(entity, set())
+    return orjson.dumps(data) if data is not None else None
+
+
+def loads(cls: Type[DeclarativeBase],
+          entity_bytes: bytes) -> Optional[DeclarativeBase]:
+    """
+    Decodes the cached entity of the model, or returns None if it was
+    written for another schema of the model or cannot be decoded.
+    """
+    try:
+        return _decode(inspect(cls), orjson.loads(entity_bytes))
+    except (_StaleEntry, KeyError, TypeError, ValueError):
+        return None
+
+
+class MemoryCache:
+    """
+    Keeps the recently used cache entries of the worker process in
+    memory in front of Redis. Entries are kept encoded, as the requests
+    modify the instances they get, and expire after the TTL even if an
+    eviction message is lost. The memory tier is only used while the
+    worker is subscribed to the eviction messages, and it is cleared on
+    every subscription, as the messages sent in between are missed.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.size = 0
+        self.generation = 0
+        self.subscribed = False
+        self.hits = 0
+        self.misses = 0
+
+    def is_enabled(self) -> bool:
+        return self.subscribed and cfg.CACHE_MEMORY_SIZE > 0
+
+    def get_stats(self) -> dict:
+        return {
+            "cache_memory_hits": self.hits,
+            "cache_memory_misses": self.misses,
+            "cache_memory_entries": len(self.entries),
+            "cache_memory_size": self.size,
+        }
+
+    def _pop(self, key: str):
+        _, entity_bytes = self.entries.pop(key)
+        self.size -= len(entity_bytes)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Returns the entry unless it is missing or expired."""
+        if not self.is_enabled():
+            return None
+
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._pop(key)
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: str, entity_bytes: bytes, generation: int):
+        """
+        Puts the entry fetched from Redis and evicts the least recently
+        used entries above the memory limit. The entry is skipped if any
+        key was evicted since the given generation, as the entry might
+        have been fetched before the eviction.
+        """
+        if not self.is_enabled() or generation != self.generation:
+            return
+
+        if key in self.entries:
+            self._pop(key)
+        self.entries[key] = (time.monotonic() + cfg.CACHE_MEMORY_TTL,
+                             entity_bytes)
+        self.size += len(entity_bytes)
+
+        while self.size > cfg.CACHE_MEMORY_SIZE:
+            self._pop(next(iter(self.entries)))
+
+    def evict(self, key: str):
+        """
+        Removes the entry of the key, or all the entries starting with
+        the key if it ends with an asterisk.
+        """
+        self.generation += 1
+        if key.endswith("*"):
+            prefix = key[:-1]
+            for entry_key in [x for x in self.entries if x.startswith(prefix)]:
+                self._pop(entry_key)
+
+        elif key in self.entries:
+            self._pop(key)
+
+    def clear(self):
+        """Removes all the entries."""
+        self.generation += 1
+        self.entries.clear()
+        self.size = 0
+
+
+memory_cache = MemoryCache()
+
 
 class CacheManager:
     """
@@ -36,14 +332,74 @@ class CacheManager:
         self.cache = cache
 
     def _get_key(self, entity: Type[DeclarativeBase],
+                 generation: Union[int, str],
                  entity_id: Union[int, str]) -> str:
         """
         Constructs a cache key based on the SQLAlchemy model's table
-        name and the model's ID. The key is formatted as table_name:id
-        for storing or retrieving the SQLAlchemy model in the Redis
-        cache.
+        name, the generation of the table and the model's ID. The key is
+        formatted as entity:{table_name}:generation:id for storing or
+        retrieving the SQLAlchemy model in the Redis cache. The braces
+        make Redis Cluster keep all the keys of the table in one slot,
+        so the scripts can access them together.
         """
-        return "%s:%s" % (entity.__tablename__, entity_id)
+        return "%s:{%s}:%s:%s" % (CACHE_ENTITY_PREFIX, entity.__tablename__,
+                                  generation, entity_id)
+
+    def _get_generation_key(self, entity: Type[DeclarativeBase]) -> str:
+        """Constructs the key of the generation counter of the table."""
+        return "%s:{%s}" % (CACHE_GENERATION_PREFIX, entity.__tablename__)
+
+    def _get_generation(self, entity: Type[DeclarativeBase]
+                        ) -> Optional[int]:
+        """Returns the generation of the table held by the memory tier."""
+        generation = memory_cache.get(self._get_generation_key(entity))
+        return int(generation) if generation is not None else None
+
+    async def _evalsha(self, script: CacheScript, keys: list,
+                       args: list) -> list:
+        """
+        Runs the script by its digest, so its source is not sent with
+        every call, and loads the script into Redis first if Redis does
+        not know it yet, e.g. after a restart.
+        """
+        try:
+            return await self.cache.evalsha(script.sha, len(keys), *keys,
+                                            *args)
+        except NoScriptError:
+            await self.cache.script_load(script.source)
+            return await self.cache.evalsha(script.sha, len(keys), *keys,
+                                            *args)
+
+    async def _run(self, script: CacheScript,
+                   entity: Type[DeclarativeBase], entity_ids: list,
+                   args: list = None) -> Tuple[int, list]:
+        """
+        Runs the script for the entries of the IDs in a single round
+        trip under the generation of the table held by the memory tier
+        or returned by the last script. If the generation has changed
+        meanwhile, the script does nothing and is run again with the
+        current generation, which is put into the memory tier. Returns
+        the generation and the rest of the result of the script.
+        """
+        table = entity.__tablename__
+        generation = self._get_generation(entity)
+        if generation is None:
+            generation = _generations.get(table, 0)
+
+        while True:
+            memory_generation = memory_cache.generation
+            key = self._get_generation_key(entity)
+            keys = [key] + [self._get_key(entity, generation, x)
+                            for x in entity_ids]
+            current, *result = await self._evalsha(
+                script, keys, [generation] + (args or []))
+
+            current = int(current)
+            _generations[table] = current
+            memory_cache.set(key, str(current).encode(), memory_generation)
+            if current == generation:
+                return generation, result
+            generation = current
 
     @timed
     async def set(self, entity: DeclarativeBase):
@@ -51,43 +407,198 @@ class CacheManager:
         Caches an SQLAlchemy model instance by serializing it and
         storing it in Redis with an expiration time.
         """
-        key = self._get_key(entity, entity.id)
-        await self.cache.set(key, dumps(entity), ex=cfg.REDIS_EXPIRE)
+        await self.set_many([entity])
 
     @timed
     async def get(self, cls: Type[DeclarativeBase],
                   entity_id: int) -> Optional[DeclarativeBase]:
         """
         Retrieves an SQLAlchemy model instance from the cache by
-        fetching the serialized model from Redis and deserializing it.
+        fetching the serialized model from the memory tier or from Redis
+        and deserializing it. Entries fetched from Redis are put into the
+        memory tier. Entries written for another schema of the model are
+        misses.
+        """
+        entities = await self.get_many(cls, [entity_id])
+        return entities.get(entity_id)
+
+    @timed
+    async def set_many(self, entities: List[DeclarativeBase]):
+        """
+        Caches several SQLAlchemy model instances of the same model at
+        once, sending all the writes to Redis in a single script call.
         """
-        key = self._get_key(cls, entity_id)
-        entity_bytes = await self.cache.get(key)
-        return loads(entity_bytes) if entity_bytes else None
+        entity_ids, values = [], []
+        for entity in entities:
+            entity_bytes = dumps(entity)
+            if entity_bytes is not None:
+                entity_ids.append(entity.id)
+                values.append(entity_bytes)
+
+        if entity_ids:
+            await self._run(CACHE_SET_SCRIPT, entities[0], entity_ids,
+                            [cfg.REDIS_EXPIRE] + values)
+
+    @timed
+    async def get_many(self, cls: Type[DeclarativeBase],
+                       entity_ids: List[int]) -> Dict[int, DeclarativeBase]:
+        """
+        Retrieves several SQLAlchemy model instances from the cache,
+        taking the entries held by the memory tier and fetching the rest
+        from Redis in a single round trip: with MGET if the memory tier
+        holds the generation of the table, or with a script otherwise.
+        Returns the instances found by their IDs; the missing entries
+        are left out.
+        """
+        generation = self._get_generation(cls)
+        entities, entity_ids_missing = {}, []
+        for entity_id in entity_ids:
+            entity_bytes = None
+            if generation is not None:
+                entity_bytes = memory_cache.get(
+                    self._get_key(cls, generation, entity_id))
+            entity = loads(cls, entity_bytes) if entity_bytes else None
+            if entity is not None:
+                entities[entity_id] = entity
+            else:
+                entity_ids_missing.append(entity_id)
+
+        if not entity_ids_missing:
+            return entities
+
+        memory_generation = memory_cache.generation
+        if generation is not None:
+            values = await self.cache.mget([
+                self._get_key(cls, generation, x)
+                for x in entity_ids_missing])
+        else:
+            generation, values = await self._run(
+                CACHE_GET_SCRIPT, cls, entity_ids_missing)
+
+        for entity_id, entity_bytes in zip(entity_ids_missing, values):
+            entity = loads(cls, entity_bytes) if entity_bytes else None
+            if entity is not None:
+                entities[entity_id] = entity
+                memory_cache.set(self._get_key(cls, generation, entity_id),
+                                 entity_bytes, memory_generation)
+
+        return entities
+
+    async def _evict(self, key: str):
+        """
+        Removes the key or the key pattern from the memory tier and
+        broadcasts it to the other workers.
+        """
+        memory_cache.evict(key)
+        await self.cache.publish(CACHE_CHANNEL, key)
 
     @timed
     async def delete(self, entity: DeclarativeBase):
         """
         Removes an SQLAlchemy model instance from the cache by deleting
-        the cache entry associated with the given model.
+        the cache entry associated with the given model. The generation
+        of the table is checked by the script on the Redis side, as the
+        memory tier might not have received its increment yet.
         """
-        key = self._get_key(entity, entity.id)
-        await self.cache.delete(key)
+        generation, _ = await self._run(CACHE_DELETE_SCRIPT, entity,
+                                        [entity.id])
+        await self._evict(self._get_key(entity, generation, entity.id))
 
     @timed
     async def delete_all(self, cls: Type[DeclarativeBase]):
         """
         Removes all cached instances of a given SQLAlchemy model class
-        by deleting all cache entries related to the specified class.
+        by incrementing the generation of its table, which makes all
+        the entries of the previous generations unreachable at once.
+        The entries are unlinked from Redis in the background.
         """
-        key_pattern = self._get_key(cls, "*")
-        for key in await self.cache.keys(key_pattern):
-            await self.cache.delete(key)
+        key = self._get_generation_key(cls)
+        generation = await self.cache.incr(key)
+        _generations[cls.__tablename__] = generation
+        await self._evict(key)
+
+        task = asyncio.create_task(self._reclaim(cls, generation))
+        _reclaim_tasks.add(task)
+        task.add_done_callback(_reclaim_tasks.discard)
+
+    async def _unlink(self, pattern: str, generation: int = None):
+        """
+        Scans the keys matching the pattern in batches, so that Redis is
+        not blocked, and unlinks them, or only the keys of the previous
+        generations if the generation is given.
+        """
+        keys = []
+        async for key in self.cache.scan_iter(match=pattern,
+                                              count=CACHE_SCAN_COUNT):
+            if generation is None or (
+                    int(_str(key).split(":")[2]) < generation):
+                keys.append(key)
+
+            if len(keys) >= CACHE_SCAN_COUNT:
+                await self.cache.unlink(*keys)
+                keys = []
+
+        if keys:
+            await self.cache.unlink(*keys)
+
+    async def _reclaim(self, cls: Type[DeclarativeBase], generation: int):
+        """Unlinks the entries of the previous generations of the table."""
+        try:
+            await self._unlink(self._get_key(cls, "*", "*"), generation)
+
+        except Exception as e:
+            log.error("Cache reclaim failed; module=cache_manager; "
+                      "function=_reclaim; e=%s;" % str(e))
 
     @timed
     async def erase(self):
         """
-        Clears all cache entries in Redis, effectively erasing all
-        cached SQLAlchemy model instances.
+        Clears all cache entries of the SQLAlchemy model instances in
+        Redis, effectively erasing all cached SQLAlchemy model
+        instances. Only the keys of the entries are unlinked, so other
+        data in the Redis database and the generations are kept.
         """
-        await self.cache.flushdb()
+        await self._unlink("%s:*" % CACHE_ENTITY_PREFIX)
+        await self._evict("*")
+
+    async def listen(self, *handlers: Callable[[str], None]):
+        """
+        Subscribes to the keys evicted by the workers and removes them
+        from the memory tier until cancelled. The memory tier is used
+        only while the subscription is alive; the connection is checked
+        at the health check interval and the subscription is renewed
+        after a failure. The keys are also passed to the handlers, so
+        other memory caches of the worker drop their entries; they get
+        the asterisk on every subscription, as the messages sent in
+        between are missed.
+        """
+        while True:
+            pubsub = self.cache.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(CACHE_CHANNEL)
+                memory_cache.clear()
+                memory_cache.subscribed = True
+                for handler in handlers:
+                    handler("*")
+
+                while True:
+                    message = await pubsub.get_message(
+                        ignore_subscribe_messages=True,
+                        timeout=cfg.REDIS_HEALTH_CHECK_INTERVAL)
+                    if message is not None:
+                        key = _str(message["data"])
+                        memory_cache.evict(key)
+                        for handler in handlers:
+                            handler(key)
+
+            except Exception as e:
+                log.error("Cache subscription failed; "
+                          "module=cache_manager; function=listen; "
+                          "e=%s;" % str(e))
+
+            finally:
+                memory_cache.subscribed = False
+                memory_cache.clear()
+                await pubsub.aclose()
+
+            await asyncio.sleep(cfg.REDIS_HEALTH_CHECK_INTERVAL)
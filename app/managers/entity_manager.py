@@ -11,7 +11,7 @@ work efficiently with large datasets and integrates with SQLAlchemy's
 asynchronous capabilities for non-blocking database interactions.
 """
 
-from typing import Union, Type, List, Optional
+from typing import Union, Type, List, Optional, Dict, Any
 from sqlalchemy import select, text, asc, desc
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -83,6 +83,24 @@ class EntityManager:
         if commit:
             await self.commit()
 
+    @timed
+    async def insert_all(self, objs: List[DeclarativeBase],
+                         flush: bool = True, commit: bool = True):
+        """
+        Insert several SQLAlchemy model instances into the database at
+        once by adding all of them to the session and flushing them
+        together, so the batch is sent in a single flush instead of one
+        per entity. The "flush" and "commit" parameters work the same
+        way as in the insert method.
+        """
+        self.session.add_all(objs)
+
+        if flush:
+            await self.flush()
+
+        if commit:
+            await self.commit()
+
     @timed
     async def select(self, cls: Type[DeclarativeBase],
                      obj_id: int) -> Union[DeclarativeBase, None]:
@@ -96,6 +114,19 @@ class EntityManager:
             select(cls).where(cls.id == obj_id).limit(1))
         return async_result.unique().scalars().one_or_none()
 
+    @timed
+    async def select_many(self, cls: Type[DeclarativeBase],
+                          obj_ids: List[int]) -> List[DeclarativeBase]:
+        """
+        Retrieve the SQLAlchemy model instances of the specified class
+        with the given IDs in a single query. The method returns the
+        instances found, in no particular order; IDs without a matching
+        entity are skipped.
+        """
+        async_result = await self.session.execute(
+            select(cls).where(cls.id.in_(obj_ids)))
+        return async_result.unique().scalars().all()
+
     @timed
     async def select_by(self, cls: Type[DeclarativeBase],
                         **kwargs) -> Union[DeclarativeBase, None]:
@@ -209,6 +240,23 @@ class EntityManager:
         async_result = await self.session.execute(query)
         return async_result.unique().scalars().one_or_none() or 0
 
+    @timed
+    async def count_grouped(self, cls: Type[DeclarativeBase],
+                            column_name: str, **kwargs) -> Dict[Any, int]:
+        """
+        Count the SQLAlchemy model instances of the specified class that
+        match the provided filters, grouped by the values of the given
+        column, in a single query. The method returns a dictionary that
+        maps each value of the column to its count; values without
+        matching entities are absent.
+        """
+        column = getattr(cls, column_name)
+        query = select(column, func.count(getattr(cls, ID))).where(
+            *self._where(cls, **kwargs)).group_by(column)
+
+        async_result = await self.session.execute(query)
+        return {value: count for value, count in async_result.all()}
+
     @timed
     async def sum_all(self, cls: Type[DeclarativeBase], column_name: str,
                       **kwargs) -> int:
@@ -3,25 +3,46 @@ This module defines the FileManager class, which provides a suite
 of asynchronous methods for performing file operations, including
 uploading, deleting, writing, reading, copying, encrypting, and
 decrypting files. It utilizes the aiofiles library for non-blocking
-file I/O operations and the Fernet encryption system for secure data
-handling. The methods are designed to work efficiently in asynchronous
+file I/O operations, which run in the dedicated I/O thread pool;
+revision files are encrypted in a segmented AES-GCM format that can be
+processed as a stream, while legacy Fernet encrypted files remain
+readable. The methods are designed to work efficiently in asynchronous
 contexts, supporting high-performance and scalable applications.
 The class includes functionality to handle different file types,
 such as images and videos, and ensures optimal performance and
 security for file management tasks.
 """
 
+import os
+import zlib
+import time
+import shutil
+import hashlib
+from contextlib import aclosing
+from typing import AsyncIterator, List, Tuple
 import aiofiles
 import aiofiles.os
 from app.decorators.timed_decorator import timed
 from app.config import get_config
+from app.helpers.cipher_helper import (
+    SegmentDecryptor, SegmentError, is_segmented, SEGMENT_HEADER_SIZE)
+from app.helpers.io_helper import io_open, io_chunk_sizes, IOWriter
+from app.helpers.crypto_helper import (
+    ParallelEncryptor, ParallelDecryptor, crypto_run, CRYPTO_BATCH_SIZE)
 from cryptography.fernet import Fernet
 
 cfg = get_config()
 cipher_suite = Fernet(cfg.FERNET_KEY)
+rmtree = aiofiles.os.wrap(shutil.rmtree)
+utime = aiofiles.os.wrap(os.utime)
 
-FILE_UPLOAD_CHUNK_SIZE = 1024 * 8  # 8 KB
-FILE_COPY_CHUNK_SIZE = 1024 * 8  # 8 KB
+FILE_ENCRYPT_CHUNK_SIZE = 1024 * 256  # 256 KB
+FILE_DECOMPRESS_CHUNK_SIZE = 1024 * 256  # 256 KB
+FILE_TMP_EXTENSION = ".tmp"
+FILE_TMP_EXPIRES = 3600
+FILE_EVICT_RATIO = 0.9
+COMPRESSION_ZLIB = "zlib"
+COMPRESSION_LEVEL = 6
 IMAGE_MIMETYPES = [
     "image/jpeg", "image/png", "image/gif", "image/bmp", "image/tiff",
     "image/webp", "image/svg+xml", "image/x-icon", "image/heif", "image/heic",
@@ -31,6 +52,44 @@ IMAGE_MIMETYPES = [
 VIDEO_MIMETYPES = [
     "video/mp4", "video/avi", "video/mkv", "video/webm", "video/x-msvideo",
     "video/x-matroska", "video/quicktime"]
+COMPRESSED_MIMETYPES = [
+    "application/zip", "application/x-zip-compressed", "application/pdf"]
+
+
+def _evict_sync(path: str, size_limit: int) -> int:
+    """
+    Deletes the least recently modified files of the directory until
+    their total size is below the eviction ratio of the size limit and
+    removes stale temporary files. Returns the total size of the files
+    that remain.
+    """
+    files, total_size = [], 0
+    with os.scandir(path) as entries:
+        for entry in entries:
+            stat = entry.stat()
+            if FILE_TMP_EXTENSION in entry.name:
+                if stat.st_mtime < time.time() - FILE_TMP_EXPIRES:
+                    os.unlink(entry.path)
+                continue
+
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+            total_size += stat.st_size
+
+    if total_size > size_limit:
+        for _, file_size, file_path in sorted(files):
+            if total_size <= size_limit * FILE_EVICT_RATIO:
+                break
+
+            try:
+                os.unlink(file_path)
+                total_size -= file_size
+            except FileNotFoundError:
+                pass
+
+    return total_size
+
+
+evict = aiofiles.os.wrap(_evict_sync)
 
 
 class FileManager:
@@ -63,19 +122,115 @@ class FileManager:
         """
         return mimetype.lower() in VIDEO_MIMETYPES
 
+    @staticmethod
+    def is_compressible(mimetype: str) -> bool:
+        """
+        Determines if content of the given MIME type is worth compressing
+        before encryption. Images, videos, archives and PDF documents are
+        already compressed, so compressing them again only costs CPU.
+        """
+        return not (FileManager.is_image(mimetype) or
+                    FileManager.is_video(mimetype) or
+                    mimetype.lower() in COMPRESSED_MIMETYPES)
+
+    @staticmethod
+    def _compressor(compression: str):
+        if compression == COMPRESSION_ZLIB:
+            return zlib.compressobj(COMPRESSION_LEVEL)
+        raise ValueError("Compression %s is not supported" % compression)
+
+    @staticmethod
+    def _decompressor(compression: str):
+        if compression == COMPRESSION_ZLIB:
+            return zlib.decompressobj()
+        raise ValueError("Compression %s is not supported" % compression)
+
     @staticmethod
     @timed
     async def upload(file: object, path: str):
         """
         Asynchronously uploads a file to the specified path by reading
-        the file in chunks and writing each chunk to the destination
-        path, handling large files efficiently without loading them
-        entirely into memory.
+        the file in chunks of growing size and writing each chunk to the
+        destination path, handling large files efficiently without
+        loading them entirely into memory.
         """
-        async with aiofiles.open(path, mode="wb") as fn:
-            while content := await file.read(FILE_UPLOAD_CHUNK_SIZE):
+        async with io_open(path, "wb") as fn:
+            for chunk_size in io_chunk_sizes():
+                content = await file.read(chunk_size)
+                if not content:
+                    break
                 await fn.write(content)
 
+    @staticmethod
+    @timed
+    async def upload_stream(chunks: AsyncIterator[bytes], path: str,
+                            compression: str = None
+                            ) -> Tuple[int, int, str]:
+        """
+        Asynchronously consumes a plaintext stream in a single pass:
+        counts its size, computes its SHA-256 content hash, and writes
+        the encrypted data to a temporary file next to the destination
+        path, which is atomically renamed into place once the stream has
+        been fully consumed. With a compression the plaintext is
+        compressed before it is encrypted. Hashing, compression and
+        encryption run in the crypto pool in batches of the plaintext.
+        Returns the plaintext size, the encrypted size and the hex
+        content hash of the plaintext.
+        """
+        tmp_path = path + FILE_TMP_EXTENSION
+        encryptor = ParallelEncryptor()
+        compressor = (FileManager._compressor(compression)
+                      if compression else None)
+        content_hash = hashlib.sha256()
+        original_size, revision_size = 0, 0
+        buffer = bytearray()
+
+        def digest(data: bytes, final: bool = False) -> bytes:
+            content_hash.update(data)
+            if not compressor:
+                return data
+            return compressor.compress(data) + (
+                compressor.flush() if final else b"")
+
+        try:
+            async with io_open(tmp_path, "wb") as fn:
+                dst_context = IOWriter(fn)
+
+                async for chunk in chunks:
+                    original_size += len(chunk)
+                    buffer += chunk
+
+                    if len(buffer) >= CRYPTO_BATCH_SIZE:
+                        encrypted_chunk = await encryptor.update(
+                            await crypto_run(digest, buffer))
+                        buffer = bytearray()
+                        revision_size += len(encrypted_chunk)
+                        await dst_context.write(encrypted_chunk)
+
+                encrypted_chunk = await encryptor.update(
+                    await crypto_run(digest, buffer, True))
+                encrypted_chunk += await encryptor.finalize()
+                revision_size += len(encrypted_chunk)
+                await dst_context.write(encrypted_chunk)
+                await dst_context.flush()
+
+            await aiofiles.os.replace(tmp_path, path)
+
+        except Exception:
+            await FileManager.delete(tmp_path)
+            raise
+
+        return original_size, revision_size, content_hash.hexdigest()
+
+    @staticmethod
+    @timed
+    async def exists(path: str) -> bool:
+        """
+        Asynchronously checks whether a regular file exists at the
+        specified path.
+        """
+        return await aiofiles.os.path.isfile(path)
+
     @staticmethod
     @timed
     async def delete(path: str):
@@ -86,6 +241,76 @@ class FileManager:
         if await aiofiles.os.path.isfile(path):
             await aiofiles.os.unlink(path)
 
+    @staticmethod
+    @timed
+    async def move(src_path: str, dst_path: str):
+        """
+        Asynchronously moves the file from src_path to dst_path within
+        the same filesystem, atomically replacing the destination file
+        if it already exists.
+        """
+        await aiofiles.os.replace(src_path, dst_path)
+
+    @staticmethod
+    @timed
+    async def touch(path: str):
+        """
+        Asynchronously sets the modification time of the file at the
+        specified path to the current time.
+        """
+        await utime(path)
+
+    @staticmethod
+    @timed
+    async def size(path: str) -> int:
+        """
+        Asynchronously returns the size in bytes of the file at the
+        specified path.
+        """
+        return await aiofiles.os.path.getsize(path)
+
+    @staticmethod
+    @timed
+    async def makedirs(path: str):
+        """
+        Asynchronously creates the directory at the specified path along
+        with any missing parents, doing nothing if it already exists.
+        """
+        await aiofiles.os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    @timed
+    async def listdir(path: str) -> List[str]:
+        """
+        Asynchronously returns the names of the entries in the directory
+        at the specified path, or an empty list if it does not exist.
+        """
+        if await aiofiles.os.path.isdir(path):
+            return await aiofiles.os.listdir(path)
+        return []
+
+    @staticmethod
+    @timed
+    async def delete_dir(path: str):
+        """
+        Asynchronously deletes the directory at the specified path with
+        all its contents if it exists.
+        """
+        if await aiofiles.os.path.isdir(path):
+            await rmtree(path)
+
+    @staticmethod
+    @timed
+    async def evict(path: str, size_limit: int) -> int:
+        """
+        Asynchronously evicts the least recently modified files of the
+        cache directory at the specified path once their total size
+        exceeds the size limit, which makes the directory an LRU cache
+        when its files are touched on every hit. Returns the total size
+        of the remaining files.
+        """
+        return await evict(path, size_limit)
+
     @staticmethod
     @timed
     async def write(path: str, data: bytes):
@@ -93,7 +318,7 @@ class FileManager:
         Asynchronously writes the given byte data to a file at the
         specified path, overwriting the file if it already exists.
         """
-        async with aiofiles.open(path, mode="wb") as fn:
+        async with io_open(path, "wb") as fn:
             await fn.write(data)
 
     @staticmethod
@@ -103,7 +328,7 @@ class FileManager:
         Asynchronously reads and returns the contents of a file at the
         specified path, loading the entire file into memory.
         """
-        async with aiofiles.open(path, mode="rb") as fn:
+        async with io_open(path, "rb") as fn:
             return await fn.read()
 
     @staticmethod
@@ -111,36 +336,223 @@ class FileManager:
     async def encrypt(data: bytes) -> bytes:
         """
         Asynchronously encrypts the given byte data using the configured
-        Fernet cipher suite, ensuring secure data encryption.
+        Fernet cipher suite in the crypto pool, ensuring secure data
+        encryption.
         """
-        return cipher_suite.encrypt(data)
+        return await crypto_run(cipher_suite.encrypt, data)
 
     @staticmethod
     @timed
     async def decrypt(data: bytes) -> bytes:
         """
-        Asynchronously decrypts the given byte data using the configured
-        Fernet cipher suite, returning the original data.
+        Asynchronously decrypts the given byte data in the crypto pool,
+        returning the original data. Data in the segmented format is
+        decrypted segment by segment, anything else is treated as a
+        legacy Fernet token.
+        """
+        if is_segmented(data):
+            decryptor = ParallelDecryptor(SegmentDecryptor(data, len(data)))
+            return b"".join(await decryptor.update(
+                data[SEGMENT_HEADER_SIZE:]) + await decryptor.finalize())
+
+        return await crypto_run(cipher_suite.decrypt, data)
+
+    @staticmethod
+    @timed
+    async def encrypt_file(src_path: str, dst_path: str) -> int:
+        """
+        Asynchronously encrypts the file at src_path into the segmented
+        format and stores it at dst_path, reading and writing in chunks
+        so memory usage does not depend on the file size. The output is
+        written to a temporary file and renamed into place, so src_path
+        and dst_path may be the same file. Segments are sealed in the
+        crypto pool. Returns the encrypted size.
+        """
+        tmp_path = dst_path + FILE_TMP_EXTENSION
+        encryptor = ParallelEncryptor()
+
+        try:
+            async with io_open(src_path, "rb") as src_context:
+                async with io_open(tmp_path, "wb") as dst_context:
+                    for chunk_size in io_chunk_sizes():
+                        chunk = await src_context.read(chunk_size)
+                        if not chunk:
+                            break
+                        await dst_context.write(
+                            await encryptor.update(chunk))
+                    await dst_context.write(await encryptor.finalize())
+
+            await aiofiles.os.replace(tmp_path, dst_path)
+
+        except Exception:
+            await FileManager.delete(tmp_path)
+            raise
+
+        return await aiofiles.os.path.getsize(dst_path)
+
+    @staticmethod
+    @timed
+    async def decrypt_file(src_path: str, dst_path: str,
+                           compression: str = None, storage=None):
+        """
+        Asynchronously decrypts the file at src_path, or the file with
+        that key in the storage, decompressing it with the given
+        compression, and stores the plaintext at dst_path, reading and
+        writing in chunks so memory usage does not depend on the file
+        size.
+        """
+        async with io_open(dst_path, "wb") as fn:
+            dst_context = IOWriter(fn)
+            async for chunk in FileManager.decrypt_iter(
+                    src_path, compression=compression, storage=storage):
+                await dst_context.write(chunk)
+            await dst_context.flush()
+
+    @staticmethod
+    async def read_iter(path: str, start: int = 0,
+                        end: int = None) -> AsyncIterator[bytes]:
+        """
+        Asynchronously yields the contents of the file at the specified
+        path between the start (inclusive) and the end (exclusive)
+        offsets in chunks, so memory usage does not depend on the size
+        of the range.
+        """
+        async with io_open(path, "rb") as fn:
+            await fn.seek(start)
+            while end is None or start < end:
+                chunk = await fn.read(FILE_ENCRYPT_CHUNK_SIZE if end is None
+                                      else min(FILE_ENCRYPT_CHUNK_SIZE,
+                                               end - start))
+                if not chunk:
+                    break
+                start += len(chunk)
+                yield chunk
+
+    @staticmethod
+    async def decrypt_iter(path: str, start: int = 0, end: int = None,
+                           compression: str = None,
+                           storage=None) -> AsyncIterator[bytes]:
+        """
+        Asynchronously decrypts the file at the specified path, or the
+        file with the given key in the storage, and yields the plaintext
+        between the start (inclusive) and the end (exclusive) offsets in
+        chunks. Segmented files are read as a single stream starting
+        from the segment that holds the start offset; legacy Fernet
+        files cannot be decrypted partially and are loaded entirely into
+        memory. Segments are decrypted in the crypto pool, several
+        batches at once, and yielded in order. Compressed files are
+        decrypted and decompressed from the beginning, skipping the data
+        before the start offset.
+        """
+        if compression:
+            async for chunk in FileManager._decompress_iter(
+                    path, compression, start, end, storage):
+                yield chunk
+            return
+
+        # Storages read their files the same way as the file manager.
+        source = storage or FileManager
+        header = b"".join([chunk async for chunk in source.read_iter(
+            path, 0, SEGMENT_HEADER_SIZE)])
+
+        if not is_segmented(header):
+            data = await crypto_run(cipher_suite.decrypt, b"".join(
+                [chunk async for chunk in source.read_iter(path)]))
+            if data[start:end]:
+                yield data[start:end]
+            return
+
+        decryptor = SegmentDecryptor(header, await source.size(path))
+
+        end = decryptor.plaintext_size if end is None else min(
+            end, decryptor.plaintext_size)
+        if start >= end:
+            return
+
+        segment_index = decryptor.segment_index(start)
+        skip = start - segment_index * decryptor.segment_size
+        remaining = end - start
+        parallel_decryptor = ParallelDecryptor(decryptor, segment_index)
+
+        async def batches():
+            async with aclosing(source.read_iter(
+                    path, decryptor.segment_offset(segment_index),
+                    decryptor.segment_offset(
+                        decryptor.segment_index(end - 1) + 1))) as stream:
+                async for data in stream:
+                    for batch in await parallel_decryptor.update(data):
+                        yield batch
+            for batch in await parallel_decryptor.finalize():
+                yield batch
+
+        try:
+            async with aclosing(batches()) as stream:
+                async for batch in stream:
+                    chunk = batch[skip:skip + remaining]
+                    skip = 0
+                    remaining -= len(chunk)
+                    if chunk:
+                        yield chunk
+
+        finally:
+            parallel_decryptor.cancel()
+
+        if remaining > 0:
+            raise SegmentError("Segmented file is truncated")
+
+    @staticmethod
+    async def _decompress_iter(path: str, compression: str, start: int,
+                               end: int,
+                               storage=None) -> AsyncIterator[bytes]:
+        """
+        Yields the decompressed plaintext of the file between the start
+        and the end offsets. Output is produced in bounded chunks, so
+        highly compressed data does not expand in memory at once, and
+        every chunk is decompressed in the crypto pool, so the event loop
+        is not blocked.
         """
-        return cipher_suite.decrypt(data)
+        decompressor = FileManager._decompressor(compression)
+        position = 0
+
+        async def chunks():
+            async for data in FileManager.decrypt_iter(
+                    path, storage=storage):
+                while data:
+                    yield await crypto_run(decompressor.decompress, data,
+                                           FILE_DECOMPRESS_CHUNK_SIZE)
+                    data = decompressor.unconsumed_tail
+            yield await crypto_run(decompressor.flush)
+
+        async with aclosing(chunks()) as stream:
+            async for chunk in stream:
+                chunk_start = max(start - position, 0)
+                chunk_end = (len(chunk) if end is None
+                             else min(len(chunk), end - position))
+                position += len(chunk)
+
+                if chunk_start < chunk_end:
+                    yield chunk[chunk_start:chunk_end]
+
+                if end is not None and position >= end:
+                    return
 
     @staticmethod
     @timed
     async def copy(src_path: str, dst_path: str):
         """
         Asynchronously copies the contents of a file from src_path to
-        dst_path in chunks. The method opens the source file for reading
-        in binary mode and the destination file for writing in binary
-        mode. It reads from the source file in chunks and writes those
-        chunks to the destination file until the entire file has been
-        copied. The operation is performed asynchronously to avoid
-        blocking the event loop, and errors such as file not found or
-        permission issues are handled gracefully.
-        """
-        async with aiofiles.open(src_path, mode="rb") as src_context:
-            async with aiofiles.open(dst_path, mode="wb") as dst_context:
-                while True:
-                    chunk = await src_context.read(FILE_COPY_CHUNK_SIZE)
+        dst_path in chunks of growing size. The method opens the source
+        file for reading in binary mode and the destination file for
+        writing in binary mode. It reads from the source file in chunks
+        and writes those chunks to the destination file until the entire
+        file has been copied. The operation is performed asynchronously
+        to avoid blocking the event loop, and errors such as file not
+        found or permission issues are handled gracefully.
+        """
+        async with io_open(src_path, "rb") as src_context:
+            async with io_open(dst_path, "wb") as dst_context:
+                for chunk_size in io_chunk_sizes():
+                    chunk = await src_context.read(chunk_size)
                     if not chunk:
                         break
                     await dst_context.write(chunk)
@@ -0,0 +1,504 @@
+"""
+This module defines the storage backends for revision, thumbnail and
+userpic files. A storage keeps files under their filenames as keys and
+provides streaming reads of byte ranges, streaming writes, and checks
+for existence, size and modification time, so the rest of the
+application does not depend on where the files are kept. The local
+storage keeps files in a sharded directory of the local filesystem,
+which pins the service to the volume of a single node; the S3 storage
+keeps them as objects in a bucket of an S3-compatible service, such
+as Amazon S3 or MinIO, which all nodes can share. Temporary files,
+upload sessions and caches are always kept on the local filesystem.
+"""
+
+import os
+import hmac
+import uuid
+import hashlib
+import datetime
+from abc import ABC, abstractmethod
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, List, NamedTuple, Optional
+from urllib.parse import quote
+from xml.etree import ElementTree
+import aiofiles
+import aiofiles.os
+import httpx
+from app.managers.file_manager import FileManager
+from app.helpers.io_helper import io_open, IOWriter
+from app.helpers.shard_helper import (
+    shard_resolve, shard_makedirs, shard_delete)
+from app.decorators.timed_decorator import timed
+from app.config import get_config
+
+cfg = get_config()
+
+STORAGE_LOCAL, STORAGE_S3 = "local", "s3"
+STORAGE_CHUNK_SIZE = 1024 * 256  # 256 KB
+S3_MIN_PART_SIZE = 1024 * 1024 * 5  # 5 MB
+S3_UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+S3_XMLNS = "{http://s3.amazonaws.com/doc/2006-03-01/}"
+
+
+class StorageStat(NamedTuple):
+    key: str
+    size: int
+    mtime: float
+
+
+class Storage(ABC):
+    """
+    Base class of the storage backends. Keys are filenames without
+    directories; the methods raise FileNotFoundError for reads of keys
+    that do not exist, like the file manager does for paths. Backends
+    that do not implement every abstract method cannot be created.
+    """
+
+    @abstractmethod
+    async def stat(self, key: str) -> Optional[StorageStat]:
+        """
+        Returns the size and the modification time of the file, or None
+        if it does not exist.
+        """
+
+    async def exists(self, key: str) -> bool:
+        """Checks whether the file exists."""
+        return await self.stat(key) is not None
+
+    async def size(self, key: str) -> int:
+        """Returns the size of the file in bytes."""
+        stat = await self.stat(key)
+        if stat is None:
+            raise FileNotFoundError(key)
+        return stat.size
+
+    @abstractmethod
+    def read_iter(self, key: str, start: int = 0,
+                  end: int = None) -> AsyncIterator[bytes]:
+        """
+        Yields the contents of the file between the start (inclusive)
+        and the end (exclusive) offsets in chunks.
+        """
+
+    @abstractmethod
+    async def write(self, key: str, chunks: AsyncIterator[bytes]):
+        """
+        Stores the chunks as the file, replacing an existing file as a
+        whole; the file becomes visible only when it is complete.
+        """
+
+    @abstractmethod
+    async def put(self, key: str, path: str):
+        """
+        Stores the local file at the path as the file and removes the
+        local file.
+        """
+
+    @abstractmethod
+    async def touch(self, key: str):
+        """
+        Sets the modification time of the file to the current time, or
+        raises FileNotFoundError if it does not exist.
+        """
+
+    async def get(self, key: str, path: str):
+        """Copies the file to the local file at the path."""
+        async with io_open(path, "wb") as fn:
+            writer = IOWriter(fn)
+            async for chunk in self.read_iter(key):
+                await writer.write(chunk)
+            await writer.flush()
+
+    @abstractmethod
+    async def delete(self, key: str):
+        """Deletes the file if it exists."""
+
+    @abstractmethod
+    def list_iter(self) -> AsyncIterator[List[StorageStat]]:
+        """
+        Yields the files of the storage in batches, so memory usage does
+        not depend on the number of files. Temporary and hidden files
+        are skipped.
+        """
+
+    async def close(self):
+        """Releases the resources held by the storage."""
+
+
+def _list_sync(path: str) -> List[StorageStat]:
+    """
+    Returns the files of the directory and its subdirectories. Hidden
+    and temporary files are skipped.
+    """
+    files = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+
+            elif entry.is_dir(follow_symlinks=False):
+                files += _list_sync(entry.path)
+
+            elif (entry.is_file(follow_symlinks=False) and
+                    ".tmp" not in entry.name):
+                stat = entry.stat()
+                files.append(StorageStat(entry.name, stat.st_size,
+                                         stat.st_mtime))
+    return files
+
+
+list_files = aiofiles.os.wrap(_list_sync)
+
+
+class LocalStorage(Storage):
+    """
+    Keeps the files in the sharded layout of the base directory on the
+    local filesystem. Files still stored in the former flat layout are
+    moved into their shard directories when they are accessed.
+    """
+
+    def __init__(self, base_path: str):
+        self.base_path = base_path
+
+    async def get_path(self, key: str) -> str:
+        """Returns the local path of the file for the key."""
+        return await shard_resolve(self.base_path, key)
+
+    @timed
+    async def stat(self, key: str) -> Optional[StorageStat]:
+        try:
+            stat = await aiofiles.os.stat(await self.get_path(key))
+            return StorageStat(key, stat.st_size, stat.st_mtime)
+        except FileNotFoundError:
+            return None
+
+    async def read_iter(self, key: str, start: int = 0,
+                        end: int = None) -> AsyncIterator[bytes]:
+        async for chunk in FileManager.read_iter(
+                await self.get_path(key), start, end):
+            yield chunk
+
+    @timed
+    async def write(self, key: str, chunks: AsyncIterator[bytes]):
+        path = await shard_makedirs(self.base_path, key)
+        # Concurrent writers of the same key use their own files.
+        tmp_path = "%s.%s.tmp" % (path, uuid.uuid4())
+        try:
+            async with io_open(tmp_path, "wb") as fn:
+                writer = IOWriter(fn)
+                async for chunk in chunks:
+                    await writer.write(chunk)
+                await writer.flush()
+            await FileManager.move(tmp_path, path)
+
+        finally:
+            await FileManager.delete(tmp_path)
+
+    @timed
+    async def put(self, key: str, path: str):
+        # Moves a copy in the flat layout first, so none is left behind.
+        await self.get_path(key)
+        await FileManager.move(path, await shard_makedirs(
+            self.base_path, key))
+
+    @timed
+    async def touch(self, key: str):
+        await FileManager.touch(await self.get_path(key))
+
+    @timed
+    async def delete(self, key: str):
+        await shard_delete(self.base_path, key)
+
+    async def list_iter(self) -> AsyncIterator[List[StorageStat]]:
+        """
+        Yields the files of the flat layout first and then the files of
+        every top level shard directory as a batch.
+        """
+        if not await aiofiles.os.path.isdir(self.base_path):
+            return
+
+        files, dirs = [], []
+        for filename in await aiofiles.os.listdir(self.base_path):
+            path = os.path.join(self.base_path, filename)
+            if filename.startswith(".") or ".tmp" in filename:
+                continue
+
+            elif await aiofiles.os.path.isdir(path):
+                dirs.append(path)
+
+            else:
+                stat = await aiofiles.os.stat(path)
+                files.append(StorageStat(filename, stat.st_size,
+                                         stat.st_mtime))
+        if files:
+            yield files
+
+        for path in sorted(dirs):
+            files = await list_files(path)
+            if files:
+                yield files
+
+
+def sigv4_headers(method: str, host: str, path: str, query: dict,
+                  headers: dict, access_key: str, secret_key: str,
+                  region: str, service: str = "s3",
+                  payload_hash: str = S3_UNSIGNED_PAYLOAD,
+                  now: datetime.datetime = None) -> dict:
+    """
+    Returns the headers with the AWS Signature Version 4 authorization
+    added. The path must be URI-encoded already; all given headers are
+    signed together with the host and the request date.
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+    date = now.strftime("%Y%m%d")
+
+    headers = {key.lower(): str(value).strip()
+               for key, value in headers.items()}
+    headers["host"] = host
+    headers["x-amz-date"] = amz_date
+
+    signed_headers = ";".join(sorted(headers))
+    canonical_headers = "".join(
+        "%s:%s\n" % (key, headers[key]) for key in sorted(headers))
+    canonical_query = "&".join(
+        "%s=%s" % (quote(key, safe="-_.~"), quote(str(value), safe="-_.~"))
+        for key, value in sorted(query.items()))
+
+    canonical_request = "\n".join([
+        method, path, canonical_query, canonical_headers, signed_headers,
+        payload_hash])
+    scope = "%s/%s/%s/aws4_request" % (date, region, service)
+    string_to_sign = "\n".join([
+        "AWS4-HMAC-SHA256", amz_date, scope,
+        hashlib.sha256(canonical_request.encode()).hexdigest()])
+
+    key = ("AWS4" + secret_key).encode()
+    for part in [date, region, service, "aws4_request"]:
+        key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+    signature = hmac.new(key, string_to_sign.encode(),
+                         hashlib.sha256).hexdigest()
+
+    headers["authorization"] = (
+        "AWS4-HMAC-SHA256 Credential=%s/%s, SignedHeaders=%s, "
+        "Signature=%s" % (access_key, scope, signed_headers, signature))
+    return headers
+
+
+class S3Storage(Storage):
+    """
+    Keeps the files as objects under the key prefix in a bucket of an
+    S3-compatible service, addressed in path style, so services such
+    as MinIO work without DNS setup. Requests are signed with AWS
+    Signature Version 4 and sent over a pool of keep-alive connections
+    of the worker process. Files larger than the part size are stored
+    with multipart uploads, so neither the file nor the request body
+    is ever held in memory as a whole.
+    """
+
+    def __init__(self, prefix: str,
+                 transport: httpx.AsyncBaseTransport = None):
+        self.prefix = prefix
+        self.transport = transport
+        self.client = None
+
+    def get_client(self) -> httpx.AsyncClient:
+        """Returns the HTTP client, which is created on first use."""
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                base_url=cfg.S3_ENDPOINT, transport=self.transport,
+                timeout=cfg.S3_TIMEOUT, limits=httpx.Limits(
+                    max_connections=cfg.S3_POOL_SIZE,
+                    max_keepalive_connections=cfg.S3_POOL_SIZE))
+        return self.client
+
+    def get_path(self, key: str = "") -> str:
+        """Returns the URI-encoded path of the object for the key."""
+        return "/%s/%s" % (cfg.S3_BUCKET, quote(self.prefix + key, safe="/"))
+
+    def _request(self, method: str, path: str, query: dict = None,
+                 headers: dict = None, content=None) -> httpx.Request:
+        client = self.get_client()
+        query = query or {}
+        headers = sigv4_headers(
+            method, client.base_url.netloc.decode(), path, query,
+            {"x-amz-content-sha256": S3_UNSIGNED_PAYLOAD} | (headers or {}),
+            cfg.S3_ACCESS_KEY, cfg.S3_SECRET_KEY, cfg.S3_REGION)
+        return client.build_request(method, path, params=query,
+                                    headers=headers, content=content)
+
+    async def _send(self, method: str, path: str, query: dict = None,
+                    headers: dict = None, content=None) -> httpx.Response:
+        response = await self.get_client().send(self._request(
+            method, path, query, headers, content))
+        if response.status_code == 404:
+            raise FileNotFoundError(path)
+        response.raise_for_status()
+        return response
+
+    @timed
+    async def stat(self, key: str) -> Optional[StorageStat]:
+        try:
+            response = await self._send("HEAD", self.get_path(key))
+        except FileNotFoundError:
+            return None
+
+        return StorageStat(key, int(response.headers["content-length"]),
+                           parsedate_to_datetime(
+                               response.headers["last-modified"]).timestamp())
+
+    async def read_iter(self, key: str, start: int = 0,
+                        end: int = None) -> AsyncIterator[bytes]:
+        if end is not None and start >= end:
+            return
+
+        headers = {}
+        if start or end is not None:
+            headers["range"] = "bytes=%s-%s" % (
+                start, "" if end is None else end - 1)
+
+        request = self._request("GET", self.get_path(key), headers=headers)
+        response = await self.get_client().send(request, stream=True)
+        try:
+            if response.status_code == 404:
+                raise FileNotFoundError(key)
+
+            # The range starts at or beyond the end of the object.
+            elif response.status_code == 416:
+                return
+
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(STORAGE_CHUNK_SIZE):
+                yield chunk
+
+        finally:
+            await response.aclose()
+
+    async def _upload_part(self, key: str, upload_id: str, part_number: int,
+                           data: bytes) -> str:
+        response = await self._send(
+            "PUT", self.get_path(key), query={
+                "partNumber": part_number, "uploadId": upload_id},
+            content=data)
+        return response.headers["etag"]
+
+    @timed
+    async def write(self, key: str, chunks: AsyncIterator[bytes]):
+        """
+        Stores the chunks with a single request if they fit into one
+        part, or with a multipart upload otherwise, which is aborted if
+        it fails so the service does not keep the parts.
+        """
+        part_size = max(cfg.S3_PART_SIZE, S3_MIN_PART_SIZE)
+        buffer, upload_id, etags = bytearray(), None, []
+
+        try:
+            async for chunk in chunks:
+                buffer.extend(chunk)
+                while len(buffer) >= part_size:
+                    if upload_id is None:
+                        response = await self._send(
+                            "POST", self.get_path(key), query={"uploads": ""})
+                        upload_id = ElementTree.fromstring(
+                            response.content).findtext(S3_XMLNS + "UploadId")
+
+                    etags.append(await self._upload_part(
+                        key, upload_id, len(etags) + 1,
+                        bytes(buffer[:part_size])))
+                    del buffer[:part_size]
+
+            if upload_id is None:
+                await self._send("PUT", self.get_path(key),
+                                 content=bytes(buffer))
+                return
+
+            if buffer:
+                etags.append(await self._upload_part(
+                    key, upload_id, len(etags) + 1, bytes(buffer)))
+
+            parts = "".join(
+                "<Part><PartNumber>%s</PartNumber><ETag>%s</ETag></Part>" % (
+                    part_number, etag)
+                for part_number, etag in enumerate(etags, start=1))
+            response = await self._send(
+                "POST", self.get_path(key), query={"uploadId": upload_id},
+                content=("<CompleteMultipartUpload>%s"
+                         "</CompleteMultipartUpload>" % parts).encode())
+
+            # The service may report an error after it has responded.
+            if b"<Error>" in response.content:
+                raise httpx.HTTPError("Multipart upload failed")
+
+        except BaseException:
+            if upload_id is not None:
+                try:
+                    await self._send("DELETE", self.get_path(key),
+                                     query={"uploadId": upload_id})
+                except Exception:
+                    pass
+            raise
+
+    @timed
+    async def put(self, key: str, path: str):
+        await self.write(key, FileManager.read_iter(path))
+        await FileManager.delete(path)
+
+    @timed
+    async def touch(self, key: str):
+        """
+        Copies the object onto itself, which is how S3 updates the
+        modification time of an object without uploading it again.
+        """
+        path = self.get_path(key)
+        await self._send("PUT", path, headers={
+            "x-amz-copy-source": path,
+            "x-amz-metadata-directive": "REPLACE"})
+
+    @timed
+    async def delete(self, key: str):
+        try:
+            await self._send("DELETE", self.get_path(key))
+        except FileNotFoundError:
+            pass
+
+    async def list_iter(self) -> AsyncIterator[List[StorageStat]]:
+        """Yields the objects under the prefix page by page."""
+        query = {"list-type": 2, "prefix": self.prefix}
+        while True:
+            response = await self._send("GET", "/%s" % cfg.S3_BUCKET,
+                                        query=query)
+            root = ElementTree.fromstring(response.content)
+
+            files = []
+            for item in root.iter(S3_XMLNS + "Contents"):
+                key = item.findtext(S3_XMLNS + "Key")[len(self.prefix):]
+                if "/" in key or key.startswith(".") or ".tmp" in key:
+                    continue
+                files.append(StorageStat(
+                    key, int(item.findtext(S3_XMLNS + "Size")),
+                    datetime.datetime.fromisoformat(
+                        item.findtext(S3_XMLNS + "LastModified")
+                        .replace("Z", "+00:00")).timestamp()))
+            if files:
+                yield files
+
+            token = root.findtext(S3_XMLNS + "NextContinuationToken")
+            if root.findtext(S3_XMLNS + "IsTruncated") != "true" or not token:
+                break
+            query["continuation-token"] = token
+
+    async def close(self):
+        client, self.client = self.client, None
+        if client is not None:
+            await client.aclose()
+
+
+def create_storage(base_path: str, prefix: str) -> Storage:
+    """
+    Returns the storage of the configured backend for the files kept in
+    the base directory by the local storage, or under the key prefix by
+    the S3 storage.
+    """
+    if cfg.STORAGE_BACKEND == STORAGE_S3:
+        return S3Storage(prefix)
+    return LocalStorage(base_path)
@@ -0,0 +1,33 @@
+"""
+The module defines the SQLAlchemy model for the chunk entity, which is
+a reference from a chunk manifest to one of the chunks it lists. The
+references tell the orphans sweeper which chunks are still in use,
+since chunks are shared by the manifests of all revisions with common
+content. References of uploads in progress are held under a temporary
+owner name and are only counted while they are fresh.
+"""
+
+import time
+from sqlalchemy import Column, BigInteger, Integer, String, UniqueConstraint
+from app.database import Base
+
+
+class Chunk(Base):
+    """
+    SQLAlchemy model for a chunk entity. Every pair of a manifest and a
+    chunk is stored once; storing the pair again refreshes its date.
+    """
+    __tablename__ = "files_chunks"
+    __table_args__ = (UniqueConstraint("revision_filename",
+                                       "chunk_filename"),)
+    _cacheable = False
+
+    id = Column(BigInteger, primary_key=True)
+    created_date = Column(Integer, index=True,
+                          default=lambda: int(time.time()))
+    revision_filename = Column(String(256), index=True, nullable=False)
+    chunk_filename = Column(String(256), index=True, nullable=False)
+
+    def __init__(self, revision_filename: str, chunk_filename: str):
+        self.revision_filename = revision_filename
+        self.chunk_filename = chunk_filename
@@ -0,0 +1,41 @@
+"""
+The module defines the SQLAlchemy model for the orphan entity, which is
+the journal of revision, thumbnail and chunk files pending deletion.
+Entries are written in the same transaction as the database change
+that leaves the file unused, so they are only kept if the change is
+committed.
+"""
+
+import time
+import enum
+from sqlalchemy import Column, BigInteger, Integer, String, Enum
+from app.database import Base
+
+
+class OrphanKind(enum.Enum):
+    revision = "revision"
+    thumbnail = "thumbnail"
+    chunk = "chunk"
+
+
+class Orphan(Base):
+    """
+    SQLAlchemy model for an orphan entity. The entry names a file that
+    may no longer be referenced by any revision; the file is deleted by
+    the orphans sweeper unless it is referenced again by then.
+    """
+    __tablename__ = "files_orphans"
+    _cacheable = False
+
+    id = Column(BigInteger, primary_key=True)
+    created_date = Column(Integer, index=True,
+                          default=lambda: int(time.time()))
+    orphan_kind = Column(Enum(OrphanKind), nullable=False)
+    orphan_filename = Column(String(256), index=True, nullable=False)
+    revision_id = Column(BigInteger, nullable=True)
+
+    def __init__(self, orphan_kind: OrphanKind, orphan_filename: str,
+                 revision_id: int = None):
+        self.orphan_kind = orphan_kind
+        self.orphan_filename = orphan_filename
+        self.revision_id = revision_id
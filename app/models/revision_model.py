@@ -1,18 +1,33 @@
-import os
 import time
-from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, event
+import enum
+from sqlalchemy import (Column, Integer, BigInteger, String, Float,
+                        ForeignKey, Enum, event, insert)
 from sqlalchemy.orm import relationship
 from app.database import Base
 from app.config import get_config
-from app.managers.file_manager import FileManager
-import asyncio
-from app.log import get_log
+from app.models.orphan_model import Orphan, OrphanKind
 
 cfg = get_config()
-log = get_log()
+
+
+class ThumbnailStatus(enum.Enum):
+    pending = "pending"
+    ready = "ready"
+    failed = "failed"
+
+
+class ScrubStatus(enum.Enum):
+    ok = "ok"
+    missing = "missing"
+    truncated = "truncated"
+    corrupted = "corrupted"
 
 
 class Revision(Base):
+    """
+    Revision of a datafile. The columns added to the table after its
+    first release are added to existing databases by upgrade.sql.
+    """
     __tablename__ = "datafiles_revisions"
     _cacheable = True
 
@@ -22,14 +37,33 @@ class Revision(Base):
     user_id = Column(BigInteger, ForeignKey("users.id"), index=True)
     datafile_id = Column(BigInteger, ForeignKey("datafiles.id"), index=True)
 
-    revision_filename = Column(String(256), nullable=False, unique=True)
+    # Revisions with identical content share one file, so filenames
+    # are not unique and act as reference counts for the shared files.
+    revision_filename = Column(String(256), index=True, nullable=False)
     revision_size = Column(BigInteger, index=False, nullable=False)
+    revision_compression = Column(String(16), index=False, nullable=True)
     original_filename = Column(String(256), index=True, nullable=False)
     original_size = Column(BigInteger, index=True, nullable=False)
     original_mimetype = Column(String(256), index=True, nullable=False)
-    thumbnail_filename = Column(String(80), nullable=True, unique=True)
+    thumbnail_filename = Column(String(80), index=True, nullable=True)
+
+    # Thumbnails are created by the background queue; the filename is
+    # known upfront, but the thumbnail is only served once it is ready.
+    thumbnail_status = Column(Enum(ThumbnailStatus), index=True,
+                              nullable=True)
+    thumbnail_attempts = Column(Integer, index=False, default=0)
+    thumbnail_retry_date = Column(Integer, index=True, nullable=True)
+
+    # Probed by the thumbnail queue for images and videos.
+    media_duration = Column(Float, index=False, nullable=True)
+    media_width = Column(Integer, index=False, nullable=True)
+    media_height = Column(Integer, index=False, nullable=True)
     downloads_count = Column(Integer, index=True, default=0)
 
+    # Verified by the integrity scrubber in the background.
+    scrub_status = Column(Enum(ScrubStatus), index=True, nullable=True)
+    scrub_date = Column(Integer, index=True, nullable=True)
+
     revision_user = relationship(
         "User", back_populates="user_revisions", lazy="joined")
 
@@ -44,28 +78,29 @@ class Revision(Base):
     def __init__(self, user_id: int, datafile_id: int,
                  revision_filename: str, revision_size: int,
                  original_filename: str, original_size: int,
-                 original_mimetype: str, thumbnail_filename: str = None):
+                 original_mimetype: str, revision_compression: str = None,
+                 thumbnail_filename: str = None,
+                 thumbnail_status: ThumbnailStatus = None):
         self.user_id = user_id
         self.datafile_id = datafile_id
         self.revision_filename = revision_filename
         self.revision_size = revision_size
+        self.revision_compression = revision_compression
         self.original_filename = original_filename
         self.original_size = original_size
         self.original_mimetype = original_mimetype
         self.thumbnail_filename = thumbnail_filename
+        self.thumbnail_status = thumbnail_status
+        self.thumbnail_attempts = 0
+        self.thumbnail_retry_date = (
+            int(time.time()) if thumbnail_status == ThumbnailStatus.pending
+            else None)
         self.downloads_count = 0
 
-    @property
-    def revision_path(self):
-        return os.path.join(cfg.REVISIONS_BASE_PATH, self.revision_filename)
-
-    @property
-    def thumbnail_path(self):
-        return os.path.join(cfg.THUMBNAILS_BASE_PATH, self.thumbnail_filename)
-
     @property
     def thumbnail_url(self):
-        if self.thumbnail_filename:
+        if self.thumbnail_filename and self.thumbnail_status in [
+                None, ThumbnailStatus.ready]:
             return cfg.THUMBNAILS_BASE_URL + self.thumbnail_filename
 
     def to_dict(self):
@@ -79,6 +114,11 @@ class Revision(Base):
             "original_size": self.original_size,
             "original_mimetype": self.original_mimetype,
             "thumbnail_url": self.thumbnail_url,
+            "thumbnail_status": (self.thumbnail_status.value
+                                 if self.thumbnail_status else None),
+            "media_duration": self.media_duration,
+            "media_width": self.media_width,
+            "media_height": self.media_height,
             "downloads_count": self.downloads_count,
             "revision_user": self.revision_user.to_dict(),
         }
@@ -87,39 +127,21 @@ class Revision(Base):
 @event.listens_for(Revision, "after_delete")
 def after_delete_listener(mapper, connection, revision: Revision):
     """
-    Schedules asynchronous tasks to delete the files related to a
-    revision entity after it is deleted from the database. It creates
-    tasks to delete both the main revision file and the associated
-    thumbnail file if one exists. This function is triggered by
+    Journals the files of a revision entity for deletion after it is
+    deleted from the database. The entries are inserted through the
+    connection of the current flush, so they are committed or rolled
+    back together with the deletion; the orphans sweeper deletes the
+    files after the commit, unless other revisions with identical
+    content still reference them. This function is triggered by
     SQLAlchemy's after_delete event for the revision entity.
     """
-    asyncio.get_event_loop().create_task(delete_revision(revision))
-    asyncio.get_event_loop().create_task(delete_thumbnail(revision))
-
-
-async def delete_revision(revision: Revision):
-    """
-    Asynchronously deletes the file associated with the specified
-    revision entity. Exceptions that occur during the file deletion
-    process are logged for monitoring and debugging purposes.
-    """
-    try:
-        await FileManager.delete(revision.revision_path)
+    orphans = [{"orphan_kind": OrphanKind.revision,
+                "orphan_filename": revision.revision_filename,
+                "revision_id": revision.id}]
 
-    except Exception as e:
-        log.error("File deletion failed; module=revision_model; "
-                  "function=delete_revision; e=%s;" % str(e))
-
-
-async def delete_thumbnail(revision: Revision):
-    """
-    Asynchronously deletes the thumbnail associated with the specified
-    revision entity. Exceptions that occur during the file deletion
-    process are logged for monitoring and debugging purposes.
-    """
     if revision.thumbnail_filename:
-        try:
-            await FileManager.delete(revision.thumbnail_path)
-        except Exception as e:
-            log.error("File deletion failed; module=revision_model; "
-                      "function=delete_thumbnail; e=%s;" % str(e))
+        orphans.append({"orphan_kind": OrphanKind.thumbnail,
+                        "orphan_filename": revision.thumbnail_filename,
+                        "revision_id": revision.id})
+
+    connection.execute(insert(Orphan), orphans)
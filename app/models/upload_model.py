@@ -0,0 +1,51 @@
+import os
+import time
+from sqlalchemy import Column, BigInteger, Integer, String, ForeignKey
+from app.config import get_config
+from app.database import Base
+
+cfg = get_config()
+
+UPLOAD_FINALIZING_EXTENSION = ".finalizing"
+
+
+class Upload(Base):
+    __tablename__ = "datafiles_uploads"
+    _cacheable = False
+
+    id = Column(BigInteger, primary_key=True)
+    created_date = Column(Integer, index=True,
+                          default=lambda: int(time.time()))
+    expires_date = Column(Integer, index=True, nullable=False)
+    user_id = Column(BigInteger, ForeignKey("users.id"), index=True)
+    original_filename = Column(String(256), nullable=False)
+    original_mimetype = Column(String(256), nullable=False)
+
+    def __init__(self, user_id: int, original_filename: str,
+                 original_mimetype: str):
+        self.expires_date = int(time.time()) + cfg.UPLOADS_EXPIRES
+        self.user_id = user_id
+        self.original_filename = original_filename
+        self.original_mimetype = original_mimetype
+
+    @property
+    def upload_path(self):
+        return os.path.join(cfg.UPLOADS_BASE_PATH, str(self.id))
+
+    @property
+    def finalizing_path(self):
+        return self.upload_path + UPLOAD_FINALIZING_EXTENSION
+
+    @property
+    def is_expired(self) -> bool:
+        return self.expires_date <= int(time.time())
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "created_date": self.created_date,
+            "expires_date": self.expires_date,
+            "user_id": self.user_id,
+            "original_filename": self.original_filename,
+            "original_mimetype": self.original_mimetype,
+        }
@@ -1,4 +1,3 @@
-import os
 import enum
 import time
 from sqlalchemy import (Boolean, Column, BigInteger, Integer, SmallInteger,
@@ -133,11 +132,6 @@ class User(Base, MFAMixin, FernetMixin):
         if self.userpic_filename:
             return cfg.USERPIC_BASE_URL + self.userpic_filename
 
-    @property
-    def userpic_path(self):
-        if self.userpic_filename:
-            return os.path.join(cfg.USERPIC_BASE_PATH, self.userpic_filename)
-
     def to_dict(self) -> dict:
         return {
             "id": self.id,
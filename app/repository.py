@@ -7,7 +7,7 @@ selecting, updating, deleting, counting, and summing models, along
 with transaction management through commit and rollback.
 """
 
-from typing import List, Type, Union
+from typing import Dict, List, Type, Union
 from redis import Redis
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import DeclarativeBase
@@ -45,6 +45,14 @@ class Repository:
         """
         await self.entity_manager.insert(entity, commit=commit)
 
+    async def insert_all(self, entities: List[DeclarativeBase],
+                         commit: bool = True):
+        """
+        Inserts several SQLAlchemy models into the database in a single
+        flush, with optional immediate transaction commit.
+        """
+        await self.entity_manager.insert_all(entities, commit=commit)
+
     async def select(self, **kwargs) -> Union[DeclarativeBase, None]:
         """
         Retrieves a SQLAlchemy model based on the provided criteria
@@ -68,17 +76,43 @@ class Repository:
 
         return entity
 
+    async def select_many(self, ids: List[int]) -> Dict[int, DeclarativeBase]:
+        """
+        Retrieves the SQLAlchemy models with the given IDs, taking the
+        cached ones with a single cache request and selecting the rest
+        from the database with a single query, which are then cached at
+        once. Returns the models found by their IDs; empty IDs are
+        skipped.
+        """
+        ids = list(dict.fromkeys(x for x in ids if x is not None))
+        entities = {}
+
+        if self.entity_class._cacheable and ids:
+            entities = await self.cache_manager.get_many(
+                self.entity_class, ids)
+
+        missing_ids = [x for x in ids if x not in entities]
+        if missing_ids:
+            selected = await self.entity_manager.select_many(
+                self.entity_class, missing_ids)
+
+            if self.entity_class._cacheable:
+                await self.cache_manager.set_many(selected)
+
+            entities.update({entity.id: entity for entity in selected})
+
+        return entities
+
     async def select_all(self, **kwargs) -> List[DeclarativeBase]:
         """
         Retrieves all SQLAlchemy models that match the given criteria,
-        with optional caching.
+        with optional caching of all of them at once.
         """
         entities = await self.entity_manager.select_all(
             self.entity_class, **kwargs)
 
         if self.entity_class._cacheable:
-            for entity in entities:
-                await self.cache_manager.set(entity)
+            await self.cache_manager.set_many(entities)
 
         return entities
 
@@ -121,6 +155,14 @@ class Repository:
         """
         return await self.entity_manager.count_all(self.entity_class, **kwargs)
 
+    async def count_grouped(self, column_name: str, **kwargs) -> dict:
+        """
+        Counts the SQLAlchemy models that match the given criteria for
+        each value of the column.
+        """
+        return await self.entity_manager.count_grouped(
+            self.entity_class, column_name, **kwargs)
+
     async def sum_all(self, column_name: str, **kwargs) -> int:
         """
         Calculates the sum of a specific column for all SQLAlchemy
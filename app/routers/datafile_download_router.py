@@ -1,5 +1,5 @@
-from fastapi import APIRouter, Depends, status
-from fastapi.responses import Response
+from fastapi import APIRouter, Depends, Header, status
+from fastapi.responses import StreamingResponse
 from app.database import get_session
 from app.cache import get_cache
 from app.decorators.locked_decorator import locked
@@ -11,7 +11,7 @@ from app.hooks import Hook
 from app.errors import E
 from app.auth import auth
 from app.repository import Repository
-from app.managers.file_manager import FileManager
+from app.helpers.range_helper import get_byte_range, revision_response
 from app.constants import (
     LOC_PATH, ERR_RESOURCE_NOT_FOUND, HOOK_BEFORE_REVISION_DOWNLOAD,
     HOOK_AFTER_REVISION_DOWNLOAD)
@@ -21,14 +21,16 @@ router = APIRouter()
 
 @router.get("/datafile/{datafile_id}/download",
             summary="Download the latest revision of a datafile.",
-            response_class=Response, status_code=status.HTTP_200_OK,
-            tags=["Datafiles"])
+            response_class=StreamingResponse,
+            status_code=status.HTTP_200_OK, tags=["Datafiles"])
 @locked
 async def datafile_download(
     datafile_id: int,
+    range_header: str = Header(None, alias="Range"),
+    if_range_header: str = Header(None, alias="If-Range"),
     session=Depends(get_session), cache=Depends(get_cache),
     current_user: User = Depends(auth(UserRole.reader))
-) -> Response:
+) -> StreamingResponse:
     datafile_repository = Repository(session, cache, Datafile)
     datafile = await datafile_repository.select(id=datafile_id)
     if not datafile:
@@ -39,8 +41,13 @@ async def datafile_download(
     datafile.latest_revision = await revision_repository.select(
         id=datafile.latest_revision_id)
 
-    data = await FileManager.read(datafile.latest_revision.revision_path)
-    decrypted_data = await FileManager.decrypt(data)
+    byte_range = get_byte_range(
+        datafile.latest_revision, range_header, if_range_header)
+
+    # Partial requests that continue a download or seek within a video
+    # are not counted as separate downloads.
+    if byte_range and byte_range[0] > 0:
+        return revision_response(datafile.latest_revision, byte_range)
 
     download_repository = Repository(session, cache, Download)
     download = Download(
@@ -58,6 +65,4 @@ async def datafile_download(
     await datafile_repository.commit()
     await hook.do(HOOK_AFTER_REVISION_DOWNLOAD, datafile.latest_revision)
 
-    headers = {"Content-Disposition": f"attachment; filename={datafile.latest_revision.original_filename}"}  # noqa E501
-    return Response(content=decrypted_data, headers=headers,
-                    media_type=datafile.latest_revision.original_mimetype)
+    return revision_response(datafile.latest_revision, byte_range)
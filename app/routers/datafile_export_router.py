@@ -0,0 +1,132 @@
+"""
+The module defines a FastAPI router for downloading several datafiles
+at once as a ZIP archive.
+"""
+
+from fastapi import APIRouter, Depends, status
+from fastapi.responses import StreamingResponse
+from app.database import get_session
+from app.cache import get_cache
+from app.decorators.locked_decorator import locked
+from app.models.user_model import User, UserRole
+from app.models.collection_model import Collection
+from app.models.datafile_model import Datafile
+from app.models.revision_model import Revision
+from app.models.download_model import Download
+from app.schemas.datafile_schemas import DatafileExportRequest
+from app.hooks import Hook
+from app.errors import E
+from app.auth import auth
+from app.repository import Repository
+from app.helpers.zip_helper import ZIP_MIMETYPE, get_zip_names, zip_stream
+from app.constants import (
+    LOC_QUERY, ERR_RESOURCE_NOT_FOUND, ERR_VALUE_INVALID,
+    HOOK_BEFORE_REVISION_DOWNLOAD, HOOK_AFTER_REVISION_DOWNLOAD)
+
+router = APIRouter()
+
+
+@router.get("/datafiles/download",
+            summary="Download datafiles as a ZIP archive.",
+            response_class=StreamingResponse,
+            status_code=status.HTTP_200_OK, tags=["Datafiles"])
+@locked
+async def datafile_export(
+    schema=Depends(DatafileExportRequest),
+    session=Depends(get_session), cache=Depends(get_cache),
+    current_user: User = Depends(auth(UserRole.reader))
+) -> StreamingResponse:
+    """
+    FastAPI router for downloading the latest revisions of several
+    datafile entities as a single ZIP archive, either all datafiles of
+    the collection or the datafiles from the list of IDs. The archive
+    is streamed while the revisions are decrypted one by one; the
+    downloads of all datafiles are recorded in a single transaction
+    before the response starts. The current user should have a reader
+    role or higher. Datafiles of the collection without a revision are
+    skipped. Returns a 200 response on success, a 404 error if the
+    collection or any of the datafiles or their revisions is not found,
+    a 422 error if neither or both of the collection and the datafiles
+    are given, and a 403 error if authentication fails or the user does
+    not have the required role.
+    """
+    if (schema.collection_id is None) == (schema.datafile_ids is None):
+        raise E([LOC_QUERY, "datafile_ids"], schema.datafile_ids,
+                ERR_VALUE_INVALID, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    datafile_repository = Repository(session, cache, Datafile)
+
+    if schema.collection_id is not None:
+        collection_repository = Repository(session, cache, Collection)
+        collection = await collection_repository.select(
+            id=schema.collection_id)
+        if not collection:
+            raise E([LOC_QUERY, "collection_id"], schema.collection_id,
+                    ERR_RESOURCE_NOT_FOUND, status.HTTP_404_NOT_FOUND)
+
+        datafiles = await datafile_repository.select_all(
+            collection_id__eq=collection.id, order_by="id", order="asc")
+        archive_filename = "collection-%s.zip" % collection.id
+
+    else:
+        datafile_ids = list(dict.fromkeys(
+            int(x) for x in schema.datafile_ids.split(",")))
+        datafiles = await datafile_repository.select_all(
+            id__in=",".join(str(x) for x in datafile_ids),
+            order_by="id", order="asc")
+
+        found_ids = [datafile.id for datafile in datafiles]
+        missing_ids = [x for x in datafile_ids if x not in found_ids]
+        if missing_ids:
+            raise E([LOC_QUERY, "datafile_ids"], missing_ids[0],
+                    ERR_RESOURCE_NOT_FOUND, status.HTTP_404_NOT_FOUND)
+        archive_filename = "datafiles.zip"
+
+    revision_repository = Repository(session, cache, Revision)
+    revisions = await revision_repository.select_many(
+        [datafile.latest_revision_id for datafile in datafiles])
+    for datafile in datafiles:
+        datafile.latest_revision = revisions.get(datafile.latest_revision_id)
+        if not datafile.latest_revision and schema.datafile_ids is not None:
+            raise E([LOC_QUERY, "datafile_ids"], datafile.id,
+                    ERR_RESOURCE_NOT_FOUND, status.HTTP_404_NOT_FOUND)
+
+    # Datafiles of the collection without a revision have nothing to
+    # download.
+    datafiles = [datafile for datafile in datafiles
+                 if datafile.latest_revision]
+
+    hook = Hook(session, cache, current_user=current_user)
+
+    if datafiles:
+        download_repository = Repository(session, cache, Download)
+        await download_repository.insert_all([
+            Download(current_user.id, datafile.id,
+                     datafile.latest_revision.id)
+            for datafile in datafiles], commit=False)
+
+        downloads_counts = await download_repository.count_grouped(
+            "datafile_id", datafile_id__in=",".join(
+                str(datafile.id) for datafile in datafiles))
+
+        for datafile in datafiles:
+            datafile.downloads_count = downloads_counts.get(datafile.id, 0)
+            await datafile_repository.update(datafile, commit=False)
+            await hook.do(HOOK_BEFORE_REVISION_DOWNLOAD,
+                          datafile.latest_revision)
+
+        await datafile_repository.commit()
+
+        for datafile in datafiles:
+            await hook.do(HOOK_AFTER_REVISION_DOWNLOAD,
+                          datafile.latest_revision)
+
+    zip_names = get_zip_names([datafile.latest_revision.original_filename
+                               for datafile in datafiles])
+    revisions = [(zip_name, datafile.latest_revision)
+                 for zip_name, datafile in zip(zip_names, datafiles)]
+
+    return StreamingResponse(
+        zip_stream(revisions), media_type=ZIP_MIMETYPE, headers={
+            "Content-Disposition": "attachment; filename=%s" % (
+                archive_filename)})
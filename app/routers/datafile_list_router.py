@@ -46,9 +46,10 @@ async def datafile_list(
     datafiles_count = await datafile_repository.count_all(**kwargs)
 
     revision_repository = Repository(session, cache, Revision)
+    revisions = await revision_repository.select_many(
+        [datafile.latest_revision_id for datafile in datafiles])
     for datafile in datafiles:
-        datafile.latest_revision = await revision_repository.select(
-          id=datafile.latest_revision_id)
+        datafile.latest_revision = revisions.get(datafile.latest_revision_id)
 
     hook = Hook(session, cache, current_user=current_user)
     await hook.do(HOOK_AFTER_DATAFILE_LIST, datafiles)
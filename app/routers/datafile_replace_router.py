@@ -1,6 +1,4 @@
-import uuid
-import os
-from fastapi import APIRouter, Depends, status, File, UploadFile
+from fastapi import APIRouter, Depends, Request, status
 from fastapi.responses import JSONResponse
 from app.database import get_session
 from app.cache import get_cache
@@ -12,25 +10,25 @@ from app.models.revision_model import Revision
 from app.hooks import Hook
 from app.auth import auth
 from app.repository import Repository
-from app.config import get_config
 from app.schemas.datafile_schemas import DatafileReplaceResponse
-from app.managers.file_manager import FileManager
-from app.helpers.image_helper import thumbnail_create
+from app.helpers.thumbnail_helper import thumbnails_notify
+from app.helpers.upload_helper import revision_receive, revision_discard
+from app.helpers.multipart_helper import MultipartStream, MULTIPART_FILE_BODY
 from app.errors import E
 from app.constants import (
     LOC_PATH, ERR_RESOURCE_NOT_FOUND, ERR_RESOURCE_LOCKED,
     HOOK_BEFORE_DATAFILE_REPLACE, HOOK_AFTER_DATAFILE_REPLACE)
 
-cfg = get_config()
 router = APIRouter()
 
 
 @router.post("/datafile/{datafile_id}", summary="Replace a datafile",
              response_class=JSONResponse, status_code=status.HTTP_201_CREATED,
-             response_model=DatafileReplaceResponse, tags=["Datafiles"])
+             response_model=DatafileReplaceResponse, tags=["Datafiles"],
+             openapi_extra=MULTIPART_FILE_BODY)
 @locked
 async def datafile_replace(
-    datafile_id: int, file: UploadFile = File(...),
+    datafile_id: int, request: Request,
     session=Depends(get_session), cache=Depends(get_cache),
     current_user: User = Depends(auth(UserRole.editor))
 ) -> DatafileReplaceResponse:
@@ -46,31 +44,22 @@ async def datafile_replace(
         raise E([LOC_PATH, "datafile_id"], datafile_id,
                 ERR_RESOURCE_LOCKED, status.HTTP_423_LOCKED)
 
-    # upload file
-    revision_filename = str(uuid.uuid4()) + cfg.REVISIONS_EXTENSION
-    revision_path = os.path.join(cfg.REVISIONS_BASE_PATH, revision_filename)
-    await FileManager.upload(file, revision_path)
+    file = MultipartStream(request)
+    await file.open()
 
-    # create thumbnail
-    thumbnail_filename = None
-    try:
-        mimetype = file.content_type
-        thumbnail_filename = await thumbnail_create(revision_path, mimetype)
-    except Exception:
-        pass
+    # Receive, hash and encrypt the file in a single pass.
+    received = await revision_receive(file.read_chunks(), file.content_type)
 
     try:
-        # encrypt file
-        data = await FileManager.read(revision_path)
-        encrypted_data = await FileManager.encrypt(data)
-        await FileManager.write(revision_path, encrypted_data)
-
         # insert revision
         revision_repository = Repository(session, cache, Revision)
         revision = Revision(
-            current_user.id, datafile.id, revision_filename,
-            os.path.getsize(revision_path), file.filename, file.size,
-            file.content_type, thumbnail_filename=thumbnail_filename)
+            current_user.id, datafile.id, received["revision_filename"],
+            received["revision_size"], file.filename,
+            received["original_size"], file.content_type,
+            revision_compression=received["revision_compression"],
+            thumbnail_filename=received["thumbnail_filename"],
+            thumbnail_status=received["thumbnail_status"])
         await revision_repository.insert(revision, commit=False)
 
         # update latest_revision_id
@@ -88,7 +77,7 @@ async def datafile_replace(
         datafile.revisions_count = await revision_repository.count_all(
             datafile_id__eq=datafile.id)
         datafile.revisions_size = await revision_repository.sum_all(
-            "revision_size", datafile_id__eq=datafile.id)
+            "original_size", datafile_id__eq=datafile.id)
         datafile.datafile_name = file.filename
         await datafile_repository.update(datafile, commit=False)
 
@@ -115,14 +104,11 @@ async def datafile_replace(
         await hook.do(HOOK_BEFORE_DATAFILE_REPLACE, datafile)
 
         await datafile_repository.commit()
+        thumbnails_notify()
         await hook.do(HOOK_AFTER_DATAFILE_REPLACE, datafile)
 
     except Exception as e:
-        await FileManager.delete(revision_path)
-        if thumbnail_filename:
-            thumbnail_path = os.path.join(
-                cfg.THUMBNAILS_BASE_PATH, thumbnail_filename)
-            await FileManager.delete(thumbnail_path)
+        await revision_discard(received)
         raise e
 
     return {
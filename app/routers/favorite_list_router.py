@@ -45,10 +45,12 @@ async def favorite_list(
     favorites_count = await favorite_repository.count_all(**kwargs)
 
     revision_repository = Repository(session, cache, Revision)
+    revisions = await revision_repository.select_many(
+        [favorite.favorite_datafile.latest_revision_id
+         for favorite in favorites])
     for favorite in favorites:
-        favorite.favorite_datafile.latest_revision = (
-                await revision_repository.select(
-                    id=favorite.favorite_datafile.latest_revision_id))
+        favorite.favorite_datafile.latest_revision = revisions.get(
+            favorite.favorite_datafile.latest_revision_id)
 
     hook = Hook(session, cache, current_user=current_user)
     await hook.do(HOOK_AFTER_FAVORITE_LIST, favorites)
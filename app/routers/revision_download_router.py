@@ -2,8 +2,8 @@
 The module defines a FastAPI router for downloading revision entities.
 """
 
-from fastapi import APIRouter, Depends, status
-from fastapi.responses import Response
+from fastapi import APIRouter, Depends, Header, status
+from fastapi.responses import StreamingResponse
 from app.database import get_session
 from app.cache import get_cache
 from app.decorators.locked_decorator import locked
@@ -15,7 +15,7 @@ from app.hooks import Hook
 from app.errors import E
 from app.auth import auth
 from app.repository import Repository
-from app.managers.file_manager import FileManager
+from app.helpers.range_helper import get_byte_range, revision_response
 from app.constants import (
     LOC_PATH, ERR_RESOURCE_NOT_FOUND, HOOK_BEFORE_REVISION_DOWNLOAD,
     HOOK_AFTER_REVISION_DOWNLOAD)
@@ -25,22 +25,27 @@ router = APIRouter()
 
 @router.get("/datafile/{datafile_id}/revision/{revision_id}/download",
             summary="Download a specified revision of a datafile.",
-            response_class=Response, status_code=status.HTTP_200_OK,
-            tags=["Datafiles"])
+            response_class=StreamingResponse,
+            status_code=status.HTTP_200_OK, tags=["Datafiles"])
 @locked
 async def revision_download(
     datafile_id: int, revision_id: int,
+    range_header: str = Header(None, alias="Range"),
+    if_range_header: str = Header(None, alias="If-Range"),
     session=Depends(get_session), cache=Depends(get_cache),
     current_user: User = Depends(auth(UserRole.reader))
-) -> Response:
+) -> StreamingResponse:
     """
     FastAPI router for downloading a revision entity. The router
     retrieves the specified revision from the repository, decrypts the
-    associated file, executes related hooks, and returns the file as an
-    attachment. The current user should have a reader role or higher.
-    Returns a 200 response on success, a 404 error if the revision is
-    not found, and a 403 error if authentication fails or the user
-    does not have the required role.
+    associated file as a stream, executes related hooks, and returns
+    the file as an attachment. The Range and If-Range headers are
+    honoured for a single byte range. The current user should have a
+    reader role or higher. Returns a 200 response on success, a 206
+    response for a byte range, a 404 error if the revision is not
+    found, a 416 error if the range cannot be satisfied, and a 403
+    error if authentication fails or the user does not have the
+    required role.
     """
     revision_repository = Repository(session, cache, Revision)
     revision = await revision_repository.select(id=revision_id)
@@ -48,8 +53,12 @@ async def revision_download(
         raise E([LOC_PATH, "revision_id"], revision_id,
                 ERR_RESOURCE_NOT_FOUND, status.HTTP_404_NOT_FOUND)
 
-    data = await FileManager.read(revision.revision_path)
-    decrypted_data = await FileManager.decrypt(data)
+    byte_range = get_byte_range(revision, range_header, if_range_header)
+
+    # Partial requests that continue a download or seek within a video
+    # are not counted as separate downloads.
+    if byte_range and byte_range[0] > 0:
+        return revision_response(revision, byte_range)
 
     download_repository = Repository(session, cache, Download)
     download = Download(
@@ -69,6 +78,4 @@ async def revision_download(
     await revision_repository.commit()
     await hook.do(HOOK_AFTER_REVISION_DOWNLOAD, revision)
 
-    headers = {"Content-Disposition": f"attachment; filename={revision.original_filename}"}  # noqa E501
-    return Response(content=decrypted_data, headers=headers,
-                    media_type=revision.original_mimetype)
+    return revision_response(revision, byte_range)
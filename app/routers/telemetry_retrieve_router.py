@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, status
 from fastapi.responses import JSONResponse
 from app.database import get_session
-from app.cache import get_cache
+from app.cache import get_cache, cache_pool
 from app.auth import auth
 from app.models.user_model import User, UserRole
 from app.decorators.locked_decorator import locked
@@ -13,6 +13,11 @@ from app.version import __version__
 from app.serial import __serial__
 from app.model import __model__
 from app.hooks import Hook
+from app.helpers.content_cache_helper import content_cache
+from app.managers.cache_manager import memory_cache
+from app.helpers.media_helper import media_pool
+from app.helpers.io_helper import io_pool
+from app.helpers.scrub_helper import scrub_stats
 from app.constants import HOOK_ON_TELEMETRY_RETRIEVE
 
 router = APIRouter()
@@ -77,4 +82,6 @@ async def telemetry_retrieve(
         "cpu_core_count": psutil.cpu_count(logical=False),
         "cpu_frequency": int(psutil.cpu_freq(percpu=False).current),
         "cpu_usage_percent": psutil.cpu_percent(),
-    }
+    } | content_cache.get_stats() | media_pool.get_stats() | (
+        io_pool.get_stats()) | cache_pool.get_stats() | (
+        memory_cache.get_stats()) | await scrub_stats(session)
@@ -0,0 +1,82 @@
+"""
+The module defines a FastAPI router for retrieving thumbnail renditions
+of revision entities.
+"""
+
+from typing import Literal
+from fastapi import APIRouter, Depends, Header, Response, status
+from fastapi.responses import FileResponse
+from app.database import get_session
+from app.cache import get_cache
+from app.decorators.locked_decorator import locked
+from app.models.user_model import User, UserRole
+from app.models.revision_model import Revision
+from app.hooks import Hook
+from app.errors import E
+from app.auth import auth
+from app.repository import Repository
+from app.helpers.rendition_helper import (
+    get_rendition_mimetype, get_rendition_filename, rendition_retrieve,
+    RENDITION_PRESETS)
+from app.constants import (
+    LOC_PATH, ERR_RESOURCE_NOT_FOUND, HOOK_AFTER_THUMBNAIL_RETRIEVE)
+
+router = APIRouter()
+
+RENDITION_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+@router.get("/datafile/{datafile_id}/revision/{revision_id}/thumbnail/"
+            "{preset}", summary="Retrieve a thumbnail of a revision.",
+            response_class=FileResponse, status_code=status.HTTP_200_OK,
+            tags=["Datafiles"])
+@locked
+async def thumbnail_retrieve(
+    datafile_id: int, revision_id: int,
+    preset: Literal[tuple(RENDITION_PRESETS)],
+    accept_header: str = Header(None, alias="Accept"),
+    if_none_match_header: str = Header(None, alias="If-None-Match"),
+    session=Depends(get_session), cache=Depends(get_cache),
+    current_user: User = Depends(auth(UserRole.reader))
+):
+    """
+    FastAPI router for retrieving a thumbnail rendition of a revision
+    entity in the size preset from the path. The rendition is returned
+    in the best format accepted by the Accept header, AVIF, WebP or
+    JPEG, and is created on the first request. Renditions never change,
+    so the response may be cached indefinitely and the If-None-Match
+    header is honoured. The current user should have a reader role or
+    higher. Returns a 200 response on success, a 304 response if the
+    rendition is not modified, a 404 error if the revision is not found
+    or has no thumbnail ready, a 422 error if the preset is unknown,
+    and a 403 error if authentication fails or the user does not have
+    the required role.
+    """
+    revision_repository = Repository(session, cache, Revision)
+    revision = await revision_repository.select(id=revision_id)
+
+    if (not revision or revision.datafile_id != datafile_id or
+            not revision.thumbnail_url):
+        raise E([LOC_PATH, "revision_id"], revision_id,
+                ERR_RESOURCE_NOT_FOUND, status.HTTP_404_NOT_FOUND)
+
+    mimetype = get_rendition_mimetype(accept_header)
+    etag = '"%s"' % get_rendition_filename(
+        revision.thumbnail_filename, preset, mimetype)
+    headers = {
+        "Cache-Control": RENDITION_CACHE_CONTROL,
+        "Vary": "Accept",
+        "ETag": etag,
+    }
+
+    if if_none_match_header and etag in [
+            x.strip() for x in if_none_match_header.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED,
+                        headers=headers)
+
+    rendition_path = await rendition_retrieve(revision, preset, mimetype)
+
+    hook = Hook(session, cache, current_user=current_user)
+    await hook.do(HOOK_AFTER_THUMBNAIL_RETRIEVE, revision)
+
+    return FileResponse(rendition_path, media_type=mimetype, headers=headers)
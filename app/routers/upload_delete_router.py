@@ -0,0 +1,56 @@
+from fastapi import APIRouter, Depends, status
+from fastapi.responses import JSONResponse
+from app.database import get_session
+from app.cache import get_cache
+from app.decorators.locked_decorator import locked
+from app.models.user_model import User, UserRole
+from app.models.upload_model import Upload
+from app.schemas.upload_schemas import UploadDeleteResponse
+from app.managers.file_manager import FileManager
+from app.repository import Repository
+from app.hooks import Hook
+from app.auth import auth
+from app.errors import E
+from app.constants import (
+    LOC_PATH, ERR_RESOURCE_NOT_FOUND, HOOK_BEFORE_UPLOAD_DELETE,
+    HOOK_AFTER_UPLOAD_DELETE)
+
+router = APIRouter()
+
+
+@router.delete("/upload/{upload_id}", summary="Delete an upload session",
+               response_class=JSONResponse, status_code=status.HTTP_200_OK,
+               response_model=UploadDeleteResponse, tags=["Datafiles"])
+@locked
+async def upload_delete(
+    upload_id: int,
+    session=Depends(get_session), cache=Depends(get_cache),
+    current_user: User = Depends(auth(UserRole.writer))
+) -> UploadDeleteResponse:
+    """
+    FastAPI router for deleting an upload session. The router fetches
+    the session from the repository, verifies that it exists and
+    belongs to the current user, deletes the session with the parts
+    received so far, executes related hooks, and returns the deleted
+    session ID in a JSON response. The current user should have a
+    writer role or higher. Returns a 200 response on success, a 404
+    error if the session is not found, and a 403 error if
+    authentication fails or the user does not have the required role.
+    """
+    upload_repository = Repository(session, cache, Upload)
+    upload = await upload_repository.select(id=upload_id)
+
+    if not upload or upload.user_id != current_user.id:
+        raise E([LOC_PATH, "upload_id"], upload_id,
+                ERR_RESOURCE_NOT_FOUND, status.HTTP_404_NOT_FOUND)
+
+    await upload_repository.delete(upload, commit=False)
+
+    hook = Hook(session, cache, current_user=current_user)
+    await hook.do(HOOK_BEFORE_UPLOAD_DELETE, upload)
+
+    await upload_repository.commit()
+    await FileManager.delete_dir(upload.upload_path)
+    await hook.do(HOOK_AFTER_UPLOAD_DELETE, upload)
+
+    return {"upload_id": upload.id}
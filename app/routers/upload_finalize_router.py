@@ -0,0 +1,126 @@
+from fastapi import APIRouter, Depends, status
+from fastapi.responses import JSONResponse
+from app.database import get_session
+from app.cache import get_cache
+from app.decorators.locked_decorator import locked
+from app.models.user_model import User, UserRole
+from app.models.datafile_model import Datafile
+from app.models.revision_model import Revision
+from app.models.upload_model import Upload
+from app.hooks import Hook
+from app.auth import auth
+from app.repository import Repository
+from app.schemas.upload_schemas import UploadFinalizeResponse
+from app.managers.file_manager import FileManager
+from app.helpers.thumbnail_helper import thumbnails_notify
+from app.helpers.upload_helper import (
+    revision_receive, revision_discard, get_parts, parts_read)
+from app.errors import E
+from app.constants import (
+    LOC_PATH, ERR_RESOURCE_NOT_FOUND, ERR_RESOURCE_LOCKED, ERR_VALUE_EMPTY,
+    HOOK_BEFORE_DATAFILE_UPLOAD, HOOK_AFTER_DATAFILE_UPLOAD)
+
+router = APIRouter()
+
+
+@router.post("/upload/{upload_id}", summary="Finalize an upload session",
+             response_class=JSONResponse, status_code=status.HTTP_201_CREATED,
+             response_model=UploadFinalizeResponse, tags=["Datafiles"])
+@locked
+async def upload_finalize(
+    upload_id: int,
+    session=Depends(get_session), cache=Depends(get_cache),
+    current_user: User = Depends(auth(UserRole.writer))
+) -> UploadFinalizeResponse:
+    """
+    FastAPI router for finalizing an upload session into a new datafile.
+    The router verifies that the session exists, belongs to the current
+    user and has not expired, and that its parts are numbered from one
+    without gaps. The parts are then joined in order and stored as the
+    revision of a new datafile exactly as a single-request upload is,
+    including the thumbnail and the datafile upload hooks, and the
+    session is deleted. The current user should have a writer role or
+    higher. Returns a 201 response on success, a 404 error if the
+    session is not found or expired, a 422 error if parts are missing,
+    a 423 error if the session is already being finalized, and a 403
+    error if authentication fails or the user does not have the
+    required role.
+    """
+    upload_repository = Repository(session, cache, Upload)
+    upload = await upload_repository.select(id=upload_id)
+
+    if not upload or upload.user_id != current_user.id or upload.is_expired:
+        raise E([LOC_PATH, "upload_id"], upload_id,
+                ERR_RESOURCE_NOT_FOUND, status.HTTP_404_NOT_FOUND)
+
+    parts = await get_parts(upload.upload_path)
+    parts_count = len(parts)
+
+    if not parts or sorted(parts) != list(range(1, parts_count + 1)):
+        raise E([LOC_PATH, "upload_id"], upload_id,
+                ERR_VALUE_EMPTY, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    # Renaming the session directory claims the session, so concurrent
+    # finalizations and late parts are rejected; it is renamed back if
+    # the finalization fails and can be retried.
+    try:
+        await FileManager.move(upload.upload_path, upload.finalizing_path)
+
+    except OSError:
+        raise E([LOC_PATH, "upload_id"], upload_id,
+                ERR_RESOURCE_LOCKED, status.HTTP_423_LOCKED)
+
+    try:
+        received = await revision_receive(
+            parts_read(upload.finalizing_path, parts_count),
+            upload.original_mimetype)
+
+    except Exception as e:
+        await FileManager.move(upload.finalizing_path, upload.upload_path)
+        raise e
+
+    try:
+        # insert datafile
+        datafile_repository = Repository(session, cache, Datafile)
+        datafile = Datafile(
+            current_user.id, upload.original_filename, revisions_count=1,
+            revisions_size=received["original_size"])
+        await datafile_repository.insert(datafile, commit=False)
+
+        # insert revision
+        revision_repository = Repository(session, cache, Revision)
+        revision = Revision(
+            current_user.id, datafile.id, received["revision_filename"],
+            received["revision_size"], upload.original_filename,
+            received["original_size"], upload.original_mimetype,
+            revision_compression=received["revision_compression"],
+            thumbnail_filename=received["thumbnail_filename"],
+            thumbnail_status=received["thumbnail_status"])
+        await revision_repository.insert(revision, commit=False)
+
+        # update latest_revision_id
+        datafile.latest_revision_id = revision.id
+        await datafile_repository.update(datafile, commit=False)
+
+        # delete upload session
+        await upload_repository.delete(upload, commit=False)
+
+        # execute hooks
+        hook = Hook(session, cache, current_user=current_user)
+        await hook.do(HOOK_BEFORE_DATAFILE_UPLOAD, datafile)
+
+        await datafile_repository.commit()
+        thumbnails_notify()
+
+    except Exception as e:
+        await revision_discard(received)
+        await FileManager.move(upload.finalizing_path, upload.upload_path)
+        raise e
+
+    await FileManager.delete_dir(upload.finalizing_path)
+    await hook.do(HOOK_AFTER_DATAFILE_UPLOAD, datafile)
+
+    return {
+        "datafile_id": datafile.id,
+        "revision_id": revision.id,
+    }
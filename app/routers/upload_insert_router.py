@@ -0,0 +1,54 @@
+from fastapi import APIRouter, Depends, status
+from fastapi.responses import JSONResponse
+from app.database import get_session
+from app.cache import get_cache
+from app.decorators.locked_decorator import locked
+from app.models.user_model import User, UserRole
+from app.models.upload_model import Upload
+from app.schemas.upload_schemas import (
+    UploadInsertRequest, UploadInsertResponse)
+from app.managers.file_manager import FileManager
+from app.repository import Repository
+from app.hooks import Hook
+from app.auth import auth
+from app.constants import HOOK_BEFORE_UPLOAD_INSERT, HOOK_AFTER_UPLOAD_INSERT
+
+router = APIRouter()
+
+
+@router.post("/upload", summary="Create an upload session",
+             response_class=JSONResponse, status_code=status.HTTP_201_CREATED,
+             response_model=UploadInsertResponse, tags=["Datafiles"])
+@locked
+async def upload_insert(
+    schema: UploadInsertRequest,
+    session=Depends(get_session), cache=Depends(get_cache),
+    current_user: User = Depends(auth(UserRole.writer))
+) -> UploadInsertResponse:
+    """
+    FastAPI router for creating an upload session, which receives a new
+    datafile in numbered parts that can be sent in parallel and resent
+    after a dropped connection. The router inserts the session into the
+    repository, creates the directory for its parts, executes related
+    hooks, and returns the session ID and expiration date in a JSON
+    response. The current user should have a writer role or higher.
+    Returns a 201 response on success, a 422 error if the filename or
+    MIME type is invalid, and a 403 error if authentication fails or
+    the user does not have the required role.
+    """
+    upload_repository = Repository(session, cache, Upload)
+    upload = Upload(current_user.id, schema.original_filename,
+                    schema.original_mimetype)
+    await upload_repository.insert(upload, commit=False)
+
+    hook = Hook(session, cache, current_user=current_user)
+    await hook.do(HOOK_BEFORE_UPLOAD_INSERT, upload)
+
+    await upload_repository.commit()
+    await FileManager.makedirs(upload.upload_path)
+    await hook.do(HOOK_AFTER_UPLOAD_INSERT, upload)
+
+    return {
+        "upload_id": upload.id,
+        "expires_date": upload.expires_date,
+    }
@@ -0,0 +1,100 @@
+from typing import AsyncIterator
+from fastapi import APIRouter, Depends, Request, status
+from fastapi.responses import JSONResponse
+from app.database import get_session
+from app.cache import get_cache
+from app.decorators.locked_decorator import locked
+from app.models.user_model import User, UserRole
+from app.models.upload_model import Upload
+from app.schemas.upload_schemas import UploadPartResponse
+from app.managers.file_manager import FileManager
+from app.helpers.upload_helper import get_part_path
+from app.repository import Repository
+from app.config import get_config
+from app.errors import E
+from app.auth import auth
+from app.constants import (
+    LOC_PATH, LOC_BODY, ERR_RESOURCE_NOT_FOUND, ERR_RESOURCE_LOCKED,
+    ERR_VALUE_INVALID, ERR_VALUE_TOO_LARGE)
+
+cfg = get_config()
+router = APIRouter()
+
+# OpenAPI description of the raw part body, which is read directly
+# from the request stream.
+PART_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/octet-stream": {
+                "schema": {"type": "string", "format": "binary"},
+            },
+        },
+    },
+}
+
+
+async def _read_part(request: Request) -> AsyncIterator[bytes]:
+    """
+    Yields the request body chunk by chunk and raises a 413 error as
+    soon as the part exceeds the maximum part size.
+    """
+    part_size = 0
+    async for chunk in request.stream():
+        part_size += len(chunk)
+        if part_size > cfg.UPLOADS_PART_SIZE:
+            raise E([LOC_BODY], None, ERR_VALUE_TOO_LARGE,
+                    status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        yield chunk
+
+
+@router.put("/upload/{upload_id}/part/{part_number}",
+            summary="Upload a part of an upload session",
+            response_class=JSONResponse, status_code=status.HTTP_200_OK,
+            response_model=UploadPartResponse, tags=["Datafiles"],
+            openapi_extra=PART_BODY)
+@locked
+async def upload_part(
+    upload_id: int, part_number: int, request: Request,
+    session=Depends(get_session), cache=Depends(get_cache),
+    current_user: User = Depends(auth(UserRole.writer))
+) -> UploadPartResponse:
+    """
+    FastAPI router for uploading a numbered part of an upload session.
+    The raw request body is encrypted while it is received and stored
+    as the part once it is complete, replacing a previous attempt with
+    the same number, so parts can be sent in parallel and resent after
+    a failure. The current user should own the session and have a
+    writer role or higher. Returns a 200 response on success, a 404
+    error if the session is not found or expired, a 422 error if the
+    part number is out of range, a 413 error if the part exceeds the
+    maximum part size, a 423 error if the session is being finalized,
+    and a 403 error if authentication fails or the user does not have
+    the required role.
+    """
+    upload_repository = Repository(session, cache, Upload)
+    upload = await upload_repository.select(id=upload_id)
+
+    if not upload or upload.user_id != current_user.id or upload.is_expired:
+        raise E([LOC_PATH, "upload_id"], upload_id,
+                ERR_RESOURCE_NOT_FOUND, status.HTTP_404_NOT_FOUND)
+
+    elif part_number < 1 or part_number > cfg.UPLOADS_PARTS_LIMIT:
+        raise E([LOC_PATH, "part_number"], part_number,
+                ERR_VALUE_INVALID, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    # The session directory is renamed while the session is finalized.
+    try:
+        part_size, _, _ = await FileManager.upload_stream(
+            _read_part(request), get_part_path(upload.upload_path,
+                                               part_number))
+
+    except FileNotFoundError:
+        raise E([LOC_PATH, "upload_id"], upload_id,
+                ERR_RESOURCE_LOCKED, status.HTTP_423_LOCKED)
+
+    return {
+        "upload_id": upload.id,
+        "part_number": part_number,
+        "part_size": part_size,
+    }
@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Depends, status
+from fastapi.responses import JSONResponse
+from app.database import get_session
+from app.cache import get_cache
+from app.decorators.locked_decorator import locked
+from app.models.user_model import User, UserRole
+from app.models.upload_model import Upload
+from app.schemas.upload_schemas import UploadSelectResponse
+from app.helpers.upload_helper import get_parts
+from app.repository import Repository
+from app.hooks import Hook
+from app.auth import auth
+from app.errors import E
+from app.constants import (
+    LOC_PATH, ERR_RESOURCE_NOT_FOUND, HOOK_AFTER_UPLOAD_SELECT)
+
+router = APIRouter()
+
+
+@router.get("/upload/{upload_id}", summary="Retrieve an upload session",
+            response_class=JSONResponse, status_code=status.HTTP_200_OK,
+            response_model=UploadSelectResponse, tags=["Datafiles"])
+@locked
+async def upload_select(
+    upload_id: int,
+    session=Depends(get_session), cache=Depends(get_cache),
+    current_user: User = Depends(auth(UserRole.writer))
+) -> UploadSelectResponse:
+    """
+    FastAPI router for retrieving an upload session. The router fetches
+    the session from the repository, verifies that it exists, belongs
+    to the current user and has not expired, executes related hooks,
+    and returns the session details with the parts received so far in
+    a JSON response, so an interrupted upload can be resumed with the
+    missing parts. The current user should have a writer role or
+    higher. Returns a 200 response on success, a 404 error if the
+    session is not found or expired, and a 403 error if authentication
+    fails or the user does not have the required role.
+    """
+    upload_repository = Repository(session, cache, Upload)
+    upload = await upload_repository.select(id=upload_id)
+
+    if not upload or upload.user_id != current_user.id or upload.is_expired:
+        raise E([LOC_PATH, "upload_id"], upload_id,
+                ERR_RESOURCE_NOT_FOUND, status.HTTP_404_NOT_FOUND)
+
+    parts = await get_parts(upload.upload_path)
+
+    hook = Hook(session, cache, current_user=current_user)
+    await hook.do(HOOK_AFTER_UPLOAD_SELECT, upload)
+
+    return upload.to_dict() | {
+        "upload_parts": [{"part_number": part_number, "part_size": size}
+                         for part_number, size in sorted(parts.items())],
+    }
@@ -9,7 +9,7 @@ from app.errors import E
 from app.hooks import Hook
 from app.auth import auth
 from app.repository import Repository
-from app.managers.file_manager import FileManager
+from app.helpers.storage_helper import userpics_storage
 from app.constants import (
     LOC_PATH, ERR_RESOURCE_NOT_FOUND, ERR_RESOURCE_FORBIDDEN,
     HOOK_BEFORE_USERPIC_DELETE, HOOK_AFTER_USERPIC_DELETE)
@@ -49,7 +49,7 @@ async def userpic_delete(
     await hook.do(HOOK_BEFORE_USERPIC_DELETE, current_user)
 
     if current_user.userpic_filename:
-        await FileManager.delete(current_user.userpic_path)
+        await userpics_storage.delete(current_user.userpic_filename)
 
     user_repository = Repository(session, cache, User)
     current_user.userpic_filename = None
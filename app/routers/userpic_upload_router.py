@@ -1,5 +1,6 @@
-import uuid
 import os
+import uuid
+from PIL import Image
 from fastapi import APIRouter, Depends, status, File, UploadFile
 from fastapi.responses import JSONResponse
 from app.database import get_session
@@ -11,12 +12,13 @@ from app.errors import E
 from app.hooks import Hook
 from app.auth import auth
 from app.repository import Repository
-from app.managers.file_manager import FileManager
+from app.managers.file_manager import FileManager, FILE_TMP_EXTENSION
 from app.helpers.image_helper import image_resize
+from app.helpers.storage_helper import userpics_storage
 from app.config import get_config
 from app.constants import (
     LOC_PATH, LOC_BODY, ERR_RESOURCE_NOT_FOUND, ERR_RESOURCE_FORBIDDEN,
-    ERR_MIMETYPE_UNSUPPORTED, HOOK_BEFORE_USERPIC_UPLOAD,
+    ERR_MIMETYPE_UNSUPPORTED, ERR_VALUE_TOO_LARGE, HOOK_BEFORE_USERPIC_UPLOAD,
     HOOK_AFTER_USERPIC_UPLOAD)
 
 router = APIRouter()
@@ -40,7 +42,8 @@ async def userpic_upload(
     have a reader role or higher. Returns a 200 response with the
     user ID. Raises a 403 error if the user attempts to upload a
     userpic for a different user, or if the user's token is invalid.
-    Raises a 422 error if the file's MIME type is unsupported.
+    Raises a 422 error if the file's MIME type is unsupported, and a 413
+    error if the image exceeds the pixel or memory budget.
     """
     user_repository = Repository(session, cache, User)
     user = await user_repository.select(id=user_id)
@@ -58,17 +61,27 @@ async def userpic_upload(
                 ERR_MIMETYPE_UNSUPPORTED, status.HTTP_422_UNPROCESSABLE_ENTITY)
 
     if current_user.userpic_filename:
-        await FileManager.delete(current_user.userpic_path)
+        await userpics_storage.delete(current_user.userpic_filename)
 
     userpic_filename = str(uuid.uuid4()) + cfg.USERPIC_EXTENSION
-    userpic_path = os.path.join(cfg.USERPIC_BASE_PATH, userpic_filename)
+    await FileManager.makedirs(cfg.USERPIC_BASE_PATH)
+    userpic_path = os.path.join(cfg.USERPIC_BASE_PATH,
+                                userpic_filename + FILE_TMP_EXTENSION)
 
     hook = Hook(session, cache, current_user=current_user)
     await hook.do(HOOK_BEFORE_USERPIC_UPLOAD, current_user)
 
     await FileManager.upload(file, userpic_path)
-    await image_resize(userpic_path, cfg.USERPIC_WIDTH, cfg.USERPIC_HEIGHT,
-                       cfg.USERPIC_QUALITY)
+    try:
+        await image_resize(userpic_path, cfg.USERPIC_WIDTH,
+                           cfg.USERPIC_HEIGHT, cfg.USERPIC_QUALITY)
+
+    except Image.DecompressionBombError:
+        await FileManager.delete(userpic_path)
+        raise E([LOC_BODY, "file"], user_id,
+                ERR_VALUE_TOO_LARGE, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    await userpics_storage.put(userpic_filename, userpic_path)
 
     user_repository = Repository(session, cache, User)
     current_user.userpic_filename = userpic_filename
@@ -122,3 +122,14 @@ class DatafileListResponse(BaseModel):
     """
     datafiles: List[DatafileSelectResponse]
     datafiles_count: int
+
+
+class DatafileExportRequest(BaseModel):
+    """
+    Pydantic schema for requesting a ZIP archive of datafile entities.
+    Requires either the collection ID, to export all datafiles of the
+    collection, or a comma-separated list of datafile IDs.
+    """
+    collection_id: Optional[int] = None
+    datafile_ids: Optional[str] = Field(
+        pattern=r"^\d+(,\d+)*$", max_length=4096, default=None)
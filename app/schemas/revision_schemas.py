@@ -19,6 +19,10 @@ class RevisionSelectResponse(BaseModel):
     original_size: int
     original_mimetype: str
     thumbnail_url: Optional[str] = None
+    thumbnail_status: Optional[Literal["pending", "ready", "failed"]] = None
+    media_duration: Optional[float] = None
+    media_width: Optional[int] = None
+    media_height: Optional[int] = None
     downloads_count: int
     revision_user: UserSelectResponse
 
@@ -0,0 +1,72 @@
+"""
+The module defines Pydantic schemas for managing upload sessions, which
+receive a datafile in numbered parts. Includes schemas for creating,
+selecting, finalizing and deleting upload sessions and for uploading
+their parts.
+"""
+
+from typing import List
+from pydantic import BaseModel, Field
+
+
+class UploadInsertRequest(BaseModel):
+    """
+    Pydantic schema for request to create an upload session. Requires
+    the original filename and optionally the MIME type of the datafile
+    that is going to be uploaded.
+    """
+    original_filename: str = Field(..., min_length=1, max_length=256)
+    original_mimetype: str = Field(min_length=1, max_length=256,
+                                   default="application/octet-stream")
+
+
+class UploadInsertResponse(BaseModel):
+    """
+    Pydantic schema for the response after creating an upload session.
+    Includes the ID assigned to the session and its expiration date.
+    """
+    upload_id: int
+    expires_date: int
+
+
+class UploadPartResponse(BaseModel):
+    """
+    Pydantic schema for the response after uploading a part. Includes
+    the session ID, the part number and the received part size.
+    """
+    upload_id: int
+    part_number: int
+    part_size: int
+
+
+class UploadPart(BaseModel):
+    part_number: int
+    part_size: int
+
+
+class UploadSelectResponse(BaseModel):
+    """
+    Pydantic schema for the response after retrieving an upload session.
+    Includes the session details and the parts received so far, ordered
+    by their part numbers.
+    """
+    id: int
+    created_date: int
+    expires_date: int
+    user_id: int
+    original_filename: str
+    original_mimetype: str
+    upload_parts: List[UploadPart]
+
+
+class UploadFinalizeResponse(BaseModel):
+    datafile_id: int
+    revision_id: int
+
+
+class UploadDeleteResponse(BaseModel):
+    """
+    Pydantic schema for the response after deleting an upload session.
+    Includes the ID of the deleted session.
+    """
+    upload_id: int
@@ -0,0 +1,82 @@
+"""
+Compares the codec of the entity cache with the pickle based
+serializer of SQLAlchemy it replaced: bytes per entity and the time of
+encoding and decoding an entity. Run from the repository root:
+
+    python -m benchmarks.cache_codec_benchmark [--number N]
+"""
+
+import timeit
+import argparse
+from sqlalchemy import inspect
+from sqlalchemy.ext import serializer
+from app.managers.cache_manager import dumps, loads
+from app.models.user_model import User, UserRole
+from app.models.collection_model import Collection
+from app.models.datafile_model import Datafile
+from app.models.revision_model import Revision
+from app.models.tag_model import Tag
+from app.models import (  # noqa: F401
+    comment_model, download_model, favorite_model, option_model)
+
+
+def entity(obj, entity_id: int):
+    for attr in inspect(type(obj)).column_attrs:
+        if attr.key not in inspect(obj).dict:
+            setattr(obj, attr.key, None)
+    obj.id = entity_id
+    return obj
+
+
+def user() -> User:
+    return entity(User(UserRole.admin, "login", "password", "first",
+                       "last"), 1)
+
+
+def datafile() -> Datafile:
+    collection = entity(Collection(1, False, "collection"), 2)
+    collection.collection_user = user()
+
+    obj = entity(Datafile(1, "name", 2), 3)
+    obj.datafile_user = user()
+    obj.datafile_collection = collection
+    obj.datafile_tags = [entity(Tag(3, "tag%s" % i), 10 + i)
+                         for i in range(5)]
+    return obj
+
+
+def revision() -> Revision:
+    obj = entity(Revision(1, 3, "revision", 1024, "file.txt", 1000,
+                          "text/plain"), 4)
+    obj.revision_user = user()
+    obj.revision_datafile = datafile()
+    return obj
+
+
+def entities() -> dict:
+    return {"user": user(), "datafile": datafile(), "revision": revision()}
+
+
+def main(number: int):
+    print("%-10s %-10s %8s %12s %12s" % (
+        "entity", "codec", "bytes", "dumps, us", "loads, us"))
+    for name, obj in entities().items():
+        cls = type(obj)
+        codecs = [
+            ("pickle", lambda: serializer.dumps(obj), serializer.loads),
+            ("columns", lambda: dumps(obj), lambda x: loads(cls, x)),
+        ]
+        for codec, encode, decode in codecs:
+            data = encode()
+            dumps_time = timeit.timeit(encode, number=number)
+            loads_time = timeit.timeit(lambda: decode(data), number=number)
+            print("%-10s %-10s %8s %12.1f %12.1f" % (
+                name, codec, len(data), dumps_time / number * 1000000,
+                loads_time / number * 1000000))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+    main(args.number)
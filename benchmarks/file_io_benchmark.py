@@ -0,0 +1,68 @@
+"""
+Measures the throughput of copying files through aiofiles with the
+default executor of the event loop and with the I/O thread pool of the
+file manager across chunk sizes, and of FileManager.copy with its
+growing chunk sizes. Run from the repository root:
+
+    python -m benchmarks.file_io_benchmark [--size MB] [--files N]
+"""
+
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+import aiofiles
+from app.managers.file_manager import FileManager
+from app.helpers.io_helper import io_pool
+
+CHUNK_SIZES = [8 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024,
+               4 * 1024 * 1024, 8 * 1024 * 1024]
+
+
+async def copy(src_path: str, dst_path: str, chunk_size: int, executor):
+    async with aiofiles.open(src_path, mode="rb",
+                             executor=executor) as src_context:
+        async with aiofiles.open(dst_path, mode="wb",
+                                 executor=executor) as dst_context:
+            while chunk := await src_context.read(chunk_size):
+                await dst_context.write(chunk)
+
+
+async def measure(name: str, paths: list, func) -> None:
+    start = time.perf_counter()
+    await asyncio.gather(*[func(src_path, src_path + ".copy")
+                           for src_path in paths])
+    elapsed = time.perf_counter() - start
+
+    size = sum(os.path.getsize(src_path) for src_path in paths)
+    print("%-28s %10.1f MB/s" % (name, size / elapsed / 1024 / 1024))
+
+
+async def main(size: int, files: int):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = []
+        for i in range(files):
+            path = os.path.join(tmp_dir, "file%s" % i)
+            with open(path, "wb") as fn:
+                fn.write(os.urandom(size * 1024 * 1024))
+            paths.append(path)
+
+        print("%s files of %s MB copied concurrently" % (files, size))
+        for chunk_size in CHUNK_SIZES:
+            for name, executor in [("default", None), ("io_pool", io_pool)]:
+                await measure(
+                    "%s, %s KB" % (name, chunk_size // 1024), paths,
+                    lambda src, dst: copy(src, dst, chunk_size, executor))
+
+        await measure("FileManager.copy", paths, FileManager.copy)
+
+    io_pool.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--files", type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(main(args.size, args.files))
@@ -7,9 +7,51 @@ entries are missing. The tests use the asynctest and unittest libraries
 to ensure that CacheManager functions correctly under various scenarios.
 """
 
+import asyncio
 import asynctest
 import unittest
 from unittest.mock import MagicMock, AsyncMock, patch, call
+from sqlalchemy import inspect
+from sqlalchemy.orm import DeclarativeBase
+from app.models.user_model import User, UserRole
+from app.models.collection_model import Collection
+from app.models.datafile_model import Datafile
+from app.models.tag_model import Tag
+from app.models import (  # noqa: F401
+    revision_model, comment_model, download_model, favorite_model,
+    option_model)
+from app.managers.cache_manager import (
+    CACHE_GET_SCRIPT, CACHE_SET_SCRIPT, CACHE_DELETE_SCRIPT, _generations)
+from redis.exceptions import NoScriptError
+
+
+def _entity(entity: DeclarativeBase, entity_id: int):
+    """Sets the ID and the columns left unset by the constructor."""
+    for attr in inspect(type(entity)).column_attrs:
+        if attr.key not in inspect(entity).dict:
+            setattr(entity, attr.key, None)
+    entity.id = entity_id
+    return entity
+
+
+async def _scan(keys: list):
+    """Yields the keys like the scan iterator of the Redis client."""
+    for key in keys:
+        yield key
+
+
+def _datafile() -> Datafile:
+    """Creates a datafile with its user, collection and tags loaded."""
+    user = _entity(User(UserRole.admin, "login", "password", "first",
+                        "last"), 1)
+    collection = _entity(Collection(1, False, "collection"), 2)
+    collection.collection_user = user
+    datafile = _entity(Datafile(1, "name", 2), 3)
+    datafile.datafile_user = user
+    datafile.datafile_collection = collection
+    datafile.datafile_tags = [_entity(Tag(3, "tag%s" % i), 10 + i)
+                              for i in range(2)]
+    return datafile
 
 
 class CacheManagerTestCase(asynctest.TestCase):
@@ -20,6 +62,7 @@ class CacheManagerTestCase(asynctest.TestCase):
 
         self.cache_mock = AsyncMock()
         self.cache_manager = CacheManager(self.cache_mock)
+        _generations.clear()
 
     async def tearDown(self):
         """Cleans up after tests."""
@@ -34,81 +77,358 @@ class CacheManagerTestCase(asynctest.TestCase):
         """Tests the _get_key method for integer IDs."""
         dummy_mock = MagicMock(__tablename__="dummies")
 
-        result = self.cache_manager._get_key(dummy_mock, 123)
-        self.assertEqual(result, "dummies:123")
+        result = self.cache_manager._get_key(dummy_mock, 2, 123)
+        self.assertEqual(result, "entity:{dummies}:2:123")
 
     async def test__get_key_asterisk(self):
         """Tests the _get_key method for wildcard (*) IDs."""
         dummy_mock = MagicMock(__tablename__="dummies")
 
-        result = self.cache_manager._get_key(dummy_mock, "*")
-        self.assertEqual(result, "dummies:*")
+        result = self.cache_manager._get_key(dummy_mock, "*", "*")
+        self.assertEqual(result, "entity:{dummies}:*:*")
+
+    async def test__get_generation_key(self):
+        """Tests the _get_generation_key method."""
+        dummy_mock = MagicMock(__tablename__="dummies")
+
+        result = self.cache_manager._get_generation_key(dummy_mock)
+        self.assertEqual(result, "generation:{dummies}")
 
     @patch("app.managers.cache_manager.cfg")
     @patch("app.managers.cache_manager.dumps")
     async def test__set(self, dumps_mock, cfg_mock):
         """Tests the set method of CacheManager to cache an object."""
+        self.cache_mock.evalsha.return_value = [b"0"]
         dummy_mock = MagicMock(__tablename__="dummies", id=123)
 
         result = await self.cache_manager.set(dummy_mock)
         self.assertIsNone(result)
 
         dumps_mock.assert_called_once_with(dummy_mock)
-        self.cache_mock.set.assert_called_once_with(
-            "dummies:123", dumps_mock.return_value, ex=cfg_mock.REDIS_EXPIRE)
+        self.cache_mock.evalsha.assert_called_once_with(
+            CACHE_SET_SCRIPT.sha, 2, "generation:{dummies}",
+            "entity:{dummies}:0:123", 0, cfg_mock.REDIS_EXPIRE,
+            dumps_mock.return_value)
+        self.cache_mock.get.assert_not_called()
 
     @patch("app.managers.cache_manager.loads")
     async def test__get(self, loads_mock):
         """Tests the get method to retrieve a cached object."""
+        self.cache_mock.evalsha.return_value = [b"0", b"entry"]
         dummy_class_mock = MagicMock(__tablename__="dummies")
 
         result = await self.cache_manager.get(dummy_class_mock, 123)
         self.assertEqual(result, loads_mock.return_value)
 
-        self.cache_mock.get.assert_called_once_with("dummies:123")
-        loads_mock.assert_called_once_with(self.cache_mock.get.return_value)
+        self.cache_mock.evalsha.assert_called_once_with(
+            CACHE_GET_SCRIPT.sha, 2, "generation:{dummies}",
+            "entity:{dummies}:0:123", 0)
+        self.cache_mock.get.assert_not_called()
+        loads_mock.assert_called_once_with(dummy_class_mock, b"entry")
+
+    @patch("app.managers.cache_manager.dumps")
+    async def test__set_not_loaded(self, dumps_mock):
+        """Tests the set method when the object cannot be encoded."""
+        dumps_mock.return_value = None
+        dummy_mock = MagicMock(__tablename__="dummies", id=123)
+
+        result = await self.cache_manager.set(dummy_mock)
+        self.assertIsNone(result)
+        self.cache_mock.evalsha.assert_not_called()
 
     @patch("app.managers.cache_manager.loads")
     async def test__get_none(self, loads_mock):
         """Tests the get method when the cache returns None."""
-        self.cache_mock.get.return_value = None
+        self.cache_mock.evalsha.return_value = [b"0", None]
         dummy_class_mock = MagicMock(__tablename__="dummies")
 
         result = await self.cache_manager.get(dummy_class_mock, 123)
         self.assertIsNone(result)
 
-        self.cache_mock.get.assert_called_once_with("dummies:123")
+        self.cache_mock.evalsha.assert_called_once()
         loads_mock.assert_not_called()
 
+    @patch("app.managers.cache_manager.loads")
+    async def test__get_generation_changed(self, loads_mock):
+        """Tests that the script is run again for a new generation."""
+        self.cache_mock.evalsha.side_effect = [[b"3"], [b"3", b"entry"]]
+        dummy_class_mock = MagicMock(__tablename__="dummies")
+
+        result = await self.cache_manager.get(dummy_class_mock, 123)
+        self.assertEqual(result, loads_mock.return_value)
+
+        self.assertListEqual(self.cache_mock.evalsha.call_args_list, [
+            call(CACHE_GET_SCRIPT.sha, 2, "generation:{dummies}",
+                 "entity:{dummies}:0:123", 0),
+            call(CACHE_GET_SCRIPT.sha, 2, "generation:{dummies}",
+                 "entity:{dummies}:3:123", 3)])
+        self.assertDictEqual(_generations, {"dummies": 3})
+
+        self.cache_mock.evalsha.reset_mock(side_effect=True)
+        self.cache_mock.evalsha.return_value = [b"3", b"entry"]
+        await self.cache_manager.get(dummy_class_mock, 123)
+        self.cache_mock.evalsha.assert_called_once_with(
+            CACHE_GET_SCRIPT.sha, 2, "generation:{dummies}",
+            "entity:{dummies}:3:123", 3)
+
+    @patch("app.managers.cache_manager.loads")
+    async def test__get_script_load(self, loads_mock):
+        """Tests that the script is loaded if Redis does not know it."""
+        self.cache_mock.evalsha.side_effect = [
+            NoScriptError(), [b"0", b"entry"]]
+        dummy_class_mock = MagicMock(__tablename__="dummies")
+
+        result = await self.cache_manager.get(dummy_class_mock, 123)
+        self.assertEqual(result, loads_mock.return_value)
+
+        self.cache_mock.script_load.assert_called_once_with(
+            CACHE_GET_SCRIPT.source)
+        self.assertEqual(self.cache_mock.evalsha.call_count, 2)
+
+    async def test__dumps_loads(self):
+        """Tests that an entity and its relationships survive the codec."""
+        from app.managers.cache_manager import dumps, loads
+        datafile = _datafile()
+
+        result = loads(Datafile, dumps(datafile))
+        self.assertTrue(inspect(result).detached)
+        self.assertEqual(inspect(result).identity, (3,))
+        self.assertEqual(result.datafile_name, "name")
+        self.assertEqual(result.datafile_user.user_role, UserRole.admin)
+        self.assertEqual(
+            result.datafile_collection.collection_user.user_login, "login")
+        self.assertListEqual([x.tag_value for x in result.datafile_tags],
+                             ["tag0", "tag1"])
+        self.assertNotIn("datafile_revisions", inspect(result).dict)
+
+    async def test__dumps_not_loaded(self):
+        """Tests that an entity with unloaded columns is not encoded."""
+        from app.managers.cache_manager import dumps
+        datafile = _datafile()
+        del inspect(datafile).dict["datafile_summary"]
+
+        self.assertIsNone(dumps(datafile))
+
+    async def test__loads_stale(self):
+        """Tests that entries of another schema are cache misses."""
+        from app.managers.cache_manager import dumps, loads
+        entity_bytes = dumps(_datafile())
+
+        self.assertIsNone(loads(User, entity_bytes))
+        self.assertIsNone(loads(Datafile, entity_bytes.replace(
+            entity_bytes[2:10], b"00000000", 1)))
+        self.assertIsNone(loads(Datafile, b"\x80\x04pickle"))
+
     async def test__delete(self):
         """Tests the delete method to remove an item from cache."""
+        _generations["dummies"] = 2
+        self.cache_mock.evalsha.return_value = [b"2"]
         dummy_mock = MagicMock(__tablename__="dummies", id=123)
 
         result = await self.cache_manager.delete(dummy_mock)
         self.assertIsNone(result)
 
-        self.cache_mock.delete.assert_called_once_with("dummies:123")
+        self.cache_mock.evalsha.assert_called_once_with(
+            CACHE_DELETE_SCRIPT.sha, 2, "generation:{dummies}",
+            "entity:{dummies}:2:123", 2)
+        self.cache_mock.get.assert_not_called()
+        self.cache_mock.publish.assert_called_once_with(
+            "cache:evict", "entity:{dummies}:2:123")
 
     async def test__delete_all(self):
         """Tests the delete_all method to remove all items."""
+        self.cache_mock.incr.return_value = 3
+        self.cache_mock.scan_iter = MagicMock(return_value=_scan([
+            b"entity:{dummies}:1:1", b"entity:{dummies}:3:1",
+            b"entity:{dummies}:2:5"]))
         dummy_class_mock = MagicMock(__tablename__="dummies")
-        key_1, key_2, key_3 = "dummies:1", "dummies:2", "dummies:3"
-        self.cache_mock.keys.return_value = [key_1, key_2, key_3]
 
         result = await self.cache_manager.delete_all(dummy_class_mock)
         self.assertIsNone(result)
 
-        self.cache_mock.keys.assert_called_once_with("dummies:*")
-        self.assertEqual(self.cache_mock.delete.call_count, 3)
-        self.assertListEqual(self.cache_mock.delete.call_args_list,
-                             [call(key_1), call(key_2), call(key_3)])
+        self.cache_mock.incr.assert_called_once_with("generation:{dummies}")
+        self.cache_mock.publish.assert_called_once_with(
+            "cache:evict", "generation:{dummies}")
+        self.cache_mock.keys.assert_not_called()
+
+        await asyncio.sleep(0)
+        self.cache_mock.scan_iter.assert_called_once_with(
+            match="entity:{dummies}:*:*", count=1000)
+        self.cache_mock.unlink.assert_called_once_with(
+            b"entity:{dummies}:1:1", b"entity:{dummies}:2:5")
 
     async def test__erase(self):
         """Tests the cache erase."""
+        self.cache_mock.scan_iter = MagicMock(return_value=_scan([
+            b"entity:{dummies}:1:1", b"entity:{others}:0:1"]))
+
         result = await self.cache_manager.erase()
         self.assertIsNone(result)
 
-        self.cache_mock.flushdb.assert_called_once()
+        self.cache_mock.flushdb.assert_not_called()
+        self.cache_mock.scan_iter.assert_called_once_with(
+            match="entity:*", count=1000)
+        self.cache_mock.unlink.assert_called_once_with(
+            b"entity:{dummies}:1:1", b"entity:{others}:0:1")
+        self.cache_mock.publish.assert_called_once_with("cache:evict", "*")
+
+    @patch("app.managers.cache_manager.cfg")
+    @patch("app.managers.cache_manager.dumps")
+    async def test__set_many(self, dumps_mock, cfg_mock):
+        """Tests that several objects are cached in one script call."""
+        dumps_mock.side_effect = [b"entry_1", None, b"entry_3"]
+        self.cache_mock.evalsha.return_value = [b"0"]
+        dummy_mocks = [MagicMock(__tablename__="dummies", id=1),
+                       MagicMock(__tablename__="dummies", id=2),
+                       MagicMock(__tablename__="dummies", id=3)]
+
+        result = await self.cache_manager.set_many(dummy_mocks)
+        self.assertIsNone(result)
+
+        self.cache_mock.evalsha.assert_called_once_with(
+            CACHE_SET_SCRIPT.sha, 3, "generation:{dummies}",
+            "entity:{dummies}:0:1", "entity:{dummies}:0:3", 0,
+            cfg_mock.REDIS_EXPIRE, b"entry_1", b"entry_3")
+        self.cache_mock.set.assert_not_called()
+
+    async def test__set_many_empty(self):
+        """Tests that nothing is sent for an empty list."""
+        result = await self.cache_manager.set_many([])
+        self.assertIsNone(result)
+        self.cache_mock.evalsha.assert_not_called()
+
+    @patch("app.managers.cache_manager.loads")
+    async def test__get_many(self, loads_mock):
+        """Tests that several objects are fetched with one script call."""
+        loads_mock.side_effect = lambda cls, x: "entity_%s" % x.decode()
+        _generations["dummies"] = 2
+        self.cache_mock.evalsha.return_value = [b"2", b"1", None, b"3"]
+        dummy_class_mock = MagicMock(__tablename__="dummies")
+
+        result = await self.cache_manager.get_many(
+            dummy_class_mock, [1, 2, 3])
+        self.assertDictEqual(result, {1: "entity_1", 3: "entity_3"})
+
+        self.cache_mock.evalsha.assert_called_once_with(
+            CACHE_GET_SCRIPT.sha, 4, "generation:{dummies}",
+            "entity:{dummies}:2:1", "entity:{dummies}:2:2",
+            "entity:{dummies}:2:3", 2)
+        self.cache_mock.get.assert_not_called()
+        self.cache_mock.mget.assert_not_called()
+
+    @patch("app.managers.cache_manager.memory_cache")
+    @patch("app.managers.cache_manager.loads")
+    async def test__get_many_memory(self, loads_mock, memory_cache_mock):
+        """Tests that the memory tier is checked before Redis."""
+        memory_cache_mock.get.side_effect = [b"2", b"entry", None]
+        self.cache_mock.mget.return_value = [None]
+        dummy_class_mock = MagicMock(__tablename__="dummies")
+
+        result = await self.cache_manager.get_many(dummy_class_mock, [1, 2])
+        self.assertDictEqual(result, {1: loads_mock.return_value})
+
+        loads_mock.assert_called_once_with(dummy_class_mock, b"entry")
+        self.cache_mock.mget.assert_called_once_with(["entity:{dummies}:2:2"])
+        self.cache_mock.evalsha.assert_not_called()
+        memory_cache_mock.set.assert_not_called()
+
+    @patch("app.managers.cache_manager.memory_cache")
+    @patch("app.managers.cache_manager.loads")
+    async def test__get_memory(self, loads_mock, memory_cache_mock):
+        """Tests the get method when the memory tier holds the entry."""
+        memory_cache_mock.get.side_effect = [b"2", b"entry"]
+        dummy_class_mock = MagicMock(__tablename__="dummies")
+
+        result = await self.cache_manager.get(dummy_class_mock, 123)
+        self.assertEqual(result, loads_mock.return_value)
+
+        self.assertListEqual(memory_cache_mock.get.call_args_list, [
+            call("generation:{dummies}"), call("entity:{dummies}:2:123")])
+        self.cache_mock.get.assert_not_called()
+        self.cache_mock.mget.assert_not_called()
+        self.cache_mock.evalsha.assert_not_called()
+        loads_mock.assert_called_once_with(dummy_class_mock, b"entry")
+
+    @patch("app.managers.cache_manager.memory_cache")
+    @patch("app.managers.cache_manager.loads")
+    async def test__get_memory_fill(self, loads_mock, memory_cache_mock):
+        """Tests that entries fetched from Redis fill the memory tier."""
+        memory_cache_mock.get.return_value = None
+        _generations["dummies"] = 2
+        self.cache_mock.evalsha.return_value = [b"2", b"entry"]
+        dummy_class_mock = MagicMock(__tablename__="dummies")
+
+        result = await self.cache_manager.get(dummy_class_mock, 123)
+        self.assertEqual(result, loads_mock.return_value)
+
+        self.cache_mock.evalsha.assert_called_once()
+        self.assertListEqual(memory_cache_mock.set.call_args_list, [
+            call("generation:{dummies}", b"2", memory_cache_mock.generation),
+            call("entity:{dummies}:2:123", b"entry",
+                 memory_cache_mock.generation)])
+
+    @patch("app.managers.cache_manager.memory_cache")
+    @patch("app.managers.cache_manager.loads")
+    async def test__get_memory_generation(self, loads_mock,
+                                          memory_cache_mock):
+        """Tests that a known generation leaves one Redis command."""
+        memory_cache_mock.get.side_effect = [b"2", None]
+        self.cache_mock.mget.return_value = [b"entry"]
+        dummy_class_mock = MagicMock(__tablename__="dummies")
+
+        result = await self.cache_manager.get(dummy_class_mock, 123)
+        self.assertEqual(result, loads_mock.return_value)
+
+        self.cache_mock.mget.assert_called_once_with(
+            ["entity:{dummies}:2:123"])
+        self.cache_mock.get.assert_not_called()
+        self.cache_mock.evalsha.assert_not_called()
+
+    @patch("app.managers.cache_manager.cfg")
+    async def test__memory_cache(self, cfg_mock):
+        """Tests the expiration, eviction and size limit of the tier."""
+        from app.managers.cache_manager import MemoryCache
+        cfg_mock.CACHE_MEMORY_SIZE, cfg_mock.CACHE_MEMORY_TTL = 8, 60
+        memory_cache = MemoryCache()
+        memory_cache.set("dummies:1", b"1111", 0)
+        self.assertIsNone(memory_cache.get("dummies:1"))
+
+        memory_cache.subscribed = True
+        for key in ["dummies:1", "dummies:2", "others:1"]:
+            memory_cache.set(key, b"1111", memory_cache.generation)
+        self.assertIsNone(memory_cache.get("dummies:1"))
+        self.assertEqual(memory_cache.get("dummies:2"), b"1111")
+        self.assertEqual(memory_cache.size, 8)
+
+        generation = memory_cache.generation
+        memory_cache.evict("dummies:*")
+        memory_cache.set("dummies:3", b"1111", generation)
+        self.assertListEqual(list(memory_cache.entries), ["others:1"])
+
+        cfg_mock.CACHE_MEMORY_TTL = -1
+        memory_cache.set("dummies:3", b"1111", memory_cache.generation)
+        self.assertIsNone(memory_cache.get("dummies:3"))
+        self.assertEqual(memory_cache.size, 4)
+
+    @patch("app.managers.cache_manager.memory_cache")
+    async def test__listen(self, memory_cache_mock):
+        """Tests that the keys broadcast by the workers are evicted."""
+        pubsub_mock = AsyncMock()
+        pubsub_mock.get_message.side_effect = [
+            None, {"data": b"dummies:123"}, asyncio.CancelledError()]
+        self.cache_mock.pubsub = MagicMock(return_value=pubsub_mock)
+
+        handler_mock = MagicMock()
+
+        with self.assertRaises(asyncio.CancelledError):
+            await self.cache_manager.listen(handler_mock)
+
+        pubsub_mock.subscribe.assert_called_once_with("cache:evict")
+        memory_cache_mock.evict.assert_called_once_with("dummies:123")
+        self.assertListEqual(handler_mock.call_args_list, [
+            call("*"), call("dummies:123")])
+        self.assertFalse(memory_cache_mock.subscribed)
+        pubsub_mock.aclose.assert_called_once()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,94 @@
+"""
+Unit tests for the Redis connection pool of the worker process, covering
+the opening and closing of the pool, the connection counts reported by
+the telemetry, and the waiting for a free connection once all of them
+are in use.
+"""
+
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, patch
+import asynctest
+from redis.exceptions import ConnectionError
+from app.cache import CachePool, CacheConnectionPool
+
+
+@patch("redis.asyncio.connection.ConnectionPool.ensure_connection",
+       new_callable=AsyncMock)
+class CacheTestCase(asynctest.TestCase):
+
+    async def test__open_close(self, ensure_connection_mock):
+        """Tests that the pool is opened on first use and closed."""
+        cache_pool = CachePool()
+        self.assertDictEqual(cache_pool.get_stats(), {
+            "redis_pool_idle": 0, "redis_pool_in_use": 0})
+
+        client = cache_pool.get_client()
+        self.assertIsInstance(cache_pool.pool, CacheConnectionPool)
+        self.assertIs(client.connection_pool, cache_pool.pool)
+        self.assertIs(cache_pool.get_client(), client)
+
+        pool = cache_pool.pool
+        with patch.object(pool, "disconnect",
+                          new_callable=AsyncMock) as disconnect_mock:
+            await cache_pool.close()
+
+        disconnect_mock.assert_called_once()
+        self.assertIsNone(cache_pool.pool)
+        self.assertIsNone(cache_pool.client)
+        await cache_pool.close()
+
+    async def test__stats(self, ensure_connection_mock):
+        """Tests the counts of idle and used connections."""
+        cache_pool = CachePool()
+        pool = cache_pool.get_client().connection_pool
+
+        first = await pool.get_connection("GET")
+        second = await pool.get_connection("GET")
+        self.assertDictEqual(cache_pool.get_stats(), {
+            "redis_pool_idle": 0, "redis_pool_in_use": 2})
+
+        await pool.release(first)
+        self.assertDictEqual(cache_pool.get_stats(), {
+            "redis_pool_idle": 1, "redis_pool_in_use": 1})
+
+        self.assertIs(await pool.get_connection("GET"), first)
+        await pool.release(first)
+        await pool.release(second)
+        self.assertDictEqual(cache_pool.get_stats(), {
+            "redis_pool_idle": 2, "redis_pool_in_use": 0})
+
+    async def test__stats_connection_error(self, ensure_connection_mock):
+        """Tests that a connection that fails to connect is not used."""
+        ensure_connection_mock.side_effect = ConnectionError()
+        pool = CacheConnectionPool(max_connections=1)
+
+        with self.assertRaises(ConnectionError):
+            await pool.get_connection("GET")
+        self.assertEqual(len(pool.in_use), 0)
+
+    async def test__exhausted_wait(self, ensure_connection_mock):
+        """Tests that a request waits for a connection to be released."""
+        pool = CacheConnectionPool(max_connections=1, timeout=5)
+        connection = await pool.get_connection("GET")
+
+        task = asyncio.create_task(pool.get_connection("GET"))
+        await asyncio.sleep(0.01)
+        self.assertFalse(task.done())
+
+        await pool.release(connection)
+        self.assertIs(await asyncio.wait_for(task, 1), connection)
+        self.assertSetEqual(pool.in_use, {connection})
+
+    async def test__exhausted_timeout(self, ensure_connection_mock):
+        """Tests that waiting for a connection times out."""
+        pool = CacheConnectionPool(max_connections=1, timeout=0.01)
+        await pool.get_connection("GET")
+
+        with self.assertRaises(ConnectionError):
+            await pool.get_connection("GET")
+        self.assertEqual(len(pool.in_use), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+"""
+Unit tests for the content-defined chunk store, covering the chunker,
+whose boundaries must depend on the content only and respect the
+minimum and maximum sizes, the splitting of the uploaded stream that
+runs in the crypto pool, and the manifest of the chunks of a revision.
+"""
+
+import random
+import hashlib
+import unittest
+import asynctest
+from app.helpers.chunk_helper import Chunker, Manifest, _chunks_split
+from app.helpers.blob_helper import get_chunk_filename
+from app.managers.file_manager import COMPRESSION_ZLIB
+
+MIN_SIZE, AVG_SIZE, MAX_SIZE = 1024, 4096, 16384
+
+
+def _data(size: int, seed: int = 0) -> bytes:
+    return random.Random(seed).randbytes(size)
+
+
+def _split(data: bytes, piece_size: int) -> list:
+    """Feeds the data to a new chunker in pieces of the given size."""
+    chunker = Chunker(MIN_SIZE, AVG_SIZE, MAX_SIZE)
+    chunks = []
+    for i in range(0, len(data), piece_size):
+        chunks.extend(chunker.update(data[i:i + piece_size]))
+    return chunks + chunker.finalize()
+
+
+class ChunkHelperTestCase(asynctest.TestCase):
+
+    async def test__chunker_deterministic(self):
+        """Tests that the boundaries do not depend on the pieces fed."""
+        data = _data(1024 * 1024)
+
+        chunks = _split(data, 65536)
+        self.assertEqual(b"".join(chunks), data)
+        for piece_size in [1000, 4096, 100000, len(data)]:
+            self.assertListEqual(_split(data, piece_size), chunks)
+
+    async def test__chunker_sizes(self):
+        """Tests that the chunk sizes respect the minimum and maximum."""
+        chunks = _split(_data(4 * 1024 * 1024, seed=1), 65536)
+        sizes = [len(x) for x in chunks]
+
+        self.assertTrue(all(MIN_SIZE <= x <= MAX_SIZE for x in sizes[:-1]))
+        self.assertTrue(0 < sizes[-1] <= MAX_SIZE)
+        average = sum(sizes) / len(sizes)
+        self.assertTrue(AVG_SIZE / 2 <= average <= AVG_SIZE * 2)
+
+    async def test__chunker_max_size(self):
+        """Tests that content without boundaries is cut at the maximum."""
+        sizes = [len(x) for x in _split(bytes(100000), 65536)]
+        self.assertListEqual(sizes, [MAX_SIZE] * 6 + [100000 - MAX_SIZE * 6])
+
+    async def test__chunker_small(self):
+        """Tests that content below the minimum is a single chunk."""
+        self.assertListEqual(_split(b"abc", 65536), [b"abc"])
+        self.assertListEqual(_split(b"", 65536), [])
+
+    async def test__chunker_edit(self):
+        """Tests that an edit only changes the chunks around it."""
+        data = _data(1024 * 1024, seed=2)
+        edited = data[:500000] + b"edit" + data[500000:]
+
+        chunks, edited_chunks = _split(data, 65536), _split(edited, 65536)
+        shared = set(chunks) & set(edited_chunks)
+        self.assertGreaterEqual(len(shared), len(chunks) - 3)
+
+    async def test__chunks_split(self):
+        """Tests that the chunks are named by the digest of the content."""
+        data = _data(100000, seed=3)
+        chunker = Chunker(MIN_SIZE, AVG_SIZE, MAX_SIZE)
+        content_hash = hashlib.sha256()
+
+        result = _chunks_split(chunker, content_hash, data, COMPRESSION_ZLIB)
+        result += _chunks_split(chunker, content_hash, None, COMPRESSION_ZLIB)
+
+        self.assertEqual(content_hash.digest(), hashlib.sha256(data).digest())
+        self.assertEqual(b"".join(x for _, x in result), data)
+        for chunk_filename, chunk in result:
+            self.assertEqual(chunk_filename, get_chunk_filename(
+                hashlib.sha256(chunk).hexdigest(), COMPRESSION_ZLIB))
+
+    async def test__manifest_dumps_loads(self):
+        """Tests that the manifest survives serialization."""
+        manifest = Manifest([("a.chunk", 100), ("b.chunk", 0),
+                             ("c.chunk", 50)])
+        self.assertListEqual(manifest.offsets, [0, 100, 100, 150])
+        self.assertEqual(manifest.size, 150)
+
+        result = Manifest.loads(manifest.dumps())
+        self.assertListEqual(result.filenames,
+                             ["a.chunk", "b.chunk", "c.chunk"])
+        self.assertListEqual(result.offsets, manifest.offsets)
+        self.assertEqual(result.dumps(), manifest.dumps())
+
+    async def test__manifest_empty(self):
+        """Tests the manifest of empty content."""
+        result = Manifest.loads(Manifest([]).dumps())
+        self.assertListEqual(result.filenames, [])
+        self.assertEqual(result.size, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+"""
+Unit tests for the cache of decrypted revision content, covering the
+memory and disk tiers on a temporary cache directory: hits, fills by
+full reads, partial reads that bypass the fill, and the deletion of a
+revision, which is broadcast to the memory tiers of the other workers.
+"""
+
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, AsyncMock, patch
+import asynctest
+from app.helpers.content_cache_helper import ContentCache
+
+CONTENT = bytes(range(256)) * 40
+
+
+async def _decrypt_iter(revision, start: int = 0, end: int = None):
+    """Yields the content of the revision in chunks."""
+    data = CONTENT[start:end]
+    for i in range(0, len(data), 1000):
+        yield data[i:i + 1000]
+
+
+@patch("app.helpers.content_cache_helper.revision_decrypt_iter",
+       side_effect=_decrypt_iter)
+class ContentCacheHelperTestCase(asynctest.TestCase):
+
+    async def setUp(self):
+        """Sets up the cache on a temporary cache directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cfg_patcher = patch("app.helpers.content_cache_helper.cfg")
+        self.cfg_mock = self.cfg_patcher.start()
+        self.cfg_mock.CONTENT_CACHE_PATH = self.tmp_dir.name
+        self.cfg_mock.CONTENT_CACHE_SIZE = 1024 * 1024
+        self.cfg_mock.CONTENT_CACHE_FILE_SIZE = 1024 * 1024
+        self.cfg_mock.CONTENT_CACHE_MEMORY_SIZE = 1024 * 1024
+        self.cfg_mock.CONTENT_CACHE_MEMORY_FILE_SIZE = 1024 * 1024
+        self.content_cache = ContentCache()
+        self.revision = MagicMock(id=123, original_size=len(CONTENT))
+
+    async def tearDown(self):
+        """Removes the temporary cache directory."""
+        self.cfg_patcher.stop()
+        self.tmp_dir.cleanup()
+
+    async def _read(self, start: int = 0, end: int = None) -> bytes:
+        """Collects the chunks yielded by revision_iter."""
+        end = len(CONTENT) if end is None else end
+        return b"".join([chunk async for chunk in
+                         self.content_cache.revision_iter(
+                             self.revision, start, end)])
+
+    async def test__memory_fill_hit(self, decrypt_iter_mock):
+        """Tests that a full read fills the memory tier."""
+        self.assertEqual(await self._read(), CONTENT)
+        self.assertEqual(self.content_cache.memory_size, len(CONTENT))
+
+        self.assertEqual(await self._read(), CONTENT)
+        self.assertEqual(await self._read(100, 200), CONTENT[100:200])
+        self.assertEqual(await self._read(len(CONTENT), len(CONTENT)), b"")
+
+        decrypt_iter_mock.assert_called_once()
+        self.assertEqual(self.content_cache.misses, 1)
+        self.assertEqual(self.content_cache.memory_hits, 3)
+
+    async def test__disk_fill_hit(self, decrypt_iter_mock):
+        """Tests that a full read of a larger revision fills the disk."""
+        self.cfg_mock.CONTENT_CACHE_MEMORY_FILE_SIZE = 1000
+
+        self.assertEqual(await self._read(), CONTENT)
+        path = self.content_cache.get_path(self.revision.id)
+        self.assertTrue(os.path.isfile(path))
+        self.assertListEqual(os.listdir(self.tmp_dir.name), ["123"])
+
+        self.assertEqual(await self._read(5000, 9000), CONTENT[5000:9000])
+        decrypt_iter_mock.assert_called_once()
+        self.assertEqual(self.content_cache.disk_hits, 1)
+        self.assertEqual(self.content_cache.memory_size, 0)
+
+    async def test__partial_read(self, decrypt_iter_mock):
+        """Tests that a partial read is decrypted without a fill."""
+        self.assertEqual(await self._read(100, 200), CONTENT[100:200])
+        self.assertEqual(await self._read(100, 200), CONTENT[100:200])
+
+        self.assertEqual(decrypt_iter_mock.call_count, 2)
+        decrypt_iter_mock.assert_called_with(self.revision, 100, 200)
+        self.assertEqual(self.content_cache.misses, 2)
+        self.assertEqual(len(self.content_cache.memory), 0)
+        self.assertListEqual(os.listdir(self.tmp_dir.name), [])
+
+    async def test__fill_too_large(self, decrypt_iter_mock):
+        """Tests that revisions above the file size are not cached."""
+        self.cfg_mock.CONTENT_CACHE_FILE_SIZE = 1000
+
+        self.assertEqual(await self._read(), CONTENT)
+        self.assertEqual(await self._read(), CONTENT)
+
+        self.assertEqual(decrypt_iter_mock.call_count, 2)
+        self.assertEqual(len(self.content_cache.memory), 0)
+
+    async def test__memory_limit(self, decrypt_iter_mock):
+        """Tests that the least recently used revisions are evicted."""
+        self.cfg_mock.CONTENT_CACHE_MEMORY_SIZE = len(CONTENT) * 2
+
+        for revision_id in [1, 2, 1, 3]:
+            self.revision.id = revision_id
+            await self._read()
+
+        self.assertListEqual(list(self.content_cache.memory), [1, 3])
+        self.assertEqual(self.content_cache.memory_size, len(CONTENT) * 2)
+
+    async def test__disabled(self, decrypt_iter_mock):
+        """Tests that nothing is cached when the cache is disabled."""
+        self.cfg_mock.CONTENT_CACHE_SIZE = 0
+
+        self.assertEqual(await self._read(), CONTENT)
+        self.assertEqual(len(self.content_cache.memory), 0)
+        self.assertEqual(self.content_cache.misses, 0)
+
+    @patch("app.helpers.content_cache_helper.cache_pool")
+    async def test__delete(self, cache_pool_mock, decrypt_iter_mock):
+        """Tests that the deletion is broadcast to the other workers."""
+        publish_mock = AsyncMock()
+        cache_pool_mock.get_client.return_value.publish = publish_mock
+        self.cfg_mock.CONTENT_CACHE_MEMORY_FILE_SIZE = 1000
+        await self._read()
+        self.content_cache._memory_set(self.revision.id, CONTENT)
+
+        await self.content_cache.delete(self.revision.id)
+
+        self.assertEqual(len(self.content_cache.memory), 0)
+        self.assertEqual(self.content_cache.memory_size, 0)
+        self.assertListEqual(os.listdir(self.tmp_dir.name), [])
+        publish_mock.assert_called_once_with("cache:evict", "content:123")
+
+    @patch("app.helpers.content_cache_helper.cache_pool")
+    async def test__delete_publish_error(self, cache_pool_mock,
+                                         decrypt_iter_mock):
+        """Tests that a failed broadcast does not fail the deletion."""
+        cache_pool_mock.get_client.return_value.publish = AsyncMock(
+            side_effect=ConnectionError())
+        self.content_cache._memory_set(self.revision.id, CONTENT)
+
+        await self.content_cache.delete(self.revision.id)
+        self.assertEqual(len(self.content_cache.memory), 0)
+
+    async def test__evict(self, decrypt_iter_mock):
+        """Tests that the keys broadcast by the workers are evicted."""
+        for revision_id in [1, 2, 3]:
+            self.content_cache._memory_set(revision_id, b"data")
+
+        for key in ["content:2", "content:x", "entity:revisions:0:1",
+                    "content:5"]:
+            self.content_cache.evict(key)
+        self.assertListEqual(list(self.content_cache.memory), [1, 3])
+        self.assertEqual(self.content_cache.memory_size, 8)
+
+        self.content_cache.evict("*")
+        self.assertEqual(len(self.content_cache.memory), 0)
+        self.assertEqual(self.content_cache.memory_size, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -143,6 +143,51 @@ class EntityManagerTestCase(asynctest.TestCase):
         flush_mock.assert_called_once()
         commit_mock.assert_not_called()
 
+    @patch("app.managers.entity_manager.EntityManager.flush")
+    @patch("app.managers.entity_manager.EntityManager.commit")
+    async def test__insert_all(self, commit_mock, flush_mock):
+        """Test the insert_all method with default flush and commit."""
+        dummies = [MagicMock(), MagicMock()]
+
+        result = await self.entity_manager.insert_all(dummies)
+        self.assertIsNone(result)
+
+        self.session_mock.add_all.assert_called_once_with(dummies)
+        self.session_mock.add.assert_not_called()
+        flush_mock.assert_called_once()
+        commit_mock.assert_called_once()
+
+    @patch("app.managers.entity_manager.EntityManager.flush")
+    @patch("app.managers.entity_manager.EntityManager.commit")
+    async def test__insert_all_commit_false(self, commit_mock, flush_mock):
+        """Test the insert_all method with commit set to False."""
+        dummies = [MagicMock(), MagicMock()]
+
+        result = await self.entity_manager.insert_all(dummies, commit=False)
+        self.assertIsNone(result)
+
+        self.session_mock.add_all.assert_called_once_with(dummies)
+        flush_mock.assert_called_once()
+        commit_mock.assert_not_called()
+
+    @patch("app.managers.entity_manager.select")
+    async def test__select_many(self, select_mock):
+        """Test the select_many method for several IDs."""
+        dummy_mocks = [MagicMock(id=1), MagicMock(id=2)]
+        dummy_class_mock = MagicMock()
+        async_result_mock = MagicMock()
+        async_result_mock.unique.return_value.scalars.return_value.all.return_value = dummy_mocks  # noqa E501
+        self.session_mock.execute.return_value = async_result_mock
+
+        result = await self.entity_manager.select_many(
+            dummy_class_mock, [1, 2])
+        self.assertListEqual(result, dummy_mocks)
+
+        select_mock.assert_called_once_with(dummy_class_mock)
+        dummy_class_mock.id.in_.assert_called_once_with([1, 2])
+        select_mock.return_value.where.assert_called_once_with(
+            dummy_class_mock.id.in_.return_value)
+
     @patch("app.managers.entity_manager.select")
     async def test__select(self, select_mock):
         """Test the select method for a specific ID."""
@@ -575,6 +620,29 @@ class EntityManagerTestCase(asynctest.TestCase):
         dummy_class_mock.id.in_.assert_not_called()
         async_result_mock.unique.return_value.scalars.return_value.one_or_none.assert_called_once() # noqa E501
 
+    @patch("app.managers.entity_manager.EntityManager._where")
+    @patch("app.managers.entity_manager.func")
+    @patch("app.managers.entity_manager.select")
+    async def test__count_grouped(self, select_mock, func_mock, where_mock):
+        """Test the count_grouped method with criteria."""
+        dummy_class_mock = MagicMock()
+        async_result_mock = MagicMock()
+        async_result_mock.all.return_value = [(1, 2), (3, 4)]
+        self.session_mock.execute.return_value = async_result_mock
+        kwargs = {"name__in": "1, 3"}
+
+        result = await self.entity_manager.count_grouped(
+            dummy_class_mock, "name", **kwargs)
+        self.assertDictEqual(result, {1: 2, 3: 4})
+
+        func_mock.count.assert_called_once_with(dummy_class_mock.id)
+        where_mock.assert_called_once_with(dummy_class_mock, **kwargs)
+        select_mock.assert_called_once_with(
+            dummy_class_mock.name, func_mock.count.return_value)
+        select_mock.return_value.where.assert_called_once_with(
+            *where_mock.return_value)
+        select_mock.return_value.where.return_value.group_by.assert_called_once_with(dummy_class_mock.name)  # noqa E501
+
     @patch("app.managers.entity_manager.EntityManager._where")
     @patch("app.managers.entity_manager.func")
     @patch("app.managers.entity_manager.select")
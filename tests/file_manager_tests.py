@@ -7,11 +7,18 @@ ensuring that each method behaves as expected under different
 conditions.
 """
 
+import os
+import hashlib
+import tempfile
 import unittest
 import asynctest
 from unittest.mock import AsyncMock, patch, call
 from app.managers.file_manager import (
-    FileManager, FILE_UPLOAD_CHUNK_SIZE, FILE_COPY_CHUNK_SIZE)
+    FileManager, cipher_suite, COMPRESSION_ZLIB, FILE_TMP_EXTENSION)
+from app.helpers.cipher_helper import (
+    SEGMENT_SIZE, SEGMENT_HEADER_SIZE, SegmentError, SegmentDecryptor,
+    encrypted_size)
+from app.helpers.crypto_helper import CRYPTO_BATCH_SIZE
 from app.config import get_config
 
 cfg = get_config()
@@ -22,11 +29,25 @@ class FileManagerTestCase(asynctest.TestCase):
 
     async def setUp(self):
         """Set up the test case environment."""
-        pass
+        self.tmp_dir = tempfile.TemporaryDirectory()
 
     async def tearDown(self):
         """Clean up the test case environment."""
-        pass
+        self.tmp_dir.cleanup()
+
+    def _tmp_file(self, filename: str, data: bytes = None) -> str:
+        """Creates a file in the temporary directory."""
+        path = os.path.join(self.tmp_dir.name, filename)
+        if data is not None:
+            with open(path, "wb") as fn:
+                fn.write(data)
+        return path
+
+    async def _decrypt_iter(self, path: str, start: int = 0,
+                            end: int = None, compression: str = None) -> bytes:
+        """Collects the chunks yielded by decrypt_iter."""
+        return b"".join([chunk async for chunk in FileManager.decrypt_iter(
+            path, start, end, compression)])
 
     def test__is_image_true(self):
         """Test that is_image method correctly identifies image."""
@@ -72,8 +93,17 @@ class FileManagerTestCase(asynctest.TestCase):
             result = FileManager.is_video(mimetype)
             self.assertFalse(result)
 
-    @patch("app.managers.file_manager.aiofiles")
-    async def test__upload(self, aiofiles_mock):
+    def test__is_compressible(self):
+        """Test the is_compressible method for text and media types."""
+        for mimetype in ["text/csv", "application/json", "text/plain"]:
+            self.assertTrue(FileManager.is_compressible(mimetype))
+
+        for mimetype in ["image/jpeg", "video/mp4", "application/zip",
+                         "application/PDF"]:
+            self.assertFalse(FileManager.is_compressible(mimetype))
+
+    @patch("app.managers.file_manager.io_open")
+    async def test__upload(self, io_open_mock):
         """Test the upload method to ensure it writes data to a file."""
         file_mock = AsyncMock()
         chunk1, chunk2 = b"data1", b"data2"
@@ -83,24 +113,135 @@ class FileManagerTestCase(asynctest.TestCase):
         result = await FileManager.upload(file_mock, path)
         self.assertIsNone(result)
 
-        aiofiles_mock.open.assert_called_once_with(path, mode="wb")
+        io_open_mock.assert_called_once_with(path, "wb")
         self.assertEqual(file_mock.read.call_count, 3)
         self.assertListEqual(file_mock.mock_calls, [
-            call.read(FILE_UPLOAD_CHUNK_SIZE),
-            call.read(FILE_UPLOAD_CHUNK_SIZE),
-            call.read(FILE_UPLOAD_CHUNK_SIZE),
+            call.read(cfg.IO_CHUNK_MIN_SIZE),
+            call.read(cfg.IO_CHUNK_MIN_SIZE * 2),
+            call.read(cfg.IO_CHUNK_MIN_SIZE * 4),
         ])
-        self.assertEqual(len(aiofiles_mock.mock_calls), 5)
-        self.assertEqual(aiofiles_mock.mock_calls[0],
-                         call.open(path, mode="wb"))
-        self.assertEqual(aiofiles_mock.mock_calls[1],
-                         call.open().__aenter__())
-        self.assertEqual(aiofiles_mock.mock_calls[2],
-                         call.open().__aenter__().write(chunk1))
-        self.assertEqual(aiofiles_mock.mock_calls[3],
-                         call.open().__aenter__().write(chunk2))
-        self.assertEqual(aiofiles_mock.mock_calls[4],
-                         call.open().__aexit__(None, None, None))
+        self.assertEqual(len(io_open_mock.mock_calls), 5)
+        self.assertEqual(io_open_mock.mock_calls[0],
+                         call(path, "wb"))
+        self.assertEqual(io_open_mock.mock_calls[1],
+                         call().__aenter__())
+        self.assertEqual(io_open_mock.mock_calls[2],
+                         call().__aenter__().write(chunk1))
+        self.assertEqual(io_open_mock.mock_calls[3],
+                         call().__aenter__().write(chunk2))
+        self.assertEqual(io_open_mock.mock_calls[4],
+                         call().__aexit__(None, None, None))
+
+    async def test__upload_stream(self):
+        """Test the upload_stream method to ensure single-pass upload."""
+        data = os.urandom(SEGMENT_SIZE * 2 + 5)
+        path = self._tmp_file("revision")
+
+        async def chunks():
+            for i in range(0, len(data), 1000):
+                yield data[i:i + 1000]
+
+        result = await FileManager.upload_stream(chunks(), path)
+        self.assertEqual(result, (len(data), encrypted_size(len(data)),
+                                  hashlib.sha256(data).hexdigest()))
+        self.assertEqual(os.path.getsize(path), result[1])
+        self.assertFalse(os.path.exists(path + ".tmp"))
+        self.assertEqual(await self._decrypt_iter(path), data)
+
+    async def test__upload_stream_batches(self):
+        """Test the upload_stream method with several crypto batches."""
+        data = os.urandom(CRYPTO_BATCH_SIZE * 3 + 5)
+        path = self._tmp_file("revision")
+
+        async def chunks():
+            for i in range(0, len(data), 100000):
+                yield data[i:i + 100000]
+
+        result = await FileManager.upload_stream(chunks(), path)
+        self.assertEqual(result, (len(data), encrypted_size(len(data)),
+                                  hashlib.sha256(data).hexdigest()))
+
+        with open(path, "rb") as fn:
+            encrypted_data = fn.read()
+        decryptor = SegmentDecryptor(encrypted_data, len(encrypted_data))
+        self.assertEqual(b"".join(decryptor.decrypt(i, encrypted_data[
+            decryptor.segment_offset(i):
+            decryptor.segment_offset(i) + decryptor.segment_length(i)])
+            for i in range(decryptor.segments_count)), data)
+
+        ranges = [(0, None), (1, CRYPTO_BATCH_SIZE * 2 + 1),
+                  (CRYPTO_BATCH_SIZE - 1, CRYPTO_BATCH_SIZE + 1),
+                  (len(data) - 3, None)]
+        for start, end in ranges:
+            self.assertEqual(await self._decrypt_iter(path, start, end),
+                             data[start:end])
+
+        with open(path, "r+b") as fn:
+            fn.seek(CRYPTO_BATCH_SIZE * 2)
+            fn.write(b"\x00" * 4)
+        with self.assertRaises(SegmentError):
+            await self._decrypt_iter(path)
+
+    async def test__upload_stream_compressed(self):
+        """Test the upload_stream method with compression."""
+        data = b"id,name,value\n" * 50000
+        path = self._tmp_file("revision")
+
+        async def chunks():
+            for i in range(0, len(data), 1000):
+                yield data[i:i + 1000]
+
+        result = await FileManager.upload_stream(
+            chunks(), path, compression=COMPRESSION_ZLIB)
+        self.assertEqual(result[0], len(data))
+        self.assertEqual(result[2], hashlib.sha256(data).hexdigest())
+        self.assertLess(result[1], len(data) // 10)
+        self.assertEqual(os.path.getsize(path), result[1])
+
+        self.assertEqual(await self._decrypt_iter(
+            path, compression=COMPRESSION_ZLIB), data)
+        ranges = [(0, 1), (5, SEGMENT_SIZE * 5), (len(data) - 3, None),
+                  (len(data), None), (10, 5)]
+        for start, end in ranges:
+            result = await self._decrypt_iter(
+                path, start, end, COMPRESSION_ZLIB)
+            self.assertEqual(result, data[start:end])
+
+    async def test__decrypt_iter_decompress_pool(self):
+        """Test that decompression runs in the crypto pool."""
+        data = b"id,name,value\n" * 50000
+        path = self._tmp_file("revision")
+
+        async def chunks():
+            yield data
+
+        await FileManager.upload_stream(chunks(), path,
+                                        compression=COMPRESSION_ZLIB)
+        funcs = []
+
+        async def run(func, *args):
+            funcs.append(getattr(func, "__name__", None))
+            return func(*args)
+
+        with patch("app.managers.file_manager.crypto_run", side_effect=run):
+            self.assertEqual(await self._decrypt_iter(
+                path, compression=COMPRESSION_ZLIB), data)
+        self.assertIn("decompress", funcs)
+        self.assertEqual(funcs[-1], "flush")
+
+    async def test__upload_stream_error(self):
+        """Test the upload_stream method when the stream fails."""
+        path = self._tmp_file("revision")
+
+        async def chunks():
+            yield b"data"
+            raise ValueError()
+
+        with self.assertRaises(ValueError):
+            await FileManager.upload_stream(chunks(), path)
+
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(path + ".tmp"))
 
     @patch("app.managers.file_manager.aiofiles")
     async def test__delete_file_exists(self, aiofiles_mock):
@@ -130,8 +271,84 @@ class FileManagerTestCase(asynctest.TestCase):
         os_mock.path.isfile.assert_called_once_with(path)
         os_mock.unlink.assert_not_called()
 
-    @patch("app.managers.file_manager.aiofiles")
-    async def test__write(self, aiofiles_mock):
+    async def test__exists(self):
+        """Test the exists method for existing and missing files."""
+        path = self._tmp_file("file", b"data")
+
+        self.assertTrue(await FileManager.exists(path))
+        self.assertFalse(await FileManager.exists(path + ".missing"))
+        self.assertFalse(await FileManager.exists(self.tmp_dir.name))
+
+    async def test__move(self):
+        """Test the move method to ensure the destination is replaced."""
+        src_path = self._tmp_file("src", b"new")
+        dst_path = self._tmp_file("dst", b"old")
+
+        result = await FileManager.move(src_path, dst_path)
+        self.assertIsNone(result)
+
+        self.assertFalse(os.path.exists(src_path))
+        with open(dst_path, "rb") as fn:
+            self.assertEqual(fn.read(), b"new")
+
+    async def test__size(self):
+        """Test the size method to ensure the file size is returned."""
+        path = self._tmp_file("file", b"data")
+        self.assertEqual(await FileManager.size(path), 4)
+
+    async def test__makedirs(self):
+        """Test the makedirs method for new and existing directories."""
+        path = os.path.join(self.tmp_dir.name, "parent", "child")
+
+        await FileManager.makedirs(path)
+        await FileManager.makedirs(path)
+        self.assertTrue(os.path.isdir(path))
+
+    async def test__listdir(self):
+        """Test the listdir method for existing and missing directories."""
+        self._tmp_file("file1", b"")
+        self._tmp_file("file2", b"")
+
+        self.assertEqual(sorted(await FileManager.listdir(self.tmp_dir.name)),
+                         ["file1", "file2"])
+        self.assertEqual(await FileManager.listdir(
+            os.path.join(self.tmp_dir.name, "missing")), [])
+
+    async def test__delete_dir(self):
+        """Test the delete_dir method to ensure contents are deleted."""
+        path = os.path.join(self.tmp_dir.name, "dir")
+        os.makedirs(os.path.join(path, "child"))
+        self._tmp_file(os.path.join("dir", "child", "file"), b"data")
+
+        await FileManager.delete_dir(path)
+        await FileManager.delete_dir(path)
+        self.assertFalse(os.path.exists(path))
+
+    async def test__touch(self):
+        """Test the touch method to ensure the mtime is updated."""
+        path = self._tmp_file("file", b"data")
+        os.utime(path, (0, 0))
+
+        await FileManager.touch(path)
+        self.assertGreater(os.path.getmtime(path), 0)
+
+    async def test__evict(self):
+        """Test the evict method to ensure the oldest files go first."""
+        for i in range(4):
+            path = self._tmp_file(str(i), b"x" * 100)
+            os.utime(path, (i, i))
+        tmp_path = self._tmp_file("4" + FILE_TMP_EXTENSION, b"x" * 100)
+
+        result = await FileManager.evict(self.tmp_dir.name, 400)
+        self.assertEqual(result, 400)
+
+        result = await FileManager.evict(self.tmp_dir.name, 300)
+        self.assertEqual(result, 200)
+        self.assertEqual(sorted(os.listdir(self.tmp_dir.name)),
+                         ["2", "3", os.path.basename(tmp_path)])
+
+    @patch("app.managers.file_manager.io_open")
+    async def test__write(self, io_open_mock):
         """Test the write method to ensure data is correctly written."""
         path = "/path"
         data = "data"
@@ -139,19 +356,19 @@ class FileManagerTestCase(asynctest.TestCase):
         result = await FileManager.write(path, data)
         self.assertIsNone(result)
 
-        aiofiles_mock.open.assert_called_once_with(path, mode="wb")
-        self.assertEqual(len(aiofiles_mock.mock_calls), 4)
-        self.assertEqual(aiofiles_mock.mock_calls[0],
-                         call.open(path, mode="wb"))
-        self.assertEqual(aiofiles_mock.mock_calls[1],
-                         call.open().__aenter__())
-        self.assertEqual(aiofiles_mock.mock_calls[2],
-                         call.open().__aenter__().write(data))
-        self.assertEqual(aiofiles_mock.mock_calls[3],
-                         call.open().__aexit__(None, None, None))
-
-    @patch("app.managers.file_manager.aiofiles")
-    async def test__read(self, aiofiles_mock):
+        io_open_mock.assert_called_once_with(path, "wb")
+        self.assertEqual(len(io_open_mock.mock_calls), 4)
+        self.assertEqual(io_open_mock.mock_calls[0],
+                         call(path, "wb"))
+        self.assertEqual(io_open_mock.mock_calls[1],
+                         call().__aenter__())
+        self.assertEqual(io_open_mock.mock_calls[2],
+                         call().__aenter__().write(data))
+        self.assertEqual(io_open_mock.mock_calls[3],
+                         call().__aexit__(None, None, None))
+
+    @patch("app.managers.file_manager.io_open")
+    async def test__read(self, io_open_mock):
         """Test the read method to ensure data is correctly read."""
         path = "/path"
 
@@ -159,18 +376,18 @@ class FileManagerTestCase(asynctest.TestCase):
         self.assertTrue(isinstance(result, AsyncMock))
         self.assertEqual(len(result.mock_calls), 1)
 
-        aiofiles_mock.open.assert_called_once_with(path, mode="rb")
-        self.assertEqual(len(aiofiles_mock.mock_calls), 5)
-        self.assertEqual(aiofiles_mock.mock_calls[0],
-                         call.open(path, mode="rb"))
-        self.assertEqual(aiofiles_mock.mock_calls[1],
-                         call.open().__aenter__())
-        self.assertEqual(aiofiles_mock.mock_calls[2],
-                         call.open().__aenter__().read())
-        self.assertEqual(aiofiles_mock.mock_calls[3],
-                         call.open().__aexit__(None, None, None))
-        self.assertEqual(aiofiles_mock.mock_calls[2],
-                         call.open().__aenter__().read())
+        io_open_mock.assert_called_once_with(path, "rb")
+        self.assertEqual(len(io_open_mock.mock_calls), 5)
+        self.assertEqual(io_open_mock.mock_calls[0],
+                         call(path, "rb"))
+        self.assertEqual(io_open_mock.mock_calls[1],
+                         call().__aenter__())
+        self.assertEqual(io_open_mock.mock_calls[2],
+                         call().__aenter__().read())
+        self.assertEqual(io_open_mock.mock_calls[3],
+                         call().__aexit__(None, None, None))
+        self.assertEqual(io_open_mock.mock_calls[2],
+                         call().__aenter__().read())
 
     @patch("app.managers.file_manager.cipher_suite")
     async def test__encrypt(self, cipher_suite_mock):
@@ -192,8 +409,91 @@ class FileManagerTestCase(asynctest.TestCase):
 
         cipher_suite_mock.decrypt.assert_called_once_with(data)
 
-    @patch("app.managers.file_manager.aiofiles")
-    async def test__copy(self, aiofiles_mock):
+    async def test__decrypt_segmented(self):
+        """Test the decrypt method with data in the segmented format."""
+        data = os.urandom(SEGMENT_SIZE * 2 + 10)
+        path = self._tmp_file("revision", data)
+
+        await FileManager.encrypt_file(path, path)
+        with open(path, "rb") as fn:
+            encrypted_data = fn.read()
+
+        result = await FileManager.decrypt(encrypted_data)
+        self.assertEqual(result, data)
+
+    async def test__encrypt_file(self):
+        """Test the encrypt_file method to ensure data is encrypted."""
+        for size in [0, 1, SEGMENT_SIZE, SEGMENT_SIZE * 3 + 7]:
+            data = os.urandom(size)
+            src_path = self._tmp_file("src", data)
+            dst_path = self._tmp_file("dst")
+
+            result = await FileManager.encrypt_file(src_path, dst_path)
+            self.assertEqual(result, encrypted_size(size))
+            self.assertEqual(os.path.getsize(dst_path), result)
+            self.assertFalse(os.path.exists(dst_path + ".tmp"))
+            self.assertEqual(await self._decrypt_iter(dst_path), data)
+
+    async def test__decrypt_file(self):
+        """Test the decrypt_file method to ensure data is decrypted."""
+        data = os.urandom(SEGMENT_SIZE * 2 + 5)
+        path = self._tmp_file("revision")
+        dst_path = self._tmp_file("plaintext")
+
+        async def chunks():
+            yield data
+
+        await FileManager.upload_stream(chunks(), path,
+                                        compression=COMPRESSION_ZLIB)
+        await FileManager.decrypt_file(path, dst_path, COMPRESSION_ZLIB)
+        with open(dst_path, "rb") as fn:
+            self.assertEqual(fn.read(), data)
+
+    async def test__decrypt_iter_range(self):
+        """Test the decrypt_iter method with start and end offsets."""
+        data = os.urandom(SEGMENT_SIZE * 3 + 100)
+        path = self._tmp_file("revision", data)
+        await FileManager.encrypt_file(path, path)
+
+        ranges = [(0, 1), (5, SEGMENT_SIZE + 5), (SEGMENT_SIZE, None),
+                  (len(data) - 1, None), (len(data), None), (10, 5)]
+        for start, end in ranges:
+            result = await self._decrypt_iter(path, start, end)
+            self.assertEqual(result, data[start:end])
+
+    async def test__decrypt_iter_legacy(self):
+        """Test the decrypt_iter method with a legacy Fernet file."""
+        data = os.urandom(1000)
+        path = self._tmp_file("revision", cipher_suite.encrypt(data))
+
+        self.assertEqual(await self._decrypt_iter(path), data)
+        self.assertEqual(await self._decrypt_iter(path, 10, 20), data[10:20])
+
+    async def test__decrypt_iter_tampered(self):
+        """Test the decrypt_iter method with a modified segment."""
+        path = self._tmp_file("revision", os.urandom(SEGMENT_SIZE * 2))
+        await FileManager.encrypt_file(path, path)
+
+        with open(path, "r+b") as fn:
+            fn.seek(SEGMENT_HEADER_SIZE + SEGMENT_SIZE + 20)
+            fn.write(b"x")
+
+        with self.assertRaises(SegmentError):
+            await self._decrypt_iter(path)
+
+    async def test__decrypt_iter_truncated(self):
+        """Test the decrypt_iter method with a truncated file."""
+        path = self._tmp_file("revision", os.urandom(SEGMENT_SIZE * 2))
+        await FileManager.encrypt_file(path, path)
+
+        with open(path, "r+b") as fn:
+            fn.truncate(os.path.getsize(path) - 16 - SEGMENT_SIZE)
+
+        with self.assertRaises(SegmentError):
+            await self._decrypt_iter(path)
+
+    @patch("app.managers.file_manager.io_open")
+    async def test__copy(self, io_open_mock):
         """Test the copy method to ensure data is copied correctly."""
         src_path = "/src_path"
         dst_path = "/dst_path"
@@ -205,19 +505,19 @@ class FileManagerTestCase(asynctest.TestCase):
 
         dst_context_mock = AsyncMock()
 
-        aiofiles_mock.open.side_effect = [src_context_mock, dst_context_mock]
+        io_open_mock.side_effect = [src_context_mock, dst_context_mock]
 
         result = await FileManager.copy(src_path, dst_path)
         self.assertIsNone(result)
 
-        self.assertEqual(aiofiles_mock.open.call_count, 2)
-        self.assertListEqual(aiofiles_mock.open.call_args_list, [
-            call(src_path, mode="rb"), call(dst_path, mode="wb")])
+        self.assertEqual(io_open_mock.call_count, 2)
+        self.assertListEqual(io_open_mock.call_args_list, [
+            call(src_path, "rb"), call(dst_path, "wb")])
         self.assertListEqual(src_context_mock.mock_calls, [
             call.__aenter__(),
-            call.__aenter__().read(FILE_COPY_CHUNK_SIZE),
-            call.__aenter__().read(FILE_COPY_CHUNK_SIZE),
-            call.__aenter__().read(FILE_COPY_CHUNK_SIZE),
+            call.__aenter__().read(cfg.IO_CHUNK_MIN_SIZE),
+            call.__aenter__().read(cfg.IO_CHUNK_MIN_SIZE * 2),
+            call.__aenter__().read(cfg.IO_CHUNK_MIN_SIZE * 4),
             call.__aexit__(None, None, None)
         ])
         self.assertListEqual(dst_context_mock.mock_calls, [
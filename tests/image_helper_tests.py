@@ -0,0 +1,199 @@
+"""
+Unit tests for the media processing helpers, covering the pixel and
+memory budgets of the image decoder and the reduced-scale decoding,
+the 413 error of a userpic over the budget, the FFmpeg slots shared by
+the processes of the host, the timeout and the errors of FFmpeg
+commands, the video probe, and the representative frame with its
+fallback to the first frame.
+"""
+
+import os
+import json
+import fcntl
+import tempfile
+import unittest
+from unittest.mock import MagicMock, AsyncMock, patch, call
+import asynctest
+import ffmpeg
+from PIL import Image
+from app.helpers.image_helper import (
+    _image_open_sync, _image_convert_sync, _video_slot_sync,
+    _video_run_sync, _video_probe_sync, _video_freeze_sync,
+    get_video_offset)
+from app.routers.userpic_upload_router import userpic_upload
+from app.errors import E
+
+
+class ImageHelperTestCase(asynctest.TestCase):
+
+    async def setUp(self):
+        """Sets up the FFmpeg slots in a temporary directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cfg_patcher = patch("app.helpers.image_helper.cfg")
+        self.cfg_mock = self.cfg_patcher.start()
+        self.cfg_mock.VIDEO_LOCKS_PATH = os.path.join(
+            self.tmp_dir.name, "locks")
+        self.cfg_mock.VIDEO_WORKERS = 2
+        self.cfg_mock.VIDEO_TIMEOUT = 0.5
+        self.cfg_mock.VIDEO_SEEK_RATIO = 0.1
+        self.cfg_mock.IMAGE_MAX_PIXELS = 100000000
+        self.cfg_mock.IMAGE_MAX_MEMORY = 536870912
+
+    async def tearDown(self):
+        self.cfg_patcher.stop()
+        self.tmp_dir.cleanup()
+
+    def _image(self, filename: str, size: tuple,
+               image_format: str = "JPEG") -> str:
+        """Saves a new image in the temporary directory."""
+        path = os.path.join(self.tmp_dir.name, filename)
+        Image.new("RGB", size, (200, 100, 50)).save(path, image_format)
+        return path
+
+    def _hold_slot(self, slot: int) -> int:
+        """Locks the slot as another process would."""
+        os.makedirs(self.cfg_mock.VIDEO_LOCKS_PATH, exist_ok=True)
+        fd = os.open(os.path.join(self.cfg_mock.VIDEO_LOCKS_PATH,
+                                  "%s.lock" % slot), os.O_RDWR | os.O_CREAT)
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self.addCleanup(os.close, fd)
+        return fd
+
+    async def test__image_pixels(self):
+        """Tests that images over the pixel budget are rejected."""
+        path = self._image("image.png", (100, 100), "PNG")
+        self.cfg_mock.IMAGE_MAX_PIXELS = 9999
+
+        with self.assertRaises(Image.DecompressionBombError):
+            _image_open_sync(path, 10, 10)
+
+        self.cfg_mock.IMAGE_MAX_PIXELS = 10000
+        self.assertTupleEqual(_image_open_sync(path, 10, 10).size,
+                              (100, 100))
+
+    async def test__image_memory(self):
+        """Tests that images over the memory budget are rejected."""
+        path = self._image("image.png", (100, 100), "PNG")
+        self.cfg_mock.IMAGE_MAX_MEMORY = 100 * 100 * 3 - 1
+
+        with self.assertRaises(Image.DecompressionBombError):
+            _image_open_sync(path, 10, 10)
+
+    async def test__image_draft(self):
+        """Tests that JPEG images are decoded at a reduced scale."""
+        path = self._image("image.jpg", (1600, 1200))
+        self.cfg_mock.IMAGE_MAX_MEMORY = 400 * 300 * 3
+
+        im = _image_open_sync(path, 100, 100)
+        self.assertTupleEqual(im.size, (400, 300))
+
+        dst_path = os.path.join(self.tmp_dir.name, "thumbnail.jpg")
+        _image_convert_sync(path, dst_path, 100, 100, "JPEG", 80)
+        with Image.open(dst_path) as im:
+            self.assertTupleEqual(im.size, (100, 75))
+
+    @patch("app.routers.userpic_upload_router.Hook")
+    @patch("app.routers.userpic_upload_router.FileManager")
+    @patch("app.routers.userpic_upload_router.Repository")
+    @patch("app.routers.userpic_upload_router.userpics_storage")
+    @patch("app.routers.userpic_upload_router.image_resize")
+    async def test__userpic_too_large(self, image_resize_mock,
+                                      userpics_storage_mock,
+                                      repository_mock, file_manager_mock,
+                                      hook_mock):
+        """Tests that a userpic over the budget is rejected with 413."""
+        image_resize_mock.side_effect = Image.DecompressionBombError()
+        file_manager_mock.makedirs = AsyncMock()
+        file_manager_mock.upload = AsyncMock()
+        file_manager_mock.delete = AsyncMock()
+        hook_mock.return_value.do = AsyncMock()
+        current_user = MagicMock(id=123, userpic_filename=None)
+        repository_mock.return_value.select = AsyncMock(
+            return_value=current_user)
+        file = MagicMock(content_type="image/jpeg")
+
+        with self.assertRaises(E) as context:
+            await userpic_upload.__wrapped__(
+                123, file, session=MagicMock(), cache=MagicMock(),
+                current_user=current_user)
+
+        self.assertEqual(context.exception.status_code, 413)
+        file_manager_mock.delete.assert_called_once_with(
+            file_manager_mock.upload.call_args.args[1])
+        userpics_storage_mock.put.assert_not_called()
+
+    async def test__slot(self):
+        """Tests that a free slot is taken while others are held."""
+        self._hold_slot(0)
+        with _video_slot_sync():
+            with self.assertRaises(BlockingIOError):
+                self._hold_slot(1)
+        self._hold_slot(1)
+
+    async def test__slot_timeout(self):
+        """Tests that waiting for a slot times out."""
+        self._hold_slot(0)
+        self._hold_slot(1)
+        with self.assertRaises(TimeoutError):
+            with _video_slot_sync():
+                pass
+
+    async def test__run(self):
+        """Tests that the output of the command is returned."""
+        self.assertEqual(_video_run_sync(["echo", "frame"]), b"frame\n")
+
+        with self.assertRaises(ffmpeg.Error):
+            _video_run_sync(["false"])
+
+    async def test__run_timeout(self):
+        """Tests that a command over the timeout is killed."""
+        with self.assertRaises(TimeoutError):
+            _video_run_sync(["sleep", "5"])
+        self._hold_slot(0)
+
+    @patch("app.helpers.image_helper._video_run_sync")
+    async def test__probe(self, run_mock):
+        """Tests that the duration and the dimensions are read."""
+        run_mock.return_value = json.dumps({
+            "streams": [{"width": 1920, "height": 1080}],
+            "format": {"duration": "12.5"}}).encode()
+        self.assertDictEqual(_video_probe_sync("video.mp4"), {
+            "duration": 12.5, "width": 1920, "height": 1080})
+
+        run_mock.return_value = b"{}"
+        self.assertDictEqual(_video_probe_sync("audio.mp4"), {
+            "duration": None, "width": None, "height": None})
+
+    async def test__offset(self):
+        """Tests that the frame is sought at a share of the duration."""
+        self.assertEqual(get_video_offset(100), 10)
+        self.assertEqual(get_video_offset(None), 0)
+        self.assertEqual(get_video_offset(0), 0)
+
+    @patch("app.helpers.image_helper._video_run_sync")
+    async def test__freeze(self, run_mock):
+        """Tests that the frame is sought in the input."""
+        dst_path = os.path.join(self.tmp_dir.name, "frame.jpg")
+        run_mock.side_effect = lambda args: open(dst_path, "wb").close()
+        _video_freeze_sync("video.mp4", dst_path, 10)
+
+        args = run_mock.call_args.args[0]
+        self.assertLess(args.index("-ss"), args.index("-i"))
+        self.assertEqual(args[args.index("-ss") + 1], "10")
+        self.assertEqual(args[args.index("-threads") + 1], "1")
+        run_mock.assert_called_once()
+
+    @patch("app.helpers.image_helper._video_run_sync")
+    async def test__freeze_past_end(self, run_mock):
+        """Tests that the first frame is taken past the end."""
+        dst_path = os.path.join(self.tmp_dir.name, "frame.jpg")
+        _video_freeze_sync("video.mp4", dst_path, 10)
+
+        self.assertEqual(run_mock.call_count, 2)
+        args = run_mock.call_args.args[0]
+        self.assertEqual(args[args.index("-ss") + 1], "0")
+        self.assertNotEqual(run_mock.call_args_list[0], call(args))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+"""
+Unit tests for the media process pool, covering the results and the
+counters of jobs, the queue of jobs beyond the concurrency limit, and
+the timeout of a job, which kills the processes of the pool so the
+next job starts a new one.
+"""
+
+import time
+import asyncio
+import unittest
+from unittest.mock import patch
+import asynctest
+from app.helpers.media_helper import MediaPool
+
+
+@patch("app.helpers.media_helper.cfg")
+class MediaHelperTestCase(asynctest.TestCase):
+
+    def _pool(self, cfg_mock, workers: int = 1,
+              timeout: float = 30) -> MediaPool:
+        cfg_mock.MEDIA_POOL_WORKERS = workers
+        cfg_mock.MEDIA_POOL_TIMEOUT = timeout
+        self.media_pool = MediaPool()
+        return self.media_pool
+
+    async def tearDown(self):
+        self.media_pool.shutdown(kill=True)
+
+    async def test__run(self, cfg_mock):
+        """Tests that jobs return their results and are counted."""
+        media_pool = self._pool(cfg_mock)
+        self.assertEqual(await media_pool.run(pow, 2, 10), 1024)
+
+        with self.assertRaises(ValueError):
+            await media_pool.run(int, "x")
+
+        self.assertDictEqual(media_pool.get_stats(), {
+            "media_pool_queued": 0, "media_pool_running": 0,
+            "media_pool_completed": 1, "media_pool_failed": 1,
+            "media_pool_timeouts": 0})
+
+    async def test__queue(self, cfg_mock):
+        """Tests that jobs beyond the limit wait in the queue."""
+        media_pool = self._pool(cfg_mock)
+        await media_pool.run(pow, 2, 10)
+
+        tasks = [asyncio.create_task(media_pool.run(time.sleep, 0.5))
+                 for _ in range(2)]
+        await asyncio.sleep(0.1)
+        self.assertEqual(media_pool.queued, 1)
+        self.assertEqual(media_pool.running, 1)
+
+        await asyncio.gather(*tasks)
+        self.assertEqual(media_pool.queued, 0)
+        self.assertEqual(media_pool.running, 0)
+        self.assertEqual(media_pool.completed, 3)
+
+    async def test__timeout_kill(self, cfg_mock):
+        """Tests that a timed out job kills the pool, which restarts."""
+        media_pool = self._pool(cfg_mock, timeout=1)
+        await media_pool.run(pow, 2, 10)
+        processes = list(media_pool.executor._processes.values())
+
+        with self.assertRaises(asyncio.TimeoutError):
+            await media_pool.run(time.sleep, 30)
+
+        self.assertIsNone(media_pool.executor)
+        for process in processes:
+            process.join(5)
+            self.assertFalse(process.is_alive())
+        self.assertEqual(media_pool.timeouts, 1)
+
+        self.assertEqual(await media_pool.run(pow, 2, 3), 8)
+        self.assertEqual(media_pool.completed, 2)
+        self.assertEqual(media_pool.running, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,236 @@
+"""
+Unit tests for the garbage collector of unreferenced files, covering
+the journaling of the files of a deleted revision, the sweeper, which
+deletes the stale files of a batch under their locks and postpones the
+files stored again by uploads, and the marker file that guards the
+reconciliation scan.
+"""
+
+import os
+import time
+import fcntl
+import tempfile
+import unittest
+from unittest.mock import MagicMock, AsyncMock, call, patch
+import asynctest
+from app.helpers.orphan_helper import (
+    orphans_sweep, orphans_reconcile_all, _reconcile_lock_sync)
+from app.managers.storage_manager import StorageStat
+from app.models.orphan_model import OrphanKind
+from app.models.revision_model import after_delete_listener
+from app.config import get_config
+
+cfg = get_config()
+
+NOW = 1700000000
+STALE = NOW - cfg.ORPHANS_GC_DELAY - 1
+FRESH = NOW - 1
+
+
+def _orphan(orphan_id: int, filename: str,
+            orphan_kind: OrphanKind = OrphanKind.revision):
+    return MagicMock(id=orphan_id, orphan_kind=orphan_kind,
+                     orphan_filename=filename, revision_id=None)
+
+
+@patch("app.helpers.orphan_helper.time.time", return_value=NOW)
+@patch("app.helpers.orphan_helper.content_cache", new=AsyncMock())
+@patch("app.helpers.orphan_helper.chunks_release", new=AsyncMock())
+@patch("app.helpers.orphan_helper.renditions_delete", new=AsyncMock())
+class OrphanHelperTestCase(asynctest.TestCase):
+
+    async def setUp(self):
+        """Sets up the database session, the storage and the locks."""
+        self.events = []
+        self.session = AsyncMock()
+        self.sessionmanager_patcher = patch(
+            "app.helpers.orphan_helper.sessionmanager")
+        sessionmanager_mock = self.sessionmanager_patcher.start()
+        sessionmanager_mock.async_sessionmaker.return_value.\
+            __aenter__.return_value = self.session
+
+        self.storage = AsyncMock()
+        self.storage.stat.side_effect = self._stat
+        self.storage.delete.side_effect = (
+            lambda key: self.events.append(("delete", key)))
+        self.storages_patcher = patch.dict(
+            "app.helpers.orphan_helper.ORPHAN_STORAGES",
+            {OrphanKind.revision: self.storage}, clear=True)
+        self.storages_patcher.start()
+
+        self.locked = set()
+        self.lock_patcher = patch("app.helpers.orphan_helper.blob_lock",
+                                  side_effect=self._lock)
+        self.lock_patcher.start()
+
+        self.referenced = set()
+        self.referenced_patcher = patch(
+            "app.helpers.orphan_helper._referenced",
+            side_effect=lambda session, kind, filenames: self.referenced)
+        self.referenced_patcher.start()
+        self.mtimes = {}
+
+    async def tearDown(self):
+        self.referenced_patcher.stop()
+        self.lock_patcher.stop()
+        self.storages_patcher.stop()
+        self.sessionmanager_patcher.stop()
+
+    def _lock(self, filename: str):
+        """Returns a lock on the file that records its use."""
+        async def acquire(blocking: bool = True) -> bool:
+            if filename in self.locked:
+                return False
+            self.events.append(("acquire", filename))
+            return True
+
+        async def release():
+            self.events.append(("release", filename))
+
+        return MagicMock(acquire=acquire, release=release)
+
+    async def _stat(self, key: str):
+        self.events.append(("stat", key))
+        if key in self.mtimes:
+            return StorageStat(key, 10, self.mtimes[key])
+
+    async def _sweep(self, orphans: list) -> tuple:
+        """
+        Runs the sweeper on the orphans and returns the SQL statements
+        that remove and postpone their journal entries.
+        """
+        self.session.execute.return_value.scalars = MagicMock()
+        self.session.execute.return_value.scalars.return_value.\
+            all.return_value = orphans
+        self.assertEqual(await orphans_sweep(), len(orphans))
+
+        statements = [str(x.args[0].compile(
+            compile_kwargs={"literal_binds": True}))
+            for x in self.session.execute.call_args_list[1:]]
+        self.session.commit.assert_called_once()
+        return statements
+
+    async def test__sweep_stale(self, time_mock):
+        """Tests that stale unreferenced files are deleted."""
+        self.mtimes = {"a.aes": STALE}
+        statements = await self._sweep(
+            [_orphan(1, "a.aes"), _orphan(2, "b.aes")])
+
+        self.assertListEqual(self.events, [
+            ("acquire", "a.aes"), ("stat", "a.aes"), ("delete", "a.aes"),
+            ("release", "a.aes"), ("acquire", "b.aes"), ("stat", "b.aes"),
+            ("delete", "b.aes"), ("release", "b.aes")])
+        self.assertEqual(len(statements), 1)
+        self.assertIn("DELETE FROM files_orphans", statements[0])
+        self.assertIn("IN (1, 2)", statements[0])
+
+    async def test__sweep_referenced(self, time_mock):
+        """Tests that referenced files are kept and their entries done."""
+        self.mtimes = {"a.aes": STALE}
+        self.referenced = {"a.aes"}
+        statements = await self._sweep([_orphan(1, "a.aes")])
+
+        self.assertListEqual(self.events, [])
+        self.assertIn("IN (1)", statements[0])
+
+    async def test__sweep_fresh(self, time_mock):
+        """Tests that files stored again recently are postponed."""
+        self.mtimes = {"a.aes": FRESH}
+        statements = await self._sweep([_orphan(1, "a.aes")])
+
+        self.storage.delete.assert_not_called()
+        self.assertListEqual(self.events, [
+            ("acquire", "a.aes"), ("stat", "a.aes"), ("release", "a.aes")])
+        self.assertEqual(len(statements), 1)
+        self.assertIn("UPDATE files_orphans", statements[0])
+        self.assertIn("created_date=%s" % NOW, statements[0])
+
+    async def test__sweep_locked(self, time_mock):
+        """Tests that files being stored by uploads are postponed."""
+        self.mtimes = {"a.aes": STALE}
+        self.locked = {"a.aes"}
+        statements = await self._sweep([_orphan(1, "a.aes")])
+
+        self.assertListEqual(self.events, [])
+        self.assertIn("UPDATE files_orphans", statements[0])
+
+    async def test__sweep_delete_error(self, time_mock):
+        """Tests that failed deletions are retried by the next sweep."""
+        self.mtimes = {"a.aes": STALE}
+        self.storage.delete.side_effect = OSError()
+        statements = await self._sweep([_orphan(1, "a.aes")])
+
+        self.assertListEqual(self.events, [
+            ("acquire", "a.aes"), ("stat", "a.aes"), ("release", "a.aes")])
+        self.assertListEqual(statements, [])
+
+    async def test__listener(self, time_mock):
+        """Tests that the files of a deleted revision are journaled."""
+        connection = MagicMock()
+        revision = MagicMock(id=123, revision_filename="a.aes",
+                             thumbnail_filename="a.webp")
+        after_delete_listener(None, connection, revision)
+
+        self.assertListEqual(connection.execute.call_args.args[1], [
+            {"orphan_kind": OrphanKind.revision,
+             "orphan_filename": "a.aes", "revision_id": 123},
+            {"orphan_kind": OrphanKind.thumbnail,
+             "orphan_filename": "a.webp", "revision_id": 123}])
+
+        revision.thumbnail_filename = None
+        after_delete_listener(None, connection, revision)
+        self.assertListEqual(connection.execute.call_args.args[1], [
+            {"orphan_kind": OrphanKind.revision,
+             "orphan_filename": "a.aes", "revision_id": 123}])
+
+
+class ReconcileLockTestCase(asynctest.TestCase):
+
+    async def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.marker_path = os.path.join(self.tmp_dir.name, ".reconciled")
+
+    async def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    async def test__lock_first(self):
+        """Tests that the first scan is due right away."""
+        fd = _reconcile_lock_sync(self.marker_path)
+        self.assertIsNotNone(fd)
+        self.assertEqual(os.stat(self.marker_path).st_mtime, 0)
+        os.close(fd)
+
+    async def test__lock_recent(self):
+        """Tests that the scan is skipped after a recent scan."""
+        open(self.marker_path, "w").close()
+        self.assertIsNone(_reconcile_lock_sync(self.marker_path))
+
+    async def test__lock_held(self):
+        """Tests that the scan is skipped while another worker runs it."""
+        open(self.marker_path, "w").close()
+        os.utime(self.marker_path, (0, 0))
+        fd = os.open(self.marker_path, os.O_RDWR)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            self.assertIsNone(_reconcile_lock_sync(self.marker_path))
+        finally:
+            os.close(fd)
+
+    @patch("app.helpers.orphan_helper.orphans_reconcile")
+    async def test__reconcile_all(self, reconcile_mock):
+        """Tests that the scan runs once and marks its time."""
+        with patch("app.helpers.orphan_helper.cfg") as cfg_mock:
+            cfg_mock.REVISIONS_BASE_PATH = self.tmp_dir.name
+            cfg_mock.ORPHANS_RECONCILE_INTERVAL = 3600
+            await orphans_reconcile_all()
+            await orphans_reconcile_all()
+
+        self.assertListEqual(reconcile_mock.call_args_list, [
+            call(OrphanKind.revision), call(OrphanKind.thumbnail),
+            call(OrphanKind.chunk)])
+        self.assertAlmostEqual(os.stat(self.marker_path).st_mtime,
+                               time.time(), delta=5)
+
+
+if __name__ == "__main__":
+    unittest.main()
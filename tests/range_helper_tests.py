@@ -0,0 +1,133 @@
+"""
+Unit tests for the HTTP Range support of revision downloads, covering
+the evaluation of the Range header, including suffix and unsatisfiable
+ranges, the fallback to the whole revision for malformed and multi-part
+ranges, and the If-Range validators by entity tag and by HTTP date.
+"""
+
+import unittest
+from unittest.mock import MagicMock
+import asynctest
+from app.helpers.range_helper import (
+    get_byte_range, get_etag, get_last_modified, revision_response)
+from app.errors import E
+
+SIZE = 1000
+CREATED_DATE = 1700000000
+
+
+class RangeHelperTestCase(asynctest.TestCase):
+
+    async def setUp(self):
+        """Sets up a revision of the given size."""
+        self.revision = MagicMock(
+            id=123, created_date=CREATED_DATE, original_size=SIZE,
+            original_filename="file.txt", original_mimetype="text/plain")
+
+    async def test__range_none(self):
+        """Tests that the whole revision is returned without a range."""
+        self.assertIsNone(get_byte_range(self.revision))
+        self.assertIsNone(get_byte_range(self.revision, ""))
+
+    async def test__range(self):
+        """Tests the ranges with the first position."""
+        for range_header, result in [("bytes=0-0", (0, 0)),
+                                     ("bytes=0-499", (0, 499)),
+                                     ("bytes=500-", (500, SIZE - 1)),
+                                     ("bytes=900-5000", (900, SIZE - 1)),
+                                     (" bytes=999-999 ", (999, 999))]:
+            self.assertTupleEqual(
+                get_byte_range(self.revision, range_header), result)
+
+    async def test__range_suffix(self):
+        """Tests the suffix ranges, which count from the end."""
+        for range_header, result in [("bytes=-1", (SIZE - 1, SIZE - 1)),
+                                     ("bytes=-100", (900, SIZE - 1)),
+                                     ("bytes=-5000", (0, SIZE - 1))]:
+            self.assertTupleEqual(
+                get_byte_range(self.revision, range_header), result)
+
+    async def test__range_suffix_zero(self):
+        """Tests that an empty suffix range cannot be satisfied."""
+        with self.assertRaises(E) as context:
+            get_byte_range(self.revision, "bytes=-0")
+
+        self.assertEqual(context.exception.status_code, 416)
+        self.assertDictEqual(context.exception.headers,
+                             {"Content-Range": "bytes */%s" % SIZE})
+
+    async def test__range_unsatisfiable(self):
+        """Tests that a range starting after the end raises 416."""
+        for range_header in ["bytes=1000-", "bytes=1000-2000",
+                             "bytes=5000-"]:
+            with self.assertRaises(E) as context:
+                get_byte_range(self.revision, range_header)
+
+            self.assertEqual(context.exception.status_code, 416)
+            self.assertDictEqual(context.exception.headers,
+                                 {"Content-Range": "bytes */%s" % SIZE})
+
+        self.revision.original_size = 0
+        with self.assertRaises(E) as context:
+            get_byte_range(self.revision, "bytes=0-")
+        self.assertDictEqual(context.exception.headers,
+                             {"Content-Range": "bytes */0"})
+
+    async def test__range_ignored(self):
+        """Tests that malformed and multi-part ranges are ignored."""
+        for range_header in ["bytes=0-10,20-30", "bytes=-", "bytes=10-5",
+                             "items=0-10", "bytes=a-b", "bytes 0-10",
+                             "bytes=-10-20", "0-10"]:
+            self.assertIsNone(get_byte_range(self.revision, range_header))
+
+    async def test__if_range_etag(self):
+        """Tests the If-Range validator by entity tag."""
+        etag = get_etag(self.revision)
+        self.assertEqual(etag, '"123-%s"' % CREATED_DATE)
+
+        self.assertTupleEqual(get_byte_range(
+            self.revision, "bytes=0-9", etag), (0, 9))
+        self.assertTupleEqual(get_byte_range(
+            self.revision, "bytes=0-9", " %s " % etag), (0, 9))
+
+        for if_range in ['"123-1"', '"456-%s"' % CREATED_DATE,
+                         "W/%s" % etag]:
+            self.assertIsNone(get_byte_range(
+                self.revision, "bytes=0-9", if_range))
+
+    async def test__if_range_date(self):
+        """Tests the If-Range validator by HTTP date."""
+        last_modified = get_last_modified(self.revision)
+        self.assertEqual(last_modified, "Tue, 14 Nov 2023 22:13:20 GMT")
+
+        self.assertTupleEqual(get_byte_range(
+            self.revision, "bytes=0-9", last_modified), (0, 9))
+
+        for if_range in ["Tue, 14 Nov 2023 22:13:19 GMT",
+                         "Wed, 15 Nov 2023 22:13:20 GMT", "yesterday"]:
+            self.assertIsNone(get_byte_range(
+                self.revision, "bytes=0-9", if_range))
+
+    async def test__if_range_unsatisfiable(self):
+        """Tests that a stale If-Range returns the whole revision."""
+        self.assertIsNone(get_byte_range(
+            self.revision, "bytes=5000-", '"123-1"'))
+
+    async def test__response(self):
+        """Tests the headers of the whole and the partial response."""
+        response = revision_response(self.revision)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-length"], str(SIZE))
+        self.assertEqual(response.headers["accept-ranges"], "bytes")
+        self.assertNotIn("content-range", response.headers)
+
+        response = revision_response(self.revision, (900, SIZE - 1))
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.headers["content-length"], "100")
+        self.assertEqual(response.headers["content-range"],
+                         "bytes 900-999/%s" % SIZE)
+        self.assertEqual(response.headers["etag"], get_etag(self.revision))
+
+
+if __name__ == "__main__":
+    unittest.main()
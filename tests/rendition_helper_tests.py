@@ -0,0 +1,165 @@
+"""
+Unit tests for the thumbnail renditions, covering the negotiation of the
+rendition format from the Accept header, the validation of the size
+presets, and the creation of every preset and format from one master
+image per revision on a temporary renditions directory.
+"""
+
+import os
+import typing
+import inspect
+import tempfile
+import unittest
+from unittest.mock import MagicMock, AsyncMock, patch
+import asynctest
+from app.helpers.rendition_helper import (
+    get_rendition_mimetype, get_master_filename, rendition_retrieve,
+    renditions_delete, RENDITION_PRESETS)
+
+RENDITION_MIMETYPES = {
+    "image/avif": ("AVIF", ".avif"),
+    "image/webp": ("WEBP", ".webp"),
+    "image/jpeg": ("JPEG", ".jpg"),
+}
+
+
+async def _image_convert(src_path, dst_path, width, height, image_format,
+                         quality):
+    """Stands in for the conversion by writing the arguments."""
+    with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+        dst.write(src.read()[:32] + b"|%d|%d|%s" % (
+            width, height, image_format.encode()))
+
+
+async def _decrypt_file(revision, path):
+    """Stands in for the decryption by writing the source file."""
+    with open(path, "wb") as fn:
+        fn.write(b"source")
+
+
+@patch("app.helpers.rendition_helper.RENDITION_MIMETYPES",
+       RENDITION_MIMETYPES)
+class RenditionHelperTestCase(asynctest.TestCase):
+
+    async def setUp(self):
+        """Sets up a temporary renditions directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cfg_patcher = patch("app.helpers.rendition_helper.cfg")
+        self.cfg_mock = self.cfg_patcher.start()
+        self.cfg_mock.RENDITIONS_BASE_PATH = self.tmp_dir.name
+        self.cfg_mock.RENDITIONS_SIZE = 1024 * 1024
+        self.cfg_mock.RENDITIONS_QUALITY = 75
+        self.cfg_mock.THUMBNAILS_EXTENSION = ".jpg"
+        self.revision = MagicMock(thumbnail_filename="abc.jpg",
+                                  original_mimetype="image/png",
+                                  media_duration=None)
+
+    async def tearDown(self):
+        """Removes the temporary renditions directory."""
+        self.cfg_patcher.stop()
+        self.tmp_dir.cleanup()
+
+    async def test__mimetype_explicit(self):
+        """Tests that the smallest explicitly accepted format wins."""
+        result = get_rendition_mimetype(
+            "image/avif,image/webp,image/apng,*/*;q=0.8")
+        self.assertEqual(result, "image/avif")
+
+        result = get_rendition_mimetype("image/webp,*/*")
+        self.assertEqual(result, "image/webp")
+
+    async def test__mimetype_quality(self):
+        """Tests that the format with the highest quality value wins."""
+        result = get_rendition_mimetype(
+            "image/avif;q=0.5, image/webp;q=0.9, image/jpeg")
+        self.assertEqual(result, "image/jpeg")
+
+        result = get_rendition_mimetype("IMAGE/WEBP; q=0.7, image/jpeg;q=0.6")
+        self.assertEqual(result, "image/webp")
+
+    async def test__mimetype_default(self):
+        """Tests that JPEG is returned for wildcards and bad headers."""
+        for accept_header in [None, "", "*/*", "image/*",
+                              "image/avif;q=0", "image/webp;q=abc"]:
+            self.assertEqual(get_rendition_mimetype(accept_header),
+                             "image/jpeg")
+
+    async def test__mimetype_unsupported(self):
+        """Tests that formats Pillow cannot write are not chosen."""
+        with patch("app.helpers.rendition_helper.RENDITION_MIMETYPES",
+                   {"image/jpeg": ("JPEG", ".jpg")}):
+            result = get_rendition_mimetype("image/avif,image/webp")
+        self.assertEqual(result, "image/jpeg")
+
+    async def test__presets_router(self):
+        """Tests that the router accepts exactly the known presets."""
+        from app.routers.thumbnail_retrieve_router import thumbnail_retrieve
+        annotation = inspect.signature(
+            thumbnail_retrieve).parameters["preset"].annotation
+
+        self.assertTupleEqual(typing.get_args(annotation),
+                              tuple(RENDITION_PRESETS))
+
+    async def test__retrieve_unknown(self):
+        """Tests that unknown presets and formats are rejected."""
+        for preset, mimetype in [("huge", "image/jpeg"),
+                                 ("small", "image/gif")]:
+            with self.assertRaises(ValueError):
+                await rendition_retrieve(self.revision, preset, mimetype)
+        self.assertListEqual(os.listdir(self.tmp_dir.name), [])
+
+    @patch("app.helpers.rendition_helper.image_convert",
+           side_effect=_image_convert)
+    @patch("app.helpers.rendition_helper.revision_decrypt_file",
+           side_effect=_decrypt_file)
+    async def test__retrieve_master(self, decrypt_mock, convert_mock):
+        """Tests that every rendition is derived from one master."""
+        for preset in RENDITION_PRESETS:
+            for mimetype in RENDITION_MIMETYPES:
+                path = await rendition_retrieve(
+                    self.revision, preset, mimetype)
+                self.assertTrue(os.path.isfile(path))
+
+        decrypt_mock.assert_called_once()
+        master_path = os.path.join(self.tmp_dir.name,
+                                   get_master_filename("abc.jpg"))
+        master_calls = [x for x in convert_mock.call_args_list
+                        if x.args[0] != master_path]
+        self.assertEqual(len(master_calls), 1)
+        self.assertEqual(master_calls[0].args[2:5], (640, 640, "PNG"))
+        self.assertEqual(convert_mock.call_count, 10)
+
+        with open(os.path.join(self.tmp_dir.name, "abc_small.webp"),
+                  "rb") as fn:
+            self.assertEqual(fn.read(), b"source|640|640|PNG|160|160|WEBP")
+        self.assertEqual(len(os.listdir(self.tmp_dir.name)), 10)
+
+        await renditions_delete("abc.jpg")
+        self.assertListEqual(os.listdir(self.tmp_dir.name), [])
+
+    @patch("app.helpers.rendition_helper.image_convert",
+           side_effect=_image_convert)
+    @patch("app.helpers.rendition_helper.video_freeze", new_callable=AsyncMock)
+    @patch("app.helpers.rendition_helper.revision_decrypt_file",
+           side_effect=_decrypt_file)
+    async def test__retrieve_video(self, decrypt_mock, freeze_mock,
+                                   convert_mock):
+        """Tests that the master of a video is made from its frame."""
+        async def video_freeze(src_path, dst_path, offset):
+            with open(dst_path, "wb") as fn:
+                fn.write(b"frame")
+        freeze_mock.side_effect = video_freeze
+        self.revision.original_mimetype = "video/mp4"
+
+        await rendition_retrieve(self.revision, "large", "image/jpeg")
+        await rendition_retrieve(self.revision, "small", "image/jpeg")
+
+        decrypt_mock.assert_called_once()
+        freeze_mock.assert_called_once()
+        with open(os.path.join(self.tmp_dir.name, "abc_small.jpg"),
+                  "rb") as fn:
+            self.assertEqual(fn.read(), b"frame|640|640|PNG|160|160|JPEG")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,7 +10,7 @@ behavior.
 
 import asynctest
 import unittest
-from unittest.mock import MagicMock, AsyncMock, call
+from unittest.mock import MagicMock, AsyncMock
 from app.repository import Repository
 
 
@@ -73,6 +73,22 @@ class RepositoryTestCase(asynctest.TestCase):
             dummy_mock, commit=False)
         repository.cache_manager.set.assert_not_called()
 
+    async def test__insert_all(self):
+        """Test insert_all with commit False."""
+        dummy_class_mock = MagicMock(__tablename__="dummies", _cacheable=True)
+        dummies = [MagicMock(), MagicMock()]
+
+        repository = Repository(None, None, dummy_class_mock)
+        repository.entity_manager = AsyncMock()
+        repository.cache_manager = AsyncMock()
+
+        result = await repository.insert_all(dummies, commit=False)
+        self.assertIsNone(result)
+
+        repository.entity_manager.insert_all.assert_called_once_with(
+            dummies, commit=False)
+        repository.cache_manager.set.assert_not_called()
+
     async def test__insert_uncacheable_commit_true(self):
         """Test insert with uncacheable entity and commit True."""
         dummy_class_mock = MagicMock(__tablename__="dummies", _cacheable=False)
@@ -219,10 +235,9 @@ class RepositoryTestCase(asynctest.TestCase):
 
         repository.entity_manager.select_all.assert_called_once_with(
             dummy_class_mock, key__eq=dummy_mocks[0].key)
-        self.assertEqual(repository.cache_manager.set.call_count, 2)
-        self.assertListEqual(
-            repository.cache_manager.set.call_args_list,
-            [call(dummy_mocks[0]), call(dummy_mocks[1])])
+        repository.cache_manager.set_many.assert_called_once_with(
+            dummy_mocks)
+        repository.cache_manager.set.assert_not_called()
 
     async def test__select_all_uncacheable(self):
         """Test select all with uncacheable entities."""
@@ -239,7 +254,62 @@ class RepositoryTestCase(asynctest.TestCase):
 
         repository.entity_manager.select_all.assert_called_once_with(
             dummy_class_mock, key__eq=dummy_mocks[0].key)
-        repository.cache_manager.set.assert_not_called()
+        repository.cache_manager.set_many.assert_not_called()
+
+    async def test__select_many_cacheable(self):
+        """Test select many with cacheable entities."""
+        dummy_class_mock = MagicMock(__tablename__="dummies", _cacheable=True)
+        dummy_mocks = [MagicMock(id=1), MagicMock(id=2)]
+
+        repository = Repository(None, None, dummy_class_mock)
+        repository.entity_manager = AsyncMock()
+        repository.entity_manager.select_many.return_value = [dummy_mocks[1]]
+        repository.cache_manager = AsyncMock()
+        repository.cache_manager.get_many.return_value = {1: dummy_mocks[0]}
+
+        result = await repository.select_many([1, 2, None, 1, 3])
+        self.assertDictEqual(result, {1: dummy_mocks[0], 2: dummy_mocks[1]})
+
+        repository.cache_manager.get_many.assert_called_once_with(
+            dummy_class_mock, [1, 2, 3])
+        repository.entity_manager.select_many.assert_called_once_with(
+            dummy_class_mock, [2, 3])
+        repository.cache_manager.set_many.assert_called_once_with(
+            [dummy_mocks[1]])
+
+    async def test__select_many_cached(self):
+        """Test select many when all the entities are cached."""
+        dummy_class_mock = MagicMock(__tablename__="dummies", _cacheable=True)
+        dummy_mock = MagicMock(id=1)
+
+        repository = Repository(None, None, dummy_class_mock)
+        repository.entity_manager = AsyncMock()
+        repository.cache_manager = AsyncMock()
+        repository.cache_manager.get_many.return_value = {1: dummy_mock}
+
+        result = await repository.select_many([1])
+        self.assertDictEqual(result, {1: dummy_mock})
+
+        repository.entity_manager.select_many.assert_not_called()
+        repository.cache_manager.set_many.assert_not_called()
+
+    async def test__select_many_uncacheable(self):
+        """Test select many with uncacheable entities."""
+        dummy_class_mock = MagicMock(__tablename__="dummies", _cacheable=False)
+        dummy_mock = MagicMock(id=1)
+
+        repository = Repository(None, None, dummy_class_mock)
+        repository.entity_manager = AsyncMock()
+        repository.entity_manager.select_many.return_value = [dummy_mock]
+        repository.cache_manager = AsyncMock()
+
+        result = await repository.select_many([1])
+        self.assertDictEqual(result, {1: dummy_mock})
+
+        repository.entity_manager.select_many.assert_called_once_with(
+            dummy_class_mock, [1])
+        repository.cache_manager.get_many.assert_not_called()
+        repository.cache_manager.set_many.assert_not_called()
 
     async def test__update_cacheable_commit_true(self):
         """Test update with cacheable entity and commit True."""
@@ -411,6 +481,21 @@ class RepositoryTestCase(asynctest.TestCase):
         repository.entity_manager.count_all.assert_called_once_with(
             dummy_class_mock, key__eq="value")
 
+    async def test__count_grouped(self):
+        """Test count_grouped method."""
+        dummy_class_mock = MagicMock()
+        dummies_counts = {1: 2, 3: 4}
+
+        repository = Repository(None, None, dummy_class_mock)
+        repository.entity_manager = AsyncMock()
+        repository.entity_manager.count_grouped.return_value = dummies_counts
+
+        result = await repository.count_grouped("key", key__in="1, 3")
+        self.assertDictEqual(result, dummies_counts)
+
+        repository.entity_manager.count_grouped.assert_called_once_with(
+            dummy_class_mock, "key", key__in="1, 3")
+
     async def test__sum_all(self):
         """Test sum_all method."""
         dummy_class_mock = MagicMock()
@@ -0,0 +1,160 @@
+"""
+Unit tests for the integrity scrubber, covering the verification of
+revision files on a temporary local storage: missing files, files
+truncated below their stored or plaintext size, corrupted segmented
+and legacy Fernet files, and the chunks of chunked revisions.
+"""
+
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+import asynctest
+from app.managers.file_manager import FileManager, cipher_suite
+from app.managers.storage_manager import LocalStorage
+from app.helpers.cipher_helper import SEGMENT_SIZE
+from app.helpers.blob_helper import get_manifest_filename
+from app.helpers.scrub_helper import revision_verify, Throttle
+from app.models.revision_model import ScrubStatus
+
+CONTENT = bytes(range(256)) * (SEGMENT_SIZE // 100)
+
+
+class ScrubHelperTestCase(asynctest.TestCase):
+
+    async def setUp(self):
+        """Sets up the revisions storage on a temporary directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.storage = LocalStorage(os.path.join(self.tmp_dir.name, "rev"))
+        self.storage_patcher = patch(
+            "app.helpers.scrub_helper.revisions_storage", self.storage)
+        self.storage_patcher.start()
+        self.throttle = Throttle(1024 ** 4)
+
+    async def tearDown(self):
+        self.storage_patcher.stop()
+        self.tmp_dir.cleanup()
+
+    async def _path(self, key: str) -> str:
+        path = await self.storage.get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    async def _revision(self, data: bytes = CONTENT,
+                        key: str = "abcdef.aes"):
+        """Stores the data as a segmented file of a new revision."""
+        src_path = os.path.join(self.tmp_dir.name, "plaintext")
+        with open(src_path, "wb") as file:
+            file.write(data)
+
+        path = await self._path(key)
+        revision_size = await FileManager.encrypt_file(src_path, path)
+        return MagicMock(revision_filename=key, revision_size=revision_size,
+                         original_size=len(data), revision_compression=None)
+
+    async def _fernet_revision(self, data: bytes = b"legacy content"):
+        """Stores the data as a legacy Fernet file of a new revision."""
+        token = cipher_suite.encrypt(data)
+        with open(await self._path("ghijkl.aes"), "wb") as file:
+            file.write(token)
+        return MagicMock(revision_filename="ghijkl.aes",
+                         revision_size=len(token), original_size=len(data),
+                         revision_compression=None)
+
+    def _corrupt(self, path: str, offset: int):
+        """Flips a byte of the file, keeping its size."""
+        with open(path, "r+b") as file:
+            file.seek(offset)
+            byte = file.read(1)
+            file.seek(offset)
+            file.write(bytes([byte[0] ^ 0xFF]))
+
+    async def test__ok(self):
+        """Tests that an intact segmented file is ok."""
+        revision = await self._revision()
+        self.assertEqual(await revision_verify(revision, self.throttle),
+                         ScrubStatus.ok)
+        self.assertGreaterEqual(self.throttle.read_size, len(CONTENT))
+
+    async def test__missing(self):
+        """Tests that a file that does not exist is missing."""
+        revision = MagicMock(revision_filename="abcdef.aes")
+        self.assertEqual(await revision_verify(revision, self.throttle),
+                         ScrubStatus.missing)
+
+    async def test__truncated(self):
+        """Tests that a file of another size than stored is truncated."""
+        revision = await self._revision()
+        path = await self.storage.get_path(revision.revision_filename)
+        with open(path, "r+b") as file:
+            file.truncate(revision.revision_size - 100)
+
+        self.assertEqual(await revision_verify(revision, self.throttle),
+                         ScrubStatus.truncated)
+
+    async def test__truncated_plaintext(self):
+        """Tests that a file of another plaintext size is truncated."""
+        revision = await self._revision()
+        revision.original_size += 1
+        self.assertEqual(await revision_verify(revision, self.throttle),
+                         ScrubStatus.truncated)
+
+        revision.revision_compression = "zlib"
+        self.assertEqual(await revision_verify(revision, self.throttle),
+                         ScrubStatus.ok)
+
+    async def test__corrupted(self):
+        """Tests that a file that fails authentication is corrupted."""
+        revision = await self._revision()
+        path = await self.storage.get_path(revision.revision_filename)
+        self._corrupt(path, revision.revision_size // 2)
+
+        self.assertEqual(await revision_verify(revision, self.throttle),
+                         ScrubStatus.corrupted)
+
+    async def test__fernet(self):
+        """Tests the legacy Fernet files."""
+        revision = await self._fernet_revision()
+        self.assertEqual(await revision_verify(revision, self.throttle),
+                         ScrubStatus.ok)
+
+        path = await self.storage.get_path(revision.revision_filename)
+        self._corrupt(path, 60)
+        self.assertEqual(await revision_verify(revision, self.throttle),
+                         ScrubStatus.corrupted)
+
+    @patch("app.helpers.scrub_helper.chunk_read")
+    @patch("app.helpers.scrub_helper.manifest_read")
+    async def test__manifest(self, manifest_read_mock, chunk_read_mock):
+        """Tests the chunks of a chunked revision."""
+        key = get_manifest_filename("hash")
+        with open(await self._path(key), "wb") as file:
+            file.write(b"manifest")
+        manifest_read_mock.return_value = MagicMock(
+            size=30, filenames=["a.aes", "b.aes"], offsets=[0, 10, 30])
+        revision = MagicMock(revision_filename=key, original_size=30,
+                             revision_compression=None)
+
+        chunk_read_mock.side_effect = [b"0" * 10, b"1" * 20]
+        self.assertEqual(await revision_verify(revision, self.throttle),
+                         ScrubStatus.ok)
+
+        chunk_read_mock.side_effect = [b"0" * 10, FileNotFoundError()]
+        self.assertEqual(await revision_verify(revision, self.throttle),
+                         ScrubStatus.missing)
+
+        chunk_read_mock.side_effect = [b"0" * 10, b"1" * 19]
+        self.assertEqual(await revision_verify(revision, self.throttle),
+                         ScrubStatus.truncated)
+
+        chunk_read_mock.side_effect = [ValueError()]
+        self.assertEqual(await revision_verify(revision, self.throttle),
+                         ScrubStatus.corrupted)
+
+        revision.original_size = 31
+        self.assertEqual(await revision_verify(revision, self.throttle),
+                         ScrubStatus.truncated)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+"""
+Unit tests for the sharded directory layout on a temporary directory,
+covering the shard paths, the lazy move of files stored in the flat
+layout, the batched background migration, and the static file lookup
+of flat URLs.
+"""
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import asynctest
+from app.helpers.shard_helper import (
+    get_shard_path, shard_resolve, shard_delete, shards_migrate,
+    ShardedStaticFiles)
+
+
+class ShardHelperTestCase(asynctest.TestCase):
+
+    async def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.base_path = self.tmp_dir.name
+
+    async def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _file(self, *path: str, data: bytes = b"data") -> str:
+        """Creates the file under the base path and returns its path."""
+        path = os.path.join(self.base_path, *path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(data)
+        return path
+
+    async def test__shard_path(self):
+        """Tests that files are stored two levels deep."""
+        self.assertEqual(get_shard_path("/base", "abcdef.aes"),
+                         "/base/ab/cd/abcdef.aes")
+        self.assertEqual(get_shard_path("", "abcdef.aes"),
+                         "ab/cd/abcdef.aes")
+
+    async def test__resolve_flat(self):
+        """Tests that a file in the flat layout is moved into place."""
+        flat_path = self._file("abcdef.aes")
+        path = await shard_resolve(self.base_path, "abcdef.aes")
+
+        self.assertEqual(path, get_shard_path(self.base_path, "abcdef.aes"))
+        self.assertFalse(os.path.exists(flat_path))
+        with open(path, "rb") as file:
+            self.assertEqual(file.read(), b"data")
+
+    async def test__resolve_sharded(self):
+        """Tests that a file in place is kept over a flat copy."""
+        path = self._file("ab", "cd", "abcdef.aes", data=b"sharded")
+        flat_path = self._file("abcdef.aes", data=b"flat")
+
+        self.assertEqual(await shard_resolve(self.base_path, "abcdef.aes"),
+                         path)
+        self.assertTrue(os.path.exists(flat_path))
+        with open(path, "rb") as file:
+            self.assertEqual(file.read(), b"sharded")
+
+    async def test__resolve_missing(self):
+        """Tests that the sharded path of a missing file is returned."""
+        path = await shard_resolve(self.base_path, "abcdef.aes")
+        self.assertEqual(path, get_shard_path(self.base_path, "abcdef.aes"))
+        self.assertListEqual(os.listdir(self.base_path), [])
+
+    async def test__delete(self):
+        """Tests that both the sharded and the flat files are deleted."""
+        path = self._file("ab", "cd", "abcdef.aes")
+        flat_path = self._file("abcdef.aes")
+        await shard_delete(self.base_path, "abcdef.aes")
+
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(flat_path))
+        await shard_delete(self.base_path, "abcdef.aes")
+
+    @patch("app.helpers.shard_helper.SHARD_MIGRATE_BATCH_SIZE", 2)
+    async def test__migrate(self):
+        """Tests that the flat layout is migrated in batches."""
+        filenames = ["abcd01.aes", "abcd02.aes", "efgh03.aes",
+                     "ijkl04.aes", "mnop05.aes"]
+        for filename in filenames:
+            self._file(filename)
+        self._file("qrst06.aes.tmp")
+        self._file(".reconciled")
+
+        await shards_migrate(self.base_path)
+
+        for filename in filenames:
+            self.assertTrue(os.path.isfile(
+                get_shard_path(self.base_path, filename)))
+        self.assertListEqual(sorted(
+            x for x in os.listdir(self.base_path)
+            if os.path.isfile(os.path.join(self.base_path, x))),
+            [".reconciled", "qrst06.aes.tmp"])
+
+    async def test__static_files(self):
+        """Tests that flat URLs resolve to the sharded and flat files."""
+        sharded_path = self._file("ab", "cd", "abcdef.jpg")
+        flat_path = self._file("ghijkl.jpg")
+        static_files = ShardedStaticFiles(directory=self.base_path)
+
+        full_path, stat_result = static_files.lookup_path("abcdef.jpg")
+        self.assertEqual(os.path.realpath(full_path),
+                         os.path.realpath(sharded_path))
+
+        full_path, stat_result = static_files.lookup_path("ghijkl.jpg")
+        self.assertEqual(os.path.realpath(full_path),
+                         os.path.realpath(flat_path))
+
+        full_path, stat_result = static_files.lookup_path("mnopqr.jpg")
+        self.assertIsNone(stat_result)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,468 @@
+"""
+Unit tests for the storage backends, covering the local storage on a
+temporary directory and the S3 storage against an in-memory stand-in
+for an S3-compatible service, including ranged reads, multipart uploads
+and paginated listings, and the AWS Signature Version 4 signing.
+"""
+
+import os
+import re
+import time
+import datetime
+import tempfile
+import unittest
+from email.utils import formatdate
+from unittest.mock import patch
+from urllib.parse import parse_qs
+import asynctest
+import httpx
+from app.managers.file_manager import FileManager
+from app.managers.storage_manager import (
+    Storage, LocalStorage, S3Storage, sigv4_headers, S3_MIN_PART_SIZE)
+from app.helpers.cipher_helper import SEGMENT_SIZE
+from app.helpers.blob_helper import revision_store
+from app.config import get_config
+
+cfg = get_config()
+
+S3_XMLNS = "http://s3.amazonaws.com/doc/2006-03-01/"
+
+
+class S3StandIn:
+    """
+    In-memory stand-in for an S3-compatible service, which handles the
+    requests of the S3 storage and records them.
+    """
+
+    def __init__(self, page_size: int = 2):
+        self.objects = {}
+        self.uploads = {}
+        self.requests = []
+        self.page_size = page_size
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if not request.headers["authorization"].startswith(
+                "AWS4-HMAC-SHA256 Credential="):
+            return httpx.Response(403)
+
+        query = {key: values[0] for key, values in parse_qs(
+            request.url.query.decode(), keep_blank_values=True).items()}
+        path = request.url.path
+        content = await request.aread()
+
+        if request.method == "GET" and "list-type" in query:
+            return self._list(query)
+
+        elif request.method == "POST" and "uploads" in query:
+            upload_id = "upload-%s" % len(self.uploads)
+            self.uploads[upload_id] = {}
+            return httpx.Response(200, content=(
+                '<InitiateMultipartUploadResult xmlns="%s">'
+                '<UploadId>%s</UploadId></InitiateMultipartUploadResult>' % (
+                    S3_XMLNS, upload_id)).encode())
+
+        elif request.method == "PUT" and "uploadId" in query:
+            part_number = int(query["partNumber"])
+            self.uploads[query["uploadId"]][part_number] = content
+            return httpx.Response(200, headers={"etag": '"%s"' % part_number})
+
+        elif request.method == "POST" and "uploadId" in query:
+            parts = self.uploads.pop(query["uploadId"])
+            numbers = [int(x) for x in re.findall(
+                rb"<PartNumber>(\d+)</PartNumber>", content)]
+            self.objects[path] = (b"".join(parts[x] for x in numbers),
+                                  time.time())
+            return httpx.Response(200, content=b"<CompleteMultipartUpload"
+                                               b"Result/>")
+
+        elif request.method == "DELETE" and "uploadId" in query:
+            self.uploads.pop(query["uploadId"], None)
+            return httpx.Response(204)
+
+        elif request.method == "PUT" and "x-amz-copy-source" in (
+                request.headers):
+            source = request.headers["x-amz-copy-source"]
+            if source not in self.objects:
+                return httpx.Response(404)
+            self.objects[path] = (self.objects[source][0], time.time())
+            return httpx.Response(200)
+
+        elif request.method == "PUT":
+            self.objects[path] = (content, time.time())
+            return httpx.Response(200)
+
+        elif request.method == "DELETE":
+            self.objects.pop(path, None)
+            return httpx.Response(204)
+
+        elif path not in self.objects:
+            return httpx.Response(404)
+
+        data, mtime = self.objects[path]
+        headers = {"last-modified": formatdate(mtime, usegmt=True)}
+        if request.method == "HEAD":
+            headers["content-length"] = str(len(data))
+            return httpx.Response(200, headers=headers)
+
+        match = re.match(r"^bytes=(\d+)-(\d*)$",
+                         request.headers.get("range", ""))
+        if not match:
+            return httpx.Response(200, headers=headers, content=data)
+
+        start = int(match.group(1))
+        end = int(match.group(2)) + 1 if match.group(2) else len(data)
+        if start >= len(data):
+            return httpx.Response(416)
+        return httpx.Response(206, headers=headers, content=data[start:end])
+
+    def _list(self, query: dict) -> httpx.Response:
+        prefix = "/%s/%s" % (cfg.S3_BUCKET, query["prefix"])
+        keys = sorted(x for x in self.objects if x.startswith(prefix))
+        start = int(query.get("continuation-token", 0))
+        page = keys[start:start + self.page_size]
+        is_truncated = start + self.page_size < len(keys)
+
+        contents = "".join(
+            "<Contents><Key>%s</Key><Size>%s</Size>"
+            "<LastModified>%s</LastModified></Contents>" % (
+                key[len(cfg.S3_BUCKET) + 2:], len(self.objects[key][0]),
+                datetime.datetime.fromtimestamp(
+                    self.objects[key][1], datetime.timezone.utc)
+                .strftime("%Y-%m-%dT%H:%M:%S.000Z"))
+            for key in page)
+        token = ("<NextContinuationToken>%s</NextContinuationToken>" % (
+            start + self.page_size) if is_truncated else "")
+
+        return httpx.Response(200, content=(
+            '<ListBucketResult xmlns="%s">%s<IsTruncated>%s</IsTruncated>'
+            '%s</ListBucketResult>' % (
+                S3_XMLNS, contents, str(is_truncated).lower(), token))
+            .encode())
+
+
+async def _chunks(data: bytes, chunk_size: int = 1024 * 1024):
+    for i in range(0, len(data), chunk_size):
+        yield data[i:i + chunk_size]
+
+
+class StorageManagerTestCase(asynctest.TestCase):
+    """Test case for the storage backends."""
+
+    async def setUp(self):
+        """Set up the test case environment."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.s3 = S3StandIn()
+        self.s3_storage = S3Storage(
+            "revisions/", transport=httpx.MockTransport(self.s3.handle))
+        self.local_storage = LocalStorage(
+            os.path.join(self.tmp_dir.name, "revisions"))
+
+    async def tearDown(self):
+        """Clean up the test case environment."""
+        await self.s3_storage.close()
+        self.tmp_dir.cleanup()
+
+    def _tmp_file(self, filename: str, data: bytes) -> str:
+        """Creates a file in the temporary directory."""
+        path = os.path.join(self.tmp_dir.name, filename)
+        with open(path, "wb") as fn:
+            fn.write(data)
+        return path
+
+    async def _read(self, storage, key: str, start: int = 0,
+                    end: int = None) -> bytes:
+        """Collects the chunks yielded by read_iter."""
+        return b"".join([chunk async for chunk in storage.read_iter(
+            key, start, end)])
+
+    async def _list(self, storage) -> list:
+        """Collects the batches yielded by list_iter."""
+        return [batch async for batch in storage.list_iter()]
+
+    def test__storage_abstract(self):
+        """Test that incomplete backends cannot be created."""
+        class IncompleteStorage(Storage):
+            async def stat(self, key: str):
+                return None
+
+        with self.assertRaises(TypeError):
+            IncompleteStorage()
+
+    def test__sigv4_headers(self):
+        """Test that the signature matches the AWS get-vanilla example."""
+        headers = sigv4_headers(
+            "GET", "example.amazonaws.com", "/", {}, {}, "AKIDEXAMPLE",
+            "wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY", "us-east-1",
+            service="service", payload_hash=(
+                "e3b0c44298fc1c149afbf4c8996fb924"
+                "27ae41e4649b934ca495991b7852b855"),
+            now=datetime.datetime(2015, 8, 30, 12, 36, 0))
+
+        self.assertEqual(headers["x-amz-date"], "20150830T123600Z")
+        self.assertEqual(
+            headers["authorization"],
+            "AWS4-HMAC-SHA256 Credential=AKIDEXAMPLE/20150830/us-east-1/"
+            "service/aws4_request, SignedHeaders=host;x-amz-date, "
+            "Signature=5fa00fa31553b73ebf1942676e86291e"
+            "8372ff2a2260956d9b8aae1d763fbf31")
+
+    async def test__local_storage_put(self):
+        """Test that a local file is moved into the sharded layout."""
+        path = self._tmp_file("upload.tmp", b"content")
+
+        await self.local_storage.put("abcdef.aes", path)
+
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.isfile(os.path.join(
+            self.local_storage.base_path, "ab", "cd", "abcdef.aes")))
+        self.assertEqual(await self._read(self.local_storage, "abcdef.aes"),
+                         b"content")
+
+    async def test__local_storage_stat_flat(self):
+        """Test that a file in the flat layout is found and moved."""
+        os.makedirs(self.local_storage.base_path)
+        self._tmp_file(os.path.join("revisions", "abcdef.aes"), b"content")
+
+        stat = await self.local_storage.stat("abcdef.aes")
+
+        self.assertEqual(stat.size, 7)
+        self.assertTrue(os.path.isfile(os.path.join(
+            self.local_storage.base_path, "ab", "cd", "abcdef.aes")))
+
+    async def test__local_storage_missing(self):
+        """Test that a missing file has no stat and cannot be read."""
+        self.assertIsNone(await self.local_storage.stat("abcdef.aes"))
+        self.assertFalse(await self.local_storage.exists("abcdef.aes"))
+
+        with self.assertRaises(FileNotFoundError):
+            await self.local_storage.size("abcdef.aes")
+
+        with self.assertRaises(FileNotFoundError):
+            await self._read(self.local_storage, "abcdef.aes")
+
+    async def test__local_storage_write_read_range(self):
+        """Test that a written file is read back by range."""
+        data = os.urandom(1024 * 600)
+
+        await self.local_storage.write("abcdef.aes", _chunks(data, 1000))
+
+        self.assertEqual(await self.local_storage.size("abcdef.aes"),
+                         len(data))
+        self.assertEqual(await self._read(
+            self.local_storage, "abcdef.aes", 1000, 300000),
+            data[1000:300000])
+
+    async def test__local_storage_delete(self):
+        """Test that deleting removes the file and ignores missing ones."""
+        await self.local_storage.write("abcdef.aes", _chunks(b"content"))
+
+        await self.local_storage.delete("abcdef.aes")
+        await self.local_storage.delete("abcdef.aes")
+
+        self.assertFalse(await self.local_storage.exists("abcdef.aes"))
+
+    async def test__local_storage_touch(self):
+        """Test that touching refreshes the modification time."""
+        await self.local_storage.write("abcdef.aes", _chunks(b"content"))
+        path = await self.local_storage.get_path("abcdef.aes")
+        os.utime(path, (0, 0))
+
+        await self.local_storage.touch("abcdef.aes")
+
+        stat = await self.local_storage.stat("abcdef.aes")
+        self.assertAlmostEqual(stat.mtime, time.time(), delta=5)
+        with self.assertRaises(FileNotFoundError):
+            await self.local_storage.touch("cdefgh.aes")
+
+    @patch("app.helpers.blob_helper.cache_pool")
+    @patch("app.helpers.blob_helper.revisions_storage")
+    async def test__revision_store(self, storage_mock, cache_pool_mock):
+        """Test that stored content is kept and the upload discarded."""
+        lock_mock = cache_pool_mock.get_client.return_value.lock
+        storage_mock.touch = self.local_storage.touch
+        storage_mock.put = self.local_storage.put
+        revision_filename, created = await revision_store(
+            self._tmp_file("upload1.tmp", b"first"), "hash")
+        self.assertTrue(created)
+
+        path = await self.local_storage.get_path(revision_filename)
+        os.utime(path, (0, 0))
+        upload_path = self._tmp_file("upload2.tmp", b"second")
+        result = await revision_store(upload_path, "hash")
+
+        self.assertTupleEqual(result, (revision_filename, False))
+        self.assertFalse(os.path.exists(upload_path))
+        self.assertEqual(await self._read(
+            self.local_storage, revision_filename), b"first")
+        self.assertAlmostEqual(os.stat(path).st_mtime, time.time(),
+                               delta=5)
+        lock_mock.assert_called_with("lock:blob:" + revision_filename,
+                                     timeout=cfg.ORPHANS_GC_DELAY)
+        self.assertEqual(lock_mock.return_value.__aexit__.call_count, 2)
+
+    async def test__local_storage_list_iter(self):
+        """Test that all files are listed, skipping temporary ones."""
+        for key in ["abcdef.aes", "abcxyz.aes", "cdefgh.aes"]:
+            await self.local_storage.write(key, _chunks(b"content"))
+        self._tmp_file(os.path.join("revisions", "upload.tmp"), b"")
+        self._tmp_file(os.path.join("revisions", "flat.aes"), b"flat")
+
+        batches = await self._list(self.local_storage)
+
+        self.assertEqual(sorted(file.key for batch in batches
+                                for file in batch),
+                         ["abcdef.aes", "abcxyz.aes", "cdefgh.aes",
+                          "flat.aes"])
+
+    async def test__s3_storage_write_read(self):
+        """Test that a small file is stored with a single request."""
+        await self.s3_storage.write("abcdef.aes", _chunks(b"content"))
+
+        self.assertEqual(len(self.s3.requests), 1)
+        self.assertEqual(self.s3.requests[0].url.path,
+                         "/%s/revisions/abcdef.aes" % cfg.S3_BUCKET)
+        self.assertEqual(await self._read(self.s3_storage, "abcdef.aes"),
+                         b"content")
+
+    async def test__s3_storage_read_range(self):
+        """Test that ranges are requested with the Range header."""
+        data = os.urandom(1000)
+        await self.s3_storage.write("abcdef.aes", _chunks(data))
+
+        self.assertEqual(await self._read(
+            self.s3_storage, "abcdef.aes", 100, 200), data[100:200])
+        self.assertEqual(self.s3.requests[-1].headers["range"],
+                         "bytes=100-199")
+
+        self.assertEqual(await self._read(
+            self.s3_storage, "abcdef.aes", 900), data[900:])
+        self.assertEqual(self.s3.requests[-1].headers["range"],
+                         "bytes=900-")
+
+        self.assertEqual(await self._read(
+            self.s3_storage, "abcdef.aes", 1000), b"")
+
+    async def test__s3_storage_missing(self):
+        """Test that a missing object has no stat and cannot be read."""
+        self.assertIsNone(await self.s3_storage.stat("abcdef.aes"))
+
+        with self.assertRaises(FileNotFoundError):
+            await self.s3_storage.size("abcdef.aes")
+
+        with self.assertRaises(FileNotFoundError):
+            await self._read(self.s3_storage, "abcdef.aes")
+
+    async def test__s3_storage_stat(self):
+        """Test that the stat holds the size and the modification time."""
+        await self.s3_storage.write("abcdef.aes", _chunks(b"content"))
+
+        stat = await self.s3_storage.stat("abcdef.aes")
+
+        self.assertEqual(stat.size, 7)
+        self.assertAlmostEqual(stat.mtime, time.time(), delta=5)
+
+    @patch("app.managers.storage_manager.cfg.S3_PART_SIZE", 0)
+    async def test__s3_storage_multipart(self):
+        """Test that a large file is stored with a multipart upload."""
+        data = os.urandom(S3_MIN_PART_SIZE * 2 + 1000)
+        path = self._tmp_file("upload.tmp", data)
+
+        await self.s3_storage.put("abcdef.aes", path)
+
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual([(x.method, x.url.params.get("partNumber"))
+                          for x in self.s3.requests],
+                         [("POST", None), ("PUT", "1"), ("PUT", "2"),
+                          ("PUT", "3"), ("POST", None)])
+        self.assertEqual(len(self.s3.requests[3].content), 1000)
+        self.assertEqual(await self._read(self.s3_storage, "abcdef.aes"),
+                         data)
+        self.assertEqual(self.s3.uploads, {})
+
+    @patch("app.managers.storage_manager.cfg.S3_PART_SIZE", 0)
+    async def test__s3_storage_multipart_abort(self):
+        """Test that a failed multipart upload is aborted."""
+        async def chunks():
+            yield os.urandom(S3_MIN_PART_SIZE)
+            raise OSError("Read failed")
+
+        with self.assertRaises(OSError):
+            await self.s3_storage.write("abcdef.aes", chunks())
+
+        self.assertEqual(self.s3.requests[-1].method, "DELETE")
+        self.assertEqual(self.s3.uploads, {})
+        self.assertFalse(await self.s3_storage.exists("abcdef.aes"))
+
+    async def test__s3_storage_touch(self):
+        """Test that touching copies the object onto itself."""
+        await self.s3_storage.write("abcdef.aes", _chunks(b"content"))
+        path = self.s3_storage.get_path("abcdef.aes")
+        self.s3.objects[path] = (b"content", 0)
+
+        await self.s3_storage.touch("abcdef.aes")
+
+        self.assertEqual(self.s3.objects[path][0], b"content")
+        self.assertAlmostEqual(self.s3.objects[path][1], time.time(),
+                               delta=5)
+        self.assertEqual(self.s3.requests[-1].headers[
+            "x-amz-metadata-directive"], "REPLACE")
+        with self.assertRaises(FileNotFoundError):
+            await self.s3_storage.touch("cdefgh.aes")
+
+    async def test__s3_storage_delete(self):
+        """Test that deleting removes the object."""
+        await self.s3_storage.write("abcdef.aes", _chunks(b"content"))
+
+        await self.s3_storage.delete("abcdef.aes")
+
+        self.assertFalse(await self.s3_storage.exists("abcdef.aes"))
+
+    async def test__s3_storage_list_iter(self):
+        """Test that the objects under the prefix are listed by pages."""
+        for key in ["a.aes", "b.aes", "c.aes"]:
+            await self.s3_storage.write(key, _chunks(b"content"))
+        thumbnails_storage = S3Storage(
+            "thumbnails/", transport=httpx.MockTransport(self.s3.handle))
+        await thumbnails_storage.write("d.jpg", _chunks(b"content"))
+        await thumbnails_storage.close()
+
+        batches = await self._list(self.s3_storage)
+
+        self.assertEqual([[file.key for file in batch] for batch in batches],
+                         [["a.aes", "b.aes"], ["c.aes"]])
+        self.assertEqual(batches[0][0].size, 7)
+
+    async def test__s3_storage_close(self):
+        """Test that the client is shared until the storage is closed."""
+        client = self.s3_storage.get_client()
+        self.assertIs(self.s3_storage.get_client(), client)
+
+        await self.s3_storage.close()
+
+        self.assertTrue(client.is_closed)
+        self.assertIsNot(self.s3_storage.get_client(), client)
+
+    async def test__decrypt_iter_storage(self):
+        """Test that revisions are decrypted by range from storages."""
+        data = os.urandom(SEGMENT_SIZE * 2 + 100)
+        path = self._tmp_file("src", data)
+        encrypted_path = self._tmp_file("upload.tmp", b"")
+        await FileManager.encrypt_file(path, encrypted_path)
+        with open(encrypted_path, "rb") as fn:
+            encrypted = fn.read()
+
+        for storage in [self.local_storage, self.s3_storage]:
+            await storage.write("abcdef.aes", _chunks(encrypted))
+
+            result = b"".join([chunk async for chunk in (
+                FileManager.decrypt_iter(
+                    "abcdef.aes", SEGMENT_SIZE - 10, SEGMENT_SIZE * 2 + 50,
+                    storage=storage))])
+
+            self.assertEqual(result, data[SEGMENT_SIZE - 10:
+                                          SEGMENT_SIZE * 2 + 50])
+
+
+if __name__ == "__main__":
+    unittest.main()
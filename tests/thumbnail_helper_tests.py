@@ -0,0 +1,160 @@
+"""
+Unit tests for the thumbnail queue, covering the claim of the next due
+revision, the ready status after a thumbnail is created, the retries
+with an increasing delay, and the failed status once the attempts are
+exhausted or the image is over the decoder budget.
+"""
+
+import unittest
+from unittest.mock import MagicMock, AsyncMock, patch
+import asynctest
+from PIL import Image
+from sqlalchemy.dialects import postgresql
+from app.helpers.thumbnail_helper import thumbnail_claim, thumbnails_process
+from app.models.revision_model import ThumbnailStatus
+from app.config import get_config
+# Registers the models the revision model relates to.
+import app.app  # noqa: F401
+
+cfg = get_config()
+
+NOW = 1700000000
+
+
+def _compile(statement) -> str:
+    return str(statement.compile(dialect=postgresql.dialect(),
+                                 compile_kwargs={"literal_binds": True}))
+
+
+@patch("app.helpers.thumbnail_helper.time.time", return_value=NOW)
+class ThumbnailHelperTestCase(asynctest.TestCase):
+
+    async def setUp(self):
+        """Sets up the session, the claimed revision and the renderer."""
+        self.session = AsyncMock()
+        self.revision = MagicMock(
+            id=123, thumbnail_filename="a.webp", thumbnail_attempts=1,
+            thumbnail_status=ThumbnailStatus.pending)
+
+        self.patchers = [
+            patch("app.helpers.thumbnail_helper.sessionmanager"),
+            patch("app.helpers.thumbnail_helper.thumbnail_claim",
+                  return_value=self.revision.id),
+            patch("app.helpers.thumbnail_helper.EntityManager"),
+            patch("app.helpers.thumbnail_helper.Repository"),
+            patch("app.helpers.thumbnail_helper.thumbnail_render"),
+            patch("app.helpers.thumbnail_helper.cache_pool"),
+        ]
+        (sessionmanager_mock, self.claim_mock, entity_manager_mock,
+         repository_mock, self.render_mock, _) = [
+            patcher.start() for patcher in self.patchers]
+
+        sessionmanager_mock.async_sessionmaker.return_value.\
+            __aenter__.return_value = self.session
+        self.entity_manager = entity_manager_mock.return_value
+        self.entity_manager.select = AsyncMock(return_value=self.revision)
+        self.entity_manager.select_by = AsyncMock(return_value=None)
+        self.update_mock = AsyncMock()
+        repository_mock.return_value.update = self.update_mock
+
+    async def tearDown(self):
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+
+    async def test__claim(self, time_mock):
+        """Tests that the claim moves the retry date and counts it."""
+        session = AsyncMock()
+        session.execute.return_value = MagicMock()
+        session.execute.return_value.scalar_one_or_none.return_value = 123
+
+        self.assertEqual(await thumbnail_claim(session), 123)
+        select_sql, update_sql = [
+            _compile(x.args[0]) for x in session.execute.call_args_list]
+        self.assertIn("thumbnail_retry_date <= %s" % NOW, select_sql)
+        self.assertIn("FOR UPDATE SKIP LOCKED", select_sql)
+        self.assertIn("thumbnail_retry_date=%s" % (
+            NOW + cfg.THUMBNAILS_QUEUE_TIMEOUT), update_sql)
+        self.assertIn("thumbnail_attempts=(datafiles_revisions."
+                      "thumbnail_attempts + 1)", update_sql)
+        session.commit.assert_called_once()
+
+    async def test__claim_empty(self, time_mock):
+        """Tests that an empty queue claims nothing."""
+        session = AsyncMock()
+        session.execute.return_value = MagicMock()
+        session.execute.return_value.scalar_one_or_none.return_value = None
+
+        self.assertIsNone(await thumbnail_claim(session))
+        session.execute.assert_called_once()
+        session.commit.assert_called_once()
+
+    async def test__process_empty(self, time_mock):
+        """Tests that the worker waits when the queue is empty."""
+        self.claim_mock.return_value = None
+        self.assertFalse(await thumbnails_process())
+        self.render_mock.assert_not_called()
+
+    async def test__process_ready(self, time_mock):
+        """Tests that the revision is ready after the thumbnail."""
+        self.assertTrue(await thumbnails_process())
+
+        self.render_mock.assert_called_once_with(self.revision, False)
+        self.assertEqual(self.revision.thumbnail_status,
+                         ThumbnailStatus.ready)
+        self.assertIsNone(self.revision.thumbnail_retry_date)
+        self.update_mock.assert_called_once_with(self.revision, commit=True)
+
+    async def test__process_probed(self, time_mock):
+        """Tests that the probe of the same content is reused."""
+        self.entity_manager.select_by.return_value = MagicMock(
+            media_duration=10.5, media_width=640, media_height=480)
+        await thumbnails_process()
+
+        self.render_mock.assert_called_once_with(self.revision, True)
+        self.assertEqual(self.revision.media_duration, 10.5)
+        self.assertEqual(self.revision.media_width, 640)
+        self.assertEqual(self.revision.media_height, 480)
+
+    async def test__process_backoff(self, time_mock):
+        """Tests that the retry delay doubles with every attempt."""
+        self.render_mock.side_effect = OSError()
+        for attempt in [1, 2, 3]:
+            self.revision.thumbnail_attempts = attempt
+            await thumbnails_process()
+
+            self.assertEqual(self.revision.thumbnail_status,
+                             ThumbnailStatus.pending)
+            self.assertEqual(self.revision.thumbnail_retry_date, NOW + (
+                cfg.THUMBNAILS_QUEUE_RETRY_DELAY * 2 ** (attempt - 1)))
+        self.assertEqual(self.update_mock.call_count, 3)
+
+    async def test__process_failed(self, time_mock):
+        """Tests that the revision fails once the attempts run out."""
+        self.render_mock.side_effect = OSError()
+        self.revision.thumbnail_attempts = cfg.THUMBNAILS_QUEUE_ATTEMPTS
+        await thumbnails_process()
+
+        self.assertEqual(self.revision.thumbnail_status,
+                         ThumbnailStatus.failed)
+        self.assertIsNone(self.revision.thumbnail_retry_date)
+        self.update_mock.assert_called_once_with(self.revision, commit=True)
+
+    async def test__process_decompression_bomb(self, time_mock):
+        """Tests that images over the budget fail without retries."""
+        self.render_mock.side_effect = Image.DecompressionBombError()
+        await thumbnails_process()
+
+        self.assertEqual(self.revision.thumbnail_status,
+                         ThumbnailStatus.failed)
+        self.assertIsNone(self.revision.thumbnail_retry_date)
+
+    async def test__process_deleted(self, time_mock):
+        """Tests that a revision deleted after the claim is skipped."""
+        self.entity_manager.select.return_value = None
+        self.assertTrue(await thumbnails_process())
+        self.render_mock.assert_not_called()
+        self.update_mock.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+"""
+Unit tests for the streaming ZIP archives, covering the names of the
+archive members for duplicated and unsafe filenames, and the archive
+produced from decrypted revisions, which must be readable by zipfile
+with deflated and stored members.
+"""
+
+import io
+import os
+import zipfile
+import unittest
+from unittest.mock import MagicMock, patch
+import asynctest
+from app.helpers.zip_helper import get_zip_names, zip_stream
+
+CONTENTS = {
+    1: b"text content " * 50000,
+    2: os.urandom(300000),
+    3: b"",
+}
+
+
+def _revision(revision_id: int, mimetype: str) -> MagicMock:
+    return MagicMock(id=revision_id, original_mimetype=mimetype,
+                     original_size=len(CONTENTS[revision_id]),
+                     created_date=1700000000)
+
+
+async def _decrypt_iter(revision):
+    """Yields the content of the revision in chunks."""
+    content = CONTENTS[revision.id]
+    for i in range(0, len(content), 65536):
+        yield content[i:i + 65536]
+
+
+class ZipHelperTestCase(asynctest.TestCase):
+
+    async def test__get_zip_names(self):
+        """Tests that unique names are kept as they are."""
+        result = get_zip_names(["a.txt", "b.txt", "c"])
+        self.assertListEqual(result, ["a.txt", "b.txt", "c"])
+
+    async def test__get_zip_names_duplicated(self):
+        """Tests that duplicated names get a numeric suffix."""
+        result = get_zip_names(["a.txt", "A.TXT", "a.txt", "a (2).txt"])
+        self.assertListEqual(
+            result, ["a.txt", "A (2).TXT", "a (3).txt", "a (2) (2).txt"])
+
+    async def test__get_zip_names_unsafe(self):
+        """Tests that names cannot escape the target directory."""
+        result = get_zip_names(["../../etc/passwd", "/abs/path.txt",
+                                "dir\\file.txt", "..", ""])
+        self.assertListEqual(result, [
+            "_.._etc_passwd", "_abs_path.txt", "dir_file.txt", "untitled",
+            "untitled (2)"])
+        for name in result:
+            self.assertNotIn("/", name)
+            self.assertNotIn("\\", name)
+            self.assertFalse(name.startswith("."))
+
+    @patch("app.helpers.zip_helper.revision_decrypt_iter",
+           side_effect=_decrypt_iter)
+    async def test__zip_stream(self, decrypt_iter_mock):
+        """Tests that the streamed archive is readable by zipfile."""
+        revisions = [("a.txt", _revision(1, "text/plain")),
+                     ("b.jpg", _revision(2, "image/jpeg")),
+                     ("c.txt", _revision(3, "text/plain"))]
+
+        chunks = [x async for x in zip_stream(revisions)]
+        self.assertGreater(len(chunks), 2)
+
+        with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertListEqual(archive.namelist(),
+                                 ["a.txt", "b.jpg", "c.txt"])
+            infos = {x.filename: x for x in archive.infolist()}
+            self.assertEqual(infos["a.txt"].compress_type,
+                             zipfile.ZIP_DEFLATED)
+            self.assertLess(infos["a.txt"].compress_size,
+                            infos["a.txt"].file_size)
+            self.assertEqual(infos["b.jpg"].compress_type,
+                             zipfile.ZIP_STORED)
+
+            for name, revision in revisions:
+                self.assertEqual(archive.read(name), CONTENTS[revision.id])
+
+    @patch("app.helpers.zip_helper.revision_decrypt_iter")
+    async def test__zip_stream_error(self, decrypt_iter_mock):
+        """Tests that a decryption error is raised from the stream."""
+        async def decrypt_iter(revision):
+            yield b"data"
+            raise ValueError("decryption failed")
+        decrypt_iter_mock.side_effect = decrypt_iter
+
+        with self.assertRaises(ValueError):
+            async for _ in zip_stream([("a.txt", _revision(1, "text/plain"))]):
+                pass
+
+
+if __name__ == "__main__":
+    unittest.main()
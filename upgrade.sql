@@ -0,0 +1,54 @@
+-- Upgrades the schema of an existing database to the current models.
+-- The application creates missing tables on startup, but it does not
+-- alter the tables that already exist, so the columns added to them
+-- must be added by this script. Every statement can be run again, so
+-- the script is run as a whole before the new version is started:
+--
+--     psql -U $POSTGRES_USERNAME -d $POSTGRES_DATABASE -f upgrade.sql
+
+-- Compression of the revision content.
+ALTER TABLE datafiles_revisions
+    ADD COLUMN IF NOT EXISTS revision_compression VARCHAR(16);
+
+-- Revisions with identical content share one file.
+ALTER TABLE datafiles_revisions
+    DROP CONSTRAINT IF EXISTS datafiles_revisions_revision_filename_key,
+    DROP CONSTRAINT IF EXISTS datafiles_revisions_thumbnail_filename_key;
+CREATE INDEX IF NOT EXISTS ix_datafiles_revisions_revision_filename
+    ON datafiles_revisions (revision_filename);
+CREATE INDEX IF NOT EXISTS ix_datafiles_revisions_thumbnail_filename
+    ON datafiles_revisions (thumbnail_filename);
+
+-- Thumbnail queue.
+DO $$ BEGIN
+    CREATE TYPE thumbnailstatus AS ENUM ('pending', 'ready', 'failed');
+EXCEPTION WHEN duplicate_object THEN NULL;
+END $$;
+ALTER TABLE datafiles_revisions
+    ADD COLUMN IF NOT EXISTS thumbnail_status thumbnailstatus,
+    ADD COLUMN IF NOT EXISTS thumbnail_attempts INTEGER DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS thumbnail_retry_date INTEGER;
+CREATE INDEX IF NOT EXISTS ix_datafiles_revisions_thumbnail_status
+    ON datafiles_revisions (thumbnail_status);
+CREATE INDEX IF NOT EXISTS ix_datafiles_revisions_thumbnail_retry_date
+    ON datafiles_revisions (thumbnail_retry_date);
+
+-- Media metadata probed by the thumbnail queue.
+ALTER TABLE datafiles_revisions
+    ADD COLUMN IF NOT EXISTS media_duration DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS media_width INTEGER,
+    ADD COLUMN IF NOT EXISTS media_height INTEGER;
+
+-- Integrity scrubber.
+DO $$ BEGIN
+    CREATE TYPE scrubstatus AS ENUM (
+        'ok', 'missing', 'truncated', 'corrupted');
+EXCEPTION WHEN duplicate_object THEN NULL;
+END $$;
+ALTER TABLE datafiles_revisions
+    ADD COLUMN IF NOT EXISTS scrub_status scrubstatus,
+    ADD COLUMN IF NOT EXISTS scrub_date INTEGER;
+CREATE INDEX IF NOT EXISTS ix_datafiles_revisions_scrub_status
+    ON datafiles_revisions (scrub_status);
+CREATE INDEX IF NOT EXISTS ix_datafiles_revisions_scrub_date
+    ON datafiles_revisions (scrub_date);